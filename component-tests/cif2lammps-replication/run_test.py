@@ -0,0 +1,52 @@
+"""Time replicating the bonded graph of MOFs of increasing size"""
+from platform import node
+from time import perf_counter
+from math import prod
+import argparse
+import json
+
+from ase.io import read
+
+from mofa.simulation.cif2lammps.cif2system import initialize_system_from_atoms, duplicate_system
+
+
+def test_function(system: dict, replication: str) -> float:
+    """Time replicating a system
+
+    Args:
+        system: System produced by cif2lammps
+        replication: Replication to perform
+    Returns:
+        Runtime (s)
+    """
+    start_time = perf_counter()
+    duplicate_system(system, replication)
+    return perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cif', help='Path to the MOF to replicate', default='../../tests/files/check.cif')
+    parser.add_argument('--max-atoms', help='Largest number of atoms in the replicated cell', default=10000, type=int)
+    parser.add_argument('--repeats', help='Number of times to repeat each measurement', default=3, type=int)
+    args = parser.parse_args()
+
+    unit_cell = read(args.cif)
+    for base_reps in [(1, 1, 1), (2, 1, 1), (2, 2, 1), (2, 2, 2), (3, 2, 2), (3, 3, 2), (3, 3, 3)]:
+        atoms = unit_cell.repeat(base_reps)
+        system = initialize_system_from_atoms(atoms)
+        for replication in ['2x1x1', '2x2x1', '2x2x2']:
+            n_atoms = len(atoms) * prod(map(int, replication.split('x')))
+            if n_atoms > args.max_atoms:
+                continue
+            for _ in range(args.repeats):
+                runtime = test_function(system, replication)
+                with open('runtimes.json', 'a') as fp:
+                    print(json.dumps({
+                        'host': node(),
+                        'cif': args.cif,
+                        'base_reps': base_reps,
+                        'replication': replication,
+                        'natoms': n_atoms,
+                        'runtime': runtime,
+                    }), file=fp)
@@ -0,0 +1,103 @@
+"""Compare launching LAMMPS for each task against reusing a persistent process"""
+from platform import node
+from pathlib import Path
+from time import perf_counter
+import argparse
+import shutil
+import json
+import re
+
+from mofa.model import MOFRecord
+from mofa.simulation.lammps import LAMMPSRunner
+from mofa.simulation.mace import MACERunner
+
+_loop_pattern = re.compile(r'^Loop time of ([\d.eE+-]+)', re.MULTILINE)
+
+
+def loop_time(run_dir: str | Path) -> float:
+    """Total time LAMMPS spent in minimization and MD loops, read from its log
+
+    Args:
+        run_dir: Directory holding the ``stdout.lmp`` log
+    Returns:
+        Loop time (s). The remainder of the task is startup, reading inputs, and loading the pair style
+    """
+    return sum(map(float, _loop_pattern.findall((Path(run_dir) / 'stdout.lmp').read_text())))
+
+
+def test_function(runner: LAMMPSRunner, lmp_path: str) -> float:
+    """Time running one simulation
+
+    Args:
+        runner: Runner used to invoke LAMMPS
+        lmp_path: Directory holding the inputs
+    Returns:
+        Runtime (s)
+    """
+    start_time = perf_counter()
+    ret = runner.invoke_lammps(lmp_path)
+    runtime = perf_counter() - start_time
+    if ret.returncode != 0:
+        raise ValueError(f'LAMMPS failed. See {lmp_path}')
+    return runtime
+
+
+def test_mace(runner: MACERunner, record: MOFRecord, name: str, timesteps: int) -> tuple[float, Path]:
+    """Time running one MACE simulation, including reading and loading the model
+
+    Args:
+        runner: Runner used to invoke LAMMPS
+        record: MOF to simulate
+        name: Name of the run
+        timesteps: Number of MD timesteps
+    Returns:
+        - Runtime (s)
+        - Run directory
+    """
+    atoms = record.atoms * [runner.md_supercell] * 3
+    start_time = perf_counter()
+    runner.run_md_with_lammps(name, atoms, min_steps=0, timesteps=timesteps, write_freq=max(timesteps, 1))
+    return perf_counter() - start_time, runner.run_dir / f'{name}-lammps'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cif', help='Path to the MOF to simulate', default='../../tests/files/check.cif')
+    parser.add_argument('--lammps-command', help='Command used to launch LAMMPS', default=['lmp_serial'], nargs='+')
+    parser.add_argument('--mace-model', help='Path to a MACE model compiled for LAMMPS. Runs MACE in place of UFF if provided')
+    parser.add_argument('--timesteps', help='Number of MD timesteps per task', default=10, type=int)
+    parser.add_argument('--tasks', help='Number of tasks to run with each method', default=10, type=int)
+    args = parser.parse_args()
+
+    record = MOFRecord.from_file(args.cif)
+    for persistent in [False, True]:
+        if args.mace_model is None:
+            runner = LAMMPSRunner(lammps_command=args.lammps_command, lmp_sims_root_path='lmp-runs',
+                                  lammps_environ={'OMP_NUM_THREADS': '1'}, persistent=persistent)
+        else:
+            runner = MACERunner(lammps_cmd=args.lammps_command, model_path=Path(args.mace_model).absolute(),
+                                run_dir=Path('mace-runs'), persistent_lammps=persistent)
+        for task in range(args.tasks):
+            if args.mace_model is None:
+                lmp_path = runner.prep_molecular_dynamics_single(f'task-{task}', record.atoms, timesteps=args.timesteps,
+                                                                 report_frequency=args.timesteps)
+                runtime = test_function(runner, lmp_path)
+            else:
+                runtime, lmp_path = test_mace(runner, record, f'task-{task}', args.timesteps)
+            loop = loop_time(lmp_path)
+            shutil.rmtree(lmp_path)
+            with open('runtimes.json', 'a') as fp:
+                print(json.dumps({
+                    'host': node(),
+                    'cif': args.cif,
+                    'lammps_command': args.lammps_command,
+                    'model': 'uff' if args.mace_model is None else args.mace_model,
+                    'persistent': persistent,
+                    'task': task,
+                    'timesteps': args.timesteps,
+                    'runtime': runtime,
+                    'loop_time': loop,
+                    'overhead': runtime - loop,
+                }), file=fp)
+        if runner.engine is not None:
+            runner.engine.close()
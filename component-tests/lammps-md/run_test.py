@@ -15,7 +15,6 @@ from parsl.launchers import MpiExecLauncher
 
 from mofa.model import MOFRecord
 from mofa.scoring.geometry import LatticeParameterChange
-from mofa.utils.conversions import write_to_string
 
 
 def test_function(mof: MOFRecord, lammps_invocation: list[str], timesteps: int, environ: dict | None = None) -> tuple[float, list[Atoms]]:
@@ -161,10 +160,8 @@ hostname
             runtime, traj = future.result()
 
             # Get the strain
-            # TODO (wardlt): Simplify how we compute strain
-            traj_vasp = [write_to_string(t, 'vasp') for t in traj]
             mof = future.mof
-            mof.md_trajectory['uff'] = {str(args.timesteps): traj_vasp}
+            mof.md_trajectory['uff'] = traj
             strain = scorer.score_mof(mof)
 
             # Store the result
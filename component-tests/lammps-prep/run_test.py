@@ -0,0 +1,68 @@
+"""Time the preparation of LAMMPS inputs for a set of MOFs"""
+from tempfile import TemporaryDirectory
+from platform import node
+from pathlib import Path
+from time import perf_counter
+import argparse
+import json
+
+from tqdm import tqdm
+
+from mofa.model import MOFRecord
+from mofa.simulation.lammps import LAMMPSRunner
+from mofa.simulation.cif2lammps.main_conversion import single_conversion
+
+
+def test_function(mof: MOFRecord, run_dir: Path) -> dict[str, float]:
+    """Time preparing the inputs with each method
+
+    Args:
+        mof: MOF to prepare
+        run_dir: Directory in which to write the inputs
+    Returns:
+        Runtime (s) for each method
+    """
+    atoms = mof.atoms
+
+    # Write a CIF then convert it
+    start_time = perf_counter()
+    cif_dir = run_dir / 'cif'
+    cif_dir.mkdir()
+    cif_path = cif_dir / f'{mof.name}.cif'
+    atoms.write(cif_path, 'cif')
+    single_conversion(str(cif_path), outdir=str(cif_dir), replication='2x2x2', read_cifs_pymatgen=True)
+    cif_time = perf_counter() - start_time
+
+    # Prepare from the structure in memory
+    runner = LAMMPSRunner(lmp_sims_root_path=str(run_dir / 'memory'))
+    start_time = perf_counter()
+    runner.prep_molecular_dynamics_single(mof.name, atoms, timesteps=1000, report_frequency=100)
+    memory_time = perf_counter() - start_time
+
+    return {'cif': cif_time, 'memory': memory_time}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mofs', help='Path to the MOFs to evaluate', default='../lammps-md/example-mofs.json')
+    parser.add_argument('--max-mofs', help='Maximum number of MOFs to evaluate', default=None, type=int)
+    args = parser.parse_args()
+
+    with open(args.mofs) as fp:
+        mofs = [MOFRecord(**json.loads(line)) for line in fp][:args.max_mofs]
+
+    for mof in tqdm(mofs):
+        with TemporaryDirectory() as tmpdir:
+            try:
+                runtimes = test_function(mof, Path(tmpdir))
+            except ValueError as e:
+                print(f'{mof.name} failed: {e}')
+                continue
+
+        with open('runtimes.json', 'a') as fp:
+            print(json.dumps({
+                'host': node(),
+                'mof': mof.name,
+                'natoms': len(mof.atoms),
+                **runtimes
+            }), file=fp)
@@ -15,7 +15,6 @@ from tqdm import tqdm
 
 from mofa.scoring.geometry import LatticeParameterChange
 from mofa.model import MOFRecord
-from mofa.utils.conversions import write_to_string
 
 
 def test_function(mof: MOFRecord, lammps_cmd: list[str], model_path: str, timesteps: int, device: str) -> tuple[float, list[Atoms]]:
@@ -193,10 +192,8 @@ hostname
             runtime, traj = future.result()
 
             # Get the strain
-            # TODO (wardlt): Simplify how we compute strain
-            traj_vasp = [(i, write_to_string(t, 'vasp')) for i, t in traj]
             mof = future.mof
-            mof.md_trajectory['uff'] = traj_vasp
+            mof.md_trajectory['uff'] = traj
             strain = scorer.score_mof(mof)
 
             # Store the result
@@ -0,0 +1,59 @@
+"""Compare relaxing MOFs one at a time against relaxing them in a batch"""
+from platform import node
+from pathlib import Path
+from time import perf_counter
+import argparse
+import shutil
+import json
+
+from mofa.model import MOFRecord
+from mofa.simulation.mace import MACERunner
+
+
+def test_function(runner: MACERunner, mofs: list[MOFRecord], batched: bool, steps: int) -> float:
+    """Time relaxing a group of MOFs
+
+    Args:
+        runner: Runner used to perform the relaxations
+        mofs: MOFs to relax
+        batched: Whether to relax them all at once
+        steps: Number of optimization steps
+    Returns:
+        Runtime (s)
+    """
+    start_time = perf_counter()
+    if batched:
+        runner.run_optimization_many(mofs, steps=steps, fmax=1e-4)
+    else:
+        for mof in mofs:
+            runner.run_optimization(mof, steps=steps, fmax=1e-4)
+    return perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cif-dir', help='Directory holding the MOFs to relax', default='../../tests/simulation/cif_files')
+    parser.add_argument('--batch-sizes', help='Number of MOFs to relax together', default=[1, 2, 4, 8], type=int, nargs='+')
+    parser.add_argument('--steps', help='Number of optimization steps', default=8, type=int)
+    parser.add_argument('--device', help='Device on which to run MACE', default='cpu')
+    args = parser.parse_args()
+
+    cifs = sorted(Path(args.cif_dir).glob('*.cif'))
+    runner = MACERunner(run_dir=Path('mace-runs'), device=args.device, delete_finished=True)
+    runner.warmup()  # Load the model before timing
+
+    for batch_size in args.batch_sizes:
+        mofs = [MOFRecord.from_file(cifs[i % len(cifs)], name=f'mof-{i}') for i in range(batch_size)]
+        for batched in [False, True]:
+            runtime = test_function(runner, mofs, batched, args.steps)
+            with open('runtimes.json', 'a') as fp:
+                print(json.dumps({
+                    'host': node(),
+                    'device': args.device,
+                    'batch_size': batch_size,
+                    'batched': batched,
+                    'steps': args.steps,
+                    'runtime': runtime,
+                    'mofs_per_second': batch_size / runtime,
+                }), file=fp)
+    shutil.rmtree('mace-runs', ignore_errors=True)
@@ -0,0 +1,78 @@
+"""Compare the payload of trajectories stored as POSCAR strings and as arrays"""
+from platform import node
+from time import perf_counter
+from typing import Callable
+import argparse
+import pickle
+import json
+
+from ase.io import read
+from bson import BSON
+
+from mofa.utils.conversions import write_to_string, read_from_string
+from mofa.utils.trajectory import Trajectory
+
+
+def test_function(obj: object, encode: Callable[[object], bytes], decode: Callable[[bytes], object]) -> tuple[int, float, float]:
+    """Time serializing then deserializing an object
+
+    Args:
+        obj: Object to be serialized
+        encode: Function which produces bytes
+        decode: Function which restores the object
+    Returns:
+        - Size of the serialized object (bytes)
+        - Time to serialize (s)
+        - Time to deserialize (s)
+    """
+    start_time = perf_counter()
+    data = encode(obj)
+    encode_time = perf_counter() - start_time
+
+    start_time = perf_counter()
+    decode(data)
+    return len(data), encode_time, perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cif', help='Path to the MOF used to make the trajectory', default='../../tests/files/check.cif')
+    parser.add_argument('--frames', help='Number of frames in each trajectory', nargs='+', default=[11, 101], type=int)
+    parser.add_argument('--repeats', help='Number of times to repeat each measurement', default=3, type=int)
+    args = parser.parse_args()
+
+    supercell = read(args.cif) * (2, 2, 2)
+    for n_frames in args.frames:
+        frames = []
+        for i in range(n_frames):
+            atoms = supercell.copy()
+            atoms.rattle(0.1, seed=i)
+            frames.append((i * 1000, atoms))
+
+        poscar = [(i, write_to_string(a, 'vasp')) for i, a in frames]
+        traj = Trajectory.from_frames(frames)
+
+        def _parse_poscar(x):
+            return [(i, read_from_string(s, 'vasp')) for i, s in x]
+
+        methods = {
+            ('poscar', 'pickle'): (poscar, pickle.dumps, lambda x: _parse_poscar(pickle.loads(x))),
+            ('poscar', 'bson'): (poscar, lambda x: BSON.encode({'traj': x}), lambda x: _parse_poscar(BSON(x).decode()['traj'])),
+            ('trajectory', 'pickle'): (traj, pickle.dumps, pickle.loads),
+            ('trajectory', 'bson'): (traj, lambda x: BSON.encode(x.to_dict()), lambda x: Trajectory.from_dict(BSON(x).decode())),
+        }
+        for (storage, encoding), (obj, encode, decode) in methods.items():
+            for _ in range(args.repeats):
+                size, encode_time, decode_time = test_function(obj, encode, decode)
+                with open('runtimes.json', 'a') as fp:
+                    print(json.dumps({
+                        'host': node(),
+                        'cif': args.cif,
+                        'natoms': len(supercell),
+                        'frames': n_frames,
+                        'storage': storage,
+                        'encoding': encoding,
+                        'size': size,
+                        'encode_time': encode_time,
+                        'decode_time': decode_time,
+                    }), file=fp)
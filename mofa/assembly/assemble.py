@@ -1,25 +1,131 @@
 """Functions for assembling a MOF structure"""
-from tempfile import TemporaryDirectory
+from collections import Counter
+from dataclasses import dataclass
+from functools import cache
 from typing import Sequence
 from pathlib import Path
 from random import choice
 import itertools
 import os
-import io
 
 import pandas as pd
 import numpy as np
 import pymatgen.core as mg
-from rdkit import Chem
+from ase.io import read
+import ase
 
 from mofa.model import NodeDescription, LigandDescription, MOFRecord
+from mofa.utils.conversions import read_from_string
 
 _bond_length_path = Path(__file__).parent / "OChemDB_bond_threshold.csv"
 
+_dummy_elements = {'COO': 'At', 'cyano': 'Fr', 'pyridine': 'Fr'}
+"""Element used to mark where each type of anchor attaches to a node"""
+_connecting_elements = {'COO': 'C', 'cyano': 'N', 'pyridine': 'N'}
+"""Element of the ligand atom which ends up at the anchor site of the node"""
+
+
+@dataclass(frozen=True)
+class AssemblyRecipe:
+    """Instructions for building a MOF from a certain type of node in a certain topology
+
+    The ligands are placed along pairs of dummy atoms in the node which point in opposite directions,
+    and the distance spanned by each ligand defines one of the lattice vectors.
+    """
+
+    node_type: str
+    """Name of the type of node"""
+    topology: str
+    """Name of the topology"""
+    slots: tuple[str, ...]
+    """Anchor type of the ligand placed along each lattice direction, in the order the ligands are used"""
+
+    @property
+    def requirements(self) -> dict[str, int]:
+        """Number of ligands required for each anchor type"""
+        return dict(Counter(self.slots))
+
+    @property
+    def node_anchors(self) -> dict[str, int]:
+        """Number of dummy atoms of each element expected in the node"""
+        return dict(Counter(_dummy_elements[a] for a in self.slots for _ in range(2)))
+
+    def matches(self, node: NodeDescription) -> bool:
+        """Whether a node has the anchor points needed by this recipe
+
+        Args:
+            node: Description of the node
+        Returns:
+            Whether the recipe applies to this node
+        """
+        symbols = read_from_string(node.xyz, 'xyz').get_chemical_symbols()
+        found = Counter(s for s in symbols if s in set(_dummy_elements.values()))
+        return found == Counter(self.node_anchors)
+
+    def assemble(self, node: NodeDescription, ligands: dict[str, Sequence[LigandDescription]]) -> str:
+        """Assemble a MOF
+
+        Args:
+            node: Description of the node
+            ligands: A map of anchor type to chosen ligands, must match :attr:`requirements`
+        Returns:
+            The structure in POSCAR format
+        """
+
+        # Make sure we have the correct number of linkers
+        for anchor_type, expected in self.requirements.items():
+            found = len(ligands.get(anchor_type, []))
+            if found != expected:
+                raise ValueError(f'Expected {expected} ligands for {anchor_type}, found {found}')
+
+        # Match each slot with a ligand
+        remaining = dict((k, list(v)) for k, v in ligands.items())
+        linkers = [remaining[anchor_type].pop(0).replace_with_dummy_atoms() for anchor_type in self.slots]
+
+        struct = place_linkers(read_from_string(node.xyz, 'xyz'), linkers, self.slots)
+        if not check_bond_lengths(struct):
+            raise ValueError('Failed to create structure')
+        return struct.to(fmt='poscar')
+
+
+_recipes: dict[tuple[str, str], AssemblyRecipe] = {}
+"""Assembly recipes keyed by node type and topology"""
+
+
+def register_recipe(recipe: AssemblyRecipe):
+    """Add an assembly recipe to the registry
+
+    Args:
+        recipe: Recipe to be added. Replaces any recipe with the same node type and topology
+    """
+    _recipes[(recipe.node_type, recipe.topology)] = recipe
+
+
+register_recipe(AssemblyRecipe(node_type='paddlewheel_pillar', topology='pcu', slots=('cyano', 'COO', 'COO')))
+register_recipe(AssemblyRecipe(node_type='carboxylate_6c', topology='pcu', slots=('COO', 'COO', 'COO')))
+
+
+def find_recipe(node: NodeDescription, topology: str) -> AssemblyRecipe:
+    """Find the assembly recipe for a certain node and topology
+
+    Args:
+        node: Description of the node
+        topology: Name of the topology
+    Returns:
+        The matching recipe
+    """
+    for (_, recipe_topology), recipe in _recipes.items():
+        if recipe_topology == topology and recipe.matches(node):
+            return recipe
+    raise NotImplementedError('No assembly methods for linker/topology pair')
+
 
 def assemble_many(ligand_options: dict[str, list[LigandDescription]], nodes: list[NodeDescription], to_make: int, attempts: int) -> list[MOFRecord]:
     """Make many MOFs
 
+    Picks a node at random for each MOF, then a topology from the recipes
+    available for that node which can be made from the types of ligands provided.
+
     Args:
         ligand_options: Many choices for each type of ligand
         nodes: List of nodes used for assembly
@@ -29,23 +135,32 @@ def assemble_many(ligand_options: dict[str, list[LigandDescription]], nodes: lis
         Up to the target number of MOFs
     """
 
+    # Find the recipes which apply to each node and have the available ligands
+    options = []
+    for node in nodes:
+        for recipe in _recipes.values():
+            if recipe.matches(node) and all(len(ligand_options.get(a, [])) > 0 for a in recipe.requirements):
+                options.append((node, recipe))
+    if len(options) == 0:
+        raise ValueError('No assembly recipes are available for these nodes and ligands')
+
     output = []
     attempts_remaining = to_make * attempts
     while len(output) < to_make and attempts_remaining > 0:
         attempts_remaining -= 1
 
         # Get a sample of ligands
+        node, recipe = choice(options)
         ligand_choices = {}
-        requirements = {'COO': 2, 'cyano': 1}  # TODO (wardlt): Do not hard code this
-        for anchor_type, count in requirements.items():
+        for anchor_type, count in recipe.requirements.items():
             ligand_choices[anchor_type] = [choice(ligand_options[anchor_type])] * count
 
         # Attempt assembly
         try:
             new_mof = assemble_mof(
-                nodes=nodes,
+                nodes=[node],
                 ligands=ligand_choices,
-                topology='pcu'
+                topology=recipe.topology
             )
         except (ValueError, KeyError, IndexError):
             continue
@@ -53,133 +168,154 @@ def assemble_many(ligand_options: dict[str, list[LigandDescription]], nodes: lis
     return output
 
 
-def readPillaredPaddleWheelXYZ(fpath, dummyElementCOO="At", dummyElementPillar="Fr"):
-    """Read xyz file of a paddlewheel node
+def pair_anchors(positions: np.ndarray) -> list[tuple[int, int]]:
+    """Group anchor points into pairs which point in opposite directions
 
-    Args:
-        fpath: xyz file path
-        dummyElementCOO: dummy element for anchoring the -C(=O)O group
-        dummyElementPillar: dummy element for anchoring the aromatic N group
-
-    Returns:
-        Pandas of node [element, x, y, z], -COO anchor ID pairs in the opposite directions, -N anchor ID pairs in the opposite directions
-    """
-    df = pd.read_csv(fpath, sep=r"\s+", skiprows=2, names=["el", "x", "y", "z"])
-    COOAnchorIds = df[df["el"] == dummyElementCOO].index.tolist()
-    PillarAnchorIds = df[df["el"] == dummyElementPillar].index.tolist()
-    df["maxDist"] = 0.
-    anchorPairs = []
-    while len(COOAnchorIds) > 0:
-        currAnchor = COOAnchorIds[-1]
-        COOAnchorIds = COOAnchorIds[:-1]
-        df.loc[COOAnchorIds, "maxDist"] = np.linalg.norm(df.loc[currAnchor, ["x", "y", "z"]].astype(float).values -
-                                                         df.loc[COOAnchorIds, ["x", "y", "z"]].values, axis=1)
-
-        pairAnchor = df[df["maxDist"] == df.loc[COOAnchorIds, "maxDist"].max()].index[0]
-        COOAnchorIds = COOAnchorIds[:COOAnchorIds.index(pairAnchor)] + COOAnchorIds[COOAnchorIds.index(pairAnchor) + 1:]
-        anchorPairs.append([currAnchor, pairAnchor])
-    return df[["el", "x", "y", "z"]], anchorPairs, PillarAnchorIds
-
-
-def readTetramerXYZ(fpath, dummyElement="At"):
-    """Read xyz file of a tetramer node
+    Pairs the last unmatched anchor with the unmatched anchor farthest from it,
+    keeping the original order if there is only a single pair.
 
     Args:
-        fpath: xyz file path
-        dummyElementCOO: dummy element for anchoring the -C(=O)O group
-
+        positions: Positions of the anchor points
     Returns:
-        Pandas of node element, x, y, z, and anchor ID pairs
+        Indices of each pair of anchors
     """
-    df = pd.read_csv(fpath, sep=r"\s+", skiprows=2, names=["el", "x", "y", "z"])
-    anchorIds = df[df["el"] == dummyElement].index.tolist()
-    df["maxDist"] = 0.
-    anchorPairs = []
-    while len(anchorIds) > 0:
-        currAnchor = anchorIds[-1]
-        anchorIds = anchorIds[:-1]
-        df.loc[anchorIds, "maxDist"] = np.linalg.norm(df.loc[currAnchor, ["x", "y", "z"]].astype(float).values -
-                                                      df.loc[anchorIds, ["x", "y", "z"]].values, axis=1)
+    if len(positions) == 2:
+        return [(0, 1)]
 
-        pairAnchor = df[df["maxDist"] == df.loc[anchorIds, "maxDist"].max()].index[0]
-        anchorIds = anchorIds[:anchorIds.index(pairAnchor)] + anchorIds[anchorIds.index(pairAnchor) + 1:]
-        anchorPairs.append([currAnchor, pairAnchor])
+    dists = np.linalg.norm(positions[:, None, :] - positions[None, :, :], axis=-1)
+    remaining = list(range(len(positions)))
+    pairs = []
+    while len(remaining) > 0:
+        current = remaining.pop()
+        partner = remaining[int(np.argmax(dists[current, remaining]))]
+        remaining.remove(partner)
+        pairs.append((current, partner))
+    return pairs
 
-    return df[["el", "x", "y", "z"]], anchorPairs
 
-
-def readCOOLinkerXYZ(fpath, dummyElement="At"):
-    """Read xyz file of a -COO type connect-2 ligand
+def rotations_to_align(vec1: np.ndarray, vec2: np.ndarray) -> np.ndarray:
+    """Compute the rotation matrices which align each of a batch of vectors with another
 
     Args:
-        fpath: xyz file path
-        dummyElement: dummy element for anchoring the -C(=O)O group
-
+        vec1: Source vectors, shape (n, 3)
+        vec2: Destination vectors, shape (n, 3)
     Returns:
-        Pandas of node element, x, y, z, and anchor ID pairs
+        Rotation matrices, shape (n, 3, 3), which rotate each source vector onto the direction of its destination
     """
-    df = pd.read_csv(fpath, sep=r"\s+", skiprows=2, names=["el", "x", "y", "z"])
-    anchorIds = df[df["el"] == dummyElement].index.tolist()
-    return df, anchorIds
+    # https://stackoverflow.com/questions/45142959/calculate-rotation-matrix-to-align-two-vectors-in-3d-space
+    a = vec1 / np.linalg.norm(vec1, axis=1, keepdims=True)
+    b = vec2 / np.linalg.norm(vec2, axis=1, keepdims=True)
+    v = np.cross(a, b)
+    c = np.sum(a * b, axis=1)
+    s2 = np.sum(v * v, axis=1)
+
+    kmat = np.zeros((len(a), 3, 3))
+    kmat[:, 0, 1], kmat[:, 0, 2] = -v[:, 2], v[:, 1]
+    kmat[:, 1, 0], kmat[:, 1, 2] = v[:, 2], -v[:, 0]
+    kmat[:, 2, 0], kmat[:, 2, 1] = -v[:, 1], v[:, 0]
+
+    parallel = s2 < 1e-16
+    scale = np.divide(1 - c, s2, out=np.zeros_like(c), where=~parallel)
+    output = np.eye(3) + kmat + np.matmul(kmat, kmat) * scale[:, None, None]
+
+    # Vectors which are already (anti)parallel need either no rotation or a half turn about a perpendicular axis
+    for i in np.flatnonzero(parallel & (c < 0)):
+        axis = np.cross(a[i], np.eye(3)[np.argmin(np.abs(a[i]))])
+        axis /= np.linalg.norm(axis)
+        output[i] = 2 * np.outer(axis, axis) - np.eye(3)
+    return output
 
 
-def readNbasedLinkerXYZ(fpath, dummyElement="Fr"):
-    """Read xyz file of a -N type connect-2 ligand
+def place_linkers(node: ase.Atoms, linkers: Sequence[ase.Atoms], anchor_types: Sequence[str]) -> mg.Structure:
+    """Place linkers along the anchor points of a node to form a periodic structure
 
-    Args:
-        fpath: xyz file path
-        dummyElement: dummy element for anchoring the -N group
+    Each linker is rotated and translated such that it spans a pair of opposite anchor points of the node,
+    and the distance between the far end of the linker and its matching anchor defines one lattice vector.
+    The transformations for all linkers are computed together.
 
+    Args:
+        node: Node structure, with dummy atoms marking the anchor points
+        linkers: Linkers with dummy atoms marking their anchor points, one per lattice vector
+        anchor_types: Anchor type of each linker
     Returns:
-        Pandas of node element, x, y, z, and anchor ID pairs
+        Assembled structure, with atoms from each linker in order followed by those of the node
     """
-    df = pd.read_csv(fpath, sep=r"\s+", skiprows=2, names=["el", "x", "y", "z"])
-    anchorIds = df[df["el"] == dummyElement].index.tolist()
-    return df, anchorIds
 
+    # Find the node anchor pairs used for each linker
+    node_symbols = np.array(node.get_chemical_symbols())
+    node_pairs = {}
+    for element in set(_dummy_elements[a] for a in anchor_types):
+        anchor_ids = np.flatnonzero(node_symbols == element)
+        node_pairs[element] = [anchor_ids[list(p)] for p in pair_anchors(node.positions[anchor_ids])]
+    node_pairs = np.array([node_pairs[_dummy_elements[a]].pop(0) for a in anchor_types])  # (n, 2)
+
+    # Pad the linker positions into a single array and locate the anchor and connecting atoms
+    n_linkers = len(linkers)
+    max_atoms = max(len(x) for x in linkers)
+    positions = np.zeros((n_linkers, max_atoms, 3))
+    linker_anchors = np.zeros((n_linkers, 2), dtype=int)
+    linker_connect = np.zeros((n_linkers, 2), dtype=int)
+    keep = []
+    for i, (linker, anchor_type) in enumerate(zip(linkers, anchor_types)):
+        symbols = np.array(linker.get_chemical_symbols())
+        positions[i, :len(linker)] = linker.positions
+        linker_anchors[i] = np.flatnonzero(symbols == _dummy_elements[anchor_type])[:2]
+
+        # The connecting atom is the nearest atom of the appropriate type to each anchor
+        candidates = np.flatnonzero(symbols == _connecting_elements[anchor_type])
+        dists = np.linalg.norm(linker.positions[linker_anchors[i], None, :] - linker.positions[None, candidates, :], axis=-1)
+        linker_connect[i] = candidates[np.argmin(dists, axis=1)]
+        keep.append((symbols, symbols != _dummy_elements[anchor_type]))
+
+    # Rotate all linkers so that they point along the anchor pair, then move them to their anchor
+    rows = np.arange(n_linkers)
+    node_vec = node.positions[node_pairs[:, 0]] - node.positions[node_pairs[:, 1]]
+    linker_vec = positions[rows, linker_anchors[:, 0]] - positions[rows, linker_anchors[:, 1]]
+    rotations = rotations_to_align(-linker_vec, node_vec)
+    positions = np.einsum('nij,nmj->nmi', rotations, positions)
+    positions += (node.positions[node_pairs[:, 0]] - positions[rows, linker_connect[:, 0]])[:, None, :]
+    lattice = node.positions[node_pairs[:, 1]] - positions[rows, linker_connect[:, 1]]
+
+    # Assemble the structure without the dummy atoms
+    dummies = set(_dummy_elements[a] for a in anchor_types)
+    node_keep = ~np.isin(node_symbols, list(dummies))
+    species = np.concatenate([s[k] for s, k in keep] + [node_symbols[node_keep]])
+    coords = np.concatenate([positions[i, :len(k)][k] for i, (_, k) in enumerate(keep)] + [node.positions[node_keep]])
+    return mg.Structure(lattice, species.tolist(), coords, coords_are_cartesian=True)
+
+
+@cache
+def _load_bond_thresholds() -> dict[str, float]:
+    """Load the minimum allowed distance between pairs of elements"""
+    df = pd.read_csv(_bond_length_path, index_col=0)
+    return dict(zip(df["element"], df["min"] - (df["stddev"] * 0.01)))
 
-def pandas2xyzfile(df, fpath, useStringIO=False):
-    """write a Pandas with [element, x, y, z] to a xyz file
 
-    Args:
-        df: Pandas with [element, x, y, z]
-        fpath: xyz file path
-        useStringIO: whether to write Pandas content into a string
-
-    Returns:
-        string of xyz file if useStringIO enabled, or empty string if useStringIO disabled
-    """
-    if useStringIO:
-        return str(len(df)) + "\n\n" + df.to_string(header=None, index=None)
-    else:
-        with io.open(fpath, "w", newline="\n") as wf:
-            wf.write(str(len(df)) + "\n\n" + df.to_string(header=None, index=None))
-        return ""
+def check_bond_lengths(struct: mg.Structure) -> bool:
+    """Check whether all atoms in a structure are farther apart than the shortest bond observed between their elements
 
-
-def rotmat2align(vec1, vec2):
-    """return a rotation matrix that rotates a 3D vector to align with another 3D vector
+    Uses the sum of the atomic radii for pairs of elements without bond length data.
 
     Args:
-        vec1: input vector 1
-        vec2: input vector 2
-
+        struct: Structure to evaluate
     Returns:
-        3x3 rotation matrix
+        Whether all distances are acceptable
     """
-    # https://stackoverflow.com/questions/45142959/calculate-rotation-matrix-to-align-two-vectors-in-3d-space
-    """ Find the rotation matrix that aligns vec1 to vec2
-    :param vec1: A 3d "source" vector
-    :param vec2: A 3d "destination" vector
-    :return mat: A transform matrix (3x3) which when applied to vec1, aligns it with vec2.
-    """
-    a, b = (vec1 / np.linalg.norm(vec1)).reshape(3), (vec2 / np.linalg.norm(vec2)).reshape(3)
-    v = np.cross(a, b)
-    c = np.dot(a, b)
-    s = np.linalg.norm(v)
-    kmat = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
-    rotation_matrix = np.eye(3) + kmat + kmat.dot(kmat) * ((1 - c) / (s ** 2))
-    return rotation_matrix
+
+    # Compute the threshold for each unique pair of elements
+    elements, types = np.unique([s.symbol for s in struct.species], return_inverse=True)
+    known = _load_bond_thresholds()
+    thresholds = np.zeros((len(elements), len(elements)))
+    for (i, x), (j, y) in itertools.product(enumerate(elements), repeat=2):
+        key = "-".join(sorted([x, y]))
+        if key in known:
+            thresholds[i, j] = known[key]
+        else:
+            thresholds[i, j] = sum(mg.periodic_table.Element(e).atomic_radius_calculated or 0. for e in (x, y))
+
+    dist_mat = struct.distance_matrix
+    dist_mat[dist_mat == 0] = np.inf
+    return bool(np.all(dist_mat > thresholds[types[:, None], types[None, :]]))
 
 
 def assemble_COO_pcuMOF(nodePath, linkerPaths, newMOFpath, dummyElement="At"):
@@ -192,86 +328,16 @@ def assemble_COO_pcuMOF(nodePath, linkerPaths, newMOFpath, dummyElement="At"):
         dummyElement: dummy element for anchoring positions
 
     Returns:
-        returnValue a cif file path if assembly succeeded, None if failed
+        returnValue a cif file path if assembly succeeded, empty string if failed
     """
+    if dummyElement != _dummy_elements['COO']:
+        raise ValueError(f'The dummy element for -COO ligands must be {_dummy_elements["COO"]}')
     MOFRootdir = os.path.split(newMOFpath)[0]
     os.makedirs(MOFRootdir, exist_ok=True)
-    Chem.rdchem.Atom(dummyElement).GetAtomicNum()
-
-    node_df, nodeAnchors = readTetramerXYZ(nodePath)
-    linkerAnchors = [None for x in range(3)]
-    linker_dfs = [None for x in range(3)]
-    linker_dfs[0], linkerAnchors[0] = readCOOLinkerXYZ(linkerPaths[0])
-    linker_dfs[1], linkerAnchors[1] = readCOOLinkerXYZ(linkerPaths[1])
-    linker_dfs[2], linkerAnchors[2] = readCOOLinkerXYZ(linkerPaths[2])
-    ldf = []
-    latVec = []
-    for _i_ in range(len(nodeAnchors)):
-        noderAnchorPair = nodeAnchors[_i_]
-        nodeAnchor1POS = node_df.loc[noderAnchorPair[0], ["x", "y", "z"]].astype(float).values
-        nodePaired2POS = node_df.loc[noderAnchorPair[1], ["x", "y", "z"]].astype(float).values
-        anchorPairVec = nodeAnchor1POS - nodePaired2POS
-        linker_df = linker_dfs[_i_]
-        linkerAnchorPair = linkerAnchors[_i_]
-
-        # translate to align n1 and l1
-        linkerAnchor1POS = linker_df.loc[linkerAnchorPair[0], ["x", "y", "z"]].astype(float).values
-        linker_df["dist2"] = np.sum((linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor1POS) *
-                                    (linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor1POS),
-                                    axis=1)
-        linkerCarbon1Idx = linker_df[linker_df["dist2"] == linker_df[linker_df["el"] == "C"]["dist2"].min()].index.tolist()[0]
-
-        linkerAnchor2POS = linker_df.loc[linkerAnchorPair[1], ["x", "y", "z"]].astype(float).values
-        linker_df["dist2"] = np.sum((linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor2POS) *
-                                    (linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor2POS),
-                                    axis=1)
-        linkerCarbon2Idx = linker_df[linker_df["dist2"] == linker_df[linker_df["el"] == "C"]["dist2"].min()].index.tolist()[0]
-
-        linkerAnchorVec = linkerAnchor1POS - linkerAnchor2POS
-
-        rotmat = rotmat2align(-linkerAnchorVec, anchorPairVec)
-        linker_df.loc[:, ["x", "y", "z"]] = rotmat.dot(linker_df.loc[:, ["x", "y", "z"]].values.T).T
-
-        displacementVec = (node_df.loc[noderAnchorPair[0], ["x", "y", "z"]].astype(float).values -
-                           linker_df.loc[linkerCarbon1Idx, ["x", "y", "z"]].astype(float).values)
-        linker_df.loc[:, ["x", "y", "z"]] = linker_df.loc[:, ["x", "y", "z"]].values + displacementVec
-
-        ldf.append(linker_df[linker_df["el"] != dummyElement].copy(deep=True))
-        farAnchorNLPairDispVec = (node_df.loc[noderAnchorPair[1], ["x", "y", "z"]].astype(float).values -
-                                  linker_df.loc[linkerCarbon2Idx, ["x", "y", "z"]].astype(float).values)
-        latVec.append(farAnchorNLPairDispVec)
-        # pandas2xyzfile(linker_df, os.path.join(newMOFdir, "linker-"+str(_i_)+".xyz"))
-
-    # pandas2xyzfile(node_df, os.path.join(newMOFpath, "node.xyz"))
-    final_df = pd.concat(ldf + [node_df[node_df["el"] != dummyElement].copy(deep=True)], axis=0)
-    final_df = final_df[final_df["el"] != dummyElement].reset_index(drop=True)[["el", "x", "y", "z"]]
-    xyzstr = pandas2xyzfile(final_df, os.path.join(MOFRootdir, "mofCart.xyz"), useStringIO=True)
-
-    mol = mg.Molecule.from_str(xyzstr, fmt="xyz")
-    # try:
-    #     os.remove(os.path.join(MOFRootdir, "mofCart.xyz"))
-    # except:
-    #     print(os.path.join(MOFRootdir, "mofCart.xyz") + " does not exist!\n")
-    MOFstruct = mg.Structure(np.array(latVec),
-                             mol.species,
-                             mol.cart_coords,
-                             coords_are_cartesian=True)
-
-    df = pd.read_csv("OChemDB_bond_threshold.csv", index_col=0)
-    element2bondLengthMap = dict(zip(df["element"], df["min"] - (df["stddev"] * 0.01)))
-    unique_bond_el = list(set(list(itertools.chain(*[["-".join(sorted([x.symbol, y.symbol])) for x in MOFstruct.species] for y in MOFstruct.species]))))
-    unique_bond_el = unique_bond_el + ["Fr-Se"]
-    for x in unique_bond_el:
-        if x not in element2bondLengthMap:
-            element2bondLengthMap[x] = 0.
-            for y in x.split("-"):
-                if not isinstance(mg.periodic_table.Element(y).atomic_radius_calculated, type(None)):
-                    element2bondLengthMap[x] = element2bondLengthMap[x] + mg.periodic_table.Element(y).atomic_radius_calculated
-    distMat = MOFstruct.distance_matrix
-    distMat[distMat == 0] = np.inf
-    bondLengthThresMat = np.array([[element2bondLengthMap["-".join(sorted([x.symbol, y.symbol]))] for x in MOFstruct.species] for y in MOFstruct.species])
-    if np.all(distMat > bondLengthThresMat):
-        MOFstruct.to(filename=newMOFpath + ".cif", fmt="cif")
+
+    struct = place_linkers(read(nodePath), [read(p) for p in linkerPaths], ['COO'] * 3)
+    if check_bond_lengths(struct):
+        struct.to(filename=newMOFpath + ".cif", fmt="cif")
         return newMOFpath + ".cif"
     else:
         return ""
@@ -294,120 +360,13 @@ def assemble_pillaredPaddleWheel_pcuMOF(nodePath,
     Returns:
         A CIF-format version of the structure
     """
+    if (dummyElementCOO, dummyElementPillar) != (_dummy_elements['COO'], _dummy_elements['cyano']):
+        raise ValueError(f'The dummy elements must be {_dummy_elements["COO"]} for -COO and {_dummy_elements["cyano"]} for -N')
 
-    # Make sure the dummy atoms are valid elements
-    Chem.rdchem.Atom(dummyElementCOO).GetAtomicNum()
-    Chem.rdchem.Atom(dummyElementPillar).GetAtomicNum()
-
-    node_df, nodeAnchorsCOO, nodeAnchorsPillar = readPillaredPaddleWheelXYZ(nodePath)
-
-    linkerAnchors = [None for x in range(2)]
-    linker_dfs = [None for x in range(2)]
-    linker_dfs[0], linkerAnchors[0] = readCOOLinkerXYZ(COOLinkerPaths[0])
-    linker_dfs[1], linkerAnchors[1] = readCOOLinkerXYZ(COOLinkerPaths[1])
-    Pillarlinker_df, PillarlinkerAnchors = readNbasedLinkerXYZ(PillarLinkerPath)
-    ldf = []
-    latVec = []
-
-    noderAnchorPair = nodeAnchorsPillar
-    nodeAnchor1POS = node_df.loc[noderAnchorPair[0], ["x", "y", "z"]].astype(float).values
-    nodePaired2POS = node_df.loc[noderAnchorPair[1], ["x", "y", "z"]].astype(float).values
-    anchorPairVec = nodeAnchor1POS - nodePaired2POS
-    linker_df = Pillarlinker_df
-    linkerAnchorPair = PillarlinkerAnchors
-
-    # translate to align n1 and l1
-    linkerAnchor1POS = linker_df.loc[linkerAnchorPair[0], ["x", "y", "z"]].astype(float).values
-    linker_df["dist2"] = np.sum((linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor1POS) *
-                                (linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor1POS),
-                                axis=1)
-    linkerNitrogen1Idx = linker_df[linker_df["dist2"] == linker_df[linker_df["el"] == "N"]["dist2"].min()].index.tolist()[0]
-
-    linkerAnchor2POS = linker_df.loc[linkerAnchorPair[1], ["x", "y", "z"]].astype(float).values
-    linker_df["dist2"] = np.sum((linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor2POS) *
-                                (linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor2POS),
-                                axis=1)
-    linkerNitrogen2Idx = linker_df[linker_df["dist2"] == linker_df[linker_df["el"] == "N"]["dist2"].min()].index.tolist()[0]
-
-    linkerAnchorVec = linkerAnchor1POS - linkerAnchor2POS
-
-    rotmat = rotmat2align(-linkerAnchorVec, anchorPairVec)
-    linker_df.loc[:, ["x", "y", "z"]] = rotmat.dot(linker_df.loc[:, ["x", "y", "z"]].values.T).T
-
-    displacementVec = (node_df.loc[noderAnchorPair[0], ["x", "y", "z"]].astype(float).values -
-                       linker_df.loc[linkerNitrogen1Idx, ["x", "y", "z"]].astype(float).values)
-    linker_df.loc[:, ["x", "y", "z"]] = linker_df.loc[:, ["x", "y", "z"]].values + displacementVec
-
-    ldf.append(linker_df[linker_df["el"] != dummyElementPillar].copy(deep=True))
-    farAnchorNLPairDispVec = (node_df.loc[noderAnchorPair[1], ["x", "y", "z"]].astype(float).values -
-                              linker_df.loc[linkerNitrogen2Idx, ["x", "y", "z"]].astype(float).values)
-    latVec.append(farAnchorNLPairDispVec)
-
-    for _i_ in range(len(nodeAnchorsCOO)):
-        noderAnchorPair = nodeAnchorsCOO[_i_]
-        nodeAnchor1POS = node_df.loc[noderAnchorPair[0], ["x", "y", "z"]].astype(float).values
-        nodePaired2POS = node_df.loc[noderAnchorPair[1], ["x", "y", "z"]].astype(float).values
-        anchorPairVec = nodeAnchor1POS - nodePaired2POS
-        linker_df = linker_dfs[_i_]
-        linkerAnchorPair = linkerAnchors[_i_]
-
-        # translate to align n1 and l1
-        linkerAnchor1POS = linker_df.loc[linkerAnchorPair[0], ["x", "y", "z"]].astype(float).values
-        linker_df["dist2"] = np.sum((linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor1POS) *
-                                    (linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor1POS),
-                                    axis=1)
-        linkerCarbon1Idx = linker_df[linker_df["dist2"] == linker_df[linker_df["el"] == "C"]["dist2"].min()].index.tolist()[0]
-
-        linkerAnchor2POS = linker_df.loc[linkerAnchorPair[1], ["x", "y", "z"]].astype(float).values
-        linker_df["dist2"] = np.sum((linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor2POS) *
-                                    (linker_df.loc[:, ["x", "y", "z"]].astype(float).values - linkerAnchor2POS),
-                                    axis=1)
-        linkerCarbon2Idx = linker_df[linker_df["dist2"] == linker_df[linker_df["el"] == "C"]["dist2"].min()].index.tolist()[0]
-
-        linkerAnchorVec = linkerAnchor1POS - linkerAnchor2POS
-
-        rotmat = rotmat2align(-linkerAnchorVec, anchorPairVec)
-        linker_df.loc[:, ["x", "y", "z"]] = rotmat.dot(linker_df.loc[:, ["x", "y", "z"]].values.T).T
-
-        displacementVec = (node_df.loc[noderAnchorPair[0], ["x", "y", "z"]].astype(float).values -
-                           linker_df.loc[linkerCarbon1Idx, ["x", "y", "z"]].astype(float).values)
-        linker_df.loc[:, ["x", "y", "z"]] = linker_df.loc[:, ["x", "y", "z"]].values + displacementVec
-
-        ldf.append(linker_df[linker_df["el"] != dummyElementCOO].copy(deep=True))
-        farAnchorNLPairDispVec = (node_df.loc[noderAnchorPair[1], ["x", "y", "z"]].astype(float).values -
-                                  linker_df.loc[linkerCarbon2Idx, ["x", "y", "z"]].astype(float).values)
-        latVec.append(farAnchorNLPairDispVec)
-
-    # pandas2xyzfile(node_df, os.path.join(newMOFpath, "node.xyz"))
-    final_df = pd.concat(ldf + [node_df[(node_df["el"] != dummyElementCOO) & (node_df["el"] != dummyElementPillar)].copy(deep=True)], axis=0)
-    final_df = final_df[final_df["el"] != dummyElementCOO].reset_index(drop=True)[["el", "x", "y", "z"]]
-    xyzstr = pandas2xyzfile(final_df, None, useStringIO=True)
-
-    mol = mg.Molecule.from_str(xyzstr, fmt="xyz")
-    # try:
-    #     os.remove(os.path.join(MOFRootdir, "mofCart.xyz"))
-    # except:
-    #     print(os.path.join(MOFRootdir, "mofCart.xyz") + " does not exist!\n")
-    MOFstruct = mg.Structure(np.array(latVec),
-                             mol.species,
-                             mol.cart_coords,
-                             coords_are_cartesian=True)
-
-    df = pd.read_csv(_bond_length_path, index_col=0)
-    element2bondLengthMap = dict(zip(df["element"], df["min"] - (df["stddev"] * 0.01)))
-    unique_bond_el = list(set(list(itertools.chain(*[["-".join(sorted([x.symbol, y.symbol])) for x in MOFstruct.species] for y in MOFstruct.species]))))
-    unique_bond_el = unique_bond_el + ["Fr-Se"]
-    for x in unique_bond_el:
-        if x not in element2bondLengthMap:
-            element2bondLengthMap[x] = 0.
-            for y in x.split("-"):
-                if not isinstance(mg.periodic_table.Element(y).atomic_radius_calculated, type(None)):
-                    element2bondLengthMap[x] = element2bondLengthMap[x] + mg.periodic_table.Element(y).atomic_radius_calculated
-    distMat = MOFstruct.distance_matrix
-    distMat[distMat == 0] = np.inf
-    bondLengthThresMat = np.array([[element2bondLengthMap["-".join(sorted([x.symbol, y.symbol]))] for x in MOFstruct.species] for y in MOFstruct.species])
-    if np.all(distMat > bondLengthThresMat):
-        return MOFstruct.to(fmt="poscar")
+    linkers = [read(PillarLinkerPath)] + [read(p) for p in COOLinkerPaths]
+    struct = place_linkers(read(nodePath), linkers, ['cyano', 'COO', 'COO'])
+    if check_bond_lengths(struct):
+        return struct.to(fmt="poscar")
     else:
         raise ValueError('Failed to create structure')
 
@@ -425,45 +384,16 @@ def assemble_mof(nodes: Sequence[NodeDescription], ligands: dict[str, Sequence[L
         ligands updated to reflect the XYZ used in the structure
     """
 
-    # Step 1: Detect which node type, use that to pick the assembly method
-    with TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
-        if 'Zn' in nodes[0].xyz and topology == 'pcu':
-            # TODO (wardlt): Refactor to move all this to a separate function
-            # Make sure we have the correct number of linkers and nodes
-            requirements = {'COO': 2, 'cyano': 1}
-            for anchor_type, expected in requirements.items():
-                found = len(ligands.get(anchor_type, []))
-                if found != expected:
-                    raise ValueError(f'Expected {expected} ligands for {anchor_type}, found {found}')
-            if len(nodes) != 1:
-                raise ValueError('Expected 1 node for this topology')
-
-            # Write the XYZ files with dummy atoms to disk
-            # TODO (wardlt): Refactor the above methods to keep everything in memory
-            node_path = (tmpdir / 'node.xyz')
-            node_path.write_text(nodes[0].xyz)
-
-            pillar_path = tmpdir / 'pillar.xyz'
-            ligands['cyano'][0].replace_with_dummy_atoms().write(pillar_path)
-
-            coo_paths = []
-            for i, ligand in enumerate(ligands['COO']):
-                coo_paths.append(path := tmpdir / f'coo-{i}.xyz')
-                ligand.replace_with_dummy_atoms().write(path)
-
-            mof_poscar = assemble_pillaredPaddleWheel_pcuMOF(
-                node_path,
-                coo_paths,
-                pillar_path
-            )
-
-        else:
-            raise NotImplementedError('No assembly methods for linker/topology pair')
+    # Detect which node type, use that to pick the assembly method
+    if len(nodes) != 1:
+        raise ValueError('Expected 1 node for this topology')
+    recipe = find_recipe(nodes[0], topology)
+    mof_poscar = recipe.assemble(nodes[0], ligands)
 
     # Assemble the full system
     return MOFRecord(
         structure=mof_poscar,
+        topology=topology,
         nodes=tuple(nodes),
         ligands=tuple(itertools.chain(*ligands.values()))
     )
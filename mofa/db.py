@@ -1,6 +1,5 @@
 """Utilities for writing data to disk using MongoDB"""
 
-from dataclasses import asdict
 from typing import Iterator
 
 from pymongo import MongoClient, ASCENDING
@@ -32,9 +31,35 @@ def initialize_database(client: MongoClient) -> Collection:
         ('structure_stability.uff', ASCENDING),
         ('gas_storage.CO2', ASCENDING)
     ])  # Queries for training sets
+
+    migrate_trajectories(collection)
     return collection
 
 
+def migrate_trajectories(coll: Collection) -> int:
+    """Convert trajectories stored as lists of timestep and POSCAR pairs to the form of :meth:`Trajectory.to_dict`
+
+    Queries on the timesteps of a trajectory (e.g., in :class:`~mofa.selection.md.MDSelector`) only match the newer form.
+
+    Args:
+        coll: Collection holding our MOF data
+    Returns:
+        Number of records converted
+    """
+    legacy = coll.aggregate([
+        {'$project': {'name': 1, 'levels': {'$objectToArray': '$md_trajectory'}}},
+        {'$unwind': '$levels'},
+        {'$match': {'levels.v': {'$type': 'array'}}},
+        {'$group': {'_id': '$name'}},
+    ])
+    names = [row['_id'] for row in legacy]
+    for record in get_records(coll, names):  # Records convert the trajectories when created
+        coll.update_one({'name': record.name}, {'$set': {
+            'md_trajectory': dict((k, v.to_dict()) for k, v in record.md_trajectory.items())
+        }})
+    return len(names)
+
+
 def get_records(coll: Collection, name: list[str]) -> list[MOFRecord]:
     """Get the records associated with a list names
 
@@ -69,7 +94,7 @@ def create_records(coll: Collection, records: list[MOFRecord]):
         records: Records to be inserted
     """
 
-    coll.insert_many(asdict(r) for r in records)
+    coll.insert_many(r.to_dict() for r in records)
 
 
 def update_records(coll: Collection, records: list[MOFRecord]):
@@ -81,7 +106,7 @@ def update_records(coll: Collection, records: list[MOFRecord]):
     """
 
     for record in records:
-        coll.update_one({'name': record.name}, {'$set': asdict(record)}, upsert=True)
+        coll.update_one({'name': record.name}, {'$set': record.to_dict()}, upsert=True)
 
 
 def count_records(coll: Collection) -> int:
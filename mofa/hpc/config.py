@@ -14,8 +14,11 @@ from parsl.providers import LocalProvider
 
 from mofa.simulation.dft.base import BaseDFTRunner
 from mofa.simulation.raspa.base import BaseRaspaRunner
+from mofa.simulation.raspa.charges import charge_engines
+from mofa.simulation.scratch import ScratchManager
 
 RASPAVersion = Literal['raspa2', 'raspa3', 'graspa', 'graspa_sycl']
+ChargeMethod = Literal['chargemol', 'qeq']
 DFTVersion = Literal['cp2k', 'pwdft']
 
 
@@ -56,6 +59,12 @@ class HPCConfig(BaseModel):
     """Command used to launch gRASPA-sycl"""
     raspa_delete_finished: bool = True
     """Whether to delete RASPA run files after execution"""
+    raspa_charges: ChargeMethod = 'chargemol'
+    """Method used to assign partial charges before GCMC. Only ``chargemol`` requires DFT"""
+    scratch_dir: Path | None = Field(default=None)
+    """Fast, node-local directory (e.g., a RAM disk) in which to run RASPA. Default is to run in :attr:`run_dir`"""
+    scratch_quota: float | None = Field(default=None)
+    """Largest total size of files kept in a scratch directory before new runs are written to :attr:`run_dir` (GB)"""
     dft_version: DFTVersion = 'cp2k'
 
     # Settings related to distributed training
@@ -116,19 +125,46 @@ class HPCConfig(BaseModel):
         """Number of workers available for CP2K tasks"""
         raise NotImplementedError
 
-    def make_raspa_runner(self) -> BaseRaspaRunner:
-        """Make the RASPA runner appropriate for this workflow"""
+    def make_scratch(self, name: str, root: Path | None = None) -> ScratchManager | None:
+        """Make the manager for run directories of a certain type of task
 
-        run_dir = self.run_dir / 'raspa-runs'
+        Args:
+            name: Name of the subdirectory for this type of task
+            root: Fast directory in which to run. Default is :attr:`scratch_dir`
+        Returns:
+            Manager which prefers the scratch directory and falls back to :attr:`run_dir`,
+            or ``None`` if there is no scratch directory
+        """
+        root = self.scratch_dir if root is None else root
+        if root is None:
+            return None
+        return ScratchManager(Path(root) / name, fallback=self.run_dir.absolute() / name, quota=self.scratch_quota)
+
+    def make_raspa_runner(self, charges: ChargeMethod | None = None) -> BaseRaspaRunner:
+        """Make the RASPA runner appropriate for this workflow
+
+        Args:
+            charges: Method used to assign partial charges, which then also names the run directory.
+                Default is to use :attr:`raspa_charges`
+        """
+
+        run_name = 'raspa-runs' if charges is None else f'raspa-{charges}-runs'
+        run_dir = self.run_dir / run_name
+        scratch = self.make_scratch(run_name)
+        charges = charge_engines[self.raspa_charges if charges is None else charges]()
+        framework_dir = self.run_dir / 'raspa-frameworks'
         if self.raspa_version == 'raspa2':
             from mofa.simulation.raspa.raspa2 import RASPA2Runner
-            return RASPA2Runner(raspa_command=self.raspa_cmd, run_dir=run_dir, delete_finished=self.raspa_delete_finished)
+            return RASPA2Runner(raspa_command=self.raspa_cmd, run_dir=run_dir, delete_finished=self.raspa_delete_finished, scratch=scratch,
+                                charges=charges, framework_dir=framework_dir)
         elif self.raspa_version == 'graspa':
             from mofa.simulation.raspa.graspa import gRASPARunner
-            return gRASPARunner(raspa_command=self.raspa_cmd, run_dir=run_dir, delete_finished=self.raspa_delete_finished)
+            return gRASPARunner(raspa_command=self.raspa_cmd, run_dir=run_dir, delete_finished=self.raspa_delete_finished, scratch=scratch,
+                                charges=charges, framework_dir=framework_dir)
         elif self.raspa_version == 'graspa_sycl':
             from mofa.simulation.raspa.graspa_sycl import GRASPASyclRunner
-            return GRASPASyclRunner(raspa_command=self.raspa_cmd, run_dir=run_dir, delete_finished=self.raspa_delete_finished)
+            return GRASPASyclRunner(raspa_command=self.raspa_cmd, run_dir=run_dir, delete_finished=self.raspa_delete_finished, scratch=scratch,
+                                    charges=charges, framework_dir=framework_dir)
         else:
             raise NotImplementedError(f'No support for {self.raspa_version} yet.')
 
@@ -1,11 +1,12 @@
 """Data models for a MOF class"""
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, asdict, replace
 from functools import cached_property
 from datetime import datetime
 from hashlib import sha512
 from pathlib import Path
 from io import StringIO
 from uuid import uuid4
+import binascii
 import json
 
 import yaml
@@ -19,6 +20,7 @@ from rdkit import Chem
 from rdkit.Chem import rdDetermineBonds, AllChem
 
 from mofa.utils.conversions import read_from_string, write_to_string
+from mofa.utils.trajectory import Trajectory
 from mofa.utils.xyz import unsaturated_xyz_to_xyz
 from mofa.utils.src import const
 
@@ -402,25 +404,34 @@ class MOFRecord:
     # Information about the 3D structure of the MOF
     structure: str | None = field(default=None, repr=False)
     """A representative 3D structure of the MOF in POSCAR format"""
+    assembled_structure: str | None = field(default=None, repr=False)
+    """The structure as assembled in POSCAR format, kept once :attr:`structure` is replaced by a relaxed structure"""
 
     # Detailed outputs from simulations
-    md_trajectory: dict[str, list[tuple[int, str]]] = field(default_factory=dict, repr=False)
+    md_trajectory: dict[str, Trajectory] = field(default_factory=dict, repr=False)
     """Structures of the molecule produced during molecular dynamics simulations.
 
     The key of the dictionary is the name of the method (e.g., forcefield) used
     for the molecular dynamics.
-    The values are a list of pairs of the MD timestep and the structure at that timestep"""
+    The values are trajectories holding the structure at each saved MD timestep.
+    Trajectories may also be provided in their dictionary form or as the older
+    list of pairs of the timestep and the structure in POSCAR format"""
 
     # Properties
-    gas_storage: dict[str, float | tuple[float, float]] = field(default_factory=dict, repr=False)  # TODO (wardlt): Allow only one type of value
+    gas_storage: dict[str, float | tuple[float, float] | list[tuple[float, float]]] = field(
+        default_factory=dict, repr=False)  # TODO (wardlt): Allow only one type of value
     """Storage capacity of the MOF for different gases and pressures. Key is the name of the gas, value is a single capacity value
-     or the capacity at different pressures (units g/L)"""
+     or the capacity at different pressures (units g/L). Isotherms added by :meth:`add_isotherms` are
+     keyed by the gas and temperature (e.g., ``CO2_298K``) and hold pairs of pressure (Pa) and uptake"""
     structure_stability: dict[str, float] = field(default_factory=dict, repr=False)
     """How likely the structure is to be stable according to different assays.
     The value is the strain between the first and last timestep. Larger values indicate worse stability
 
     The strain for each assay should correspond to the strain from the longest trajectory in :attr:`md_trajectory`
     """
+    pore_geometry: dict[str, float] = field(default_factory=dict, repr=False)
+    """Descriptors of the pores of the relaxed structure, such as the pore-limiting diameter (``pld``),
+    as computed by :class:`~mofa.scoring.geometry.PoreGeometry`"""
 
     # Tracking provenance of structure
     times: dict[str, datetime] = field(default_factory=lambda: {'created': datetime.now()})
@@ -439,6 +450,16 @@ class MOFRecord:
 
             self.name = f'mof-{hasher.hexdigest()[-8:]}'
 
+        # Convert trajectories stored in other formats
+        for level, traj in list(self.md_trajectory.items()):
+            if isinstance(traj, dict):
+                self.md_trajectory[level] = Trajectory.from_dict(traj)
+            elif not isinstance(traj, Trajectory):
+                if len(traj) == 0:
+                    del self.md_trajectory[level]
+                else:
+                    self.md_trajectory[level] = Trajectory.from_frames([(step, read_vasp(StringIO(strc))) for step, strc in traj])
+
     @classmethod
     def from_file(cls, path: Path | str, read_kwargs: dict | None = None, **kwargs) -> 'MOFRecord':
         """Create a MOF description from a structure file on disk
@@ -469,13 +490,56 @@ class MOFRecord:
         """The structure as an ASE Atoms object"""
         return read_vasp(StringIO(self.structure))
 
+    @cached_property
+    def assembled_atoms(self) -> ase.Atoms:
+        """The structure as assembled, before any relaxation, as an ASE Atoms object"""
+        if self.assembled_structure is None:
+            return self.atoms
+        return read_vasp(StringIO(self.assembled_structure))
+
+    def add_isotherms(self, table, uptake_column: str = 'uptake_mol_kg'):
+        """Store the uptakes computed at several conditions as isotherms in :attr:`gas_storage`
+
+        Args:
+            table: Dataframe with the adsorbate, temperature, pressure and uptakes,
+                such as produced by :meth:`~mofa.simulation.raspa.base.BaseRaspaRunner.run_gcmc_many`
+            uptake_column: Name of the column holding the uptake to store
+        """
+        for (adsorbate, temperature), group in table.groupby(['adsorbate', 'temperature']):
+            group = group.sort_values('pressure')
+            self.gas_storage[f'{adsorbate}_{temperature:.0f}K'] = [
+                (float(p), float(u)) for p, u in zip(group['pressure'], group[uptake_column])
+            ]
+
+    def to_dict(self) -> dict:
+        """Render the record as a dictionary which can be stored in MongoDB
+
+        Trajectories are stored in the binary form produced by :meth:`Trajectory.to_dict`
+
+        Returns:
+            Dictionary version of the object
+        """
+
+        output = asdict(replace(self, md_trajectory={}))
+        output['md_trajectory'] = dict((k, v.to_dict()) for k, v in self.md_trajectory.items())
+        return output
+
     def to_json(self, **kwargs) -> str:
         """Render the structure to a JSON string
 
-        Keyword arguments are passed to :meth:`json.dumps`
+        Keyword arguments are passed to :meth:`json.dumps`. Binary data are encoded in base64
 
         Returns:
             JSON-format version of the object
         """
 
-        return json.dumps(asdict(self), **kwargs)
+        user_default = kwargs.pop('default', None)
+
+        def _default(obj):
+            if isinstance(obj, bytes):
+                return binascii.b2a_base64(obj, newline=False).decode()
+            if user_default is not None:
+                return user_default(obj)
+            raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+        return json.dumps(self.to_dict(), default=_default, **kwargs)
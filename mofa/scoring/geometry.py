@@ -1,13 +1,34 @@
 """Metrics for screening a MOF or linker based on its geometry"""
-from io import StringIO
+from collections import defaultdict
+from itertools import product
 
 import numpy as np
 import ase
-from ase.io.vasp import read_vasp
+from ase import units
+from ase.data.vdw_alvarez import vdw_radii
+from scipy import ndimage
+from scipy.spatial import cKDTree
 
 from mofa.model import MOFRecord
 from dataclasses import dataclass
 from mofa.scoring.base import MOFScorer, Scorer
+from mofa.utils.trajectory import CellSeries
+
+
+def principal_strain(init_cell: np.ndarray, cells: np.ndarray) -> np.ndarray:
+    """Compute the maximum principal strain between an initial cell and one or more later cells
+
+    Follows: https://www.cryst.ehu.es/cryst/strain.html
+
+    Args:
+        init_cell: Initial lattice vectors as rows, shape (3, 3)
+        cells: Later lattice vectors, shape (3, 3) or (frames, 3, 3)
+    Returns:
+        Largest absolute principal strain of each cell
+    """
+    strain = np.matmul(np.asarray(init_cell, dtype=float), np.linalg.inv(np.asarray(cells, dtype=float))) - np.eye(3)
+    strain = 0.5 * (strain + np.swapaxes(strain, -1, -2))
+    return np.abs(np.linalg.eigvalsh(strain)).max(axis=-1)
 
 
 class MinimumDistance(MOFScorer):
@@ -32,13 +53,162 @@ class LatticeParameterChange(Scorer):
             raise ValueError(f'No data available for MD simulations at level: "{self.md_level}"')
         traj = record.md_trajectory[self.md_level]
 
-        # Get the initial and final structures
-        init_strc = read_vasp(StringIO(traj[0][1]))
-        final_strc: ase.Atoms = read_vasp(StringIO(traj[-1][1]))
+        # Compute the maximum principal strain between the initial and final cells
+        return float(principal_strain(traj.cells[0], traj.cells[-1]))
+
+    def score_series(self, series: CellSeries | np.ndarray) -> float:
+        """Score the stability of a MOF given only the cells reported during MD
+
+        Args:
+            series: Cells reported at each step. Either a :class:`~mofa.utils.trajectory.CellSeries`,
+                an array of lattice vectors with shape (reports, 3, 3), or of lattice parameters with shape (reports, 6)
+        Returns:
+            Maximum principal strain between the first and last cells
+        """
+        if isinstance(series, CellSeries):
+            cells = series.cells
+        else:
+            series = np.asarray(series, dtype=float)
+            cells = series if series.ndim == 3 else CellSeries(timesteps=np.arange(len(series)), cellpars=series).cells
+        if len(cells) == 0:
+            raise ValueError('No cells provided')
+        return float(principal_strain(cells[0], cells[-1]))
+
+
+def _fibonacci_sphere(n_points: int) -> np.ndarray:
+    """Evenly distribute points on the unit sphere"""
+    index = np.arange(n_points) + 0.5
+    polar = np.arccos(1 - 2 * index / n_points)
+    azimuth = np.pi * (1 + 5 ** 0.5) * index
+    return np.stack([np.cos(azimuth) * np.sin(polar), np.sin(azimuth) * np.sin(polar), np.cos(polar)], axis=1)
+
+
+def _percolates(mask: np.ndarray) -> bool:
+    """Whether the selected points of a periodic grid form a channel which spans the cell
+
+    Args:
+        mask: Which points of the grid are selected
+    Returns:
+        Whether any connected region touches its own periodic image
+    """
+    labels, _ = ndimage.label(mask)
+
+    # Find regions which connect across each face, and the cell they move into
+    edges = []
+    for axis in range(3):
+        last, first = np.take(labels, -1, axis=axis).ravel(), np.take(labels, 0, axis=axis).ravel()
+        connected = (last > 0) & (first > 0)
+        shift = np.zeros(3, dtype=int)
+        shift[axis] = 1
+        for a, b in np.unique(np.stack([last[connected], first[connected]], axis=1), axis=0):
+            edges.append((a, b, shift))
+
+    # Assign each region an image offset. A region reached with two different offsets is connected to its image
+    neighbors = defaultdict(list)
+    for a, b, shift in edges:
+        neighbors[a].append((b, shift))
+        neighbors[b].append((a, -shift))
+    offsets = {}
+    for start in neighbors:
+        if start in offsets:
+            continue
+        offsets[start] = np.zeros(3, dtype=int)
+        stack = [start]
+        while len(stack) > 0:
+            node = stack.pop()
+            for other, shift in neighbors[node]:
+                offset = offsets[node] + shift
+                if other not in offsets:
+                    offsets[other] = offset
+                    stack.append(other)
+                elif (offsets[other] != offset).any():
+                    return True
+    return False
+
+
+@dataclass
+class PoreGeometry(MOFScorer):
+    """Describe the pores of a MOF using the distance from each point of a grid to the nearest atom surface
+
+    Computes the following descriptors:
+
+    - ``lcd``: Largest cavity diameter. Diameter of the largest sphere which fits in the framework (Å)
+    - ``pld``: Pore-limiting diameter. Diameter of the largest sphere which can pass through the framework (Å)
+    - ``void_fraction``: Fraction of the volume outside the van der Waals spheres of the atoms
+    - ``asa``: Area of the surface traced by the center of a probe rolled over the atoms (m^2/g),
+      including that of pockets which the probe cannot reach from a channel
+
+    The accuracy of the diameters is limited by the grid spacing.
+    Atoms use the van der Waals radii of `Alvarez <https://doi.org/10.1039/C3DT50599E>`_.
+    """
+
+    metric: str = 'pld'
+    """Descriptor used as the score"""
+    probe_radius: float = 1.65
+    """Radius of the probe used for the surface area (Å). Default is the kinetic radius of CO2"""
+    grid_spacing: float = 0.4
+    """Largest distance between grid points (Å)"""
+    surface_points: int = 96
+    """Number of points on the sphere of each atom used for the surface area"""
+
+    def __call__(self, mof: ase.Atoms) -> float:
+        return self.describe(mof)[self.metric]
+
+    def describe(self, atoms: ase.Atoms) -> dict[str, float]:
+        """Compute all descriptors of the pore structure
+
+        Args:
+            atoms: Periodic structure of the MOF
+        Returns:
+            Value of each descriptor
+        """
+        radii = vdw_radii[atoms.numbers]
+        if np.isnan(radii).any():
+            raise ValueError('No van der Waals radius for: ' + ', '.join(sorted(set(np.array(atoms.get_chemical_symbols())[np.isnan(radii)]))))
+
+        # Surround the cell with its periodic images
+        cell = atoms.cell.array
+        shifts = np.array(list(product([-1, 0, 1], repeat=3))) @ cell
+        wrapped = atoms.get_scaled_positions() @ cell
+        images = (wrapped[None, :, :] + shifts[:, None, :]).reshape(-1, 3)
+        image_radii = np.tile(radii, len(shifts))
+        tree = cKDTree(images)
+        n_neighbors = min(8, len(images))
+
+        # Compute the distance from each grid point to the nearest atom surface
+        n_points = np.ceil(atoms.cell.lengths() / self.grid_spacing).astype(int)
+        axes = [np.arange(n) / n for n in n_points]
+        grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3) @ cell
+        dists, inds = tree.query(grid, k=n_neighbors)
+        dists, inds = dists.reshape(len(grid), -1), inds.reshape(len(grid), -1)
+        surface_dist = (dists - image_radii[inds]).min(axis=1).reshape(n_points)
+
+        # Find the largest sphere which can pass through the cell
+        largest = max(surface_dist.max(), 0.)
+        if largest == 0 or not _percolates(surface_dist > 0):
+            limiting = 0.
+        else:
+            low, high = 0., largest
+            while high - low > self.grid_spacing / 10:
+                mid = (low + high) / 2
+                if _percolates(surface_dist >= mid):
+                    low = mid
+                else:
+                    high = mid
+            limiting = low
+
+        # Compute the fraction of points on each probe sphere not inside another
+        sphere = _fibonacci_sphere(self.surface_points)
+        probe_radii = radii + self.probe_radius
+        points = (wrapped[:, None, :] + probe_radii[:, None, None] * sphere[None, :, :]).reshape(-1, 3)
+        dists, inds = tree.query(points, k=min(16, len(images)))
+        dists, inds = dists.reshape(len(points), -1), inds.reshape(len(points), -1)
+        buried = (dists < image_radii[inds] + self.probe_radius - 1e-6).any(axis=1).reshape(len(atoms), -1)
+        area = (4 * np.pi * probe_radii ** 2 * (1 - buried.mean(axis=1))).sum()  # Å^2
 
-        # Compute the maximum principal strain
-        #  Following: https://www.cryst.ehu.es/cryst/strain.html
-        strain = np.matmul(init_strc.cell.array, np.linalg.inv(final_strc.cell.array)) - np.eye(3)
-        strain = 0.5 * (strain + strain.T)
-        strains = np.linalg.eigvals(strain)
-        return np.abs(strains).max()
+        return {
+            'lcd': float(2 * largest),
+            'pld': float(2 * limiting),
+            'void_fraction': float((surface_dist > 0).mean()),
+            'asa': float(area * 1e-20 / (atoms.get_masses().sum() * units._amu * 1e3)),
+        }
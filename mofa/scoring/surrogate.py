@@ -0,0 +1,238 @@
+"""Surrogate models which predict the properties of a MOF from cheap descriptors of its structure and ligands"""
+from dataclasses import dataclass, field
+from typing import Sequence
+
+import numpy as np
+import ase
+from ase import units
+from rdkit import Chem
+from rdkit.Chem import rdFingerprintGenerator
+from sklearn.ensemble import ExtraTreesClassifier, ExtraTreesRegressor
+
+from mofa.model import MOFRecord
+from mofa.scoring.base import MOFScorer
+from mofa.scoring.geometry import PoreGeometry
+
+_nonmetals = {'H', 'B', 'C', 'N', 'O', 'F', 'Si', 'P', 'S', 'Cl', 'Se', 'Br', 'I'}
+
+composition_names = ['density', 'atom_density', 'frac_H', 'frac_C', 'frac_N', 'frac_O', 'frac_halogen', 'frac_metal']
+"""Names of the descriptors computed by :func:`composition_descriptors`"""
+
+descriptor_names = composition_names + ['lcd', 'pld', 'void_fraction', 'asa']
+"""Names of the descriptors computed by :func:`structure_descriptors`"""
+
+
+def composition_descriptors(atoms: ase.Atoms) -> np.ndarray:
+    """Compute descriptors of a MOF from its composition and density
+
+    Args:
+        atoms: Structure of the MOF
+    Returns:
+        Descriptors in the order of :data:`composition_names`
+    """
+    volume = atoms.cell.volume
+    symbols = np.array(atoms.get_chemical_symbols())
+    return np.array([
+        atoms.get_masses().sum() * units._amu * 1e3 / (volume * 1e-24),  # g/cm^3
+        len(atoms) / volume,
+        *[np.isin(symbols, group).mean() for group in [['H'], ['C'], ['N'], ['O'], ['F', 'Cl', 'Br', 'I']]],
+        (~np.isin(symbols, list(_nonmetals))).mean(),
+    ])
+
+
+def structure_descriptors(atoms: ase.Atoms, pore_geometry: dict[str, float] | None = None) -> np.ndarray:
+    """Compute descriptors of a MOF from its composition, density and pores
+
+    Args:
+        atoms: Structure of the MOF
+        pore_geometry: Pore descriptors computed by :class:`~mofa.scoring.geometry.PoreGeometry`.
+            Computed from the structure if not provided
+    Returns:
+        Descriptors in the order of :data:`descriptor_names`
+    """
+    if pore_geometry is None or len(pore_geometry) == 0:
+        pore_geometry = PoreGeometry(grid_spacing=0.5).describe(atoms)
+    return np.concatenate([composition_descriptors(atoms), [pore_geometry[k] for k in ['lcd', 'pld', 'void_fraction', 'asa']]])
+
+
+def ligand_fingerprint(record: MOFRecord, length: int = 1024, radius: int = 2) -> np.ndarray:
+    """Compute a Morgan fingerprint of all ligands in a MOF
+
+    Args:
+        record: MOF to describe
+        length: Number of bits in the fingerprint
+        radius: Largest radius of the circular substructures
+    Returns:
+        Bits present in the fingerprint of any ligand. All zeros for ligands without a valid SMILES
+    """
+    generator = rdFingerprintGenerator.GetMorganGenerator(radius=radius, fpSize=length)
+    output = np.zeros(length, dtype=np.uint8)
+    for ligand in record.ligands:
+        mol = None if ligand.smiles is None else Chem.MolFromSmiles(ligand.smiles)
+        if mol is not None:
+            output |= generator.GetFingerprintAsNumPy(mol).astype(np.uint8)
+    return output
+
+
+def record_descriptors(record: MOFRecord) -> np.ndarray:
+    """Compute the descriptors of a MOF record, using the pore geometry stored in the record if available"""
+    return structure_descriptors(record.atoms, record.pore_geometry)
+
+
+@dataclass
+class UptakeSurrogate(MOFScorer):
+    """Ensemble of randomized trees which predicts the gas uptake of a MOF from :func:`structure_descriptors`
+
+    Trained on the uptakes stored in :attr:`~mofa.model.MOFRecord.gas_storage`,
+    using at most :attr:`max_train` of the most recent records so that retraining takes about a second.
+    The uncertainty of a prediction is the standard deviation of the predictions of each tree.
+    """
+
+    gas: str = 'CO2'
+    """Key of the uptake in :attr:`~mofa.model.MOFRecord.gas_storage`"""
+    max_train: int = 1024
+    """Largest number of records used for training"""
+    n_trees: int = 128
+    """Number of trees in the ensemble"""
+    model: ExtraTreesRegressor | None = field(default=None, repr=False)
+    """Trained model. ``None`` before :meth:`fit` is called"""
+
+    def fit(self, records: Sequence[MOFRecord]) -> 'UptakeSurrogate':
+        """Train the model on MOFs with a single uptake value
+
+        Args:
+            records: MOFs to train on. Those without a single uptake value for :attr:`gas` are skipped
+        Returns:
+            Self
+        """
+        labeled = [r for r in records if isinstance(r.gas_storage.get(self.gas), (int, float))][-self.max_train:]
+        if len(labeled) < 2:
+            raise ValueError(f'Need at least 2 MOFs with a {self.gas} uptake. Found {len(labeled)}')
+
+        x = np.array([record_descriptors(r) for r in labeled])
+        y = np.array([r.gas_storage[self.gas] for r in labeled], dtype=float)
+        return self.fit_descriptors(x, y)
+
+    def fit_descriptors(self, x: np.ndarray, y: np.ndarray) -> 'UptakeSurrogate':
+        """Train the model given the descriptors and uptakes of MOFs
+
+        Args:
+            x: Descriptors of each MOF, as computed by :func:`structure_descriptors`
+            y: Uptake of each MOF
+        Returns:
+            Self
+        """
+        if len(y) < 2:
+            raise ValueError(f'Need at least 2 MOFs with a {self.gas} uptake. Found {len(y)}')
+        self.model = ExtraTreesRegressor(n_estimators=self.n_trees, min_samples_leaf=2)
+        self.model.fit(x[-self.max_train:], y[-self.max_train:])
+        return self
+
+    def predict(self, records: Sequence[MOFRecord]) -> tuple[np.ndarray, np.ndarray]:
+        """Predict the uptake of MOFs
+
+        Args:
+            records: MOFs to evaluate
+        Returns:
+            - Predicted uptake of each MOF
+            - Standard deviation of each prediction
+        """
+        return self.predict_descriptors(np.array([record_descriptors(r) for r in records]))
+
+    def predict_descriptors(self, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Predict the uptake of MOFs given their descriptors
+
+        Args:
+            x: Descriptors of each MOF, as computed by :func:`structure_descriptors`
+        Returns:
+            - Predicted uptake of each MOF
+            - Standard deviation of each prediction
+        """
+        if self.model is None:
+            raise ValueError('The model has not been trained')
+        per_tree = np.array([tree.predict(x) for tree in self.model.estimators_])
+        return per_tree.mean(axis=0), per_tree.std(axis=0)
+
+    def __call__(self, mof: ase.Atoms) -> float:
+        return float(self.predict_descriptors(structure_descriptors(mof)[None, :])[0][0])
+
+    def score_mof(self, record: MOFRecord) -> float:
+        return float(self.predict([record])[0][0])
+
+
+@dataclass
+class StabilityClassifier(MOFScorer):
+    """Ensemble of randomized trees which predicts whether a MOF will remain stable during MD
+
+    Features are the :func:`composition_descriptors` and lattice parameters of the as-assembled structure
+    (:attr:`~mofa.model.MOFRecord.assembled_atoms`) and the :func:`ligand_fingerprint` of its ligands,
+    so that MOFs are described the same way before and after relaxation.
+    Trained on the strains stored in :attr:`~mofa.model.MOFRecord.structure_stability`,
+    using at most :attr:`max_train` of the most recent records.
+    """
+
+    md_level: str = 'mace'
+    """Level of MD whose strain is predicted"""
+    max_strain: float = 0.25
+    """Largest strain of a MOF considered stable"""
+    max_train: int = 2048
+    """Largest number of records used for training"""
+    n_trees: int = 128
+    """Number of trees in the ensemble"""
+    fingerprint_length: int = 1024
+    """Number of bits in the ligand fingerprint"""
+    model: ExtraTreesClassifier | None = field(default=None, repr=False)
+    """Trained model. ``None`` before :meth:`fit` is called"""
+
+    def features(self, record: MOFRecord) -> np.ndarray:
+        """Compute the features of a MOF
+
+        Args:
+            record: MOF to describe
+        Returns:
+            Composition descriptors, lattice parameters, then the ligand fingerprint
+        """
+        atoms = record.assembled_atoms
+        return np.concatenate([
+            composition_descriptors(atoms),
+            atoms.cell.cellpar(),
+            ligand_fingerprint(record, length=self.fingerprint_length)
+        ])
+
+    def fit(self, records: Sequence[MOFRecord]) -> 'StabilityClassifier':
+        """Train the model on MOFs with a computed strain
+
+        Args:
+            records: MOFs to train on. Those without a strain at :attr:`md_level` are skipped
+        Returns:
+            Self
+        """
+        labeled = [r for r in records if r.structure_stability.get(self.md_level) is not None][-self.max_train:]
+        if len(labeled) == 0:
+            raise ValueError(f'No MOFs have a strain at level={self.md_level}')
+
+        y = np.array([r.structure_stability[self.md_level] <= self.max_strain for r in labeled])
+        if y.all() or not y.any():
+            raise ValueError(f'All {len(labeled)} MOFs are {"stable" if y.all() else "unstable"}. Need examples of both')
+
+        x = np.array([self.features(r) for r in labeled])
+        model = ExtraTreesClassifier(n_estimators=self.n_trees, min_samples_leaf=2, class_weight='balanced')
+        self.model = model.fit(x, y)  # Replace the previous model only once training finishes
+        return self
+
+    def predict_proba(self, records: Sequence[MOFRecord]) -> np.ndarray:
+        """Predict the probability that MOFs remain stable
+
+        Args:
+            records: MOFs to evaluate
+        Returns:
+            Probability that the strain of each MOF is at most :attr:`max_strain`
+        """
+        if self.model is None:
+            raise ValueError('The model has not been trained')
+        x = np.array([self.features(r) for r in records])
+        stable_col = list(self.model.classes_).index(True)
+        return self.model.predict_proba(x)[:, stable_col]
+
+    def score_mof(self, record: MOFRecord) -> float:
+        return float(self.predict_proba([record])[0])
@@ -1,10 +1,12 @@
 """Selecting which DFT calculations to perform"""
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
+import numpy as np
 from pymongo.collection import Collection
 
-from mofa.db import row_to_record
+from mofa.db import get_records, row_to_record
 from mofa.model import MOFRecord
+from mofa.scoring.surrogate import UptakeSurrogate, record_descriptors
 
 
 @dataclass(kw_only=True)
@@ -15,6 +17,8 @@ class DFTSelector:
         - are not currently running ('dft' not in `in_progress`)
         - have been relaxed (``times.relaxed`` is available)
         - have strains below a threshold
+        - have pores large enough for the adsorbate, if :attr:`min_pore_diameter` is set
+        - have been screened with GCMC using charges which need no DFT, if :attr:`screen_key` is set
     """
 
     # Criteria
@@ -22,17 +26,45 @@ class DFTSelector:
     """Name of the MD method used to qualify stability"""
     max_strain: float = 0.25
     """Maximum level of strain to allow"""
+    min_pore_diameter: float | None = None
+    """Smallest pore-limiting diameter to allow (Å). MOFs without pore descriptors are not excluded"""
+    screen_key: str | None = None
+    """Key in ``gas_storage`` of the uptake from GCMC screening with charges which need no DFT.
+    If set, MOFs must be screened before DFT. Default is to not screen"""
     collection: Collection
     """Collection of MOF records from previous calculations"""
 
+    # Ordering
+    prefer: str | None = None
+    """Pore descriptor (e.g., ``void_fraction``) for which to select the MOF with the largest value first.
+    Default is to pick the MOF with the largest screening uptake if :attr:`screen_key` is set, and randomly otherwise"""
+
     @property
-    def match_stages(self) -> list[dict]:
-        """Stages used to match applicable records"""
-        return [
-            {'$match': {'in_progress': {'$nin': ['dft']}}},
+    def criteria_stages(self) -> list[dict]:
+        """Stages used to match records which are relaxed and stable"""
+        stages = [
             {'$match': {'times.relaxed': {'$exists': True}}},
             {'$match': {f'structure_stability.{self.md_level}': {'$not': {'$gt': self.max_strain}}}}
         ]
+        if self.min_pore_diameter is not None:
+            stages.append({'$match': {'pore_geometry.pld': {'$not': {'$lt': self.min_pore_diameter}}}})
+        return stages
+
+    @property
+    def match_stages(self) -> list[dict]:
+        """Stages used to match applicable records"""
+        stages = [{'$match': {'in_progress': {'$nin': ['dft']}}}] + self.criteria_stages
+        if self.screen_key is not None:
+            stages.append({'$match': {f'gas_storage.{self.screen_key}': {'$type': 'number'}}})
+        return stages
+
+    @property
+    def screening_stages(self) -> list[dict]:
+        """Stages used to match records which are ready for GCMC screening"""
+        return [
+            {'$match': {'in_progress': {'$nin': ['dft', 'screening']}}},
+            {'$match': {f'gas_storage.{self.screen_key}': {'$exists': False}}}
+        ] + self.criteria_stages
 
     def count_available(self) -> int:
         """Count the number of MOFs available for MD within the database"""
@@ -49,7 +81,113 @@ class DFTSelector:
             The selected MOF record
         """
         stages = self.match_stages
-        stages.append({'$sample': {'size': 1}})  # Pick randomly
+        if self.prefer is not None:
+            stages.extend([{'$sort': {f'pore_geometry.{self.prefer}': -1}}, {'$limit': 1}])
+        elif self.screen_key is not None:
+            stages.extend([{'$sort': {f'gas_storage.{self.screen_key}': -1}}, {'$limit': 1}])
+        else:
+            stages.append({'$sample': {'size': 1}})  # Pick randomly
         for record in self.collection.aggregate(stages):
             return row_to_record(record)
         raise ValueError('No MOFs match the criteria')
+
+    def select_screening(self) -> MOFRecord:
+        """Select which MOF to screen with GCMC next
+
+        Returns:
+            The selected MOF record
+        """
+        if self.screen_key is None:
+            raise ValueError('Screening is not enabled')
+        stages = self.screening_stages
+        stages.append({'$sample': {'size': 1}})
+        for record in self.collection.aggregate(stages):
+            return row_to_record(record)
+        raise ValueError('No MOFs need screening')
+
+
+@dataclass(kw_only=True)
+class SurrogateDFTSelector(DFTSelector):
+    """Pick the MOF with the best predicted uptake according to a surrogate model
+
+    Candidates are ranked by an upper confidence bound, the predicted uptake plus
+    :attr:`exploration` times its uncertainty. The surrogate is retrained whenever more uptakes
+    are available. MOFs are picked randomly until there are enough uptakes to train it.
+    """
+
+    surrogate: UptakeSurrogate = field(default_factory=UptakeSurrogate)
+    """Model which predicts the uptake of a MOF"""
+    exploration: float = 1.
+    """Weight of the uncertainty of the prediction"""
+    min_train: int = 8
+    """Number of MOFs with computed uptakes needed before using the surrogate"""
+    max_candidates: int = 1024
+    """Largest number of candidate MOFs evaluated with the surrogate, starting from the most recently relaxed"""
+
+    _trained_on: int = field(default=0, init=False, repr=False)
+    """Number of uptakes used to train the current model"""
+    _descriptors: dict[str, np.ndarray] = field(default_factory=dict, init=False, repr=False)
+    """Descriptors of MOFs used for training or as candidates, which do not change once a MOF is relaxed"""
+
+    def _label_query(self) -> dict:
+        """Query which matches MOFs with a computed uptake and pore descriptors"""
+        return {f'gas_storage.{self.surrogate.gas}': {'$type': 'number'}, 'pore_geometry.lcd': {'$exists': True}}
+
+    def _get_descriptors(self, names: list[str]) -> np.ndarray:
+        """Get the descriptors of MOFs, computing them only for MOFs not seen before"""
+        missing = [n for n in names if n not in self._descriptors]
+        if len(missing) > 0:
+            for row in self.collection.find({'name': {'$in': missing}}, projection={'md_trajectory': 0}):
+                record = row_to_record(row)
+                self._descriptors[record.name] = record_descriptors(record)
+        return np.array([self._descriptors[n] for n in names])
+
+    def update_surrogate(self) -> bool:
+        """Retrain the surrogate if more uptakes are available
+
+        MOFs without pore descriptors are not used for training.
+
+        Returns:
+            Whether the surrogate is ready to use
+        """
+        n_labeled = self.collection.count_documents(self._label_query())
+        if n_labeled < self.min_train:
+            return False
+        if n_labeled != self._trained_on:
+            rows = self.collection.find(self._label_query(), projection={'name': 1, 'gas_storage': 1}) \
+                .sort('times.raspa-done', -1).limit(self.surrogate.max_train)
+            rows = list(rows)[::-1]
+            x = self._get_descriptors([row['name'] for row in rows])
+            self.surrogate.fit_descriptors(x, np.array([row['gas_storage'][self.surrogate.gas] for row in rows], dtype=float))
+            self._trained_on = n_labeled
+        return True
+
+    def select_next(self) -> MOFRecord:
+        """Select which MOF to run next
+
+        MOFs without pore descriptors are only picked before the surrogate is trained
+
+        Returns:
+            The selected MOF record
+        """
+        if not self.update_surrogate():
+            return super().select_next()
+
+        stages = self.match_stages
+        stages.extend([
+            {'$match': {'pore_geometry.lcd': {'$exists': True}}},
+            {'$sort': {'times.relaxed': -1}},
+            {'$limit': self.max_candidates},
+            {'$project': {'name': 1}}
+        ])
+        names = [row['name'] for row in self.collection.aggregate(stages)]
+        if len(names) == 0:
+            raise ValueError('No MOFs match the criteria')
+
+        # Forget MOFs which are no longer candidates, except those used for training
+        labeled = set(row['name'] for row in self.collection.find(self._label_query(), projection={'name': 1}))
+        self._descriptors = dict((k, v) for k, v in self._descriptors.items() if k in labeled or k in names)
+
+        mean, std = self.surrogate.predict_descriptors(self._get_descriptors(names))
+        best = names[int(np.argmax(mean + self.exploration * std))]
+        return get_records(self.collection, [best])[0]  # Retrieve the full record
@@ -1,5 +1,9 @@
 """Modules for selecting which MD calculation to evaluate next"""
+from bisect import insort
 from dataclasses import dataclass
+from itertools import count
+from threading import Lock
+from typing import Callable, Iterator
 
 from pymongo.collection import Collection
 import numpy as np
@@ -8,6 +12,57 @@ from mofa.model import MOFRecord
 from mofa.db import row_to_record
 
 
+class StabilityQueue:
+    """Bounded queue of new MOFs which pops the MOF most likely to be stable
+
+    MOFs are ranked by a scoring function, with ties broken in favor of the most recently added MOF.
+    Adding a MOF to a full queue evicts the lowest-ranked MOF.
+    Without a scoring function, the queue behaves like a :class:`~collections.deque`
+    which pops the newest MOF and evicts the oldest.
+
+    Args:
+        maxlen: Largest number of MOFs to hold
+        scorer: Function which computes the priority of a MOF, such as the probability it is stable
+    """
+
+    def __init__(self, maxlen: int, scorer: Callable[[MOFRecord], float] | None = None):
+        self.maxlen = maxlen
+        self.scorer = scorer
+        self._entries: list[tuple[float, int, MOFRecord]] = []  # Sorted from lowest to highest priority
+        self._counter = count()
+        self._lock = Lock()
+
+    def _priority(self, record: MOFRecord) -> float:
+        return 0. if self.scorer is None else self.scorer(record)
+
+    def set_scorer(self, scorer: Callable[[MOFRecord], float] | None):
+        """Change the scoring function and re-rank the MOFs in the queue"""
+        with self._lock:
+            self.scorer = scorer
+            self._entries = sorted((self._priority(record), order, record) for _, order, record in self._entries)
+
+    def append(self, record: MOFRecord):
+        """Add a MOF to the queue, evicting the lowest-ranked MOF if the queue is full"""
+        priority = self._priority(record)
+        with self._lock:
+            insort(self._entries, (priority, next(self._counter), record), key=lambda x: x[:2])
+            if len(self._entries) > self.maxlen:
+                self._entries.pop(0)
+
+    def pop(self) -> MOFRecord:
+        """Remove and return the highest-ranked MOF"""
+        with self._lock:
+            if len(self._entries) == 0:
+                raise IndexError('pop from an empty queue')
+            return self._entries.pop()[2]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[MOFRecord]:
+        return iter([record for _, _, record in reversed(self._entries)])
+
+
 @dataclass(kw_only=True)
 class MDSelector:
     """Pick which MD calculation to run next"""
@@ -29,12 +84,15 @@ class MDSelector:
         stages = [{'$match': {'in_progress': {'$nin': ['stability']}}}]
         if self.maximum_steps is not None:
             stages.append({'$match': {
-                f'md_trajectory.{self.md_level}': {
+                f'md_trajectory.{self.md_level}.timesteps': {
                     '$not': {'$elemMatch': {'$gte': self.maximum_steps}}
                 }}})
         stages.append({'$match': {
             f'structure_stability.{self.md_level}': {'$not': {'$gt': self.max_strain}}}
         })
+        stages.append({'$match': {  # Skip MOFs whose strain has already settled
+            f'md_trajectory.{self.md_level}.stop_reason': {'$ne': 'plateau'}}
+        })
         return stages
 
     def count_available(self) -> int:
@@ -45,11 +103,11 @@ class MDSelector:
             return result['available']
         return 0
 
-    def select_next(self, new_mofs: list[MOFRecord]) -> MOFRecord:
+    def select_next(self, new_mofs: list[MOFRecord] | StabilityQueue) -> MOFRecord:
         """Select which MOF to run next
 
         Args:
-            new_mofs: List of MOFs yet to be added to the database.
+            new_mofs: MOFs yet to be added to the database, with the next to run at the end.
                 A MOF will be removed from this list if selected
         Returns:
             The selected MOF record
@@ -0,0 +1,137 @@
+"""Storage for simulation inputs which are reused between runs on the same MOF"""
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+import pickle
+import shutil
+import os
+
+import numpy as np
+import ase
+
+
+def structure_hash(atoms: ase.Atoms) -> str:
+    """Compute a hash of the composition, positions, and cell of a structure
+
+    Positions and cell are rounded to 1e-4 Å before hashing so that structures which
+    survive a round trip through a text format keep the same hash.
+
+    Args:
+        atoms: Structure to hash
+    Returns:
+        Hex digest of the hash
+    """
+    hasher = sha256()
+    hasher.update(np.asarray(atoms.numbers, dtype=np.int64).tobytes())
+    for array in [atoms.positions, atoms.cell.array]:
+        hasher.update((np.round(array, 4) + 0.).tobytes())  # Adding zero removes negative zeros
+    return hasher.hexdigest()
+
+
+def copy_atomic(source: Path, destination: Path):
+    """Copy a file such that readers never see a partially-written destination
+
+    Args:
+        source: File to be copied
+        destination: Where to copy it
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f'{destination.name}.{os.getpid()}.tmp')
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+@dataclass
+class MOFCache:
+    """Per-MOF storage of force field typing and LAMMPS restart files
+
+    Each MOF receives its own directory named by the force field and a hash of the
+    structure from which the inputs were built. Files are written atomically,
+    so the same directory may be shared between workers.
+    """
+
+    root: Path
+    """Directory holding the cached files"""
+
+    def __post_init__(self):
+        self.root = Path(self.root)
+
+    def mof_dir(self, atoms: ase.Atoms, force_field: str) -> Path:
+        """Directory holding the files for a certain structure and force field
+
+        Args:
+            atoms: Structure from which the simulation inputs were built
+            force_field: Name of the force field
+        Returns:
+            Path to the directory, which may not yet exist
+        """
+        return self.root / f'{force_field}-{structure_hash(atoms)[:24]}'
+
+    def load_typing(self, atoms: ase.Atoms, force_field: str) -> Any | None:
+        """Retrieve the typed force field for a structure
+
+        Args:
+            atoms: Structure from which the force field was built
+            force_field: Name of the force field
+        Returns:
+            The stored object, or ``None`` if not available
+        """
+        path = self.mof_dir(atoms, force_field) / 'typing.pkl'
+        try:
+            with path.open('rb') as fp:
+                return pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save_typing(self, atoms: ase.Atoms, force_field: str, typing: Any):
+        """Store the typed force field for a structure
+
+        Args:
+            atoms: Structure from which the force field was built
+            force_field: Name of the force field
+            typing: Object to store
+        """
+        path = self.mof_dir(atoms, force_field) / 'typing.pkl'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with tmp_path.open('wb') as fp:
+            pickle.dump(typing, fp)
+        os.replace(tmp_path, path)
+
+    def restart_path(self, atoms: ase.Atoms, force_field: str, timestep: int) -> Path:
+        """Location of the restart file written after a certain total number of timesteps
+
+        Args:
+            atoms: Structure from which the simulation started
+            force_field: Name of the force field
+            timestep: Total number of timesteps run before the restart was written
+        Returns:
+            Path to the restart file, which may not yet exist
+        """
+        return self.mof_dir(atoms, force_field) / f'md.{timestep}.restart'
+
+    def save_restart(self, atoms: ase.Atoms, force_field: str, timestep: int, restart_file: Path):
+        """Copy a restart file into the cache, removing those from earlier segments
+
+        Args:
+            atoms: Structure from which the simulation started
+            force_field: Name of the force field
+            timestep: Total number of timesteps run before the restart was written
+            restart_file: Restart file written by LAMMPS
+        """
+        new_path = self.restart_path(atoms, force_field, timestep)
+        copy_atomic(restart_file, new_path)
+        for path in new_path.parent.glob('md.*.restart'):
+            if path != new_path:
+                path.unlink(missing_ok=True)
+
+    def remove(self, atoms: ase.Atoms, force_field: str):
+        """Delete all files for a structure and force field, such as once it will not be simulated further
+
+        Args:
+            atoms: Structure from which the simulation inputs were built
+            force_field: Name of the force field
+        """
+        shutil.rmtree(self.mof_dir(atoms, force_field), ignore_errors=True)
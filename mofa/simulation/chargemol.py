@@ -0,0 +1,59 @@
+"""Reading the outputs of chargemol"""
+from functools import lru_cache
+from pathlib import Path
+import re
+
+import numpy as np
+import ase
+
+chargemol_fname = "DDEC6_even_tempered_net_atomic_charges.xyz"
+"""Name of the file holding the DDEC6 charges"""
+
+_float_pattern = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def read_chargemol(path: str | Path) -> ase.Atoms:
+    """Read the structure and charges from a chargemol output file
+
+    Args:
+        path: Path to the output file
+    Returns:
+        Structure with the charge of each atom in ``atoms.arrays['q']``
+    """
+    with open(path) as fp:
+        natoms = int(fp.readline())
+        header = fp.readline()
+        block = [next(fp) for _ in range(natoms)]
+
+    # The cell is written as three vectors after "unitcell" in the comment line
+    cell = np.array(_float_pattern.findall(header.split('unitcell', 1)[1])[:9], dtype=float).reshape(3, 3)
+
+    # Each line holds the symbol, position and charge of an atom
+    symbols = [line.split(None, 1)[0] for line in block]
+    values = np.loadtxt(block, usecols=(1, 2, 3, 4), ndmin=2)
+    atoms = ase.Atoms(symbols=symbols, positions=values[:, :3], cell=cell, pbc=True)
+    atoms.arrays['q'] = values[:, 3]
+    return atoms
+
+
+@lru_cache(maxsize=32)
+def _read_cached(path: Path, mtime_ns: int, size: int) -> ase.Atoms:
+    """Read a file once per version"""
+    return read_chargemol(path)
+
+
+def load_chargemol(cp2k_path: str | Path, fname: str = chargemol_fname) -> ase.Atoms:
+    """Load the charged structure from a CP2K directory in which chargemol has been run
+
+    The parsed structure is cached, so repeated calls for the same directory do not re-read the file
+    unless it has been modified.
+
+    Args:
+        cp2k_path: Path to the CP2K run
+        fname: Name of the chargemol output file
+    Returns:
+        Structure with the charge of each atom in ``atoms.arrays['q']``
+    """
+    path = (Path(cp2k_path) / fname).absolute()
+    stat = path.stat()
+    return _read_cached(path, stat.st_mtime_ns, stat.st_size).copy()
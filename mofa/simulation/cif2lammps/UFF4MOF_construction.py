@@ -9,6 +9,7 @@ import warnings
 from .force_field_construction import force_field
 from .cif2system import PBC3DF_sym
 from .superimposition import SVDSuperimposer
+from .topology import Topology, group_first_seen, combination_pairs
 
 metals = atomic_data.metals
 mass_key = atomic_data.mass_key
@@ -666,73 +667,75 @@ class UFF4MOF(force_field):
             'special_bonds': sb,
             'comments': comments}
 
-    def enumerate_bonds(self):
+    def bond_order(self, fft_i, fft_j, esi, esj, bond_type):
 
-        SG = self.system['graph']
         bond_order_dict = self.args['bond_orders']
 
-        bonds = {}
-        for e in SG.edges(data=True):
-
-            i, j, data = e
-            fft_i = SG.nodes[i]['force_field_type']
-            fft_j = SG.nodes[j]['force_field_type']
-            bond_type = data['bond_type']
-            esi = SG.nodes[i]['element_symbol']
-            esj = SG.nodes[j]['element_symbol']
-
-            # look for the bond order, otherwise use the convention based on
-            # the bond type
+        # look for the bond order, otherwise use the convention based on
+        # the bond type
+        try:
+            return bond_order_dict[(fft_i, fft_j)]
+        except KeyError:
             try:
-                bond_order = bond_order_dict[(fft_i, fft_j)]
+                return bond_order_dict[(fft_j, fft_i)]
             except KeyError:
-                try:
-                    bond_order = bond_order_dict[(fft_j, fft_i)]
-                except KeyError:
-                    # half for metal-nonmetal
-                    if any(
-                        a in metals for a in (
-                            esi,
-                            esj)) and not all(
-                        a in metals for a in (
-                            esi,
-                            esj)):
-                        bond_order = 0.5
-                    # quarter for metal-metal
-                    elif all(a in metals for a in (esi, esj)):
-                        bond_order = 0.25
-                    # use bond order
-                    else:
-                        bond_order = bond_order_dict[bond_type]
+                # half for metal-nonmetal
+                if any(a in metals for a in (esi, esj)) and not all(a in metals for a in (esi, esj)):
+                    return 0.5
+                # quarter for metal-metal
+                elif all(a in metals for a in (esi, esj)):
+                    return 0.25
+                # use bond order
+                else:
+                    return bond_order_dict[bond_type]
 
-            bond = tuple(sorted([fft_i, fft_j]) + [bond_order])
+    def enumerate_bonds(self):
 
-            # add to list if bond type already exists, else add a new type
+        SG = self.system['graph']
+        topology = self.topology = Topology(SG)
+        names = topology.type_names
+        types = topology.types
+        elements = [SG.nodes[n]['element_symbol'] for n in topology.nodes]
+
+        # the bond order only depends on the types and elements of the atoms and the bond type
+        bond_orders = {}
+        order_ids = {}
+        edge_order = np.zeros(len(topology.edges), dtype=int)
+        for e, ((i, j), data) in enumerate(zip(topology.edges.tolist(), topology.edge_data)):
+            key = (types[i], types[j], elements[i], elements[j], data['bond_type'])
             try:
-                bonds[bond].append((i, j))
+                bond_order = bond_orders[key]
             except KeyError:
-                bonds[bond] = [(i, j)]
-
+                bond_order = bond_orders[key] = self.bond_order(names[types[i]], names[types[j]], elements[i], elements[j], data['bond_type'])
             data['bond_order'] = bond_order
+            edge_order[e] = order_ids.setdefault(bond_order, len(order_ids))
+        topology.edge_order = edge_order
+
+        # bond types are the sorted pair of atom types and the bond order, numbered in the order they appear
+        edge_types = types[topology.edges]
+        keys = np.stack([edge_types.min(axis=1), edge_types.max(axis=1), edge_order], axis=1)
+        groups, first, order = group_first_seen(keys)
+        bond_labels = list(map(tuple, topology.node_labels(topology.edges)))
 
         bond_params = {}
         bond_comments = {}
         all_bonds = {}
-        ID = 0
-        count = 0
         styles = []
         # index bonds by ID
-        for b in bonds:
+        members = np.split(order, np.cumsum(np.bincount(groups, minlength=len(first)))[:-1])
+        for ID, (e, edges) in enumerate(zip(first, members), start=1):
 
-            ID += 1
-            bond_order = b[2]
-            bond = (b[0], b[1])
+            bond_order = topology.edge_data[e]['bond_order']
+            bond = (names[keys[e, 0]], names[keys[e, 1]])
             params = self.bond_parameters(bond, float(bond_order))
             styles.append(params[0])
             bond_params[ID] = list(params)
             bond_comments[ID] = list(bond) + ['bond order=' + str(bond_order)]
-            all_bonds[ID] = bonds[b]
-            count += len(bonds[b])
+            all_bonds[ID] = [bond_labels[b] for b in edges]
+
+        # equilibrium length of each edge, for the angle parameters
+        bond_lengths = np.array([bond_params[ID][2] if len(bond_params[ID]) > 2 else np.nan for ID in sorted(bond_params)])
+        topology.edge_length = bond_lengths[groups] if len(groups) > 0 else np.zeros(0)
 
         styles = set(styles)
         if len(styles) == 1:
@@ -745,83 +748,51 @@ class UFF4MOF(force_field):
             'params': bond_params,
             'style': style,
             'count': (
-                count,
+                len(topology.edges),
                 len(all_bonds)),
             'comments': bond_comments}
 
     def enumerate_angles(self):
 
-        SG = self.system['graph']
-        bonds = self.bond_data['all_bonds']
-        bond_params = self.bond_data['params']
-        inv_bonds = dict((b, bt) for bt in bonds for b in bonds[bt])
-        angles = {}
-
-        for n in SG.nodes(data=True):
-
-            name, data = n
-            nbors = list(SG.neighbors(name))
-
-            for comb in itertools.combinations(nbors, 2):
-
-                j = name
-                i, k = comb
-
-                fft_i = SG.nodes[i]['force_field_type']
-                fft_j = SG.nodes[j]['force_field_type']
-                fft_k = SG.nodes[k]['force_field_type']
-
-                sort_ik = sorted([(fft_i, i), (fft_k, k)], key=lambda x: x[0])
-                fft_i, i = sort_ik[0]
-                fft_k, k = sort_ik[1]
-
-                # look up bond constants (don't need to calculate again, yay!)
-                try:
-                    bond_type_ij = inv_bonds[(i, j)]
-                except KeyError:
-                    bond_type_ij = inv_bonds[(j, i)]
-                try:
-                    bond_type_jk = inv_bonds[(j, k)]
-                except KeyError:
-                    bond_type_jk = inv_bonds[(k, j)]
-
-                try:
-                    r_ij = bond_params[bond_type_ij][2]
-                    r_jk = bond_params[bond_type_jk][2]
-                except IndexError:
-                    continue
-
-                angle = sorted((fft_i, fft_k))
-                sorted_rs = sorted((r_ij, r_jk))
-
-                # angle = (angle[0], fft_j, angle[1], r_ij, r_jk)
-                angle = (angle[0], fft_j, angle[1], sorted_rs[0], sorted_rs[1])
-
-                # add to list if angle type already exists, else add a new type
-                try:
-                    angles[angle].append((i, j, k))
-                except KeyError:
-                    angles[angle] = [(i, j, k)]
+        topology = self.topology
+        names = topology.type_names
+        types = topology.types
+
+        # every pair of neighbors of each center atom j, with the outer atoms ordered by type
+        j, slot_i, slot_k = combination_pairs(topology.degree)
+        i = topology.neighbor(j, slot_i)
+        k = topology.neighbor(j, slot_k)
+        swap = types[i] > types[k]
+        i, k = np.where(swap, k, i), np.where(swap, i, k)
+
+        # skip angles involving bonds without an equilibrium length
+        r_ij = topology.edge_length[topology.csr_edge[topology.indptr[j] + slot_i]]
+        r_jk = topology.edge_length[topology.csr_edge[topology.indptr[j] + slot_k]]
+        valid = np.logical_not(np.isnan(r_ij) | np.isnan(r_jk))
+        i, j, k, r_ij, r_jk = i[valid], j[valid], k[valid], r_ij[valid], r_jk[valid]
+
+        # angle types are the outer and center types plus the sorted bond lengths
+        lengths, r_ids = np.unique(np.concatenate([r_ij, r_jk]), return_inverse=True)
+        r_ids = r_ids.reshape(2, -1)
+        keys = np.stack([types[i], types[j], types[k], r_ids.min(axis=0), r_ids.max(axis=0)], axis=1)
+        groups, first, order = group_first_seen(keys)
+        angle_labels = list(map(tuple, topology.node_labels(np.stack([i, j, k], axis=1))))
 
         angle_params = {}
         angle_comments = {}
         all_angles = {}
-        ID = 0
-        count = 0
         styles = []
 
         # index angles by ID
-        for a in angles:
+        members = np.split(order, np.cumsum(np.bincount(groups, minlength=len(first)))[:-1])
+        for ID, (a, angles) in enumerate(zip(first, members), start=1):
 
-            ID += 1
-            fft_i, fft_j, fft_k, r_ij, r_jk = a
-            angle = (fft_i, fft_j, fft_k)
-            params = self.angle_parameters(angle, r_ij, r_jk)
+            angle = tuple(names[t] for t in keys[a, :3])
+            params = self.angle_parameters(angle, lengths[keys[a, 3]], lengths[keys[a, 4]])
             styles.append(params[0])
             angle_params[ID] = list(params)
             angle_comments[ID] = list(angle)
-            all_angles[ID] = angles[a]
-            count += len(angles[a])
+            all_angles[ID] = [angle_labels[x] for x in angles]
 
         styles = set(styles)
         if len(styles) == 1:
@@ -834,114 +805,109 @@ class UFF4MOF(force_field):
             'params': angle_params,
             'style': style,
             'count': (
-                count,
+                len(angle_labels),
                 len(all_angles)),
             'comments': angle_comments}
 
     def enumerate_dihedrals(self):
 
         SG = self.system['graph']
-        dihedrals = {}
-        dihedral_params = {}
-
-        for e in SG.edges(data=True):
-
-            j, k = e[0:2]
-            fft_j = SG.nodes[j]['force_field_type']
-            fft_k = SG.nodes[k]['force_field_type']
-            hyb_j = SG.nodes[j]['hybridization']
-            hyb_k = SG.nodes[k]['hybridization']
-            els_j = SG.nodes[j]['element_symbol']
-            els_k = SG.nodes[k]['element_symbol']
-            bond_order = e[2]['bond_order']
-            nodes = (j, k)
-
-            nbors_j = [n for n in SG.neighbors(j) if n != k]
-            nbors_k = [n for n in SG.neighbors(k) if n != j]
-
-            il_pairs = list(itertools.product(nbors_j, nbors_k))
-            dihedral_list = [(p[0], j, k, p[1]) for p in il_pairs]
-
-            bond = sorted([fft_j, fft_k])
-            bond = (bond[0], bond[1], bond_order)
-            hybridization = (hyb_j, hyb_k)
-            element_symbols = (els_j, els_k)
-
-            # here I calculate  parameters for each dihedral (I know) but I prefer identifying
-            # those dihedrals before passing to the final dihedral data
-            # construction.
-            params = self.dihedral_parameters(
-                bond, hybridization, element_symbols, nodes)
-
-            if params != 'NA':
-                try:
-                    dihedrals[bond].extend(dihedral_list)
-                except KeyError:
-                    dihedrals[bond] = dihedral_list
-                    dihedral_params[bond] = params
+        topology = self.topology
+        names = topology.type_names
+        types = topology.types
+        degree = topology.degree
+        j, k = topology.edges.T
+
+        # the parameters depend on the bond type, the hybridization and elements of the central atoms,
+        # and their degrees, so are computed once for each distinct combination
+        descriptors = {}
+        node_descriptors = np.array([
+            [descriptors.setdefault((SG.nodes[n]['hybridization'], SG.nodes[n]['element_symbol']), len(descriptors))]
+            for n in topology.nodes
+        ], dtype=int).reshape(-1)
+        descriptor_values = list(descriptors)
+        bond_keys = np.stack([np.minimum(types[j], types[k]), np.maximum(types[j], types[k]), topology.edge_order], axis=1)
+        edge_keys = np.concatenate([bond_keys, np.stack([node_descriptors[j], node_descriptors[k], degree[j], degree[k]], axis=1)], axis=1)
+        param_groups, param_first, _ = group_first_seen(edge_keys)
+
+        edge_params = []
+        for e in param_first:
+            (hyb_j, els_j), (hyb_k, els_k) = descriptor_values[edge_keys[e, 3]], descriptor_values[edge_keys[e, 4]]
+            bond = (names[bond_keys[e, 0]], names[bond_keys[e, 1]], topology.edge_data[e]['bond_order'])
+            edge_params.append(self.dihedral_parameters(
+                bond, (hyb_j, hyb_k), (els_j, els_k), tuple(topology.node_labels(topology.edges[e]))))
+        has_params = np.array([p != 'NA' for p in edge_params], dtype=bool)[param_groups] if len(param_groups) > 0 else np.zeros(0, dtype=bool)
+
+        # dihedral types are keyed by the bond type, taking the parameters from its first bond which has them
+        edges = np.flatnonzero(has_params)
+        groups, first, _ = group_first_seen(bond_keys[edges])
+
+        # every combination of the other neighbors of j and of k for each bond
+        n_j, n_k = degree[j[edges]] - 1, degree[k[edges]] - 1
+        counts = n_j * n_k
+        owner = np.repeat(np.arange(len(edges)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        slot_i, slot_l = local // n_k[owner], local % n_k[owner]
+        slot_i += slot_i >= topology.edge_slot[edges[owner], 0]
+        slot_l += slot_l >= topology.edge_slot[edges[owner], 1]
+        dihedrals = np.stack([
+            topology.neighbor(j[edges[owner]], slot_i),
+            j[edges[owner]],
+            k[edges[owner]],
+            topology.neighbor(k[edges[owner]], slot_l)
+        ], axis=1)
+        dihedral_labels = list(map(tuple, topology.node_labels(dihedrals)))
+        order = np.argsort(groups[owner], kind='stable')
 
         all_dihedrals = {}
         dihedral_comments = {}
         indexed_dihedral_params = {}
-        ID = 0
-        count = 0
-        for d in dihedrals:
-
-            ID += 1
-            dihedral = ('X', d[0], d[1], 'X')
-            params = dihedral_params[d]
-            all_dihedrals[ID] = dihedrals[d]
-            indexed_dihedral_params[ID] = list(dihedral_params[d])
+        members = np.split(order, np.cumsum(np.bincount(groups[owner], minlength=len(first)))[:-1])
+        for ID, (e, group_dihedrals) in enumerate(zip(first, members), start=1):
+
+            edge = edges[e]
+            bond_order = topology.edge_data[edge]['bond_order']
+            dihedral = ('X', names[bond_keys[edge, 0]], names[bond_keys[edge, 1]], 'X')
+            all_dihedrals[ID] = [dihedral_labels[d] for d in group_dihedrals]
+            indexed_dihedral_params[ID] = list(edge_params[param_groups[edge]])
             dihedral_comments[ID] = list(
-                dihedral) + ['bond order=' + str(d[2])]
-            count += len(dihedrals[d])
+                dihedral) + ['bond order=' + str(bond_order)]
 
         self.dihedral_data = {
             'all_dihedrals': all_dihedrals,
             'params': indexed_dihedral_params,
             'style': 'harmonic',
             'count': (
-                count,
+                len(dihedral_labels),
                 len(all_dihedrals)),
             'comments': dihedral_comments}
 
     def enumerate_impropers(self):
 
-        SG = self.system['graph']
-        impropers = {}
-
-        for n in SG.nodes(data=True):
-
-            i, data = n
-            nbors = list(SG.neighbors(i))
-
-            if len(nbors) == 3:
-
-                fft_i = data['force_field_type']
-                fft_nbors = tuple(
-                    sorted([SG.nodes[m]['force_field_type'] for m in nbors]))
-                O_2_flag = False
-                # force constant is much larger if j,k, or l is O_2
-                if 'O_2' in fft_nbors or 'O_2_M' in fft_nbors:
-                    O_2_flag = True
-                j, k, LL = nbors
+        topology = self.topology
+        names = topology.type_names
+        types = topology.types
 
-                # only need to consider one combination
-                imps = [[i, j, k, LL]]
+        # one improper for each atom with three neighbors
+        centers = np.flatnonzero(topology.degree == 3)
+        nbors = topology.indices[topology.indptr[centers][:, None] + np.arange(3)]
 
-                try:
-                    impropers[(fft_i, O_2_flag)].extend(imps)
-                except KeyError:
-                    impropers[(fft_i, O_2_flag)] = imps
+        # force constant is much larger if j,k, or l is O_2
+        O_2_types = [t for t, name in enumerate(names) if name in ('O_2', 'O_2_M')]
+        O_2_flags = np.isin(types[nbors], O_2_types).any(axis=1)
+        keys = np.stack([types[centers], O_2_flags], axis=1)
+        groups, first, order = group_first_seen(keys)
+        improper_labels = topology.node_labels(np.concatenate([centers[:, None], nbors], axis=1))
 
         all_impropers = {}
         improper_params = {}
         improper_comments = {}
         ID = 0
         count = 0
-        for i in impropers:
+        members = np.split(order, np.cumsum(np.bincount(groups, minlength=len(first)))[:-1])
+        for c, impropers in zip(first, members):
 
-            fft_i, O_2_flag = i
+            fft_i, O_2_flag = names[keys[c, 0]], bool(O_2_flags[c])
 
             params = self.improper_parameters(fft_i, O_2_flag)
 
@@ -949,9 +915,9 @@ class UFF4MOF(force_field):
                 ID += 1
                 improper_params[ID] = list(params)
                 improper_comments[ID] = [
-                    i[0], 'X', 'X', 'X', 'O_2 present=' + str(O_2_flag)]
-                all_impropers[ID] = impropers[i]
-                count += len(impropers[i])
+                    fft_i, 'X', 'X', 'X', 'O_2 present=' + str(O_2_flag)]
+                all_impropers[ID] = [improper_labels[x] for x in impropers]
+                count += len(impropers)
 
         self.improper_data = {
             'all_impropers': all_impropers,
@@ -306,12 +306,32 @@ def initialize_system(
         small_molecule_cutoff=5,
         read_pymatgen=False):
     if not read_pymatgen:
-        elems, names, cif_labels, ccoords, fcoords, charge_list, bonds, uc_params, unit_cell = cif_read(
-            filename, charges=charges)
+        parsed = cif_read(filename, charges=charges)
     else:
         from .pymatgen_cif2system import cif_read_pymatgen
-        elems, names, cif_labels, ccoords, fcoords, charge_list, bonds, uc_params, unit_cell = cif_read_pymatgen(
-            filename, charges=charges)
+        parsed = cif_read_pymatgen(filename, charges=charges)
+
+    return build_system(parsed, small_molecule_cutoff=small_molecule_cutoff, name=filename)
+
+
+def initialize_system_from_atoms(
+        atoms,
+        charges=None,
+        small_molecule_cutoff=5):
+    """
+        builds the system graph directly from an ASE atoms object, equivalent to reading a CIF written
+        from the same structure with read_pymatgen=True
+    """
+    from .pymatgen_cif2system import atoms_read_pymatgen
+    parsed = atoms_read_pymatgen(atoms, charges=charges)
+    return build_system(parsed, small_molecule_cutoff=small_molecule_cutoff, name=atoms.get_chemical_formula())
+
+
+def build_system(parsed, small_molecule_cutoff=5, name=None):
+    """
+        builds the bond graphs of the framework and small molecules from the output of a structure reader
+    """
+    elems, names, cif_labels, ccoords, fcoords, charge_list, bonds, uc_params, unit_cell = parsed
 
     A, B, C, alpha, beta, gamma = uc_params
 
@@ -389,7 +409,7 @@ def initialize_system(
             data['bond_type'] = 'A'
 
     if print_flag:
-        logger.debug('correcting bond type to aromatic for', filename)
+        logger.debug('correcting bond type to aromatic for', name)
 
     components = []
     SGS = [G.subgraph(c).copy() for c in nx.connected_components(G)]
@@ -505,22 +525,7 @@ def duplicate_system(system, replications, small_molecule_cutoff=10):
     cz = (c ** 2.0 - cx ** 2.0 - cy ** 2.0) ** 0.5
     unit_cell = np.asarray([[ax, ay, az], [bx, by, bz], [cx, cy, cz]]).T
 
-    basis_vecs = [np.array([1, 0, 0]), np.array(
-        [0, 1, 0]), np.array([0, 0, 1])]
-    dim0 = [[np.array([0, 0, 0])]] + [[np.array([0, 0, 0])] + [basis_vecs[0]
-                                                               for i in range(r + 1)] for r in range(replications[0] - 1)]
-    dim1 = [[np.array([0, 0, 0])]] + [[np.array([0, 0, 0])] + [basis_vecs[1]
-                                                               for i in range(r + 1)] for r in range(replications[1] - 1)]
-    dim2 = [[np.array([0, 0, 0])]] + [[np.array([0, 0, 0])] + [basis_vecs[2]
-                                                               for i in range(r + 1)] for r in range(replications[2] - 1)]
-
-    dim0 = [np.sum([v for v in comb], axis=0) for comb in dim0]
-    dim1 = [np.sum([v for v in comb], axis=0) for comb in dim1]
-    dim2 = [np.sum([v for v in comb], axis=0) for comb in dim2]
-
-    trans_vecs = [np.sum(comb, axis=0)
-                  for comb in itertools.product(dim0, dim1, dim2)]
-    trans_vecs = [v for v in trans_vecs if np.any(v)]
+    trans_vecs = np.array([v for v in itertools.product(*(range(r) for r in replications)) if any(v)])
 
     logger.debug('The transformation vectors for the replication are:')
     for vec in trans_vecs:
@@ -532,130 +537,74 @@ def duplicate_system(system, replications, small_molecule_cutoff=10):
         raise ValueError(
             'The number of transformation vectors in the replication is wrong somehow')
 
+    # fractional positions of the original atoms (image 0) and each of their copies, shape (images, atoms, 3)
+    nodes = list(G.nodes())
+    node_pos = dict((n, i) for i, n in enumerate(nodes))
+    n_nodes, n_copies = len(nodes), len(trans_vecs)
+    orig_fvecs = np.array([G.nodes[n]['fractional_position'] for n in nodes], dtype=float)
+    fvecs = np.concatenate([orig_fvecs[None, :, :], orig_fvecs[None, :, :] + trans_vecs[:, None, :]], axis=0)
+    fvecs /= np.array(replications, dtype=float)
+    cvecs = np.einsum('ij,...j->...i', unit_cell, fvecs)
+
+    # copies are numbered by translation vector, then by atom
+    max_ind = max([d['index'] for n, d in G.nodes(data=True)])
+    copy_ids = max_ind + 1 + np.arange(n_copies * n_nodes).reshape(n_copies, n_nodes)
+    image_ids = [nodes] + copy_ids.tolist()
+
     NG = G.copy()
+    for i, node in enumerate(nodes):
+        NG.nodes[node]['fractional_position'] = fvecs[0, i]
+        NG.nodes[node]['cartesian_position'] = cvecs[0, i]
+
+    new_nodes = []
+    for t, ids in enumerate(copy_ids.tolist()):
+        for i, (node, node_data) in enumerate(G.nodes(data=True)):
+            new_nodes.append((ids[i], dict(
+                element_symbol=node_data['element_symbol'],
+                mol_flag=1,
+                index=ids[i],
+                force_field_type='',
+                cartesian_position=cvecs[t + 1, i],
+                fractional_position=fvecs[t + 1, i],
+                charge=node_data['charge'],
+                duplicated_version_of=node_data['index'],
+                cif_label=node_data['cif_label'])))
+    NG.add_nodes_from(new_nodes)
+
+    # check every image of each bond against every image of its partner, in blocks of bonds to limit memory
+    edges = list(G.edges(data=True))
+    new_edges = []
     edge_remove_list = []
-    max_ind = max([d['index'] for n, d in G.nodes(data=True)])
-    count = max_ind
-    equivalency = dict((n, []) for n in G.nodes())
-
-    for trans_vec in trans_vecs:
-
-        for node, node_data in G.nodes(data=True):
-            count += 1
-
-            # this data stays the same
-            element_symbol = node_data['element_symbol']
-            charge = node_data['charge']
-            cif_label = node_data['cif_label']
-
-            # update index
-            original_atom = node_data['index']
-            new_index = count
-
-            # update coordinates
-            fvec = node_data['fractional_position']
-            translated_fvec = fvec + trans_vec
-            fvec = np.array([c / d for c, d in zip(fvec, replications)])
-            translated_fvec = np.array(
-                [c / d for c, d in zip(translated_fvec, replications)])
-            NG.nodes[node]['fractional_position'] = fvec
-
-            equivalency[original_atom].append(new_index)
-            NG.add_node(new_index,
-                        element_symbol=element_symbol,
-                        mol_flag=1,
-                        index=new_index,
-                        force_field_type='',
-                        cartesian_position=np.array([0.0,
-                                                     0.0,
-                                                     0.0]),
-                        fractional_position=translated_fvec,
-                        charge=charge,
-                        duplicated_version_of=original_atom,
-                        cif_label=cif_label)
-
-    for node, data in NG.nodes(data=True):
-        data['cartesian_position'] = np.dot(
-            unit_cell, data['fractional_position'])
-
-    for n0, n1, edge_data in G.edges(data=True):
-
-        sym_code = edge_data['sym_code']
-        bond_type = edge_data['bond_type']
-        length = edge_data['length']
-
-        fvec_n0 = NG.nodes[n0]['fractional_position']
-        fvec_n1 = NG.nodes[n1]['fractional_position']
-
-        for eq0 in equivalency[n0]:
-            for eq1 in equivalency[n1]:
-
-                fvec_eq0 = NG.nodes[eq0]['fractional_position']
-                fvec_eq1 = NG.nodes[eq1]['fractional_position']
-
-                dist_e0e1, sym_e0e1 = PBC3DF_sym(fvec_eq0, fvec_eq1)
-                dist_e0e1 = np.linalg.norm(np.dot(unit_cell, dist_e0e1))
-
-                dist_n0e1, sym_n0e1 = PBC3DF_sym(fvec_n0, fvec_eq1)
-                dist_n0e1 = np.linalg.norm(np.dot(unit_cell, dist_n0e1))
-
-                dist_e0n1, sym_e0n1 = PBC3DF_sym(fvec_eq0, fvec_n1)
-                dist_e0n1 = np.linalg.norm(np.dot(unit_cell, dist_e0n1))
-
-                dist_n0n1, sym_n0n1 = PBC3DF_sym(fvec_n0, fvec_n1)
-                dist_n0n1 = np.linalg.norm(np.dot(unit_cell, dist_n0n1))
-
-                if abs(dist_e0e1 - length) < 0.075:
-
-                    if np.any(sym_e0e1):
-                        sym_code = '1_' + \
-                                   ''.join(map(str, map(int, sym_e0e1 + 5)))
-                    else:
-                        sym_code = '.'
-
-                    NG.add_edge(
-                        eq0,
-                        eq1,
-                        sym_code=sym_code,
-                        bond_type=bond_type,
-                        length=dist_e0e1)
-
-                if abs(dist_n0e1 - length) < 0.075:
-
-                    if np.any(sym_n0e1):
-                        sym_code = '1_' + \
-                                   ''.join(map(str, map(int, sym_n0e1 + 5)))
-                    else:
-                        sym_code = '.'
-
-                    NG.add_edge(
-                        n0,
-                        eq1,
-                        sym_code=sym_code,
-                        bond_type=bond_type,
-                        length=dist_n0e1)
-
-                if abs(dist_e0n1 - length) < 0.075:
-
-                    if np.any(sym_e0n1):
-                        sym_code = '1_' + \
-                                   ''.join(map(str, map(int, sym_e0n1 + 5)))
-                    else:
-                        sym_code = '.'
-
-                    NG.add_edge(
-                        eq0,
-                        n1,
-                        sym_code=sym_code,
-                        bond_type=bond_type,
-                        length=dist_n0e1)
-
-                if abs(dist_n0n1 - length) > 0.075:
-                    if (n0, n1) not in edge_remove_list:
-                        edge_remove_list.append((n0, n1))
-
-    for e in edge_remove_list:
-        NG.remove_edge(e[0], e[1])
+    # image pairs checked for each bond, in order: copy-copy, original-copy, copy-original
+    cand_a, cand_b = np.array([
+        pair for a in range(1, n_copies + 1) for b in range(1, n_copies + 1) for pair in ((a, b), (0, b), (a, 0))
+    ]).T
+    block_size = max(1, 2 ** 20 // (n_copies + 1) ** 2)
+    for block_start in range(0, len(edges), block_size):
+        block = edges[block_start:block_start + block_size]
+        ids0 = np.array([node_pos[n0] for n0, _, _ in block])
+        ids1 = np.array([node_pos[n1] for _, n1, _ in block])
+        lengths = np.array([d['length'] for _, _, d in block])
+
+        # displacement between image a of n0 and image b of n1 under the periodic boundary, shape (bonds, a, b, 3)
+        disp = fvecs[:, ids0].transpose(1, 0, 2)[:, :, None, :] - fvecs[:, ids1].transpose(1, 0, 2)[:, None, :, :]
+        sym = np.where(disp > 0.5, -1.0, np.where(disp < -0.5, 1.0, 0.))
+        disp = disp + sym
+        dists = np.linalg.norm(np.einsum('ij,...j->...i', unit_cell, disp), axis=-1)
+        match = np.abs(dists - lengths[:, None, None]) < 0.075
+
+        for k, c in zip(*np.nonzero(match[:, cand_a, cand_b])):
+            a, b = cand_a[c], cand_b[c]
+            sym_ab = sym[k, a, b]
+            sym_code = '1_' + ''.join(map(str, map(int, sym_ab + 5))) if np.any(sym_ab) else '.'
+            new_edges.append((image_ids[a][ids0[k]], image_ids[b][ids1[k]],
+                              dict(sym_code=sym_code, bond_type=block[k][2]['bond_type'], length=dists[k, a, b])))
+
+        for k in np.flatnonzero(np.abs(dists[:, 0, 0] - lengths) > 0.075):
+            edge_remove_list.append((block[k][0], block[k][1]))
+
+    NG.add_edges_from(new_edges)
+    NG.remove_edges_from(edge_remove_list)
 
     components = []
     SGS = [NG.subgraph(c).copy() for c in nx.connected_components(NG)]
@@ -8,7 +8,8 @@ from ase import neighborlist
 from ase.geometry import get_distances
 from pymatgen.io.cif import CifParser
 from pymatgen.io.ase import AseAtomsAdaptor
-from pymatgen.core import bonds
+from pymatgen.core import bonds, Lattice, Structure
+from ase.io.cif import autolabel
 from numpy import cross, eye
 from numpy.linalg import norm, inv
 from scipy.linalg import expm
@@ -170,13 +171,6 @@ def read_cif(self):
 
 
 def cif_read_pymatgen(filename, charges=False, coplanarity_tolerance=0.1):
-    valencies = {'C': 4.0, 'Si': 4.0, 'Ge': 4.0, 'N': 3.0,
-                 'P': 3.0, 'As': 3.0, 'Sb': 3.0, 'O': 2.0,
-                 'S': 2.0, 'Se': 2.0, 'Te': 2.0, 'F': 1.0,
-                 'Cl': 1.0, 'Br': 1.0, 'I': 1.0, 'H': 1.0,
-                 'X': 1.0}
-
-    bond_types = {0.5: 'S', 1.0: 'S', 1.5: 'A', 2.0: 'D', 3.0: 'T'}
 
     with open(filename, 'r') as f:
         f = f.read()
@@ -200,6 +194,36 @@ def cif_read_pymatgen(filename, charges=False, coplanarity_tolerance=0.1):
 
     cif = CifParser(filename)
     struct = cif.get_structures(primitive=False)[0]
+    return structure_read_pymatgen(struct, charge_list if charges else None, coplanarity_tolerance)
+
+
+def atoms_read_pymatgen(atoms, charges=None, coplanarity_tolerance=0.1):
+    """
+        prepares an ASE atoms object in the same way as a CIF written by ASE and read back by pymatgen:
+        the cell is rotated to the standard orientation, atoms are wrapped into the cell, labeled by element,
+        and sorted by electronegativity
+    """
+
+    lattice = Lattice.from_parameters(*atoms.cell.cellpar())
+    struct = Structure(lattice, atoms.get_chemical_symbols(), atoms.get_scaled_positions(wrap=True),
+                       labels=autolabel(atoms.get_chemical_symbols()))
+    if charges is not None:
+        struct.add_site_property('charge', charges)
+    struct = struct.get_sorted_structure()
+    if charges is not None:
+        charges = list(struct.site_properties['charge'])
+    return structure_read_pymatgen(struct, charges, coplanarity_tolerance)
+
+
+def structure_read_pymatgen(struct, charge_list=None, coplanarity_tolerance=0.1):
+    valencies = {'C': 4.0, 'Si': 4.0, 'Ge': 4.0, 'N': 3.0,
+                 'P': 3.0, 'As': 3.0, 'Sb': 3.0, 'O': 2.0,
+                 'S': 2.0, 'Se': 2.0, 'Te': 2.0, 'F': 1.0,
+                 'Cl': 1.0, 'Br': 1.0, 'I': 1.0, 'H': 1.0,
+                 'X': 1.0}
+
+    bond_types = {0.5: 'S', 1.0: 'S', 1.5: 'A', 2.0: 'D', 3.0: 'T'}
+
     atoms = AseAtomsAdaptor.get_atoms(struct)
     unit_cell = atoms.get_cell()
     inv_uc = inv(unit_cell.T)
@@ -231,7 +255,7 @@ def cif_read_pymatgen(filename, charges=False, coplanarity_tolerance=0.1):
 
     logger.debug('skin for bond calculation is', skin)
 
-    if not charges:
+    if charge_list is None:
         charge_list = [0.0 for a in atoms]
 
     cutoffs = neighborlist.natural_cutoffs(atoms)
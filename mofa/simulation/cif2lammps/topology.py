@@ -0,0 +1,105 @@
+"""Array representation of a bonded graph used to enumerate force field terms"""
+import numpy as np
+
+
+def group_first_seen(keys):
+    """
+        groups rows of an integer key array, numbering groups by where they first appear
+
+        returns the group of each row, the first row of each group, and an ordering of the rows
+        which lists each group in turn while preserving the original order within a group
+    """
+
+    keys = np.asarray(keys, dtype=int).reshape(len(keys), -1)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    # combine the columns into a single integer key
+    flat = np.ravel_multi_index(keys.T, keys.max(axis=0) + 1)
+    _, first, inverse = np.unique(flat, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=int)
+    rank[np.argsort(first)] = np.arange(len(first))
+    groups = rank[inverse]
+
+    return groups, np.sort(first), np.argsort(groups, kind='stable')
+
+
+def combination_pairs(degrees):
+    """
+        positions of each pair of neighbors, in the order given by itertools.combinations,
+        for nodes with the given degrees
+
+        returns the node and the two neighbor positions of each pair
+    """
+
+    degrees = np.asarray(degrees)
+    counts = degrees * (degrees - 1) // 2
+    owner = np.repeat(np.arange(len(degrees)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    first = np.zeros(len(owner), dtype=int)
+    second = np.zeros(len(owner), dtype=int)
+    for d in np.unique(degrees[degrees > 1]):
+        table_first, table_second = np.triu_indices(d, 1)
+        mask = degrees[owner] == d
+        first[mask] = table_first[local[mask]]
+        second[mask] = table_second[local[mask]]
+
+    return owner, first, second
+
+
+class Topology(object):
+
+    """
+        compiled form of a networkx graph: nodes and edges are numbered in the order networkx
+        iterates over them, the adjacency is stored in CSR form, and each node carries an integer
+        force field type ID (IDs are assigned in sorted order of the type names so that comparing
+        IDs is the same as comparing names)
+    """
+
+    def __init__(self, graph, type_key='force_field_type'):
+
+        self.nodes = list(graph.nodes())
+        self.labels = np.array(self.nodes, dtype=int if all(isinstance(n, int) for n in self.nodes) else object)
+        position = dict((n, i) for i, n in enumerate(self.nodes))
+
+        # adjacency in CSR form, keeping the neighbor order of networkx
+        self.degree = np.array([len(graph.adj[n]) for n in self.nodes], dtype=int)
+        self.indptr = np.concatenate([[0], np.cumsum(self.degree)]).astype(int)
+        self.indices = np.array([position[m] for n in self.nodes for m in graph.adj[n]], dtype=int)
+        owner = np.repeat(np.arange(len(self.nodes)), self.degree)
+        slot = np.arange(len(self.indices)) - self.indptr[owner]
+
+        # edges are numbered in the order of graph.edges(), which lists each edge from the endpoint seen first
+        forward = self.indices >= owner
+        self.edges = np.stack([owner[forward], self.indices[forward]], axis=1)
+        self.edge_data = [d for n, f in zip(self.nodes, np.split(forward, self.indptr[1:-1]))
+                          for d, keep in zip(graph.adj[n].values(), f) if keep]
+
+        # match each CSR entry to its edge, and record where each endpoint lists the other
+        edge_keys = self.edges[:, 0] * len(self.nodes) + self.edges[:, 1]
+        key_order = np.argsort(edge_keys)
+        csr_keys = np.minimum(owner, self.indices) * len(self.nodes) + np.maximum(owner, self.indices)
+        self.csr_edge = key_order[np.searchsorted(edge_keys, csr_keys, sorter=key_order)]
+        self.edge_slot = np.zeros((len(self.edges), 2), dtype=int)
+        self.edge_slot[self.csr_edge, np.where(forward, 0, 1)] = slot
+
+        # integer type IDs
+        names = [graph.nodes[n][type_key] for n in self.nodes]
+        self.type_names = sorted(set(names))
+        type_id = dict((t, i) for i, t in enumerate(self.type_names))
+        self.types = np.array([type_id[t] for t in names], dtype=int)
+
+    def neighbor(self, node, slot):
+        """
+            position of the slot-th neighbor of each node
+        """
+
+        return self.indices[self.indptr[node] + slot]
+
+    def node_labels(self, positions):
+        """
+            graph labels for an array of node positions, as nested lists
+        """
+
+        return self.labels[np.asarray(positions)].tolist()
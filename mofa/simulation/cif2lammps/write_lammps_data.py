@@ -41,9 +41,10 @@ def isfloat(value):
         return False
 
 
-def lammps_inputs(args):
-
-    cifname, force_field, ff_string, sm_ff_string, outdir, charges, replication, read_pymatgen, add_molecule, sm_file = args
+def force_field_settings(ff_string):
+    """
+        parameters, cutoff and mixing rules for each force field
+    """
 
     # add more forcefields here as they are created
     if ff_string == 'UFF4MOF':
@@ -72,6 +73,35 @@ def lammps_inputs(args):
         FF_args = {'FF_parameters': 'gaff2', 'bond_orders': None}
         cutoff = 12.50
         mixing_rules = 'shift yes mix arithmetic'
+    else:
+        raise ValueError(f'No settings available for force field: {ff_string}')
+
+    return FF_args, cutoff, mixing_rules
+
+
+def compile_force_field(system, force_field, ff_string, sm_ff_string=None, charges=False):
+    """
+        types the atoms of a system and assigns all force field parameters
+    """
+
+    FF_args, cutoff, _ = force_field_settings(ff_string)
+    FF = force_field(system, cutoff, FF_args)
+    FF.compile_force_field(charges=charges)
+
+    if sm_ff_string is not None:
+        add_small_molecules(FF, sm_ff_string)
+    else:
+        if len(FF.system['SM_graph'].nodes()) != 0:
+            warnings.warn(
+                'extra-framework molecules detected, but no small molecule force field is specified!')
+
+    return FF
+
+
+def lammps_inputs(args):
+
+    cifname, force_field, ff_string, sm_ff_string, outdir, charges, replication, read_pymatgen, add_molecule, sm_file = args
+    _, cutoff, mixing_rules = force_field_settings(ff_string)
 
     system = initialize_system(
         cifname,
@@ -87,15 +117,64 @@ def lammps_inputs(args):
 
     logger.debug('system initialized...')
 
-    FF = force_field(system, cutoff, FF_args)
-    FF.compile_force_field(charges=charges)
+    FF = compile_force_field(system, force_field, ff_string, sm_ff_string, charges)
 
-    if sm_ff_string is not None:
-        add_small_molecules(FF, sm_ff_string)
+    if replication != '':
+        suffix = ''.join(cifname.split(
+            '/')[-1].split('.')[0:-1]) + '_' + replication
     else:
-        if len(FF.system['SM_graph'].nodes()) != 0:
-            warnings.warn(
-                'extra-framework molecules detected, but no small molecule force field is specified!')
+        suffix = ''.join(cifname.split('/')[-1].split('.')[0:-1])
+
+    if sm_file is not None:
+
+        NM = len(list(nx.connected_components(system['SM_graph'])))
+        suffix += '_' + str(NM)
+
+    infile_add_lines, extra_types = None, None
+    if add_molecule is not None:
+        molfile, infile_add_lines, extra_types = include_molecule_file(
+            FF, count_types(FF), add_molecule)
+        with open(outdir + os.sep + 'mol.' + suffix, 'w') as MF:
+            MF.write(molfile)
+
+    data_name = 'data.' + suffix
+    write_data_file(FF, outdir + os.sep + data_name, charges=charges)
+    write_in_file(FF, outdir + os.sep + 'in.' + suffix, data_name, mixing_rules,
+                  sm_ff_string=sm_ff_string, add_molecule=add_molecule,
+                  infile_add_lines=infile_add_lines, extra_types=extra_types)
+
+
+def count_types(FF):
+    """
+        number of atom, bond, angle, dihedral and improper types
+    """
+
+    try:
+        ty_dihedrals = FF.dihedral_data['count'][1]
+    except AttributeError:
+        ty_dihedrals = None
+
+    try:
+        ty_impropers = FF.improper_data['count'][1]
+    except AttributeError:
+        ty_impropers = None
+
+    return len(FF.atom_types), FF.bond_data['count'][1], FF.angle_data['count'][1], ty_dihedrals, ty_impropers
+
+
+def element_list(FF):
+    """
+        element symbol of each atom type, in the order of the type IDs
+    """
+    return [FF.atom_element_symbols[fft] for fft in FF.atom_masses]
+
+
+def write_data_file(FF, path, charges=False):
+    """
+        writes the LAMMPS data file for a compiled force field
+    """
+
+    system = FF.system
 
     # write_cif_from_system(system, 'check.cif')
     first_line = "Created by Ryther's code on " + \
@@ -118,24 +197,6 @@ def lammps_inputs(args):
         N_impropers = 0
         ty_impropers = None
 
-    if replication != '':
-        suffix = ''.join(cifname.split(
-            '/')[-1].split('.')[0:-1]) + '_' + replication
-    else:
-        suffix = ''.join(cifname.split('/')[-1].split('.')[0:-1])
-
-    if sm_file is not None:
-
-        NM = len(list(nx.connected_components(system['SM_graph'])))
-        suffix += '_' + str(NM)
-
-    maxIDs = (ty_atoms, ty_bonds, ty_angles, ty_dihedrals, ty_impropers)
-    if add_molecule is not None:
-        molfile, infile_add_lines, extra_types = include_molecule_file(
-            FF, maxIDs, add_molecule)
-        with open(outdir + os.sep + 'mol.' + suffix, 'w') as MF:
-            MF.write(molfile)
-
     a, b, c, alpha, beta, gamma = system['box']
     cifbox = "# a, b, c, alpha, beta, gamma: " + "%.10f" % a + ", " + "%.10f" % b + ", " + "%.10f" % c + \
         ", " + "%.10f" % alpha + ", " + "%.10f" % beta + ", " + "%.10f" % gamma + " $$$atoms$$$"
@@ -146,9 +207,7 @@ def lammps_inputs(args):
     yz = np.round((b * c * np.cos(math.radians(alpha)) - xy * xz) / ly, 8)
     lz = np.round(np.sqrt(c**2 - xz**2 - yz**2), 8)
 
-    data_name = 'data.' + suffix
-
-    with open(outdir + os.sep + data_name, 'w') as data:
+    with open(path, 'w') as data:
         data.write(first_line + '\n')
         data.write('\n')
         data.write('    ' + str(N_atoms) + ' atoms\n')
@@ -471,7 +530,14 @@ def lammps_inputs(args):
                                                                                                         id2label[improper[3]]))
                     data.write('\n')
 
-    with open(outdir + os.sep + 'in.' + suffix, 'w') as infile:
+
+def write_in_file(FF, path, data_name, mixing_rules, sm_ff_string=None, add_molecule=None,
+                  infile_add_lines=None, extra_types=None, footer=''):
+    """
+        writes the LAMMPS input file which reads the data file, optionally followed by additional commands
+    """
+
+    with open(path, 'w') as infile:
 
         infile.write('units           real\n')
         infile.write('atom_style      full\n')
@@ -707,3 +773,4 @@ def lammps_inputs(args):
                     infile.write(shake_line)
 
         infile.write('\n')
+        infile.write(footer)
@@ -6,8 +6,9 @@ from subprocess import run
 
 import ase
 
+from mofa.simulation.chargemol import load_chargemol
 from mofa.simulation.dft.cp2k import _file_dir
-from mofa.utils.conversions import read_from_string
+from mofa.simulation.scratch import gunzip_file
 
 # Get the path to the CP2K atomic density guesses
 _chargemol_path = which('chargemol')
@@ -33,6 +34,10 @@ def compute_partial_charges(cp2k_path: Path, threads: int | None = 2):
     with open(cp2k_path / "job_control.txt", "w") as wf:
         wf.write(write_str)
 
+    # The density may have been compressed after the CP2K computation
+    if not (cp2k_path / "valence_density.cube").is_file() and (cp2k_path / "valence_density.cube.gz").is_file():
+        gunzip_file(cp2k_path / "valence_density.cube.gz", cp2k_path / "valence_density.cube")
+
     # my local CP2k is not renaming the output automatically, so an extra renaming step is added here
     if not (cp2k_path / "valence_density.cube").is_file():
         cube_fname = list(cp2k_path.glob('*.cube'))
@@ -65,13 +70,4 @@ def load_atoms_with_charges(cp2k_path) -> ase.Atoms:
     Returns:
         Atoms object complete with charges
     """
-    chargemol_out_fname = "DDEC6_even_tempered_net_atomic_charges.xyz"
-    with open(cp2k_path / chargemol_out_fname, "r") as cmresf:
-        res_lines = cmresf.readlines()
-    natoms = int(res_lines[0])
-    lat_str = (" ".join(res_lines[1].split("unitcell")[1]
-                        .replace("}", "").replace("{", "")
-                        .replace("]", "").replace("[", "")
-                        .replace(",", "").split()))
-    extxyzstr = "".join([res_lines[0], '''Lattice="''' + lat_str + '''" Properties=species:S:1:pos:R:3:q:R:1\n'''] + res_lines[2:natoms + 2])
-    return read_from_string(extxyzstr, fmt='extxyz')
+    return load_chargemol(cp2k_path)
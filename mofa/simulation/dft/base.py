@@ -1,6 +1,7 @@
 """Base class for DFT computations"""
-from contextlib import contextmanager, redirect_stdout, redirect_stderr
+from contextlib import contextmanager
 from dataclasses import dataclass
+from typing import Sequence
 from pathlib import Path
 
 import ase
@@ -9,16 +10,61 @@ from ase.io import Trajectory
 from ase.optimize import LBFGS
 
 from mofa.model import MOFRecord
-from mofa.utils.conversions import read_from_string, canonicalize
+from mofa.simulation.scratch import ScratchManager
+from mofa.utils.conversions import canonicalize
+
+
+def choose_starting_structure(mof: MOFRecord) -> ase.Atoms:
+    """Pick the best available starting geometry for a DFT computation
+
+    Uses the structure relaxed with a forcefield if available, then the last frame
+    of the longest MD trajectory, and the as-assembled structure otherwise.
+    MD frames of a supercell are folded back into the unit cell.
+
+    Args:
+        mof: Record describing the MOF
+    Returns:
+        Starting structure, which has the same atoms in the same order as ``mof.atoms``
+    """
+    if 'relaxed' in mof.times or len(mof.md_trajectory) == 0:
+        return mof.atoms  # The relaxed structure replaces the as-assembled one
+    traj = max(mof.md_trajectory.values(), key=lambda t: int(t.timesteps[-1]))
+    unit_cell = fold_supercell(traj.get_atoms(-1), mof.atoms)
+    return mof.atoms if unit_cell is None else unit_cell
+
+
+def fold_supercell(frame: ase.Atoms, unit_cell: ase.Atoms) -> ase.Atoms | None:
+    """Recover the unit cell from a frame of MD run on a supercell made with ``unit_cell * [n, n, n]``
+
+    The supercell holds each image of the unit cell in turn, starting with the original.
+
+    Args:
+        frame: Structure from MD
+        unit_cell: Unit cell used to build the supercell
+    Returns:
+        The first image of the unit cell with the cell of the frame divided by ``n``,
+        or ``None`` if the frame is not a supercell of ``unit_cell``
+    """
+    n_atoms = len(unit_cell)
+    reps = round((len(frame) / n_atoms) ** (1 / 3))
+    if reps ** 3 * n_atoms != len(frame) or not (frame.numbers.reshape(-1, n_atoms) == unit_cell.numbers).all():
+        return None
+    if reps == 1:
+        return frame
+
+    output = frame[:n_atoms]
+    output.set_cell(frame.cell[:] / reps, scale_atoms=False)
+    output.wrap()
+    return output
 
 
 def _load_structure(mof: MOFRecord, structure_source: tuple[str, int] | None):
     """Read the appropriate input structure"""
     if structure_source is None:
-        return mof.atoms
+        return choose_starting_structure(mof)
     else:
         traj, ind = structure_source
-        return read_from_string(mof.md_trajectory[traj][ind], "vasp")
+        return mof.md_trajectory[traj].get_atoms(ind)
 
 
 @dataclass
@@ -30,6 +76,8 @@ class BaseDFTRunner:
     """Directory in which to write output files"""
     dft_cmd: str | None = None
     """Command which launches the DFT code"""
+    scratch: ScratchManager | None = None
+    """Manager which places run directories. Default is to use :attr:`run_dir`"""
 
     def run_single_point(
             self,
@@ -43,7 +91,7 @@ class BaseDFTRunner:
             mof: Structure to be run
             level: Name of the level of computation to perform
             structure_source: Name of the MD trajectory and frame ID from which to source the
-                input structure. Default is to use the as-assembled structure
+                input structure. Default is to use :func:`choose_starting_structure`
         Returns:
             - Structure with computed properties
             - Path to the run directory
@@ -65,7 +113,7 @@ class BaseDFTRunner:
             mof: Structure to be run
             level: Name of the level of computation to perform
             structure_source: Name of the MD trajectory and frame ID from which to source the
-                input structure. Default is to use the as-assembled structure
+                input structure. Default is to use :func:`choose_starting_structure`
             steps: Maximum number of optimization steps
             fmax: Convergence threshold for optimization
         Returns:
@@ -76,7 +124,7 @@ class BaseDFTRunner:
         return self._run_calc(mof.name, atoms, 'optimize', level, steps, fmax)
 
     @contextmanager
-    def _make_calc(self, level: str, out_dir: Path) -> Calculator:
+    def _make_calc(self, level: str, out_dir: Path, previous_dirs: Sequence[Path] = ()) -> Calculator:
         """Create the Calculator which drives this DFT code
 
         Should handle closing the calculator after completion
@@ -84,11 +132,29 @@ class BaseDFTRunner:
         Args:
             level: Fidelity level for the computation
             out_dir: Output directory to use for this computation
+            previous_dirs: Directories of earlier computations of the same MOF at the same level,
+                which may hold files used to start this computation (e.g., wavefunctions)
         Returns:
             Calculator object, ready to compute
         """
         raise NotImplementedError()
 
+    def _previous_dirs(self, name: str, level: str) -> list[Path]:
+        """Find the run directories of computations of a MOF at a certain level
+
+        Args:
+            name: Name of the MOF
+            level: Level of accuracy
+        Returns:
+            Absolute paths of the existing directories
+        """
+        roots = [self.run_dir] if self.scratch is None else [self.scratch.root, self.scratch.fallback]
+        return [
+            (root / f'{name}-{action}-{level}').absolute()
+            for root in roots if root is not None for action in ('single', 'optimize')
+            if (root / f'{name}-{action}-{level}').is_dir()
+        ]
+
     def _run_calc(self, name: str, atoms: ase.Atoms, action: str, level: str,
                   steps: int = 8, fmax: float = 1e-2) -> tuple[ase.Atoms, Path] | None:
         """Run CP2K in a special directory
@@ -107,14 +173,16 @@ class BaseDFTRunner:
 
         # Either run in the eventual output directory if one MOF per CP2K,
         #  or run in a separate dir if we will re-use the CP2K executable
-        out_dir = self.run_dir / f'{name}-{action}-{level}'
-        out_dir = out_dir.absolute()
+        if self.scratch is not None:
+            out_dir = self.scratch.make_dir(f'{name}-{action}-{level}')
+        else:
+            out_dir = self.run_dir / f'{name}-{action}-{level}'
+            out_dir = out_dir.absolute()
+            out_dir.mkdir(parents=True, exist_ok=True)
 
         # Begin execution
-        out_dir.mkdir(parents=True, exist_ok=True)
-        with (open(out_dir / 'cp2k.stdout', 'w') as fo, redirect_stdout(fo),
-              open(out_dir / 'cp2k.stderr', 'w') as fe, redirect_stderr(fe),
-              self._make_calc(level, out_dir) as calc):
+        previous_dirs = self._previous_dirs(name, level)
+        with self._make_calc(level, out_dir, previous_dirs) as calc:
 
             # Run the calculation
             atoms = atoms.copy()
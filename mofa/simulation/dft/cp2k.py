@@ -1,21 +1,28 @@
 """Run computations backed by CP2K"""
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from contextlib import contextmanager
-from typing import Optional
+from typing import Sequence
 from pathlib import Path
 import shutil
+import shlex
+import atexit
 import uuid
-import time
-import os
 
 from ase.calculators.calculator import Calculator
 from ase.calculators.cp2k import CP2K
 from ase import units
 
 from mofa.simulation.dft.base import BaseDFTRunner
+from mofa.simulation.dft.shells import ShellPool
+from mofa.simulation.scratch import capture_files, gunzip_file, gzip_in_background
 
 _file_dir = Path(__file__).parent.joinpath('files').absolute()
 
+_wfn_name = 'cp2k-RESTART.wfn'
+"""Name of the wavefunction restart file written by CP2K"""
+_wfn_guess_name = 'guess.wfn'
+"""Name of the wavefunction file read at the start of a computation"""
+
 _cp2k_options = {
     'default': {
         'basis_set': 'DZVP-MOLOPT-SR-GTH',
@@ -28,6 +35,49 @@ _cp2k_options = {
 }
 
 
+def _shell_alive(calc: CP2K) -> bool:
+    """Whether the cp2k_shell behind a calculator is ready for more commands"""
+    shell = calc._shell
+    return shell is not None and shell.isready and shell._child is not None and shell._child.poll() is None
+
+
+def _close_shell(calc: CP2K):
+    """Stop the cp2k_shell behind a calculator, killing it if it does not exit cleanly"""
+    shell = calc._shell
+    if shell is None:
+        return
+    calc._shell = None
+    try:
+        shell.close()
+    except (AssertionError, OSError):
+        if shell._child is not None:
+            shell._child.kill()
+            shell._child.wait()
+
+
+_shell_pool: ShellPool[CP2K] | None = None
+
+
+def get_shell_pool(max_shells: int | None = None, idle_timeout: float | None = None) -> ShellPool[CP2K]:
+    """Get the pool of cp2k_shell processes shared by all runners in this process
+
+    Args:
+        max_shells: Largest number of shells held at once. Leaves the setting unchanged if ``None``
+        idle_timeout: How long a shell may sit idle before being closed (s). Leaves the setting unchanged if ``None``
+    Returns:
+        The shared pool
+    """
+    global _shell_pool
+    if _shell_pool is None:
+        _shell_pool = ShellPool(is_alive=_shell_alive, close=_close_shell)
+        atexit.register(_shell_pool.close_all)
+    if max_shells is not None:
+        _shell_pool.max_shells = max_shells
+    if idle_timeout is not None:
+        _shell_pool.idle_timeout = idle_timeout
+    return _shell_pool
+
+
 @dataclass
 class CP2KRunner(BaseDFTRunner):
     """Interface for running pre-defined CP2K workflows"""
@@ -35,15 +85,42 @@ class CP2KRunner(BaseDFTRunner):
     dft_cmd: str = 'cp2k_shell'
     run_dir: Path = Path('cp2k-runs')
     close_cp2k: bool = False
-    """Whether to close CP2K after a successful job"""
-    _calc: Optional[CP2K] = field(default=None, init=False, repr=False)
-    """Holds the calculator"""
+    """Whether to close CP2K after a successful job. If not, CP2K runs in a shell held by :meth:`get_shell_pool`"""
+    max_shells: int = 1
+    """Largest number of cp2k_shell processes kept open by this process"""
+    shell_idle_timeout: float = 600.
+    """How long an open cp2k_shell may sit idle before being closed (s)"""
     ignore_failure: bool = True
     """Whether to ignore convergence failures"""
+    reuse_wavefunction: bool = True
+    """Whether to start the SCF from the wavefunction of an earlier computation of the same MOF, if available"""
+    moved_files: tuple[str, ...] = ('*.cube', _wfn_name)
+    """Patterns of large outputs moved from a shared run directory into the output directory of each computation"""
+    copied_files: tuple[str, ...] = ('cp2k.out', 'cp2k.inp')
+    """Patterns of logs copied from a shared run directory into the output directory of each computation"""
+    compressed_files: tuple[str, ...] = ()
+    """Patterns of outputs to compress with gzip in the background after each computation (e.g., the wavefunction)"""
 
-    @contextmanager
-    def _make_calc(self, level: str, out_dir: Path) -> Calculator:
+    @staticmethod
+    def _find_wavefunction(previous_dirs: Sequence[Path]) -> Path | None:
+        """Find the most recent wavefunction written by an earlier computation
+
+        Args:
+            previous_dirs: Run directories of the earlier computations
+        Returns:
+            Path to the wavefunction restart file, if any
+        """
+        wfns = [d / name for d in previous_dirs for name in [_wfn_name, _wfn_name + '.gz'] if (d / name).is_file()]
+        return max(wfns, key=lambda p: p.stat().st_mtime, default=None)
+
+    def _make_input(self, level: str) -> str:
+        """Render the CP2K input file for a level of computation
 
+        Args:
+            level: Fidelity level for the computation
+        Returns:
+            Contents of the input file
+        """
         # Get the template for this level of computation
         template_file = _file_dir / f'cp2k-{level}-template.inp'
         if not template_file.is_file():
@@ -52,44 +129,88 @@ class CP2KRunner(BaseDFTRunner):
         if self.ignore_failure:
             # Does not work with CP2K<2024.1, which is what we're running on Polaris but not what comes with Ubuntu
             inp = inp.replace("&SCF\n", "&SCF\n         IGNORE_CONVERGENCE_FAILURE\n")
+        if self.reuse_wavefunction:
+            # Write the wavefunction at the end of each SCF, and read one if it is provided.
+            #  CP2K falls back to the default guess if the restart file is missing
+            inp = inp.replace("&SCF\n", f"&SCF\n         SCF_GUESS RESTART\n         WFN_RESTART_FILE_NAME {_wfn_guess_name}\n")
+            inp = inp.replace("&RESTART OFF\n", "&RESTART ON\n               BACKUP_COPIES 0\n")
+        return inp
+
+    @contextmanager
+    def _make_calc(self, level: str, out_dir: Path, previous_dirs: Sequence[Path] = ()) -> Calculator:
+
+        inp = self._make_input(level)
 
         # Get the other settings
         if level not in _cp2k_options:
             raise ValueError(f'No presents for {level}')
         options = _cp2k_options[level]
 
-        # Check the run-directory
         if self.close_cp2k:
-            run_dir = out_dir
-        elif self._calc is None:
-            run_dir = self.run_dir / f'temp-{uuid.uuid4()}'
-            run_dir.mkdir(parents=True, exist_ok=True)
+            # Run in the output directory with a new shell
+            run_dir = Path(out_dir).absolute()
+            calc = self._launch_shell(run_dir, inp, options)
+            try:
+                with self._provide_wavefunction(run_dir, previous_dirs):
+                    yield calc
+            finally:
+                _close_shell(calc)
         else:
-            run_dir = self._calc.run_dir
+            # Run in the directory of a shell kept open between computations
+            pool = get_shell_pool(self.max_shells, self.shell_idle_timeout)
+            with pool.acquire((self.dft_cmd, level, inp), lambda: self._launch_shell(self._make_shell_dir(), inp, options)) as calc:
+                with self._provide_wavefunction(calc.run_dir, previous_dirs):
+                    yield calc
+
+                # Collect only the outputs needed later, leaving the rest to be overwritten by the next computation
+                capture_files(calc.run_dir, out_dir, move=self.moved_files, copy=self.copied_files)
+        gzip_in_background(p for pattern in self.compressed_files for p in Path(out_dir).glob(pattern) if p.suffix != '.gz')
+
+    def _make_shell_dir(self) -> Path:
+        """Create the run directory for a shell used by many computations"""
+        if self.scratch is not None:
+            return self.scratch.make_dir(f'temp-{uuid.uuid4()}')
+        run_dir = self.run_dir.absolute() / f'temp-{uuid.uuid4()}'
+        run_dir.mkdir(parents=True, exist_ok=True)
+        return run_dir
+
+    def _launch_shell(self, run_dir: Path, inp: str, options: dict) -> CP2K:
+        """Start cp2k_shell in a run directory
 
-        start_dir = Path.cwd()
-        os.chdir(run_dir)
+        Args:
+            run_dir: Directory in which CP2K runs
+            inp: Input file
+            options: Other settings for the calculator
+        Returns:
+            Calculator connected to the shell
+        """
+        # Launch CP2K from the run directory, as it writes some files (e.g., cube files) relative to where it starts
+        calc = CP2K(
+            command=f'cd {shlex.quote(str(run_dir))} && {self.dft_cmd}',
+            directory=str(run_dir),
+            inp=inp,
+            max_scf=128,
+            **options,
+        )
+        calc.run_dir = run_dir
+        return calc
+
+    @contextmanager
+    def _provide_wavefunction(self, run_dir: Path, previous_dirs: Sequence[Path]):
+        """Place the wavefunction from an earlier computation of this MOF in the run directory, and never one from another MOF
+
+        Args:
+            run_dir: Directory in which CP2K runs
+            previous_dirs: Run directories of the earlier computations
+        """
+        guess_path = run_dir / _wfn_guess_name
+        guess_path.unlink(missing_ok=True)
+        previous_wfn = self._find_wavefunction(previous_dirs) if self.reuse_wavefunction else None
+        if previous_wfn is not None and previous_wfn.suffix == '.gz':
+            gunzip_file(previous_wfn, guess_path)
+        elif previous_wfn is not None:
+            shutil.copyfile(previous_wfn, guess_path)
         try:
-            if self._calc is None:
-                self._calc = CP2K(
-                    command=self.dft_cmd,
-                    directory=".",
-                    inp=inp,
-                    max_scf=128,
-                    **options,
-                )
-                self._calc.run_dir = run_dir
-            yield self._calc  # Pass the calculator to be used externally
-        except AssertionError:
-            time.sleep(30)  # Give time for CP2K to exit cleanly
-            self._calc = None
-            raise
+            yield
         finally:
-            os.chdir(start_dir)  # Paths are relative to the start directory
-
-        if self.close_cp2k:
-            self._calc = None
-        else:
-            # Copy files from the run directory to here
-            for path in self._calc.run_dir.iterdir():
-                shutil.copy(path, out_dir / path.name)
+            guess_path.unlink(missing_ok=True)
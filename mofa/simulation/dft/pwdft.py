@@ -1,6 +1,7 @@
 """Run computations backed by PWDFT. Copied from Raymundo Hernandez and Alvaro Vazquez-Mayagoitia's implementation."""
 from contextlib import contextmanager
 from dataclasses import dataclass
+from typing import Sequence
 from pathlib import Path
 from shutil import move
 import os
@@ -463,8 +464,8 @@ class PWDFT(FileIOCalculator):
     def write_input(self, atoms, properties, system_changes):
         """Write input parameters to files"""
         # Prepare perm and scratch directories
-        perm = os.path.abspath(self.parameters.get("perm", "perm"))
-        scratch = os.path.abspath(self.parameters.get("scratch", "perm"))
+        perm = os.path.join(self.directory, self.parameters.get("perm", "perm"))
+        scratch = os.path.join(self.directory, self.parameters.get("scratch", "perm"))
         os.makedirs(perm, exist_ok=True)
         os.makedirs(scratch, exist_ok=True)
 
@@ -495,7 +496,7 @@ class PWDFTRunner(BaseDFTRunner):
     dft_cmd: str = 'mpiexec -n 1 pwdft'
 
     @contextmanager
-    def _make_calc(self, level: str, out_dir: Path) -> Calculator:
+    def _make_calc(self, level: str, out_dir: Path, previous_dirs: Sequence[Path] = ()) -> Calculator:
         if level not in _pwdft_options:
             raise ValueError(f"No presets for {level}")
         options = _pwdft_options[level].copy()
@@ -506,12 +507,9 @@ class PWDFTRunner(BaseDFTRunner):
         #  TODO (wardlt): For some reason PWDFT cannot make directories?
         out_dir.joinpath('perm').mkdir(parents=True, exist_ok=True)
 
-        start_dir = Path.cwd().absolute()
         try:
-            os.chdir(out_dir)
-            yield PWDFT(label='mof', **options)
+            yield PWDFT(label='mof', directory=str(out_dir), **options)
         finally:
             # Move the valence cube file(s) from perm to root directory
             for file in out_dir.joinpath('perm').glob('*.cube'):
                 move(file, out_dir)
-            os.chdir(start_dir)
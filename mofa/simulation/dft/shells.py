@@ -0,0 +1,144 @@
+"""Pool of long-lived interactive processes (e.g., ``cp2k_shell``) shared by all computations in a worker"""
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Condition
+from typing import Callable, Generic, Hashable, Iterator, TypeVar
+from time import monotonic
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+@dataclass
+class PooledShell(Generic[T]):
+    """A process held by the pool"""
+
+    key: Hashable
+    """Settings with which the process was launched"""
+    handle: T | None = None
+    """Object which controls the process. ``None`` while it is being launched"""
+    busy: bool = True
+    """Whether the process is in use by a computation"""
+    last_used: float = field(default_factory=monotonic)
+    """Time the process was last returned to the pool"""
+
+
+class ShellPool(Generic[T]):
+    """Processes kept alive between computations, each launched with specific settings
+
+    Computations receive an idle process launched with the same settings if one is available.
+    Otherwise, the pool launches a new process, closing the least-recently-used idle process
+    if the pool is full, or waits for a process to become idle.
+    Processes which have died, which were in use when a computation failed, or which have been idle
+    for longer than the timeout are closed rather than reused.
+
+    Args:
+        is_alive: Function which checks whether a process is healthy
+        close: Function which stops a process
+        max_shells: Largest number of processes held at once
+        idle_timeout: How long a process may sit idle before being closed (s). No limit if ``None``
+    """
+
+    def __init__(self, is_alive: Callable[[T], bool], close: Callable[[T], None], max_shells: int = 1, idle_timeout: float | None = 600.):
+        self.is_alive = is_alive
+        self.close = close
+        self.max_shells = max_shells
+        self.idle_timeout = idle_timeout
+        self.shells: list[PooledShell[T]] = []
+        self._cond = Condition()
+
+    def _stop(self, shell: PooledShell[T], reason: str):
+        """Remove a process from the pool and close it"""
+        with self._cond:
+            if shell in self.shells:
+                self.shells.remove(shell)
+            self._cond.notify_all()
+        if shell.handle is not None:
+            logger.info(f'Closing a shell. Reason: {reason}')
+            try:
+                self.close(shell.handle)
+            except Exception:  # The process may already be gone
+                logger.warning('Failed to close a shell cleanly', exc_info=True)
+
+    def _prune(self) -> list[PooledShell[T]]:
+        """Find idle processes which should be closed. Must be called while holding the lock"""
+        now = monotonic()
+        return [
+            s for s in self.shells if not s.busy and (
+                not self.is_alive(s.handle) or (self.idle_timeout is not None and now - s.last_used > self.idle_timeout)
+            )
+        ]
+
+    def _checkout(self, key: Hashable) -> tuple[PooledShell[T], list[PooledShell[T]]]:
+        """Reserve a process, or a slot for a new one, and list the processes to be closed"""
+        with self._cond:
+            while True:
+                to_close = self._prune()
+                for shell in to_close:
+                    self.shells.remove(shell)
+
+                # Use an idle process with the same settings
+                idle = sorted((s for s in self.shells if not s.busy), key=lambda s: s.last_used)
+                for shell in idle:
+                    if shell.key == key:
+                        shell.busy = True
+                        return shell, to_close
+
+                # Make room for a new process
+                if len(self.shells) >= self.max_shells and len(idle) > 0:
+                    to_close.append(idle[0])
+                    self.shells.remove(idle[0])
+                if len(self.shells) < self.max_shells:
+                    shell = PooledShell(key=key)
+                    self.shells.append(shell)
+                    return shell, to_close
+
+                # Wait for a process to become available
+                for shell in to_close:
+                    self._stop(shell, 'unhealthy or idle')
+                self._cond.wait()
+
+    @contextmanager
+    def acquire(self, key: Hashable, launch: Callable[[], T]) -> Iterator[T]:
+        """Get a process for a computation, returning it to the pool once the computation completes
+
+        Args:
+            key: Settings of the process, which must match for a process to be reused
+            launch: Function which starts a new process with those settings
+        Yields:
+            Object which controls the process
+        """
+        shell, to_close = self._checkout(key)
+        for other in to_close:
+            self._stop(other, 'unhealthy, idle, or making room')
+
+        # Launch the process if this is a new slot
+        if shell.handle is None:
+            try:
+                shell.handle = launch()
+            except BaseException:
+                self._stop(shell, 'failed to launch')
+                raise
+
+        try:
+            yield shell.handle
+        except BaseException:
+            self._stop(shell, 'computation failed')
+            raise
+
+        if not self.is_alive(shell.handle):
+            self._stop(shell, 'died during computation')
+            return
+        with self._cond:
+            shell.busy = False
+            shell.last_used = monotonic()
+            self._cond.notify_all()
+
+    def close_all(self):
+        """Close every idle process"""
+        with self._cond:
+            idle = [s for s in self.shells if not s.busy]
+        for shell in idle:
+            self._stop(shell, 'closing the pool')
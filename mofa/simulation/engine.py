@@ -0,0 +1,169 @@
+"""A LAMMPS process which is reused between simulations"""
+from subprocess import Popen, PIPE, DEVNULL, CompletedProcess, run as run_process
+from tempfile import TemporaryFile
+from typing import Callable, Sequence
+from pathlib import Path
+from time import sleep
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def run_with_callback(args: Sequence[str], callback: Callable[[], object] | None = None, poll_interval: float = 0.1,
+                      **kwargs) -> CompletedProcess:
+    """Run a process to completion, calling a function periodically while it runs
+
+    Args:
+        args: Command to execute
+        callback: Function called while the process runs, such as to monitor its outputs
+        poll_interval: How often to call the function (s)
+        kwargs: Passed to :class:`~subprocess.Popen`
+    Returns:
+        The completed process
+    """
+    if callback is None:
+        return run_process(args, **kwargs)
+    with Popen(args, **kwargs) as proc:
+        while proc.poll() is None:
+            callback()
+            sleep(poll_interval)
+    return CompletedProcess(args, proc.returncode)
+
+
+class LAMMPSEngine:
+    """Run many LAMMPS simulations in a single, long-lived LAMMPS process
+
+    The process reads commands from its standard input, which stays open between simulations.
+    Each simulation moves into its run directory and then includes the input file from that directory.
+    Reusing the process avoids starting LAMMPS, its accelerator packages, and the Python interpreter
+    used by ML-IAP pair styles for every simulation.
+
+    Simulations either clear the previous state before starting or provide a setup file,
+    which defines the simulation box and pair style. The setup file is only run after clearing the state
+    if it differs from the one run last, so that simulations which share a setup keep the model loaded
+    and on the device. Their input files must then replace the atoms and remove any fixes they define.
+    ``component-tests/lammps-engine`` measures how much time is saved.
+
+    LAMMPS exits when a simulation fails, in which case the failure is reported through the
+    return code and a new process is started for the next simulation.
+
+    Args:
+        command: Command used to launch LAMMPS. Must not include an input file
+        environ: Additional environment variables to provide to LAMMPS
+        poll_interval: How often to check whether a simulation has finished (s)
+    """
+
+    def __init__(self, command: Sequence[str], environ: dict[str, str] | None = None, poll_interval: float = 0.01):
+        self.command = list(command)
+        self.environ = None if environ is None else environ.copy()
+        self.poll_interval = poll_interval
+        self._proc: Popen | None = None
+        self._stderr = None
+        self._stderr_start: int = 0  # Position in the error log at which the current simulation started
+        self._setup: str | None = None  # Contents of the setup file run since the state was last cleared
+
+    def __getstate__(self):
+        # Processes cannot be transferred between workers, so a copy starts its own
+        state = self.__dict__.copy()
+        state['_proc'] = state['_stderr'] = state['_setup'] = None
+        return state
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @property
+    def running(self) -> bool:
+        """Whether the LAMMPS process is alive"""
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """Launch LAMMPS if it is not already running"""
+        if self.running:
+            return
+        self.close()
+
+        env = None
+        if self.environ is not None:
+            env = os.environ.copy()
+            env.update(self.environ)
+        self._stderr = TemporaryFile()
+        self._proc = Popen(self.command + ['-log', 'none', '-screen', 'none'],
+                           stdin=PIPE, stdout=DEVNULL, stderr=self._stderr, env=env, text=True)
+        logger.info(f'Launched a persistent LAMMPS process. PID={self._proc.pid}')
+
+    def run(self, run_dir: str | Path, input_file: str = 'in.lmp', callback: Callable[[], object] | None = None,
+            setup_file: str | None = None) -> CompletedProcess:
+        """Run a simulation
+
+        Args:
+            run_dir: Directory holding the input files, into which outputs are written
+            input_file: Name of the input file within the run directory
+            callback: Function called periodically while the simulation runs
+            setup_file: Name of a file within the run directory which defines the box and pair style,
+                and is skipped if the same setup was already run. Default is to clear the state before each simulation
+        Returns:
+            Result of the simulation. The log is written to ``stdout.lmp`` in the run directory
+        """
+
+        run_dir = Path(run_dir).absolute()
+        done_path = run_dir / 'engine.done'
+        done_path.unlink(missing_ok=True)
+
+        # Send the commands for this simulation, ending by writing a file which marks it finished
+        self.start()
+        self._stderr_start = os.lseek(self._stderr.fileno(), 0, os.SEEK_END)
+        commands = [f'shell cd "{run_dir}"', 'log stdout.lmp']
+        setup = None if setup_file is None else (run_dir / setup_file).read_text()
+        if setup is None or setup != self._setup:
+            commands.insert(0, 'clear')
+            if setup is not None:
+                commands.append(f'include {setup_file}')
+        self._setup = setup
+        commands.extend([
+            f'include {input_file}',
+            'log none',
+            f'print "done" file "{done_path}"',
+        ])
+        try:
+            self._proc.stdin.write('\n'.join(commands) + '\n')
+            self._proc.stdin.flush()
+        except BrokenPipeError:
+            pass  # Handled when checking whether the process is still alive
+
+        # Wait until the simulation finishes or LAMMPS exits
+        while not done_path.is_file():
+            if self._proc.poll() is not None:
+                return self._failed(run_dir)
+            if callback is not None:
+                callback()
+            sleep(self.poll_interval)
+        done_path.unlink()
+        return CompletedProcess(self.command, 0)
+
+    def _failed(self, run_dir: Path) -> CompletedProcess:
+        """Record the output of a process which exited and prepare to start a new one"""
+        returncode = self._proc.returncode or 1
+        self._stderr.seek(self._stderr_start)
+        (run_dir / 'stderr.lmp').write_bytes(self._stderr.read())  # Only the output of this simulation
+        logger.warning(f'Persistent LAMMPS process exited with code {returncode} while running in {run_dir}')
+        self.close()
+        return CompletedProcess(self.command, returncode)
+
+    def close(self):
+        """Stop the LAMMPS process"""
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()  # LAMMPS exits once it reaches the end of its input
+                self._proc.wait(timeout=10)
+            except Exception:
+                self._proc.kill()
+                self._proc.wait()
+            self._proc = None
+        self._setup = None
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
@@ -1,8 +1,7 @@
 """Interfaces for performing specific types of simulations"""
 
-import ase
-
 from mofa.model import MOFRecord
+from mofa.utils.trajectory import Trajectory
 
 
 class MDInterface:
@@ -14,7 +13,7 @@ class MDInterface:
     def run_molecular_dynamics(self,
                                mof: MOFRecord,
                                timesteps: int,
-                               report_frequency: int) -> list[tuple[int, ase.Atoms]]:
+                               report_frequency: int) -> Trajectory:
         """Run NPT molecular dynamics
 
         Start from the last structure of the previous trajectory
@@ -24,6 +23,6 @@ class MDInterface:
             timesteps: How many total timesteps to run
             report_frequency: How often to report structures
         Returns:
-            Structures produced at specified intervals
+            Structures produced at specified intervals, which iterates as pairs of timestep and structure
         """
         raise NotImplementedError()
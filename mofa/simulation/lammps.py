@@ -1,24 +1,75 @@
 """Simulation operations that involve LAMMPS"""
-from typing import Sequence
-from subprocess import run, CompletedProcess
+from typing import Callable, Sequence
+from subprocess import CompletedProcess
+from string import Template
 from pathlib import Path
-import io
 import shutil
 import logging
 import os
 
 import ase
-import pandas as pd
-from ase.io.lammpsrun import read_lammps_dump_text
 
-from .cif2lammps.main_conversion import single_conversion
+from .cif2lammps.cif2system import initialize_system_from_atoms, replication_determination
+from .cif2lammps.write_lammps_data import force_field_settings, compile_force_field, element_list, write_data_file, write_in_file
 from .cif2lammps.UFF4MOF_construction import UFF4MOF
 
 from mofa.model import MOFRecord
+from mofa.utils.trajectory import CellSeries, Trajectory, read_lammps_dump
+from .cache import MOFCache
+from .engine import LAMMPSEngine, run_with_callback
 from .interfaces import MDInterface
+from .scratch import ScratchManager
+from .thermo import StrainMonitor, StrainWatch, dump_commands, md_finished, md_start_commands, read_thermo
 
 logger = logging.getLogger(__name__)
 
+_md_template = Template("""
+
+# simulation
+
+fix                 fxnpt all npt temp 300.0 300.0 $$(200.0*dt) tri 1.0 1.0 $$(800.0*dt)
+variable            Nevery equal ${report_frequency}
+
+thermo              $${Nevery}
+thermo_style        custom step cpu dt time temp press pe ke etotal density xlo ylo zlo cella cellb cellc cellalpha cellbeta cellgamma
+thermo_modify       flush yes
+
+${minimize}reset_timestep      0
+
+${dump_start}
+timestep            ${stepsize_fs}
+${md_start}run                 ${timesteps}
+${dump_end}write_restart       relaxing.*.restart
+write_data          relaxing.*.data
+
+""")
+"""Simulation commands appended to the input file written by cif2lammps"""
+
+_minimize_command = "minimize            1.0e-10 1.0e-10 10000 100000\n"
+"""Energy minimization performed before the first MD segment"""
+
+_force_field_key = 'UFF4MOF-2x2x2'
+"""Name of the typed force field in the cache"""
+
+
+def _set_positions(ff, atoms: ase.Atoms):
+    """Replace the positions and cell of a typed force field
+
+    Args:
+        ff: Force field compiled by cif2lammps
+        atoms: New structure, with atoms in the order of their LAMMPS IDs
+    """
+
+    graph = ff.system['graph']
+    nodes = sorted(graph.nodes)
+    if [graph.nodes[n]['element_symbol'] for n in nodes] != atoms.get_chemical_symbols():
+        raise ValueError('The structure does not match the atoms of the typed force field')
+
+    for node, pos, frac in zip(nodes, atoms.positions, atoms.get_scaled_positions(wrap=False)):
+        graph.nodes[node]['cartesian_position'] = pos
+        graph.nodes[node]['fractional_position'] = frac
+    ff.system['box'] = tuple(atoms.cell.cellpar())
+
 
 class LAMMPSRunner(MDInterface):
     """Interface for running pre-defined LAMMPS workflows with UFF4MOF forcefield
@@ -28,6 +79,17 @@ class LAMMPSRunner(MDInterface):
         lmp_sims_root_path: Scratch directory for LAMMPS simulations
         lammps_environ: Additional environment variables to provide to LAMMPS
         delete_finished: Whether to delete run files once completed
+        cache_dir: Directory in which to store typed force fields and restart files.
+            Default is a ``typing-cache`` directory inside ``lmp_sims_root_path``
+        persistent: Whether to run every simulation in the same LAMMPS process
+        strain_monitor: Criteria used to end MD runs early based on the strain of the cell.
+            Runs continue to the requested number of timesteps if not provided
+        maximum_steps: Most MD timesteps run for any MOF. Cached files are deleted once a MOF reaches it
+        max_strain: Largest strain of a MOF which is simulated further. Cached files are deleted once a MOF exceeds it
+        cell_only: Whether to write coordinates for only the first and last frame of each MD run.
+            The cell at every reported step is always available from the :attr:`~mofa.utils.trajectory.Trajectory.cell_series`
+        scratch: Manager which places run directories and removes them in the background.
+            Default is to run in ``lmp_sims_root_path`` and remove directories before returning
     """
 
     traj_name = 'uff'
@@ -36,12 +98,73 @@ class LAMMPSRunner(MDInterface):
                  lammps_command: Sequence[str] = ("lmp_serial",),
                  lmp_sims_root_path: str = "lmp_sims",
                  lammps_environ: dict[str, str] | None = None,
-                 delete_finished: bool = True):
+                 delete_finished: bool = True,
+                 cache_dir: str | None = None,
+                 persistent: bool = False,
+                 strain_monitor: StrainMonitor | None = None,
+                 maximum_steps: int | None = None,
+                 max_strain: float | None = None,
+                 cell_only: bool = False,
+                 scratch: ScratchManager | None = None):
         self.lammps_command = lammps_command
         self.lmp_sims_root_path = lmp_sims_root_path
         os.makedirs(self.lmp_sims_root_path, exist_ok=True)
-        self.lammps_environ = lammps_environ.copy()
+        self.lammps_environ = None if lammps_environ is None else lammps_environ.copy()
         self.delete_finished = delete_finished
+        self.cache = MOFCache(Path(cache_dir) if cache_dir is not None else Path(lmp_sims_root_path) / 'typing-cache')
+        self.engine = LAMMPSEngine(lammps_command, lammps_environ) if persistent else None
+        self.strain_monitor = strain_monitor
+        self.maximum_steps = maximum_steps
+        self.max_strain = max_strain
+        self.cell_only = cell_only
+        self.scratch = scratch
+
+    def _make_run_dir(self, run_name: str) -> str:
+        """Create the directory for a simulation"""
+        if self.scratch is not None:
+            return str(self.scratch.make_dir(run_name))
+        lmp_path = os.path.join(self.lmp_sims_root_path, run_name)
+        os.makedirs(lmp_path, exist_ok=True)
+        return lmp_path
+
+    def _remove_run_dir(self, lmp_path: str):
+        """Delete the directory of a simulation"""
+        if self.scratch is not None:
+            self.scratch.release(lmp_path)
+        else:
+            shutil.rmtree(lmp_path)
+
+    def _md_footer(self, ff, timesteps: int, report_frequency: int, stepsize_fs: float, minimize: str) -> str:
+        """Render the simulation commands for an MD run"""
+        elements = " ".join(element_list(ff))
+        dump_start, dump_end = dump_commands('id type element x y z q', elements, self.cell_only)
+        return _md_template.substitute(
+            report_frequency=report_frequency,
+            stepsize_fs=stepsize_fs,
+            timesteps=timesteps,
+            minimize=minimize,
+            md_start=md_start_commands(self.strain_monitor is not None),
+            dump_start=dump_start,
+            dump_end=dump_end,
+        )
+
+    def typed_force_field(self, atoms: ase.Atoms):
+        """Assign the UFF4MOF force field to the supercell of a MOF, reusing a previous assignment if available
+
+        Args:
+            atoms: Unit cell of the MOF
+        Returns:
+            Force field compiled by cif2lammps
+        """
+
+        ff = self.cache.load_typing(atoms, _force_field_key)
+        if ff is None:
+            _, cutoff, _ = force_field_settings('UFF4MOF')
+            system = initialize_system_from_atoms(atoms)
+            system, _ = replication_determination(system, '2x2x2', cutoff)
+            ff = compile_force_field(system, UFF4MOF, 'UFF4MOF')
+            self.cache.save_typing(atoms, _force_field_key, ff)
+        return ff
 
     def prep_molecular_dynamics_single(self, run_name: str, atoms: ase.Atoms, timesteps: int, report_frequency: int, stepsize_fs: float = 0.5) -> str:
         """Use cif2lammps to assign force field to a single MOF and generate input files for lammps simulation
@@ -56,71 +179,67 @@ class LAMMPSRunner(MDInterface):
             lmp_path: a directory with the lammps simulation input files
         """
 
-        # Convert the cif_path to string, as that's what the underlying library uses
-        lmp_path = os.path.join(self.lmp_sims_root_path, run_name)
-        os.makedirs(lmp_path, exist_ok=True)
+        lmp_path = self._make_run_dir(run_name)
 
-        # Write the cif file to disk
-        cif_path = os.path.join(lmp_path, f'{run_name}.cif')
-        atoms.write(cif_path, 'cif')
         try:
-            single_conversion(cif_path,
-                              force_field=UFF4MOF,
-                              ff_string='UFF4MOF',
-                              small_molecule_force_field=None,
-                              outdir=lmp_path,
-                              charges=False,
-                              parallel=False,
-                              replication='2x2x2',
-                              read_cifs_pymatgen=True,
-                              add_molecule=None,
-                              small_molecule_file=None)
-            in_file_name = [x for x in os.listdir(lmp_path) if x.startswith("in.") and not x.startswith("in.lmp")][0]
-            data_file_name = [x for x in os.listdir(lmp_path) if x.startswith("data.") and not x.startswith("data.lmp")][0]
-            in_file_rename = "in.lmp"
-            data_file_rename = "data.lmp"
-            logger.info("Reading data file for element list: " + os.path.join(lmp_path, data_file_name))
-            with io.open(os.path.join(lmp_path, data_file_name), "r") as rf:
-                df = pd.read_csv(io.StringIO(rf.read().split("Masses")[1].split("Pair Coeffs")[0]), sep=r"\s+", header=None)
-                element_list = df[3].to_list()
-            with io.open(os.path.join(lmp_path, in_file_rename), "w") as wf:
-                logger.info("Writing input file: " + os.path.join(lmp_path, in_file_rename))
-                with io.open(os.path.join(lmp_path, in_file_name), "r") as rf:
-                    logger.info("Reading original input file: " + os.path.join(lmp_path, in_file_name))
-                    wf.write(rf.read().replace(data_file_name, data_file_rename) + f"""
+            # Type the atoms and assign parameters directly from the structure in memory
+            _, _, mixing_rules = force_field_settings('UFF4MOF')
+            ff = self.typed_force_field(atoms)
 
-# simulation
+            # Write the data file and an input file which includes the simulation commands
+            write_data_file(ff, os.path.join(lmp_path, 'data.lmp'))
+            footer = self._md_footer(ff, timesteps, report_frequency, stepsize_fs, _minimize_command)
+            write_in_file(ff, os.path.join(lmp_path, 'in.lmp'), 'data.lmp', mixing_rules, footer=footer)
+        except Exception as e:
+            self._remove_run_dir(lmp_path)
+            raise e
 
-fix                 fxnpt all npt temp 300.0 300.0 $(200.0*dt) tri 1.0 1.0 $(800.0*dt)
-variable            Nevery equal {report_frequency}
+        return lmp_path
 
-thermo              ${{Nevery}}
-thermo_style        custom step cpu dt time temp press pe ke etotal density xlo ylo zlo cella cellb cellc cellalpha cellbeta cellgamma
-thermo_modify       flush yes
+    def prep_molecular_dynamics_continuation(self, run_name: str, atoms: ase.Atoms, start_atoms: ase.Atoms, start_timestep: int,
+                                             timesteps: int, report_frequency: int, stepsize_fs: float = 0.5) -> str:
+        """Generate input files which continue a previous simulation without minimizing again
 
-minimize            1.0e-10 1.0e-10 10000 100000
-reset_timestep      0
+        Restarts from the LAMMPS restart file of the previous segment if it is in the cache,
+        and otherwise from the last structure using the cached force field typing.
 
-dump                trajectAll all custom ${{Nevery}} dump.lammpstrj.all id type element x y z q
-dump_modify         trajectAll element {" ".join(element_list)}
+        Args:
+            run_name: Name of the run directory
+            atoms: Structure from which the first segment started
+            start_atoms: Last structure from the previous segment
+            start_timestep: Number of timesteps run in previous segments
+            timesteps: Number of additional timesteps to run
+            report_frequency: How often to report structures
+            stepsize_fs: Timestep size
+        Returns:
+            lmp_path: a directory with the lammps simulation input files
+        """
 
-timestep            {stepsize_fs}
-run                 {timesteps}
-undump              trajectAll
-write_restart       relaxing.*.restart
-write_data          relaxing.*.data
+        lmp_path = self._make_run_dir(run_name)
 
-""")
-            os.remove(os.path.join(lmp_path, in_file_name))
-            shutil.move(os.path.join(lmp_path, data_file_name), os.path.join(lmp_path, data_file_rename))
+        try:
+            _, _, mixing_rules = force_field_settings('UFF4MOF')
+            ff = self.typed_force_field(atoms)
+            footer = self._md_footer(ff, timesteps, report_frequency, stepsize_fs, '')
 
+            restart_path = self.cache.restart_path(atoms, _force_field_key, start_timestep)
+            if restart_path.is_file():
+                # The restart file holds the force field, positions, and velocities
+                shutil.copyfile(restart_path, os.path.join(lmp_path, 'restart.lmp'))
+                with open(os.path.join(lmp_path, 'in.lmp'), 'w') as fp:
+                    fp.write('read_restart        restart.lmp\n')
+                    fp.write(footer)
+            else:
+                _set_positions(ff, start_atoms)
+                write_data_file(ff, os.path.join(lmp_path, 'data.lmp'))
+                write_in_file(ff, os.path.join(lmp_path, 'in.lmp'), 'data.lmp', mixing_rules, footer=footer)
         except Exception as e:
-            shutil.rmtree(lmp_path)
+            self._remove_run_dir(lmp_path)
             raise e
 
         return lmp_path
 
-    def run_molecular_dynamics(self, mof: MOFRecord, timesteps: int, report_frequency: int) -> list[tuple[int, ase.Atoms]]:
+    def run_molecular_dynamics(self, mof: MOFRecord, timesteps: int, report_frequency: int) -> Trajectory:
         """Run a molecular dynamics trajectory
 
         Args:
@@ -128,38 +247,74 @@ write_data          relaxing.*.data
             timesteps: Number of timesteps to run
             report_frequency: How often to report structures
         Returns:
-            Structures produced at specified intervals
+            Structures produced at specified intervals. Ends before ``timesteps`` if stopped by the strain monitor,
+            in which case the reason is stored as the :attr:`~mofa.utils.trajectory.Trajectory.stop_reason`
         """
 
-        # Generate the input files
-        lmp_path = self.prep_molecular_dynamics_single(mof.name, mof.atoms, timesteps, report_frequency)
+        # Start from the end of the previous trajectory, if available
+        start_timestep = 0
+        reference_cell = None
+        if len(mof.md_trajectory.get(self.traj_name, [])) > 0:
+            reference_cell = mof.md_trajectory[self.traj_name].cells[0]
+            start_timestep, start_atoms = mof.md_trajectory[self.traj_name][-1]
+            if timesteps <= start_timestep:
+                raise ValueError(f'Trajectory for {mof.name} already contains {start_timestep} timesteps')
+            lmp_path = self.prep_molecular_dynamics_continuation(mof.name, mof.atoms, start_atoms, start_timestep,
+                                                                 timesteps - start_timestep, report_frequency)
+        else:
+            lmp_path = self.prep_molecular_dynamics_single(mof.name, mof.atoms, timesteps, report_frequency)
 
         # Invoke lammps
         try:
-            ret = self.invoke_lammps(lmp_path)
+            watch = None
+            if self.strain_monitor is not None:
+                watch = StrainWatch(self.strain_monitor, lmp_path, reference_cell=reference_cell, start_timestep=start_timestep)
+            ret = self.invoke_lammps(lmp_path, callback=watch)
             if ret.returncode != 0:
                 raise ValueError('LAMMPS failed.' + ('' if self.delete_finished else f'Check the log files in: {lmp_path}'))
 
-            # Read the output file
-            with open(Path(lmp_path) / 'dump.lammpstrj.all') as fp:
-                return [(i * report_frequency, strc) for i, strc in enumerate(read_lammps_dump_text(fp, slice(None)))]
+            # Read the output files
+            output = read_lammps_dump(Path(lmp_path) / 'dump.lammpstrj.all')
+            output.cell_series = CellSeries.from_thermo(read_thermo(Path(lmp_path) / 'stdout.lmp'))
+            if watch is not None:
+                watch()  # Check the final frames
+                output.stop_reason = watch.reason
+
+            # Keep the restart file for the next segment, which is named by the last timestep run
+            steps_run = int(output.timesteps[-1])
+            restart_file = Path(lmp_path) / f'relaxing.{steps_run}.restart'
+            if restart_file.is_file():
+                self.cache.save_restart(mof.atoms, _force_field_key, start_timestep + steps_run, restart_file)
+
+            if start_timestep > 0:
+                output = output[1:]  # The first frame is the last from the previous run
+                output.cell_series = output.cell_series[1:]
+            output = output.shift_timesteps(start_timestep)
+
+            # Remove the cached files once the MOF will not be run further
+            if md_finished(output, reference_cell, self.maximum_steps, self.max_strain):
+                self.cache.remove(mof.atoms, _force_field_key)
+            return output
         finally:
             if self.delete_finished:
-                shutil.rmtree(lmp_path)
+                self._remove_run_dir(lmp_path)
 
-    def invoke_lammps(self, lmp_path: str | Path) -> CompletedProcess:
+    def invoke_lammps(self, lmp_path: str | Path, callback: Callable[[], object] | None = None) -> CompletedProcess:
         """Invoke LAMMPS in a specific run directory
 
         Args:
             lmp_path: Path to the LAMMPS run directory
+            callback: Function called periodically while LAMMPS runs
         Returns:
             Log from the completed process
         """
 
         lmp_path = Path(lmp_path)
+        if self.engine is not None:
+            return self.engine.run(lmp_path, callback=callback)
         with open(lmp_path / 'stdout.lmp', 'w') as fp, open(lmp_path / 'stderr.lmp', 'w') as fe:
             env = None
             if self.lammps_environ is not None:
                 env = os.environ.copy()
                 env.update(self.lammps_environ)
-            return run(list(self.lammps_command) + ['-i', 'in.lmp'], cwd=lmp_path, stdout=fp, stderr=fe, env=env)
+            return run_with_callback(list(self.lammps_command) + ['-i', 'in.lmp'], callback, cwd=lmp_path, stdout=fp, stderr=fe, env=env)
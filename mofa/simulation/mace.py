@@ -1,24 +1,41 @@
 """Run computations backed by MACE"""
 import shutil
-from collections import deque
-from dataclasses import dataclass
-from functools import lru_cache
+from collections import deque, OrderedDict
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from functools import partial
 from string import Template
 from pathlib import Path
-import os
-from subprocess import run
+from threading import RLock
+from time import perf_counter
+from copy import copy
+from typing import Callable
+import logging
 
 import ase
+import numpy as np
+import torch
 from ase import io
-from ase.io.lammpsrun import read_lammps_dump_text
-from mace.calculators import mace_mp
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.stress import full_3x3_to_voigt_6_stress
+from mace import data
+from mace.calculators import mace_mp, MACECalculator
+from mace.tools import torch_geometric
 from ase.filters import UnitCellFilter
 from ase.io import Trajectory
 from ase.optimize import LBFGS
 
 from mofa.model import MOFRecord
+from mofa.scoring.geometry import PoreGeometry
+from mofa.simulation.cache import MOFCache
+from mofa.simulation.engine import LAMMPSEngine, run_with_callback
 from mofa.simulation.interfaces import MDInterface
-from mofa.utils.conversions import read_from_string
+from mofa.simulation.optimize import BatchFIRE
+from mofa.simulation.scratch import ScratchManager
+from mofa.simulation.thermo import StrainMonitor, StrainWatch, dump_commands, md_finished, md_start_commands, read_thermo
+from mofa.utils.trajectory import CellSeries, Trajectory as MDTrajectory, read_lammps_dump
+
+logger = logging.getLogger(__name__)
 
 _mace_options = {
     "default": {
@@ -58,13 +75,32 @@ velocity            all create 300.0 12345
 
 thermo              $${Nevery}
 
-dump                trajectAll all custom $${Nevery} dump.lammpstrj.all id type element x y z
-dump_modify         trajectAll element $elements
+${dump_start}
+${md_start}run                 $timesteps
+${dump_end}write_restart       relaxing.*.restart
+""")
+
+template_restart = Template("""
+read_restart        restart.lmp
+
+$pair_style
+
+# simulation
+
+timestep            0.0005
+fix                 fxnpt all npt temp 300.0 300.0 $$(200.0*dt) tri 1.0 1.0 $$(800.0*dt)
+variable            Nevery equal $write_freq
 
-run                 $timesteps
-undump              trajectAll
-write_restart       relaxing.*.restart
+thermo              $${Nevery}
+thermo_style        custom step cpu dt time temp press pe ke etotal density xlo ylo zlo cella cellb cellc cellalpha cellbeta cellgamma
+thermo_modify       flush yes
+reset_timestep      0
+
+${dump_start}
+${md_start}run                 $timesteps
+${dump_end}write_restart       relaxing.*.restart
 """)
+"""Input file for continuing from a restart file, which holds the positions, velocities, and thermostat state"""
 
 _pair_style_templates = {
     'ml-mace': Template('''
@@ -77,6 +113,78 @@ pair_coeff * * $elements
 ''')
 }
 
+template_engine_setup = Template("""
+units           metal
+atom_style      atomic
+atom_modify     map yes
+newton          on
+boundary        p p p
+
+
+box             tilt large
+region          cell prism 0 1 0 1 0 1 0 0 0
+create_box      $atom_types cell
+
+$pair_style
+""")
+"""Commands which define the box and load the model, run once for all simulations in a persistent LAMMPS process"""
+
+template_engine_input = Template("""
+# replace the atoms of the previous simulation
+
+delete_atoms        group all
+change_box          all $box units box
+mass                * 1.0
+read_data           data.lmp add append
+$pair_coeff
+
+# simulation
+
+timestep            0.0005
+fix                 fxnpt all npt temp 300.0 300.0 $$(200.0*dt) tri 1.0 1.0 $$(800.0*dt)
+variable            Nevery equal $write_freq
+
+thermo              10
+thermo_style        custom step cpu dt time temp press pe ke etotal density xlo ylo zlo cella cellb cellc cellalpha cellbeta cellgamma
+thermo_modify       flush yes
+
+${start}
+thermo              $${Nevery}
+
+${dump_start}
+${md_start}run                 $timesteps
+${dump_end}write_data          relaxing.*.data nocoeff
+
+unfix               fxnpt
+${md_end}""")
+"""Input file for a simulation in a persistent LAMMPS process.
+Restart files can only be read after clearing the model, so continuations start from a data file holding velocities"""
+
+_engine_pair_templates = {
+    'ml-mace': (_pair_style_templates['ml-mace'], Template('')),
+    'ml-iap': (Template('pair_style mliap unified $model_path 0'), Template('pair_coeff * * $elements')),
+}
+"""Commands which load the model and which assign elements to each atom type in a persistent LAMMPS process.
+The ``mace`` pair style reads the model with ``pair_coeff``, so it is loaded again whenever the elements change"""
+
+_engine_atom_types = 8
+"""Fewest atom types in the box of a persistent LAMMPS process, which may hold MOFs with different numbers of elements"""
+
+
+def _change_box_args(data_path: Path) -> str:
+    """Arguments to ``change_box`` which set the box to that of a LAMMPS data file"""
+    bounds = {'xy': '0', 'xz': '0', 'yz': '0'}
+    with data_path.open() as fp:
+        for line in fp:
+            words = line.split('#')[0].split()
+            if words[-2:] in (['xlo', 'xhi'], ['ylo', 'yhi'], ['zlo', 'zhi']):
+                bounds[words[-2][0]] = f'{words[0]} {words[1]}'
+            elif words[-3:] == ['xy', 'xz', 'yz']:
+                bounds.update(zip(words[3:], words[:3]))
+            elif len(words) == 1 and words[0].isalpha():
+                break  # The first section after the header
+    return ' '.join(f'{k} final {bounds[k]}' for k in ['x', 'y', 'z', 'xy', 'xz', 'yz'])
+
 
 def _read_log_tail(path: Path, line_count: int = 50) -> str:
     """Read a bounded tail from a subprocess log file."""
@@ -87,12 +195,10 @@ def _read_log_tail(path: Path, line_count: int = 50) -> str:
         return ''
 
 
-@lru_cache(1)
-def load_model(device: str, level: str = 'default'):
-    """Load a MACE calculator and cache it in device memory
+def _load_mace(level: str) -> MACECalculator:
+    """Load a MACE calculator into host memory
 
     Args:
-        device: Which device on which to load MACE
         level: What level of MACE to use
     """
     try:
@@ -104,7 +210,197 @@ def load_model(device: str, level: str = 'default'):
     if level not in _mace_options:
         raise ValueError(f"No presets for {level}")
     options = _mace_options[level]
-    return mace_mp(device=device, **options)
+    return mace_mp(device='cpu', **options)
+
+
+def _model_size(calc: MACECalculator) -> int:
+    """Memory used by the parameters and buffers of all models in a calculator (bytes)"""
+    return sum(t.numel() * t.element_size() for model in calc.models for t in [*model.parameters(), *model.buffers()])
+
+
+StageTimer = Callable[[str, float], None]
+"""Function called with the name of a stage of a task (e.g., load, transfer, compute, io) and its duration (s)"""
+
+
+class ModelPool:
+    """MACE calculators kept in the memory of a device between tasks
+
+    Calculators are loaded the first time a level is requested, then moved to the device
+    and kept there. The least-recently used calculators are removed once the models on the
+    device exceed the memory budget. The pool may be used by several threads at once.
+
+    Args:
+        device: Device on which to hold the models
+        memory_budget: Largest total size of the models held on the device (GB). No limit if ``None``
+        loader: Function which loads the calculator for a level into host memory
+    """
+
+    def __init__(self, device: str, memory_budget: float | None = None, loader: Callable[[str], MACECalculator] = _load_mace):
+        self.device = device
+        self.memory_budget = memory_budget
+        self.loader = loader
+        self._calcs: OrderedDict[str, MACECalculator] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._warm: set[str] = set()
+        self._lock = RLock()
+
+    @property
+    def levels(self) -> list[str]:
+        """Levels held on the device, from least to most recently used"""
+        return list(self._calcs.keys())
+
+    @property
+    def memory_used(self) -> int:
+        """Total size of the models held on the device (bytes)"""
+        return sum(self._sizes.values())
+
+    def get(self, level: str = 'default', timer: StageTimer | None = None) -> MACECalculator:
+        """Get the calculator for a level, loading it if needed
+
+        Args:
+            level: What level of MACE to use
+            timer: Function which receives the time spent loading and transferring the model
+        Returns:
+            Calculator with its models on the device
+        """
+
+        with self._lock:
+            if level in self._calcs:
+                self._calcs.move_to_end(level)
+                return self._calcs[level]
+
+            # Load the model then move it to the device
+            start_time = perf_counter()
+            calc = self.loader(level)
+            load_time = perf_counter() - start_time
+
+            start_time = perf_counter()
+            calc.models = [model.to(self.device) for model in calc.models]
+            calc.device = torch.device(self.device)
+            transfer_time = perf_counter() - start_time
+            if timer is not None:
+                timer('load', load_time)
+                timer('transfer', transfer_time)
+
+            # Make room for it
+            size = _model_size(calc)
+            while self.memory_budget is not None and len(self._calcs) > 0 and self.memory_used + size > self.memory_budget * 1e9:
+                self.evict(next(iter(self._calcs)))
+            self._calcs[level] = calc
+            self._sizes[level] = size
+            return calc
+
+    def evict(self, level: str):
+        """Remove the calculator for a level from the device
+
+        Args:
+            level: Level to be removed
+        """
+        with self._lock:
+            self._calcs.pop(level)
+            self._sizes.pop(level)
+            self._warm.discard(level)
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def warmup(self, level: str = 'default', timer: StageTimer | None = None):
+        """Load the calculator for a level and evaluate a small structure with it
+
+        Does nothing if the level has already been warmed up
+
+        Args:
+            level: What level of MACE to use
+            timer: Function which receives the time spent loading, transferring, and evaluating the model
+        """
+        with self._lock:
+            if level in self._warm:
+                return
+            calc = self.get(level, timer)
+            start_time = perf_counter()
+            z = calc.z_table.zs[0]
+            atoms = ase.Atoms(numbers=[z, z], positions=[[0, 0, 0], [1.5, 1.5, 1.5]], cell=[3, 3, 3], pbc=True)
+            atoms.calc = calc
+            atoms.get_forces()
+            atoms.get_stress()
+            if timer is not None:
+                timer('warmup', perf_counter() - start_time)
+            self._warm.add(level)
+
+
+_pools: dict[str, ModelPool] = {}
+
+
+def get_model_pool(device: str, memory_budget: float | None = None) -> ModelPool:
+    """Get the model pool for a device, which is shared by all runners in this process
+
+    Args:
+        device: Device on which to hold the models
+        memory_budget: Largest total size of the models held on the device (GB). Leaves the budget unchanged if ``None``
+    Returns:
+        The pool for that device
+    """
+    if device not in _pools:
+        _pools[device] = ModelPool(device)
+    pool = _pools[device]
+    if memory_budget is not None:
+        pool.memory_budget = memory_budget
+    return pool
+
+
+def load_model(device: str, level: str = 'default') -> MACECalculator:
+    """Load a MACE calculator and keep it in device memory
+
+    Args:
+        device: Which device on which to load MACE
+        level: What level of MACE to use
+    """
+    return get_model_pool(device).get(level)
+
+
+def evaluate_batch(calc: MACECalculator, atoms_list: list[ase.Atoms]):
+    """Compute the energy, forces, and stress of several structures with one forward pass of each model
+
+    The results are stored as a :class:`~ase.calculators.singlepoint.SinglePointCalculator` on each structure.
+
+    Args:
+        calc: MACE calculator holding the models
+        atoms_list: Structures to evaluate
+    """
+
+    # Combine the graphs of all structures into a single batch
+    keyspec = data.KeySpecification(info_keys={}, arrays_keys={"charges": calc.charges_key})
+    dataset = [
+        data.AtomicData.from_config(
+            data.config_from_atoms(atoms, key_specification=keyspec, head_name=calc.head),
+            z_table=calc.z_table,
+            cutoff=calc.r_max,
+            heads=calc.available_heads,
+        ) for atoms in atoms_list
+    ]
+    loader = torch_geometric.dataloader.DataLoader(dataset=dataset, batch_size=len(dataset), shuffle=False, drop_last=False)
+    batch = next(iter(loader)).to(calc.device)
+
+    # Average the outputs of each model in the committee
+    energies, forces, stresses = [], [], []
+    for model in calc.models:
+        out = model(batch.clone().to_dict(), compute_stress=True, training=False)
+        energies.append(out["energy"].detach())
+        forces.append(out["forces"].detach())
+        stresses.append(out["stress"].detach())
+    energies = sum(energies).cpu().numpy() / len(calc.models) * calc.energy_units_to_eV
+    forces = sum(forces).cpu().numpy() / len(calc.models) * calc.energy_units_to_eV / calc.length_units_to_A
+    stresses = sum(stresses).cpu().numpy() / len(calc.models) * calc.energy_units_to_eV / calc.length_units_to_A ** 3
+
+    # Store the results with each structure
+    ptr = batch["ptr"].cpu().numpy()
+    for i, atoms in enumerate(atoms_list):
+        atoms.calc = SinglePointCalculator(
+            atoms,
+            energy=energies[i],
+            free_energy=energies[i],
+            forces=forces[ptr[i]:ptr[i + 1]],
+            stress=full_3x3_to_voigt_6_stress(stresses[i])
+        )
 
 
 def _load_structure(mof: MOFRecord, structure_source: tuple[str, int] | None):
@@ -113,7 +409,7 @@ def _load_structure(mof: MOFRecord, structure_source: tuple[str, int] | None):
         return mof.atoms
     else:
         traj, ind = structure_source
-        return read_from_string(mof.md_trajectory[traj][ind][-1], "vasp")
+        return mof.md_trajectory[traj].get_atoms(ind)
 
 
 @dataclass
@@ -141,6 +437,85 @@ class MACERunner(MDInterface):
 
     Note: You will need to save the model in the appropriate format with
     ``mace_create_lammps_model``"""
+    cache_dir: Path | None = None
+    """Directory in which to keep restart files between MD segments. Default is a ``cache`` directory in :attr:`run_dir`"""
+    persistent_lammps: bool = False
+    """Whether to run every MD simulation in the same LAMMPS process, which keeps the model loaded between simulations"""
+    model_memory_budget: float | None = None
+    """Largest total size of the MACE models held on the device (GB). No limit if ``None``"""
+    timing_hooks: list[Callable[[str, str, float], None]] = field(default_factory=list)
+    """Functions called with the name of a task, a stage of the task (load, transfer, compute, io), and its duration (s)"""
+    strain_monitor: StrainMonitor | None = None
+    """Criteria used to end MD runs early based on the strain of the cell. Runs continue to the requested length if ``None``"""
+    maximum_steps: int | None = None
+    """Most MD timesteps run for any MOF. Cached restart files are deleted once a MOF reaches it"""
+    max_strain: float | None = None
+    """Largest strain of a MOF which is simulated further. Cached restart files are deleted once a MOF exceeds it"""
+    md_cell_only: bool = False
+    """Whether to write coordinates for only the first and last frame of each MD run.
+    The cell at every reported step is always available from the :attr:`~mofa.utils.trajectory.Trajectory.cell_series`"""
+    scratch: ScratchManager | None = None
+    """Manager which places run directories and removes them in the background. Default is to use :attr:`run_dir`"""
+    pore_geometry: PoreGeometry | None = None
+    """Tool used to describe the pores of each relaxed structure, stored as ``atoms.info['pore_geometry']``.
+    An empty dictionary is stored if the description fails. Pores are not described if ``None``"""
+    _engine: LAMMPSEngine | None = field(default=None, init=False, repr=False)
+
+    @property
+    def cache(self) -> MOFCache:
+        """Storage for restart files"""
+        return MOFCache(self.run_dir / 'cache' if self.cache_dir is None else self.cache_dir)
+
+    @property
+    def model_pool(self) -> ModelPool:
+        """Models held on the device"""
+        return get_model_pool(self.device, self.model_memory_budget)
+
+    def warmup(self, level: str = 'default'):
+        """Load a MACE model onto the device and evaluate a small structure with it
+
+        Call at the start of a worker so that the first task does not pay to load the model
+
+        Args:
+            level: Level of accuracy to prepare
+        """
+        self.model_pool.warmup(level, timer=partial(self._report_time, 'warmup'))
+
+    def _report_time(self, name: str, stage: str, elapsed: float):
+        """Send the duration of a stage of a task to the timing hooks"""
+        for hook in self.timing_hooks:
+            hook(name, stage, elapsed)
+
+    @contextmanager
+    def _timed(self, name: str, stage: str):
+        """Report the time spent within a block to the timing hooks"""
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self._report_time(name, stage, perf_counter() - start_time)
+
+    def _make_run_dir(self, name: str) -> Path:
+        """Create the directory for a computation"""
+        if self.scratch is not None:
+            return self.scratch.make_dir(name)
+        out_dir = self.run_dir / name
+        out_dir.mkdir(parents=True, exist_ok=True)
+        return out_dir
+
+    def _remove_run_dir(self, out_dir: Path):
+        """Delete the directory of a computation"""
+        if self.scratch is not None:
+            self.scratch.release(out_dir)
+        else:
+            shutil.rmtree(out_dir)
+
+    @property
+    def engine(self) -> LAMMPSEngine | None:
+        """LAMMPS process reused between MD simulations, if :attr:`persistent_lammps` is set"""
+        if self.persistent_lammps and self._engine is None:
+            self._engine = LAMMPSEngine(self.lammps_cmd)
+        return self._engine
 
     def run_single_point(
             self,
@@ -184,7 +559,81 @@ class MACERunner(MDInterface):
             - Path to the run directory
         """
         atoms = _load_structure(mof, structure_source)
-        return self._run_mace(mof.name, atoms, "optimize", level, steps, fmax)
+        atoms, out_dir = self._run_mace(mof.name, atoms, "optimize", level, steps, fmax)
+        self._describe_pores(mof.name, atoms)
+        return atoms, out_dir
+
+    def run_optimization_many(
+            self,
+            mofs: list[MOFRecord],
+            level: str = "default",
+            structure_source: tuple[str, int] | None = None,
+            steps: int = 8,
+            fmax: float = 1e-2,
+    ) -> list[tuple[ase.Atoms, Path]]:
+        """Relax several structures together
+
+        Forces for every structure which has yet to converge are computed in a single batch,
+        and the structures are moved with FIRE rather than the LBFGS used by :meth:`run_optimization`.
+
+        Args:
+            mofs: Structures to be run
+            level: Name of the level of computation to perform
+            structure_source: Name of the MD trajectory and frame ID from which to source the
+                input structures. Default is to use the as-assembled structures
+            steps: Maximum number of optimization steps
+            fmax: Convergence threshold for optimization
+        Returns:
+            Relaxed structure and path to the run directory for each MOF
+        """
+
+        # Make the output directories
+        out_dirs = [self._make_run_dir(f"{mof.name}-optimize-{level}") for mof in mofs]
+
+        # Get the model, which stays on the device between tasks
+        task_name = "+".join(mof.name for mof in mofs)
+        calc = self.model_pool.get(level, timer=partial(self._report_time, task_name))
+
+        atoms_list = [_load_structure(mof, structure_source).copy() for mof in mofs]
+        try:
+            with ExitStack() as stack:
+                logfiles = [stack.enter_context(open(out_dir / "relax.log", "w")) for out_dir in out_dirs]
+                trajs = [stack.enter_context(Trajectory(out_dir / "relax.traj", mode="w")) for out_dir in out_dirs]
+                opt = BatchFIRE(
+                    [UnitCellFilter(atoms, hydrostatic_strain=False) for atoms in atoms_list],
+                    evaluate=partial(evaluate_batch, calc),
+                    logfiles=logfiles,
+                    trajectories=trajs,
+                )
+                with self._timed(task_name, 'compute'):
+                    opt.run(fmax=fmax, steps=steps)
+
+            # Write the results to disk for easy retrieval
+            with self._timed(task_name, 'io'):
+                for atoms, out_dir in zip(atoms_list, out_dirs):
+                    atoms.write(out_dir / "atoms.extxyz")
+        finally:
+            # Clear out the completed files, if desired
+            if self.delete_finished:
+                for out_dir in out_dirs:
+                    self._remove_run_dir(out_dir)
+
+        # Remove the calculator from the atoms
+        for mof, atoms in zip(mofs, atoms_list):
+            atoms.calc = None
+            self._describe_pores(mof.name, atoms)
+        return [(atoms, out_dir.absolute()) for atoms, out_dir in zip(atoms_list, out_dirs)]
+
+    def _describe_pores(self, name: str, atoms: ase.Atoms):
+        """Store the pore descriptors of a relaxed structure in its ``info``, if :attr:`pore_geometry` is set"""
+        if self.pore_geometry is None:
+            return
+        with self._timed(name, 'compute'):
+            try:
+                atoms.info['pore_geometry'] = self.pore_geometry.describe(atoms)
+            except ValueError as exc:
+                logger.warning(f'Failed to compute pore geometry for {name}: {exc}')
+                atoms.info['pore_geometry'] = {}
 
     def _run_mace(
             self,
@@ -210,45 +659,38 @@ class MACERunner(MDInterface):
             - Structure with computed properties
             - Absolute path to the run directory
         """
-        # Create and move to output directory
-        out_dir = self.run_dir / f"{name}-{action}-{level}"
-        start_dir = Path().cwd()
-        out_dir.mkdir(parents=True, exist_ok=True)
+        # Create the output directory
+        out_dir = self._make_run_dir(f"{name}-{action}-{level}")
 
-        # Load the model and move it to the device
-        calc = load_model(self.device, level)
-        for model in calc.models:
-            model.to(self.device)
+        # Get the model, which stays on the device between tasks.
+        #  Each task uses its own copy of the calculator, which shares the models but not the results
+        calc = copy(self.model_pool.get(level, timer=partial(self._report_time, name)))
+        calc.reset()
 
         try:
-            os.chdir(out_dir)
             # Initialize MACE calculator
             atoms = atoms.copy()
             atoms.calc = calc
 
             # Run the calculation
-            if action == "single":
-                atoms.get_potential_energy()
-            elif action == "optimize":
-                ecf = UnitCellFilter(atoms, hydrostatic_strain=False)
-                with Trajectory("relax.traj", mode="w") as traj:
-                    dyn = LBFGS(ecf, logfile="relax.log", trajectory=traj)
-                    dyn.run(fmax=fmax, steps=steps)
-            else:
-                raise ValueError(f"Action not supported: {action}")
+            with self._timed(name, 'compute'):
+                if action == "single":
+                    atoms.get_potential_energy()
+                elif action == "optimize":
+                    ecf = UnitCellFilter(atoms, hydrostatic_strain=False)
+                    with Trajectory(out_dir / "relax.traj", mode="w") as traj:
+                        dyn = LBFGS(ecf, logfile=out_dir / "relax.log", trajectory=traj)
+                        dyn.run(fmax=fmax, steps=steps)
+                else:
+                    raise ValueError(f"Action not supported: {action}")
 
             # Write the result to disk for easy retrieval
-            atoms.write("atoms.extxyz")
+            with self._timed(name, 'io'):
+                atoms.write(out_dir / "atoms.extxyz")
         finally:
-            os.chdir(start_dir)
-
-            # Move the model back to the CPU
-            for model in calc.models:
-                model.to('cpu')
-
             # Clear out the completed files, if desired
             if self.delete_finished:
-                shutil.rmtree(out_dir)
+                self._remove_run_dir(out_dir)
 
         # Remove the calculator from the atoms
         atoms.calc = None
@@ -260,43 +702,53 @@ class MACERunner(MDInterface):
             atoms: ase.Atoms,
             min_steps: int,
             timesteps: int,
-            write_freq: int
-    ) -> list[tuple[int, ase.Atoms]]:
+            write_freq: int,
+            restart_file: Path | None = None,
+            save_restart: Callable[[int, Path], None] | None = None,
+            reference_cell: np.ndarray | None = None,
+            start_timestep: int = 0,
+    ) -> MDTrajectory:
+        """Run NPT MD using LAMMPS
+
+        Args:
+            name: Name used for the run directory
+            atoms: Starting structure
+            min_steps: Number of minimization steps to perform before MD
+            timesteps: Number of MD timesteps
+            write_freq: How often to write structures
+            restart_file: Restart file from which to continue, instead of starting from ``atoms``.
+                Must be a data file holding velocities if using the persistent LAMMPS process
+            save_restart: Function called with the number of timesteps run and the restart (or data) file written at the end
+            reference_cell: Cell against which the strain monitor measures strain. Default is the cell at the start of the run
+            start_timestep: Number of timesteps run in previous segments
+        Returns:
+            Structures produced at specified intervals, which end early if stopped by the strain monitor
+        """
         # Make a run directory
-        out_dir = self.run_dir / f"{name}-lammps"
-        out_dir.mkdir(parents=True, exist_ok=True)
+        out_dir = self._make_run_dir(f"{name}-lammps")
 
-        # Write the input file
+        # Write the input files
         elements = sorted(set(atoms.get_chemical_symbols()))
         if self.lammps_pkg not in _pair_style_templates:
             raise NotImplementedError(f'Pair style {self.lammps_module} not yet supported')
-        pair_style = _pair_style_templates[self.lammps_pkg].substitute(
-            elements=" ".join(elements),
-            model_path=str(self.model_path),
-        )
-
-        inp_file = template_input.substitute(
-            write_freq=write_freq,
-            min_steps=min_steps,
-            timesteps=timesteps,
-            pair_style=pair_style,
-            elements=" ".join(elements)
-        )
-        inp_path = out_dir / 'in.lammps'
-        inp_path.write_text(inp_file)
-
-        # Write the structure
-        data_path = out_dir / 'data.lmp'
-        io.write(
-            str(data_path), atoms, 'lammps-data',
-            specorder=elements, bonds=False, masses=True
-        )
+        if self.engine is not None:
+            self._write_engine_inputs(out_dir, atoms, elements, min_steps, timesteps, write_freq, restart_file)
+        else:
+            self._write_inputs(out_dir, atoms, elements, min_steps, timesteps, write_freq, restart_file)
 
         # Invoke LAMMPS
         try:
-            with open(out_dir / 'stdout.lmp', 'w') as fp, open(out_dir / 'stderr.lmp', 'w') as fe:
-                env = None
-                proc = run(list(self.lammps_cmd) + ['-i', inp_path.name], cwd=out_dir, stdout=fp, stderr=fe, env=env)
+            watch = None
+            if self.strain_monitor is not None:
+                watch = StrainWatch(self.strain_monitor, out_dir, reference_cell=reference_cell, start_timestep=start_timestep)
+            with self._timed(name, 'compute'):
+                if self.engine is not None:
+                    proc = self.engine.run(out_dir, 'in.lammps', callback=watch, setup_file='setup.lammps')
+                else:
+                    with open(out_dir / 'stdout.lmp', 'w') as fp, open(out_dir / 'stderr.lmp', 'w') as fe:
+                        env = None
+                        proc = run_with_callback(list(self.lammps_cmd) + ['-i', 'in.lammps'], watch,
+                                                 cwd=out_dir, stdout=fp, stderr=fe, env=env)
 
             if proc.returncode != 0:
                 message = [f'LAMMPS failed in {out_dir} with exit code {proc.returncode}']
@@ -310,21 +762,115 @@ class MACERunner(MDInterface):
                 raise ValueError('\n'.join(message))
 
             # Read the outputs
-            with open(out_dir / 'dump.lammpstrj.all') as fp:
-                return [(i * write_freq, strc) for i, strc in enumerate(read_lammps_dump_text(fp, slice(None)))]
+            with self._timed(name, 'io'):
+                output = read_lammps_dump(out_dir / 'dump.lammpstrj.all')
+                output.cell_series = CellSeries.from_thermo(read_thermo(out_dir / 'stdout.lmp'))
+            if watch is not None:
+                watch()  # Check the final frames
+                output.stop_reason = watch.reason
+
+            # Keep the restart file for the next segment, which is named by the last timestep run
+            steps_run = int(output.timesteps[-1])
+            restart_path = out_dir / f'relaxing.{steps_run}.{"restart" if self.engine is None else "data"}'
+            if save_restart is not None and restart_path.is_file():
+                save_restart(steps_run, restart_path)
+            return output
         finally:
             if self.delete_finished:
-                shutil.rmtree(out_dir)
+                self._remove_run_dir(out_dir)
+
+    def _write_inputs(self, out_dir: Path, atoms: ase.Atoms, elements: list[str], min_steps: int, timesteps: int,
+                      write_freq: int, restart_file: Path | None):
+        """Write the input file and structure for a new LAMMPS process"""
+        pair_style = _pair_style_templates[self.lammps_pkg].substitute(
+            elements=" ".join(elements),
+            model_path=str(self.model_path),
+        )
+
+        template = template_input if restart_file is None else template_restart
+        dump_start, dump_end = dump_commands('id type element x y z', " ".join(elements), self.md_cell_only)
+        inp_file = template.substitute(
+            write_freq=write_freq,
+            min_steps=min_steps,
+            timesteps=timesteps,
+            pair_style=pair_style,
+            md_start=md_start_commands(self.strain_monitor is not None),
+            dump_start=dump_start,
+            dump_end=dump_end,
+        )
+        (out_dir / 'in.lammps').write_text(inp_file)
+
+        # Write the structure
+        if restart_file is None:
+            data_path = out_dir / 'data.lmp'
+            io.write(
+                str(data_path), atoms, 'lammps-data',
+                specorder=elements, bonds=False, masses=True
+            )
+        else:
+            shutil.copyfile(restart_file, out_dir / 'restart.lmp')
+
+    def _write_engine_inputs(self, out_dir: Path, atoms: ase.Atoms, elements: list[str], min_steps: int, timesteps: int,
+                             write_freq: int, restart_file: Path | None):
+        """Write the setup file, input file, and structure for the persistent LAMMPS process
+
+        The setup depends only on the model and the number of atom types, so that it is shared between MOFs.
+        Atom types beyond the number of elements are assigned to the last element and hold no atoms.
+        """
+        type_elements = elements + elements[-1:] * (_engine_atom_types - len(elements))
+        style_template, coeff_template = _engine_pair_templates[self.lammps_pkg]
+        options = dict(elements=" ".join(type_elements), model_path=str(self.model_path))
+        (out_dir / 'setup.lammps').write_text(template_engine_setup.substitute(
+            atom_types=len(type_elements),
+            pair_style=style_template.substitute(**options)
+        ))
+
+        # Write the structure, which is either new or a data file written at the end of a previous segment
+        data_path = out_dir / 'data.lmp'
+        if restart_file is None:
+            io.write(
+                str(data_path), atoms, 'lammps-data',
+                specorder=elements, bonds=False, masses=True
+            )
+            start = (f'minimize            0. 1.0e-2 {min_steps} 10000\n'
+                     'reset_timestep      0\n\n'
+                     'velocity            all create 300.0 12345\n')
+        else:
+            shutil.copyfile(restart_file, data_path)
+            start = 'reset_timestep      0\n'
+
+        dump_start, dump_end = dump_commands('id type element x y z', " ".join(type_elements), self.md_cell_only)
+        (out_dir / 'in.lammps').write_text(template_engine_input.substitute(
+            box=_change_box_args(data_path),
+            pair_coeff=coeff_template.substitute(**options),
+            write_freq=write_freq,
+            timesteps=timesteps,
+            start=start,
+            md_start=md_start_commands(self.strain_monitor is not None),
+            md_end='unfix               halt\n' if self.strain_monitor is not None else '',
+            dump_start=dump_start,
+            dump_end=dump_end,
+        ))
 
     def run_molecular_dynamics(self,
                                mof: MOFRecord,
                                timesteps: int,
-                               report_frequency: int) -> list[tuple[int, ase.Atoms]]:
+                               report_frequency: int) -> MDTrajectory:
         # Get the initial structure
+        cache_key = f'{self.traj_name}-{self.md_supercell}x{self.md_supercell}x{self.md_supercell}'
+        if self.persistent_lammps:
+            cache_key += '-data'  # The persistent process continues from data files rather than restart files
+        restart_file = None
+        reference_cell = None
         if self.traj_name in mof.md_trajectory:
-            start_frame, strc = mof.md_trajectory[self.traj_name][-1]
-            atoms = read_from_string(strc, 'vasp')
+            start_frame, atoms = mof.md_trajectory[self.traj_name][-1]
+            reference_cell = mof.md_trajectory[self.traj_name].cells[0]
             continuation = True
+
+            # Use the restart file from the previous segment, if available
+            restart_file = self.cache.restart_path(mof.atoms, cache_key, start_frame)
+            if not restart_file.is_file():
+                restart_file = None
         else:
             atoms = mof.atoms * ([self.md_supercell] * 3)
             start_frame = 0
@@ -336,10 +882,20 @@ class MACERunner(MDInterface):
             atoms=atoms,
             timesteps=timesteps - start_frame,
             min_steps=0 if continuation else 100,
-            write_freq=report_frequency
+            write_freq=report_frequency,
+            restart_file=restart_file,
+            save_restart=lambda steps_run, path: self.cache.save_restart(mof.atoms, cache_key, start_frame + steps_run, path),
+            reference_cell=reference_cell,
+            start_timestep=start_frame,
         )
         if continuation:
-            output.pop(0)  # The first frame is the last from the previous run
+            output = output[1:]  # The first frame is the last from the previous run
+            output.cell_series = output.cell_series[1:]
 
         # Increment the outputs by the start time
-        return [(i + start_frame, atoms) for i, atoms in output]
+        output = output.shift_timesteps(start_frame)
+
+        # Remove the restart files once the MOF will not be run further
+        if md_finished(output, reference_cell, self.maximum_steps, self.max_strain):
+            self.cache.remove(mof.atoms, cache_key)
+        return output
@@ -0,0 +1,163 @@
+"""Geometry optimizers which relax many structures at once"""
+from typing import Callable, Sequence, TextIO
+import time
+
+import numpy as np
+import ase
+from ase.io.trajectory import TrajectoryWriter
+
+
+def _atoms_of(optimizable) -> ase.Atoms:
+    """Get the atoms behind an optimizable object, which is either the atoms or a filter"""
+    return optimizable if isinstance(optimizable, ase.Atoms) else optimizable.atoms
+
+
+class BatchFIRE:
+    """FIRE optimizer which relaxes several structures together
+
+    Applies the same update rules as :class:`ase.optimize.FIRE` to each structure,
+    storing the coordinates of all structures in a single array.
+    Every step requires one call to ``evaluate`` for all structures which have yet to converge,
+    so a calculator can compute all of their forces in the same batch.
+
+    Args:
+        optimizables: Structures or filters (e.g., :class:`~ase.filters.UnitCellFilter`) to be relaxed
+        evaluate: Function which computes the energy, forces, and stresses of a list of structures
+            and attaches a calculator holding them to each structure
+        logfiles: File to which to log the progress of each structure
+        trajectories: Trajectory to which to write each step of each structure
+        dt: Initial timestep
+        maxstep: Largest distance any structure moves in a step
+        dtmax: Largest timestep
+        Nmin: Number of downhill steps before increasing the timestep
+        finc: Factor by which to increase the timestep
+        fdec: Factor by which to decrease the timestep after an uphill step
+        astart: Initial mixing parameter
+        fa: Factor by which to decrease the mixing parameter
+    """
+
+    def __init__(self,
+                 optimizables: Sequence,
+                 evaluate: Callable[[list[ase.Atoms]], None],
+                 logfiles: Sequence[TextIO | None] | None = None,
+                 trajectories: Sequence[TrajectoryWriter | None] | None = None,
+                 dt: float = 0.1, maxstep: float = 0.2, dtmax: float = 1.0,
+                 Nmin: int = 5, finc: float = 1.1, fdec: float = 0.5, astart: float = 0.1, fa: float = 0.99):
+        self.optimizables = list(optimizables)
+        self.evaluate = evaluate
+        n_opt = len(self.optimizables)
+        self.logfiles = [None] * n_opt if logfiles is None else list(logfiles)
+        self.trajectories = [None] * n_opt if trajectories is None else list(trajectories)
+        self.maxstep = maxstep
+        self.dtmax = dtmax
+        self.Nmin = Nmin
+        self.finc = finc
+        self.fdec = fdec
+        self.astart = astart
+        self.fa = fa
+
+        # Optimizer state for each structure
+        self.dt = np.full(n_opt, dt)
+        self.a = np.full(n_opt, astart)
+        self.Nsteps = np.zeros(n_opt, dtype=int)
+        self.nsteps = np.zeros(n_opt, dtype=int)
+
+        # Offsets of each structure in the array of all coordinates
+        sizes = np.array([np.size(o.get_positions()) for o in self.optimizables], dtype=int)
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)])
+        self.vel = np.zeros(self.offsets[-1])
+        self.started = np.zeros(n_opt, dtype=bool)
+
+    @staticmethod
+    def _segments(values: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        """Sum consecutive segments of an array"""
+        return np.add.reduceat(values, np.cumsum(sizes) - sizes)
+
+    def _log(self, active: np.ndarray, forces: list[np.ndarray]):
+        """Write the energy and largest force of each active structure to its log and trajectory"""
+        now = time.localtime()
+        for i, f in zip(np.flatnonzero(active), forces):
+            optimizable = self.optimizables[i]
+            if self.logfiles[i] is not None:
+                if self.nsteps[i] == 0:
+                    self.logfiles[i].write("%s  %4s %8s %15s  %12s\n" % (" " * 4, "Step", "Time", "Energy", "fmax"))
+                fmax = np.sqrt((f.reshape(-1, 3) ** 2).sum(axis=1).max())
+                self.logfiles[i].write("FIRE:  %3d %02d:%02d:%02d %15.6f %15.6f\n" % (
+                    self.nsteps[i], now[3], now[4], now[5], optimizable.get_potential_energy(), fmax))
+                self.logfiles[i].flush()
+            if self.trajectories[i] is not None:
+                self.trajectories[i].write(_atoms_of(optimizable))
+
+    def run(self, fmax: float = 0.05, steps: int = 100_000_000) -> np.ndarray:
+        """Relax all structures until converged or out of steps
+
+        Args:
+            fmax: Convergence threshold for the largest force on any atom
+            steps: Maximum number of steps for each structure
+        Returns:
+            Whether each structure converged
+        """
+
+        converged = np.zeros(len(self.optimizables), dtype=bool)
+        active = np.ones(len(self.optimizables), dtype=bool)
+        max_steps = self.nsteps + steps
+        while True:
+            # Compute the forces for every unconverged structure at once
+            indices = np.flatnonzero(active)
+            self.evaluate([_atoms_of(self.optimizables[i]) for i in indices])
+            forces = [self.optimizables[i].get_forces() for i in indices]
+            self._log(active, forces)
+
+            # Stop moving those which have converged or run out of steps
+            largest = np.array([np.sqrt((f ** 2).sum(axis=1).max()) for f in forces])
+            converged[indices] = largest < fmax
+            moving = ~converged[indices] & (self.nsteps[indices] < max_steps[indices])
+            if not moving.any():
+                break
+            indices = indices[moving]
+            active[:] = False
+            active[indices] = True
+
+            # Gather the state of the structures to move
+            sizes = np.diff(self.offsets)[indices]
+            mask = np.repeat(active, np.diff(self.offsets))
+            forces = np.concatenate([f.ravel() for f, m in zip(forces, moving) if m])
+            vel = self.vel[mask]
+            started = self.started[indices]
+            a, dt, Nsteps = self.a[indices], self.dt[indices], self.Nsteps[indices]
+
+            # Mix the velocity and forces of structures which have been moving downhill
+            vf = self._segments(forces * vel, sizes)
+            grad2 = self._segments(forces * forces, sizes)
+            vv = self._segments(vel * vel, sizes)
+            downhill = started & (vf > 0)
+            scale = np.where(downhill, np.sqrt(vv) / np.sqrt(np.where(grad2 > 0, grad2, 1)), 0)
+            vel = np.where(np.repeat(downhill, sizes), (1 - np.repeat(a, sizes)) * vel + np.repeat(a * scale, sizes) * forces, vel)
+            speed_up = downhill & (Nsteps > self.Nmin)
+            dt = np.where(speed_up, np.minimum(dt * self.finc, self.dtmax), dt)
+            a = np.where(speed_up, a * self.fa, a)
+            Nsteps = np.where(downhill, Nsteps + 1, Nsteps)
+
+            # Reset those which went uphill
+            uphill = started & ~downhill
+            vel = np.where(np.repeat(uphill, sizes), 0., vel)
+            a = np.where(uphill, self.astart, a)
+            dt = np.where(uphill, dt * self.fdec, dt)
+            Nsteps = np.where(uphill, 0, Nsteps)
+
+            # Move the structures, limiting the step size
+            vel = vel + np.repeat(dt, sizes) * forces
+            dr = np.repeat(dt, sizes) * vel
+            normdr = np.sqrt(self._segments(dr * dr, sizes))
+            dr *= np.repeat(np.where(normdr > self.maxstep, self.maxstep / np.where(normdr > 0, normdr, 1), 1.), sizes)
+            for i, step in zip(indices, np.split(dr, np.cumsum(sizes)[:-1])):
+                optimizable = self.optimizables[i]
+                optimizable.set_positions(optimizable.get_positions() + step.reshape(-1, 3))
+
+            # Store the new state
+            self.vel[mask] = vel
+            self.a[indices], self.dt[indices], self.Nsteps[indices] = a, dt, Nsteps
+            self.started[indices] = True
+            self.nsteps[indices] += 1
+
+        return converged
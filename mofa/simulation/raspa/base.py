@@ -1,13 +1,20 @@
 """Interface definitions"""
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Sequence
 from pathlib import Path
 import subprocess
 import shutil
 
 import ase
+import pandas as pd
 
-from mofa.simulation.raspa.utils import get_cif_from_chargemol, write_cif
+from mofa.simulation.raspa.charges import ChargeEngine, ChargemolCharges
+from mofa.simulation.raspa.utils import calculate_cell_size, write_cif, write_cif_once
+from mofa.simulation.scratch import ScratchManager
+
+
+gcmc_columns = ['adsorbate', 'temperature', 'pressure', 'uptake_mol_kg', 'error_mol_kg', 'uptake_g_L', 'error_g_L']
+"""Columns of the table produced by :meth:`BaseRaspaRunner.run_gcmc_many`"""
 
 
 @dataclass(kw_only=True)
@@ -23,26 +30,34 @@ class BaseRaspaRunner:
     """Whether to delete the run files after completing"""
     cutoff: float = 12.8
     """Van der Waals and Coulomb cutoff distance in Angstroms"""
+    scratch: ScratchManager | None = None
+    """Manager which places run directories and removes them in the background. Default is to use :attr:`run_dir`"""
+    charges: ChargeEngine = field(default_factory=ChargemolCharges)
+    """Method used to assign partial charges to the atoms of the MOF"""
+    framework_dir: Path | None = None
+    """Directory in which to write the charged structure of each MOF once, linking it into every run.
+    Default is to write the structure in each run directory"""
 
     def run_gcmc(
             self,
             name: str,
-            cp2k_dir: Path | str,
+            cp2k_dir: Path | str | None,
             adsorbate: str,
             cycles: int,
             temperature: float,
-            pressure: float
+            pressure: float,
+            atoms: ase.Atoms | None = None,
     ) -> tuple[float, float, float, float]:
         """Run a GCMC calculation
 
         Args:
             name: Name of the MOF
-            cp2k_dir: Path to a completed CP2K calculation, which contains the partial charges on each atom
-                in the output files from a chargemol computation
+            cp2k_dir: Path to a completed CP2K calculation, which is required if :attr:`charges` uses the DFT results
             adsorbate: Name of the adsorbate
             cycles: Number of monte carlo steps
             temperature: Simulation temperature in Kelvin (K).
             pressure: Simulation pressure in Pascal (Pa).
+            atoms: Structure of the MOF, used by charge engines which do not require DFT
         Returns:
              Computed uptake (U) and error (E) from RASPA2 in the following order:
                 - U (mol/kg)
@@ -50,33 +65,124 @@ class BaseRaspaRunner:
                 - U (g/L)
                 - E (g/L)
         """
-        out_dir = self.run_dir / f"{name}_{adsorbate}_{temperature}_{pressure:0e}"
-        out_dir.mkdir(parents=True, exist_ok=True)
-        cp2k_dir = Path(cp2k_dir)
+        run_name = f"{name}_{adsorbate}_{temperature}_{pressure:0e}"
+        out_dir = self._make_run_dir(run_name)
 
         try:
             # Write CIF file with charges
-            atoms = get_cif_from_chargemol(cp2k_dir)
-            write_cif(atoms, out_dir, "input.cif")
+            atoms = self.charges.assign(atoms, cp2k_dir)
+            self._write_framework(out_dir, atoms)
+
+            return self._run_condition(out_dir, atoms, calculate_cell_size(atoms), cycles, adsorbate, temperature, pressure)
+        finally:
+            if self.delete_finished:
+                self._remove_run_dir(out_dir)
+
+    def run_gcmc_many(
+            self,
+            name: str,
+            cp2k_dir: Path | str | None,
+            conditions: Sequence[tuple[str, float, float]],
+            cycles: int,
+            atoms: ase.Atoms | None = None,
+    ) -> pd.DataFrame:
+        """Run GCMC calculations for the same MOF at several conditions
 
-            # Invoke the version specific input writer
-            self._write_inputs(out_dir, atoms, cycles, adsorbate, temperature, pressure)
+        The charged structure and the number of unit cells are computed once, then RASPA is run
+        for each condition in turn within subdirectories of a single run directory.
 
-            # Invoke RASPA
-            with open(out_dir / "raspa.log", "w") as fp, open(out_dir / "raspa.err", "w") as fe:
-                result = subprocess.run(self.raspa_command, cwd=out_dir, stdout=fp, stderr=fe)
-            if result.returncode != 0:
-                raise ValueError(f'RASPA failed in {out_dir}')
+        Args:
+            name: Name of the MOF
+            cp2k_dir: Path to a completed CP2K calculation, which is required if :attr:`charges` uses the DFT results
+            conditions: Adsorbate, temperature (K), and pressure (Pa) of each simulation
+            cycles: Number of monte carlo steps
+            atoms: Structure of the MOF, used by charge engines which do not require DFT
+        Returns:
+            Table with the conditions and computed uptake of each simulation, with columns listed in :data:`gcmc_columns`
+        """
+        out_dir = self._make_run_dir(f"{name}_gcmc")
 
-            # Read the results
-            return self._read_outputs(out_dir, atoms, adsorbate)
+        try:
+            # Write CIF file with charges, which is shared by all conditions
+            atoms = self.charges.assign(atoms, cp2k_dir)
+            self._write_framework(out_dir, atoms)
+            unit_cells = calculate_cell_size(atoms)
+
+            rows = []
+            for adsorbate, temperature, pressure in conditions:
+                cond_dir = out_dir / f"{adsorbate}_{temperature}_{pressure:0e}"
+                cond_dir.mkdir(exist_ok=True)
+                (cond_dir / "input.cif").unlink(missing_ok=True)
+                (cond_dir / "input.cif").symlink_to(Path("..") / "input.cif")
+
+                result = self._run_condition(cond_dir, atoms, unit_cells, cycles, adsorbate, temperature, pressure)
+                rows.append((adsorbate, temperature, pressure, *result))
+            return pd.DataFrame(rows, columns=gcmc_columns)
         finally:
             if self.delete_finished:
-                shutil.rmtree(out_dir)
+                self._remove_run_dir(out_dir)
+
+    def _make_run_dir(self, run_name: str) -> Path:
+        """Create the directory for a RASPA run"""
+        if self.scratch is not None:
+            return self.scratch.make_dir(run_name)
+        out_dir = self.run_dir / run_name
+        out_dir.mkdir(parents=True, exist_ok=True)
+        return out_dir
+
+    def _write_framework(self, out_dir: Path, atoms: ase.Atoms):
+        """Place the charged structure in a run directory as input.cif"""
+        if self.framework_dir is None:
+            write_cif(atoms, out_dir, "input.cif")
+            return
+        cif_path = write_cif_once(atoms, self.framework_dir)
+        (out_dir / "input.cif").unlink(missing_ok=True)
+        (out_dir / "input.cif").symlink_to(cif_path.absolute())
+
+    def _remove_run_dir(self, out_dir: Path):
+        """Delete a finished run directory"""
+        if self.scratch is not None:
+            self.scratch.release(out_dir)
+        else:
+            shutil.rmtree(out_dir)
+
+    def _run_condition(self,
+                       out_dir: Path,
+                       atoms: ase.Atoms,
+                       unit_cells: tuple[int, int, int],
+                       cycles: int,
+                       adsorbate: str,
+                       temperature: float,
+                       pressure: float) -> tuple[float, float, float, float]:
+        """Run RASPA in a directory which already contains the structure as "input.cif"
+
+        Args:
+            out_dir: Path in which to run RASPA
+            atoms: Structure of the MOF
+            unit_cells: Number of unit cells along each direction
+            cycles: Number of monte carlo steps
+            adsorbate: Name of the adsorbate
+            temperature: Simulation temperature in Kelvin (K).
+            pressure: Simulation pressure in Pascal (Pa).
+        Returns:
+            Uptakes and errors, as in :meth:`run_gcmc`
+        """
+        # Invoke the version specific input writer
+        self._write_inputs(out_dir, atoms, unit_cells, cycles, adsorbate, temperature, pressure)
+
+        # Invoke RASPA
+        with open(out_dir / "raspa.log", "w") as fp, open(out_dir / "raspa.err", "w") as fe:
+            result = subprocess.run(self.raspa_command, cwd=out_dir, stdout=fp, stderr=fe)
+        if result.returncode != 0:
+            raise ValueError(f'RASPA failed in {out_dir}')
+
+        # Read the results
+        return self._read_outputs(out_dir, atoms, adsorbate)
 
     def _write_inputs(self,
                       out_dir: Path,
                       atoms: ase.Atoms,
+                      unit_cells: tuple[int, int, int],
                       cycles: int,
                       adsorbate: str,
                       temperature: float,
@@ -84,13 +190,15 @@ class BaseRaspaRunner:
         """Set up RASPA input files in a new directory
 
         The directory already contains a file named "input.cif"
-        with the structure of the MOF
+        with the structure of the MOF.
+        Files which are not modified should be linked from their template using :meth:`ScratchManager.link_files`
 
         Args:
             out_dir: Path in which to run RASPA
             atoms: Structure of the MOF
-            adsorbate: Name of the adsorbate
+            unit_cells: Number of unit cells along each direction
             cycles: Number of monte carlo steps
+            adsorbate: Name of the adsorbate
             temperature: Simulation temperature in Kelvin (K).
             pressure: Simulation pressure in Pascal (Pa).
         """
@@ -0,0 +1,179 @@
+"""Methods which assign the partial charges used in GCMC simulations"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from math import ceil, pi, sqrt
+
+import ase
+import ase.io
+import numpy as np
+from ase.neighborlist import neighbor_list
+from ase.units import Bohr, Hartree
+from scipy.special import erfc
+
+from mofa.simulation.chargemol import chargemol_fname
+from mofa.simulation.raspa.utils import get_cif_from_chargemol
+
+_coulomb = Hartree * Bohr
+"""Coulomb constant (eV·Å/e^2)"""
+
+# First ionization potential and electron affinity (eV) of elements found in MOFs,
+#  from the CRC Handbook of Chemistry and Physics. Negative affinities are set to zero,
+#  and hydrogen uses an affinity of -2 eV as in EQeq
+_ionization_data: dict[str, tuple[float, float]] = {
+    'H': (13.598, -2.0), 'Li': (5.392, 0.618), 'B': (8.298, 0.280), 'C': (11.260, 1.262), 'N': (14.534, 0.0),
+    'O': (13.618, 1.461), 'F': (17.423, 3.401), 'Na': (5.139, 0.548), 'Mg': (7.646, 0.0), 'Al': (5.986, 0.433),
+    'Si': (8.152, 1.390), 'P': (10.487, 0.746), 'S': (10.360, 2.077), 'Cl': (12.968, 3.613), 'K': (4.341, 0.501),
+    'Ca': (6.113, 0.025), 'Sc': (6.561, 0.188), 'Ti': (6.828, 0.079), 'V': (6.746, 0.525), 'Cr': (6.767, 0.676),
+    'Mn': (7.434, 0.0), 'Fe': (7.902, 0.151), 'Co': (7.881, 0.662), 'Ni': (7.640, 1.156), 'Cu': (7.726, 1.235),
+    'Zn': (9.394, 0.0), 'Ga': (5.999, 0.430), 'Br': (11.814, 3.364), 'Sr': (5.695, 0.048), 'Y': (6.217, 0.307),
+    'Zr': (6.634, 0.426), 'Mo': (7.092, 0.746), 'Ag': (7.576, 1.302), 'Cd': (8.994, 0.0), 'In': (5.786, 0.300),
+    'I': (10.451, 3.059), 'Ba': (5.212, 0.145), 'Hf': (6.825, 0.0), 'Pb': (7.417, 0.364),
+}
+
+
+class ChargeEngine:
+    """Interface for methods which assign partial charges to the atoms of a MOF"""
+
+    requires_dft: bool = True
+    """Whether the method requires a completed DFT computation"""
+
+    def assign(self, atoms: ase.Atoms | None = None, cp2k_dir: Path | str | None = None) -> ase.Atoms:
+        """Assign partial charges
+
+        Args:
+            atoms: Structure of the MOF
+            cp2k_dir: Path to a completed CP2K computation
+        Returns:
+            Structure with the charges of each atom in ``atoms.info["_atom_site_charge"]``
+        """
+        raise NotImplementedError()
+
+
+@dataclass
+class ChargemolCharges(ChargeEngine):
+    """DDEC6 charges computed by chargemol from the electron density of a CP2K computation
+
+    Chargemol must have already been run in the CP2K directory (see :func:`~mofa.simulation.dft.compute_partial_charges`)
+    """
+
+    chargemol_fname: str = chargemol_fname
+    """Name of the chargemol output file"""
+
+    def assign(self, atoms: ase.Atoms | None = None, cp2k_dir: Path | str | None = None) -> ase.Atoms:
+        if cp2k_dir is None:
+            raise ValueError('Chargemol charges require the path to a CP2K computation')
+        return get_cif_from_chargemol(Path(cp2k_dir), self.chargemol_fname)
+
+
+@dataclass
+class QEqCharges(ChargeEngine):
+    """Charge equilibration in a periodic structure, which requires only the geometry
+
+    Charges minimize an energy built from the electronegativity and hardness of each element,
+    which follow from its ionization potential and electron affinity as in EQeq
+    (`Wilmer et al. <https://doi.org/10.1021/jz3008485>`_),
+    and the Coulomb interactions between all atoms computed with an Ewald sum.
+    Interactions between nearby atoms are shielded using the Ohno-Klopman form,
+    which approaches the average hardness of the two atoms at short distances.
+    """
+
+    requires_dft = False
+
+    total_charge: float = 0.
+    """Net charge of the unit cell"""
+    coulomb_scale: float = 1.
+    """Factor multiplying the interactions between atoms. Values below 1 mimic dielectric screening"""
+    cutoff: float = 10.
+    """Distance over which the real-space part of the Ewald sum is computed (Å)"""
+    parameters: dict[str, tuple[float, float]] = field(default_factory=dict)
+    """Ionization potential and electron affinity (eV) used in place of the default for certain elements"""
+
+    def assign(self, atoms: ase.Atoms | None = None, cp2k_dir: Path | str | None = None) -> ase.Atoms:
+        if atoms is None:
+            if cp2k_dir is None:
+                raise ValueError('QEq charges require the structure or a completed computation')
+            atoms = ase.io.read(Path(cp2k_dir) / 'atoms.json')
+        atoms = atoms.copy()
+        atoms.calc = None
+        atoms.info["_atom_site_charge"] = self.compute(atoms).tolist()
+        return atoms
+
+    def compute(self, atoms: ase.Atoms) -> np.ndarray:
+        """Compute the charges of each atom
+
+        Args:
+            atoms: Periodic structure
+        Returns:
+            Charge of each atom
+        """
+        # Get the electronegativity and hardness of each atom
+        data = {**_ionization_data, **self.parameters}
+        missing = set(atoms.get_chemical_symbols()).difference(data)
+        if len(missing) > 0:
+            raise ValueError(f'No QEq parameters for: {", ".join(sorted(missing))}')
+        ip, ea = np.array([data[s] for s in atoms.get_chemical_symbols()]).T
+        electronegativity = (ip + ea) / 2
+        hardness = ip - ea
+
+        # Solve for the charges which minimize the energy subject to the total charge
+        n_atoms = len(atoms)
+        system = np.zeros((n_atoms + 1, n_atoms + 1))
+        system[:n_atoms, :n_atoms] = self.coulomb_scale * coulomb_matrix(atoms, hardness, self.cutoff)
+        system[np.arange(n_atoms), np.arange(n_atoms)] += hardness
+        system[n_atoms, :n_atoms] = system[:n_atoms, n_atoms] = 1
+        target = np.concatenate([-electronegativity, [self.total_charge]])
+        return np.linalg.solve(system, target)[:n_atoms]
+
+
+def coulomb_matrix(atoms: ase.Atoms, hardness: np.ndarray, cutoff: float = 10., accuracy: float = 3.2) -> np.ndarray:
+    """Compute the interaction energy between each pair of unit charges in a periodic structure
+
+    The diagonal holds the interaction of each charge with its own periodic images,
+    and all terms include a neutralizing background.
+
+    Args:
+        atoms: Periodic structure
+        hardness: Hardness of each atom, which sets the shielding of close pairs (eV)
+        cutoff: Real-space cutoff distance (Å)
+        accuracy: Product of the cutoff and the Ewald splitting parameter,
+            which sets the accuracy of both the real and reciprocal space sums
+    Returns:
+        Matrix of interaction energies (eV/e^2)
+    """
+    n_atoms = len(atoms)
+    volume = atoms.cell.volume
+    alpha = accuracy / cutoff
+    matrix = np.zeros((n_atoms, n_atoms))
+
+    # Real space part, including the shielding of nearby pairs
+    i, j, d = neighbor_list('ijd', atoms, cutoff)
+    shielding = 2 * _coulomb / (hardness[i] + hardness[j])
+    values = erfc(alpha * d) / d + (1 / np.sqrt(d ** 2 + shielding ** 2) - 1 / d)
+    np.add.at(matrix, (i, j), values)
+
+    # Reciprocal space part, using only one of each pair of opposite wave vectors
+    recip = 2 * pi * atoms.cell.reciprocal()
+    k_max = 2 * alpha * accuracy
+    n_max = [ceil(k_max / np.linalg.norm(b)) for b in recip]
+    grid = np.stack(np.meshgrid(*[np.arange(-n, n + 1) for n in n_max], indexing='ij'), axis=-1).reshape(-1, 3)
+    first_nonzero = np.take_along_axis(grid, np.argmax(grid != 0, axis=1)[:, None], axis=1)[:, 0]
+    grid = grid[first_nonzero > 0]
+    k_vecs = grid @ recip
+    k2 = (k_vecs ** 2).sum(axis=1)
+    k_vecs, k2 = k_vecs[k2 <= k_max ** 2], k2[k2 <= k_max ** 2]
+    weights = 2 * 4 * pi / volume * np.exp(-k2 / (4 * alpha ** 2)) / k2
+    phase = atoms.positions @ k_vecs.T
+    cos, sin = np.cos(phase), np.sin(phase)
+    matrix += (cos * weights) @ cos.T + (sin * weights) @ sin.T
+
+    # Self-interaction and background corrections
+    matrix[np.arange(n_atoms), np.arange(n_atoms)] -= 2 * alpha / sqrt(pi)
+    matrix -= pi / (volume * alpha ** 2)
+    return matrix * _coulomb
+
+
+charge_engines: dict[str, type[ChargeEngine]] = {
+    'chargemol': ChargemolCharges,
+    'qeq': QEqCharges,
+}
+"""Charge engines which can be selected by name"""
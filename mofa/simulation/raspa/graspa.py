@@ -1,15 +1,22 @@
 """Interface to the CUDA Version of RASPA, `gRASPA <https://github.com/snurr-group/gRASPA>`_"""
 from dataclasses import dataclass
 from pathlib import Path
-import subprocess
-import shutil
 
 import ase
 
 from .base import BaseRaspaRunner
-from .utils import calculate_cell_size
+from .utils import RASPAInputBuilder
 
 _file_dir = Path(__file__).parent / "files" / "graspa_template"
+_input_builder = RASPAInputBuilder(_file_dir, {
+    "NCYCLE": "cycles",
+    "ADSORBATE": "adsorbate",
+    "TEMPERATURE": "temperature",
+    "PRESSURE": "pressure",
+    "UC_X UC_Y UC_Z": "unit_cells",
+    "CUTOFF": "cutoff",
+    "CIF": "framework",
+})
 
 
 @dataclass
@@ -24,37 +31,22 @@ class gRASPARunner(BaseRaspaRunner):
     def _write_inputs(self,
                       out_dir: Path,
                       atoms: ase.Atoms,
+                      unit_cells: tuple[int, int, int],
                       cycles: int,
                       adsorbate: str,
                       temperature: float,
                       pressure: float):
-        # Copy other input files (simulation.input, force fields and definition files) from template folder.
-        subprocess.run(f"cp {_file_dir}/* {out_dir}/", shell=True)
-        [uc_x, uc_y, uc_z] = calculate_cell_size(atoms=atoms)
-
-        # Modify input from template simulation.input
-        with (
-            open(f"{out_dir}/simulation.input", "r") as f_in,
-            open(f"{out_dir}/simulation.input.tmp", "w") as f_out,
-        ):
-            for line in f_in:
-                if "NCYCLE" in line:
-                    line = line.replace("NCYCLE", str(cycles))
-                if "ADSORBATE" in line:
-                    line = line.replace("ADSORBATE", adsorbate)
-                if "TEMPERATURE" in line:
-                    line = line.replace("TEMPERATURE", str(temperature))
-                if "PRESSURE" in line:
-                    line = line.replace("PRESSURE", str(pressure))
-                if "UC_X UC_Y UC_Z" in line:
-                    line = line.replace("UC_X UC_Y UC_Z", f"{uc_x} {uc_y} {uc_z}")
-                if "CUTOFF" in line:
-                    line = line.replace("CUTOFF", str(self.cutoff))
-                if "CIF" in line:
-                    line = line.replace("CIF", "input")
-                f_out.write(line)
-
-        shutil.move(f"{out_dir}/simulation.input.tmp", f"{out_dir}/simulation.input")
+        # Link the force fields and definition files, and write the input file
+        _input_builder.stage(
+            out_dir,
+            cycles=cycles,
+            adsorbate=adsorbate,
+            temperature=temperature,
+            pressure=pressure,
+            unit_cells=" ".join(str(x) for x in unit_cells),
+            cutoff=self.cutoff,
+            framework="input",
+        )
 
     def _read_outputs(self, out_dir: Path, atoms: ase.Atoms, adsorbate: str) -> tuple[float, float, float, float]:
         # Get output from raspa.log file
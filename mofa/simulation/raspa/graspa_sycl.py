@@ -3,16 +3,23 @@
 Source: https://github.com/abagusetty/gRASPA/tree/sync-launches
 """
 from dataclasses import dataclass
-import subprocess
 from pathlib import Path
-import shutil
 
 import ase
 
 from mofa.simulation.raspa.base import BaseRaspaRunner
-from mofa.simulation.raspa.utils import calculate_cell_size
+from mofa.simulation.raspa.utils import RASPAInputBuilder
 
 _file_dir = Path(__file__).parent / "files" / "graspa_sycl_template"
+_input_builder = RASPAInputBuilder(_file_dir, {
+    "NCYCLE": "cycles",
+    "ADSORBATE": "adsorbate",
+    "TEMPERATURE": "temperature",
+    "PRESSURE": "pressure",
+    "UC_X UC_Y UC_Z": "unit_cells",
+    "CUTOFF": "cutoff",
+    "CIFFILE": "framework",
+})
 
 
 @dataclass
@@ -22,38 +29,22 @@ class GRASPASyclRunner(BaseRaspaRunner):
     def _write_inputs(self,
                       out_dir: Path,
                       atoms: ase.Atoms,
+                      unit_cells: tuple[int, int, int],
                       cycles: int,
                       adsorbate: str,
                       temperature: float,
                       pressure: float):
-        # Copy other input files (simulation.input, force fields and definition files) from template folder.
-        subprocess.run(f"cp {_file_dir}/* {out_dir}/", shell=True)
-
-        [uc_x, uc_y, uc_z] = calculate_cell_size(atoms=atoms)
-
-        # Modify input from template simulation.input
-        with (
-            open(f"{out_dir}/simulation.input", "r") as f_in,
-            open(f"{out_dir}/simulation.input.tmp", "w") as f_out,
-        ):
-            for line in f_in:
-                if "NCYCLE" in line:
-                    line = line.replace("NCYCLE", str(cycles))
-                if "ADSORBATE" in line:
-                    line = line.replace("ADSORBATE", adsorbate)
-                if "TEMPERATURE" in line:
-                    line = line.replace("TEMPERATURE", str(temperature))
-                if "PRESSURE" in line:
-                    line = line.replace("PRESSURE", str(pressure))
-                if "UC_X UC_Y UC_Z" in line:
-                    line = line.replace("UC_X UC_Y UC_Z", f"{uc_x} {uc_y} {uc_z}")
-                if "CUTOFF" in line:
-                    line = line.replace("CUTOFF", str(self.cutoff))
-                if "CIFFILE" in line:
-                    line = line.replace("CIFFILE", "input")
-                f_out.write(line)
-
-        shutil.move(f"{out_dir}/simulation.input.tmp", f"{out_dir}/simulation.input")
+        # Link the force fields and definition files, and write the input file
+        _input_builder.stage(
+            out_dir,
+            cycles=cycles,
+            adsorbate=adsorbate,
+            temperature=temperature,
+            pressure=pressure,
+            unit_cells=" ".join(str(x) for x in unit_cells),
+            cutoff=self.cutoff,
+            framework="input",
+        )
 
     def _read_outputs(self, out_dir: Path, atoms: ase.Atoms, adsorbate: str) -> tuple[float, float, float, float]:
         # Get output from Output/ folder
@@ -91,8 +82,4 @@ class GRASPASyclRunner(BaseRaspaRunner):
         uptake_g_L = uptake_total_molecule / (6.022 * 1e23) * molar_mass / framework_vol_in_L
         error_g_L = error_total_molecule / (6.022 * 1e23) * molar_mass / framework_vol_in_L
 
-        # Remove gRASPA simulation directory
-        if self.delete_finished:
-            shutil.rmtree(out_dir)
-
         return uptake_mol_kg, error_mol_kg, uptake_g_L, error_g_L
@@ -1,9 +1,19 @@
 """Functions used across multiple RASPA versions"""
+from functools import cached_property
+from hashlib import sha256
+from string import Template
 from pathlib import Path
+from uuid import uuid4
+import shutil
+import re
 
 import numpy as np
 import ase
 
+from mofa.simulation.cache import structure_hash
+from mofa.simulation.chargemol import chargemol_fname, load_chargemol
+from mofa.simulation.scratch import ScratchManager
+
 
 def calculate_cell_size(atoms: ase.Atoms, cutoff: float = 12.8) -> tuple[int, int, int]:
     """Method to calculate Unitcells (for periodic boundary condition) for GCMC
@@ -32,6 +42,57 @@ def calculate_cell_size(atoms: ase.Atoms, cutoff: float = 12.8) -> tuple[int, in
     return uc_x, uc_y, uc_z
 
 
+class RASPAInputBuilder:
+    """Write the input files for RASPA from a directory of templates
+
+    The template directory holds the main input file, which contains placeholders for the settings
+    of each simulation, and static files (e.g., force fields, molecule definitions) used by every simulation.
+    The templates are read once, when first used, and then reused for every simulation.
+
+    Args:
+        template_dir: Directory holding the template files
+        placeholders: Map of the placeholder text within the input file to the name of the setting which replaces it
+        input_file: Name of the main input file
+    """
+
+    def __init__(self, template_dir: Path, placeholders: dict[str, str], input_file: str = 'simulation.input'):
+        self.template_dir = Path(template_dir)
+        self.placeholders = placeholders.copy()
+        self.input_file = input_file
+
+    @cached_property
+    def template(self) -> Template:
+        """Main input file with each placeholder replaced by a template variable"""
+        text = (self.template_dir / self.input_file).read_text().replace('$', '$$')
+        pattern = re.compile('|'.join(rf'\b{re.escape(p)}\b' for p in sorted(self.placeholders, key=len, reverse=True)))
+        return Template(pattern.sub(lambda m: f'${{{self.placeholders[m.group()]}}}', text))
+
+    def render(self, **settings) -> str:
+        """Produce the main input file
+
+        Args:
+            settings: Value of each setting
+        Returns:
+            Contents of the input file
+        """
+        return self.template.substitute({k: str(v) for k, v in settings.items()})
+
+    def stage(self, out_dir: Path, **settings):
+        """Write the input files for a simulation
+
+        Links the static files from the template directory and writes the main input file.
+
+        Args:
+            out_dir: Directory in which to run RASPA
+            settings: Value of each setting
+        """
+        out_dir = Path(out_dir)
+        ScratchManager.link_files(self.template_dir, out_dir, exclude=[self.input_file])
+        input_path = out_dir / self.input_file
+        input_path.unlink(missing_ok=True)  # Never write through a link to the template
+        input_path.write_text(self.render(**settings))
+
+
 def write_cif(atoms: ase.Atoms, out_dir: Path, name: str):
     """Save a CIF file with partial charges for RASPA2 from an ASE Atoms object.
 
@@ -41,60 +102,85 @@ def write_cif(atoms: ase.Atoms, out_dir: Path, name: str):
         name (str): Name of the output file.
     """
 
+    a, b, c, alpha, beta, gamma = atoms.cell.cellpar()
+    header = (
+        f"MOFA-{name}\n"
+        f"_cell_length_a      {a}\n"
+        f"_cell_length_b      {b}\n"
+        f"_cell_length_c      {c}\n"
+        f"_cell_angle_alpha   {alpha}\n"
+        f"_cell_angle_beta    {beta}\n"
+        f"_cell_angle_gamma   {gamma}\n"
+        "\n"
+        "_symmetry_space_group_name_H-M    'P 1'\n"
+        "_symmetry_int_tables_number        1\n"
+        "\n"
+        "loop_\n"
+        "  _symmetry_equiv_pos_as_xyz\n"
+        "  'x, y, z'\n"
+        "loop_\n"
+        "  _atom_site_label\n"
+        "  _atom_site_occupancy\n"
+        "  _atom_site_fract_x\n"
+        "  _atom_site_fract_y\n"
+        "  _atom_site_fract_z\n"
+        "  _atom_site_thermal_displace_type\n"
+        "  _atom_site_B_iso_or_equiv\n"
+        "  _atom_site_type_symbol\n"
+        "  _atom_site_charge\n"
+    )
+
+    # Number the atoms of each element in order of appearance
+    symbols = atoms.get_chemical_symbols()
+    _, inverse = np.unique(atoms.numbers, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    grouped = inverse[order]
+    labels = np.empty(len(atoms), dtype=int)
+    labels[order] = np.arange(len(atoms)) - np.searchsorted(grouped, grouped) + 1
+
+    # Format every atom with a single operation. No partial occupancy
+    coords = atoms.get_scaled_positions()
+    charges = np.asarray(atoms.info["_atom_site_charge"], dtype=float)
+    columns = [symbols, labels.tolist(), *coords.T.tolist(), symbols, charges.tolist()]
+    values = tuple(v for row in zip(*columns) for v in row)
+    body = ("%s%d 1.0 %.6f %.6f %.6f Biso 1.0 %s %.6f\n" * len(atoms)) % values
+
     with open(out_dir / name, "w") as fp:
-        fp.write(f"MOFA-{name}\n")
-
-        a, b, c, alpha, beta, gamma = atoms.cell.cellpar()
-        fp.write(f"_cell_length_a      {a}\n")
-        fp.write(f"_cell_length_b      {b}\n")
-        fp.write(f"_cell_length_c      {c}\n")
-        fp.write(f"_cell_angle_alpha   {alpha}\n")
-        fp.write(f"_cell_angle_beta    {beta}\n")
-        fp.write(f"_cell_angle_gamma   {gamma}\n")
-        fp.write("\n")
-        fp.write("_symmetry_space_group_name_H-M    'P 1'\n")
-        fp.write("_symmetry_int_tables_number        1\n")
-        fp.write("\n")
-
-        fp.write("loop_\n")
-        fp.write("  _symmetry_equiv_pos_as_xyz\n")
-        fp.write("  'x, y, z'\n")
-        fp.write("loop_\n")
-        fp.write("  _atom_site_label\n")
-        fp.write("  _atom_site_occupancy\n")
-        fp.write("  _atom_site_fract_x\n")
-        fp.write("  _atom_site_fract_y\n")
-        fp.write("  _atom_site_fract_z\n")
-        fp.write("  _atom_site_thermal_displace_type\n")
-        fp.write("  _atom_site_B_iso_or_equiv\n")
-        fp.write("  _atom_site_type_symbol\n")
-        fp.write("  _atom_site_charge\n")
-
-        coords = atoms.get_scaled_positions().tolist()
-        symbols = atoms.get_chemical_symbols()
-        occupancies = [
-            1 for i in range(len(symbols))
-        ]  # No partial occupancy
-        charges = atoms.info["_atom_site_charge"]
-
-        no = {}
-
-        for symbol, pos, occ, charge in zip(
-                symbols, coords, occupancies, charges
-        ):
-            if symbol in no:
-                no[symbol] += 1
-            else:
-                no[symbol] = 1
-
-            fp.write(
-                f"{symbol}{no[symbol]} {occ:.1f} {pos[0]:.6f} {pos[1]:.6f} {pos[2]:.6f} Biso 1.0 {symbol} {charge:.6f}\n"
-            )
+        fp.write(header)
+        fp.write(body)
+
+
+def write_cif_once(atoms: ase.Atoms, cif_dir: Path, name: str = "input.cif") -> Path:
+    """Write the CIF of a charged structure into a directory shared between runs, unless already present
+
+    Each structure receives a subdirectory named by a hash of the structure and charges,
+    which is created atomically so that workers may share the same directory.
+
+    Args:
+        atoms: Structure containing partial charges in ``atoms.info["_atom_site_charge"]``
+        cif_dir: Directory holding the CIF files
+        name: Name of the CIF file
+    Returns:
+        Path to the CIF file
+    """
+    hasher = sha256(structure_hash(atoms).encode())
+    hasher.update((np.round(np.asarray(atoms.info["_atom_site_charge"], dtype=float), 6) + 0.).tobytes())
+    digest = hasher.hexdigest()[:24]
+    path = Path(cif_dir) / digest / name
+    if not path.is_file():
+        tmp_dir = Path(cif_dir) / f".{digest}.{uuid4().hex[:8]}.tmp"
+        tmp_dir.mkdir(parents=True)
+        write_cif(atoms, tmp_dir, name)
+        try:
+            tmp_dir.rename(path.parent)
+        except OSError:  # Another worker wrote the same structure first
+            shutil.rmtree(tmp_dir)
+    return path
 
 
 def get_cif_from_chargemol(
     cp2k_path: Path,
-    chargemol_fname: str = "DDEC6_even_tempered_net_atomic_charges.xyz"
+    chargemol_fname: str = chargemol_fname
 ) -> ase.Atoms:
     """Return an ASE atom object from a Chargemol output file.
 
@@ -105,42 +191,6 @@ def get_cif_from_chargemol(
     Returns:
         ase.Atoms: ASE Atoms object containing partial charges in atoms.info["_atom_site_charge"].
     """
-    with open(cp2k_path / chargemol_fname, "r") as f:
-        symbols = []
-        x = []
-        y = []
-        z = []
-        charges = []
-        positions = []
-        lines = f.readlines()
-
-        for i, line in enumerate(lines):
-            if i == 0:
-                natoms = int(line)
-            elif i == 1:
-                data = line.split()
-                a1 = float(data[10])
-                a2 = float(data[11])
-                a3 = float(data[12])
-                b1 = float(data[15])
-                b2 = float(data[16])
-                b3 = float(data[17])
-                c1 = float(data[20])
-                c2 = float(data[21])
-                c3 = float(data[22])
-
-            elif i <= natoms + 1:
-                data = line.split()
-                symbols.append(data[0])
-                x = float(data[1])
-                y = float(data[2])
-                z = float(data[3])
-                charges.append(float(data[4]))
-                positions.append([x, y, z])
-    cell = [[a1, a2, a3], [b1, b2, b3], [c1, c2, c3]]
-    atoms = ase.Atoms(
-        symbols=symbols, positions=positions, cell=cell, pbc=True
-    )
-    atoms.info["_atom_site_charge"] = charges
-
+    atoms = load_chargemol(cp2k_path, chargemol_fname)
+    atoms.info["_atom_site_charge"] = atoms.arrays.pop("q").tolist()
     return atoms
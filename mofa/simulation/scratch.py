@@ -0,0 +1,244 @@
+"""Management of the scratch directories in which simulations run"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from time import monotonic
+from typing import Iterable
+from uuid import uuid4
+import logging
+import shutil
+import gzip
+import os
+
+logger = logging.getLogger(__name__)
+
+_compress_executor: ThreadPoolExecutor | None = None
+"""Thread which compresses files in the background"""
+
+
+def directory_size(path: Path) -> int:
+    """Total size of the files within a directory, not counting symbolic links
+
+    Args:
+        path: Directory to measure
+    Returns:
+        Size in bytes
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                stat = os.lstat(os.path.join(dirpath, filename))
+            except FileNotFoundError:
+                continue  # Deleted while walking
+            if not os.path.islink(os.path.join(dirpath, filename)):
+                total += stat.st_size
+    return total
+
+
+def capture_files(source_dir: str | Path, dest_dir: str | Path, move: Iterable[str] = (), copy: Iterable[str] = ()) -> list[Path]:
+    """Collect selected outputs of a computation from a run directory shared between computations
+
+    Args:
+        source_dir: Run directory
+        dest_dir: Directory in which to store the outputs
+        move: Patterns matching files to move, such as large files rewritten by every computation
+        copy: Patterns matching files to copy, such as logs which are still open
+    Returns:
+        Paths of the captured files
+    """
+    source_dir, dest_dir = Path(source_dir), Path(dest_dir)
+    if source_dir.absolute() == dest_dir.absolute():
+        return []
+
+    captured = []
+    for patterns, action in [(move, shutil.move), (copy, shutil.copyfile)]:
+        for pattern in patterns:
+            for path in source_dir.glob(pattern):
+                if not path.is_file():
+                    continue
+                dest = dest_dir / path.name
+                action(path, dest)  # Moves are renames if both are on the same filesystem
+                captured.append(dest)
+    return captured
+
+
+def gzip_file(path: str | Path) -> Path:
+    """Compress a file with gzip, replacing the original
+
+    The compressed file only appears once complete.
+
+    Args:
+        path: File to compress
+    Returns:
+        Path to the compressed file
+    """
+    path = Path(path)
+    gz_path = path.with_name(path.name + '.gz')
+    tmp_path = path.with_name(path.name + '.gz.tmp')
+    with path.open('rb') as fi, gzip.open(tmp_path, 'wb', compresslevel=6) as fo:
+        shutil.copyfileobj(fi, fo, length=1024 ** 2)
+    os.replace(tmp_path, gz_path)
+    path.unlink()
+    return gz_path
+
+
+def gzip_in_background(paths: Iterable[str | Path]) -> list[Future]:
+    """Compress files with :func:`gzip_file` on a background thread
+
+    Args:
+        paths: Files to compress
+    Returns:
+        Futures which resolve to the paths of the compressed files
+    """
+    global _compress_executor
+    if _compress_executor is None:
+        _compress_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compress')
+    return [_compress_executor.submit(gzip_file, path) for path in paths]
+
+
+def gunzip_file(path: str | Path, destination: str | Path):
+    """Decompress a file compressed by :func:`gzip_file`
+
+    Args:
+        path: Compressed file
+        destination: Path of the decompressed file
+    """
+    destination = Path(destination)
+    tmp_path = destination.with_name(destination.name + '.tmp')
+    with gzip.open(path, 'rb') as fi, tmp_path.open('wb') as fo:
+        shutil.copyfileobj(fi, fo, length=1024 ** 2)
+    os.replace(tmp_path, destination)
+
+
+class ScratchManager:
+    """Create run directories on fast storage, such as a RAM disk, and clean them up off the critical path
+
+    New directories are placed in :attr:`root` unless the files already there exceed the quota
+    or the filesystem is nearly full, in which case they are placed in :attr:`fallback`.
+    Finished directories are removed by a background thread so that deleting many small files
+    does not delay returning the result of a task.
+
+    Args:
+        root: Preferred location for run directories (e.g., ``/dev/shm/mofa``)
+        fallback: Location used when the preferred location is full. Default is to always use ``root``
+        quota: Largest total size of the files in ``root`` before using the fallback (GB). No limit if ``None``
+        min_free: Smallest free space left on the filesystem of ``root`` before using the fallback (GB)
+        measure_interval: Time between measurements of the size of the files in ``root`` (s)
+    """
+
+    def __init__(self, root: str | Path, fallback: str | Path | None = None, quota: float | None = None, min_free: float = 0.,
+                 measure_interval: float = 60.):
+        self.root = Path(root)
+        self.fallback = None if fallback is None else Path(fallback)
+        self.quota = quota
+        self.min_free = min_free
+        self.measure_interval = measure_interval
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: list[Future] = []
+        self._measured: tuple[float, int] | None = None
+
+    def __getstate__(self):
+        # Threads cannot be transferred between workers, so a copy starts its own.
+        #  Clocks differ between hosts, so a copy also makes its own measurements
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_pending'] = []
+        state['_measured'] = None
+        return state
+
+    def used_space(self) -> int:
+        """Total size of the files in :attr:`root`
+
+        Walking the directory takes longer as more runs are stored, so the size is
+        measured again only once the last measurement is older than :attr:`measure_interval`.
+
+        Returns:
+            Size in bytes
+        """
+        now = monotonic()
+        if self._measured is None or now - self._measured[0] >= self.measure_interval:
+            self._measured = (now, directory_size(self.root))
+        return self._measured[1]
+
+    def has_room(self) -> bool:
+        """Whether a new directory would fit in :attr:`root`"""
+        if self.quota is not None and self.root.is_dir() and self.used_space() >= self.quota * 1e9:
+            return False
+        if self.min_free > 0:
+            self.root.mkdir(parents=True, exist_ok=True)
+            if shutil.disk_usage(self.root).free < self.min_free * 1e9:
+                return False
+        return True
+
+    def make_dir(self, name: str) -> Path:
+        """Create a run directory
+
+        Reuses an existing directory of the same name in either location,
+        as when continuing a previous simulation.
+
+        Args:
+            name: Name of the directory
+        Returns:
+            Absolute path to the directory
+        """
+        for root in [self.root, self.fallback]:
+            if root is not None and (root / name).is_dir():
+                return (root / name).absolute()
+
+        root = self.root
+        if self.fallback is not None and not self.has_room():
+            logger.info(f'Scratch space in {self.root} is full. Creating {name} in {self.fallback}')
+            root = self.fallback
+        path = root / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path.absolute()
+
+    @staticmethod
+    def link_files(source_dir: str | Path, dest_dir: str | Path, copy: Iterable[str] = (), exclude: Iterable[str] = ()):
+        """Populate a run directory with links to the files of a template directory
+
+        Args:
+            source_dir: Directory holding the template files
+            dest_dir: Run directory
+            copy: Names of files to copy rather than link, such as those which will be edited
+            exclude: Names of files to skip
+        """
+        copy = set(copy)
+        exclude = set(exclude)
+        dest_dir = Path(dest_dir)
+        for source in Path(source_dir).iterdir():
+            if not source.is_file() or source.name in exclude:
+                continue
+            dest = dest_dir / source.name
+            dest.unlink(missing_ok=True)
+            if source.name in copy:
+                shutil.copyfile(source, dest)
+            else:
+                dest.symlink_to(source.absolute())
+
+    def release(self, path: str | Path):
+        """Remove a finished run directory in the background
+
+        The directory is renamed immediately, so a new directory of the same name may be created
+        while the old one is being removed.
+
+        Args:
+            path: Directory to remove
+        """
+        path = Path(path)
+        trash = path.with_name(f'.{path.name}.{uuid4().hex[:8]}.deleting')
+        try:
+            path.rename(trash)
+        except FileNotFoundError:
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scratch-cleanup')
+        self._pending = [f for f in self._pending if not f.done()]
+        self._pending.append(self._executor.submit(shutil.rmtree, trash, ignore_errors=True))
+
+    def wait(self):
+        """Block until all directories queued for removal are gone"""
+        for future in self._pending:
+            future.result()
+        self._pending.clear()
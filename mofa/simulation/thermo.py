@@ -0,0 +1,229 @@
+"""Write the reporting commands of LAMMPS MD runs, and read and monitor their thermodynamic output"""
+from dataclasses import dataclass
+from pathlib import Path
+import logging
+
+import numpy as np
+from ase.geometry import cellpar_to_cell, cell_to_cellpar
+
+from mofa.scoring.geometry import principal_strain
+from mofa.utils.trajectory import CellSeries, Trajectory
+
+logger = logging.getLogger(__name__)
+
+md_start_marker = 'MOFA: starting MD'
+"""Line printed by LAMMPS immediately before the MD run"""
+
+stop_file = 'STOP'
+"""Name of the file which, once created in the run directory, halts the MD run"""
+
+
+def md_start_commands(early_stop: bool = False) -> str:
+    """LAMMPS commands to insert before the MD run
+
+    Args:
+        early_stop: Whether to halt the run once a :attr:`stop_file` appears in the run directory.
+            The run is checked every ``Nevery`` timesteps, so it always stops on a reported frame
+    Returns:
+        Commands to add to the input file
+    """
+    commands = f'print               "{md_start_marker}"\n'
+    if early_stop:
+        commands += (f'variable            stop equal is_file({stop_file})\n'
+                     'fix                 halt all halt ${Nevery} v_stop > 0 error continue\n')
+    return commands
+
+
+def dump_commands(columns: str, elements: str, cell_only: bool = False) -> tuple[str, str]:
+    """LAMMPS commands which write coordinates to ``dump.lammpstrj.all`` during an MD run
+
+    Args:
+        columns: Per-atom columns to write
+        elements: Element of each atom type, separated by spaces
+        cell_only: Whether to write only the first and last frames, leaving the cell at other steps
+            to be read from the thermodynamic output
+    Returns:
+        - Commands to insert before the run
+        - Commands to insert after the run
+    """
+    if cell_only:
+        write = f'write_dump          all custom dump.lammpstrj.all {columns} modify element {elements}'
+        return write + '\n', write + ' append yes\n'
+    return (f'dump                trajectAll all custom ${{Nevery}} dump.lammpstrj.all {columns}\n'
+            f'dump_modify         trajectAll element {elements}\n'), 'undump              trajectAll\n'
+
+
+def read_thermo(path: str | Path) -> dict[str, np.ndarray]:
+    """Read the thermodynamic data printed during the MD run of a LAMMPS log
+
+    Only reads the data printed after :data:`md_start_marker`, which excludes any minimization.
+    Incomplete lines, as when reading the log of a running simulation, are skipped.
+
+    Args:
+        path: Path to the log file
+    Returns:
+        Values of each column, keyed by the lower-case column name. Empty if the MD has yet to start
+    """
+
+    with open(path, errors='replace') as fp:
+        lines = fp.read().splitlines()
+    try:
+        start = next(i for i, line in enumerate(lines) if line.strip() == md_start_marker)
+    except StopIteration:
+        return {}
+
+    columns, rows = None, []
+    for line in lines[start + 1:]:
+        if columns is None:
+            if line.startswith('Step '):  # The first header after the marker belongs to the MD run
+                columns = line.lower().split()
+            continue
+        if line.startswith('Loop time'):
+            break
+        values = line.split()
+        if len(values) != len(columns):
+            continue
+        try:
+            rows.append([float(v) for v in values])
+        except ValueError:
+            continue  # Warnings printed during the run
+
+    if columns is None:
+        return {}
+    data = np.array(rows, dtype=float).reshape(-1, len(columns))
+    output = dict(zip(columns, data.T))
+    output['step'] = output['step'].astype(np.int64)
+    return output
+
+
+def thermo_strain(thermo: dict[str, np.ndarray], reference_cell: np.ndarray | None = None) -> np.ndarray:
+    """Compute the strain of the cell at each step of the thermodynamic output
+
+    Args:
+        thermo: Data read using :meth:`read_thermo`
+        reference_cell: Cell against which to measure the strain. Default is the cell of the first step
+    Returns:
+        Maximum principal strain at each step
+    """
+    cells = CellSeries.from_thermo(thermo).cells
+    if len(cells) == 0:
+        return np.zeros((0,))
+
+    # Rotate the reference into the same orientation as the cells from LAMMPS
+    reference_cell = cells[0] if reference_cell is None else cellpar_to_cell(cell_to_cellpar(reference_cell))
+    return principal_strain(reference_cell, cells)
+
+
+def md_finished(trajectory: Trajectory,
+                reference_cell: np.ndarray | None = None,
+                maximum_steps: int | None = None,
+                max_strain: float | None = None) -> bool:
+    """Determine whether a MOF will not be simulated further after an MD run
+
+    Args:
+        trajectory: Latest run, with timesteps counted from the start of the first run
+        reference_cell: Cell at the start of the first run. Default is the first cell of ``trajectory``
+        maximum_steps: Most timesteps run for any MOF
+        max_strain: Largest strain of a MOF which is simulated further
+    Returns:
+        Whether the run was stopped early, reached ``maximum_steps``, or exceeded ``max_strain``
+    """
+    if trajectory.stop_reason is not None:
+        return True
+    if maximum_steps is not None and trajectory.timesteps[-1] >= maximum_steps:
+        return True
+    if max_strain is not None:
+        reference_cell = trajectory.cells[0] if reference_cell is None else reference_cell
+        return float(principal_strain(reference_cell, trajectory.cells[-1])) > max_strain
+    return False
+
+
+@dataclass
+class StrainMonitor:
+    """Decide when to stop an MD simulation based on the strain of the cell
+
+    The simulation stops if the strain exceeds :attr:`max_strain`, as the structure is clearly unstable,
+    or if the strain changes by less than :attr:`plateau_tolerance` over the last :attr:`plateau_window` reports,
+    as the structure has settled.
+    """
+
+    max_strain: float = 0.25
+    """Strain above which the MOF is considered unstable"""
+    plateau_window: int = 5
+    """Number of reported steps over which to measure whether the strain has plateaued"""
+    plateau_tolerance: float = 0.005
+    """Largest change in strain within the window for the strain to be considered plateaued"""
+    min_timesteps: int = 0
+    """Minimum number of timesteps before stopping due to a plateau"""
+
+    def check(self, timesteps: np.ndarray, strains: np.ndarray) -> str | None:
+        """Determine whether to stop the simulation
+
+        Args:
+            timesteps: Timesteps at which the strain was measured
+            strains: Strain at each timestep
+        Returns:
+            Reason for stopping (``unstable`` or ``plateau``), or ``None`` to continue
+        """
+        if len(strains) == 0:
+            return None
+        if strains[-1] > self.max_strain:
+            return 'unstable'
+        if len(strains) >= self.plateau_window and timesteps[-1] >= self.min_timesteps:
+            window = strains[-self.plateau_window:]
+            if window.max() - window.min() < self.plateau_tolerance:
+                return 'plateau'
+        return None
+
+
+class StrainWatch:
+    """Halt a running simulation once its strain meets the stopping criteria of a monitor
+
+    Call periodically while the simulation runs. The log is only read again once it grows.
+
+    Args:
+        monitor: Criteria for stopping
+        run_dir: Run directory of a simulation, which must include :func:`md_start_commands` with early stopping
+        log_name: Name of the log file within the run directory
+        reference_cell: Cell against which to measure strain. Default is the cell at the start of the run
+        start_timestep: Number of timesteps run before this simulation, used to compare against the minimum
+    """
+
+    def __init__(self, monitor: StrainMonitor, run_dir: str | Path, log_name: str = 'stdout.lmp',
+                 reference_cell: np.ndarray | None = None, start_timestep: int = 0):
+        self.monitor = monitor
+        self.log_path = Path(run_dir) / log_name
+        self.stop_path = Path(run_dir) / stop_file
+        self.reference_cell = reference_cell
+        self.start_timestep = start_timestep
+        self.reason: str | None = None
+        self._log_size = -1
+        self.stop_path.unlink(missing_ok=True)
+
+    def __call__(self) -> bool:
+        """Check the latest output and signal LAMMPS to stop if needed
+
+        Returns:
+            Whether the simulation has been told to stop
+        """
+        if self.reason is not None:
+            return True
+        try:
+            size = self.log_path.stat().st_size
+        except FileNotFoundError:
+            return False
+        if size == self._log_size:
+            return False
+        self._log_size = size
+
+        thermo = read_thermo(self.log_path)
+        if len(thermo.get('step', ())) == 0:
+            return False
+        strains = thermo_strain(thermo, self.reference_cell)
+        self.reason = self.monitor.check(thermo['step'] + self.start_timestep, strains)
+        if self.reason is not None:
+            logger.info(f'Stopping MD in {self.log_path.parent} at step {thermo["step"][-1]}. Reason: {self.reason},'
+                        f' strain: {strains[-1] * 100:.1f}%')
+            self.stop_path.touch()
+            return True
+        return False
@@ -12,6 +12,7 @@ from random import shuffle
 from threading import Event, Lock
 from typing import TextIO
 
+import ase
 from colmena.models import Result
 from colmena.queue import ColmenaQueues
 from colmena.exceptions import TimeoutException
@@ -22,10 +23,12 @@ from mofa import db as mofadb
 from mofa.finetune.difflinker import DiffLinkerCurriculum
 from mofa.hpc.config import HPCConfig
 
-from mofa.model import LigandTemplate, MOFRecord, LigandDescription, NodeDescription
-from mofa.scoring.geometry import LatticeParameterChange
+from mofa.model import LigandTemplate, LigandDescription, MOFRecord, NodeDescription
+from mofa.scoring.geometry import LatticeParameterChange, PoreGeometry
+from mofa.scoring.surrogate import StabilityClassifier
 from mofa.selection.dft import DFTSelector
-from mofa.selection.md import MDSelector
+from mofa.selection.md import MDSelector, StabilityQueue
+from mofa.simulation.dft.base import choose_starting_structure
 from mofa.utils.conversions import write_to_string
 
 
@@ -67,12 +70,18 @@ class SimulationConfig:
     """Number of timesteps to perform with MD at different levels"""
     md_report: int = 1000
     """How frequently to report MD frames"""
+    stability_model: bool = False
+    """Whether to run new MOFs in the order of their predicted probability of being stable"""
+    stability_retrain: int = 32
+    """Number of MD results between retraining the stability model"""
+    relax_batch_size: int = 1
+    """Largest number of new MOFs to relax together in one task"""
 
 
 class MOFAThinker(BaseThinker, AbstractContextManager):
     """Thinker which schedules MOF generation and testing"""
 
-    stability_queue: deque[MOFRecord]
+    stability_queue: StabilityQueue
     """Priority queue of MOFs to be evaluated for stability"""
     ligand_assembly_queue: dict[str, deque[LigandDescription]]
     """Queue of the latest ligands to be generated for each type"""
@@ -119,7 +128,10 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
         self.dft_selector = dft_selector
 
         # Set up the queues
-        self.stability_queue = deque(maxlen=8 * self.hpc_config.num_lammps_workers)  # Starts empty
+        self.stability_queue = StabilityQueue(maxlen=8 * self.hpc_config.num_lammps_workers)  # Starts empty
+        self.stability_model: StabilityClassifier | None = None  # Ranks the queue once trained
+        if simulation_config.stability_model:
+            self.stability_model = StabilityClassifier(md_level=simulation_config.md_level, max_strain=md_selector.max_strain)
 
         self.generate_queue = deque()  # Starts with one of each task (ligand, size)
         tasks = list(product(range(len(generator_config.templates)), generator_config.atom_counts))
@@ -147,6 +159,7 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
 
         # Settings related for training
         self.start_train = Event()
+        self.start_stability_train = Event()
         self.initial_weights = self.generator_config.generator_path  # Store the starting weights, which we'll always use as a starting point for training
         self.num_lammps_completed = 0  # Number of MOFs which have finished stability
         self.num_raspa_completed = 0  # Number for which we have gas storage
@@ -344,7 +357,21 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
             self.logger.warning(f'{self.md_selector.count_available()} are available for MD')
             raise
 
-        if 'relaxed' not in to_run.times:
+        to_mark = [to_run]
+        if 'relaxed' not in to_run.times and self.sim_config.relax_batch_size > 1:
+            # Relax other new MOFs in the same task
+            while len(to_mark) < self.sim_config.relax_batch_size and len(self.stability_queue) > 0:
+                to_mark.append(self.stability_queue.pop())
+            self.queues.send_inputs(
+                to_mark,
+                method='run_optimization_ff_many',
+                topic='lammps',
+                task_info={'names': [r.name for r in to_mark],
+                           'level': self.sim_config.md_level}
+            )
+            mofadb.create_records(self.collection, to_mark)
+            self.logger.info(f'Started initial relaxation for {len(to_mark)} MOFs: {", ".join(r.name for r in to_mark)}')
+        elif 'relaxed' not in to_run.times:
             self.queues.send_inputs(
                 to_run,
                 method='run_optimization_ff',
@@ -366,8 +393,9 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
             self.logger.info(f'Started MD simulation for mof={to_run.name}. '
                              f'Simulation queue depth: {len(self.stability_queue)}.')
 
-        # Mark that it's in progress
-        mofadb.mark_in_progress(self.collection, to_run, 'stability')
+        # Mark that they are in progress
+        for record in to_mark:
+            mofadb.mark_in_progress(self.collection, record, 'stability')
 
     @result_processor(topic='lammps')
     def store_lammps(self, result: Result):
@@ -381,13 +409,13 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
             self.logger.warning(f'MD task failed: {result.failure_info.exception}')
         else:
             self.post_md_queue.put(result)
-            self.simulations_left -= 1
+            self.simulations_left -= len(result.task_info.get('names', [None]))  # Each MOF of a batch counts
             self.logger.info(f'Successful computation. Budget remaining: {self.simulations_left}')
 
         print(result.json(exclude={'inputs', 'value'}), file=self._output_files['simulation-results'], flush=True)
 
         # Check if termination conditions are met
-        if self.simulations_left == 0:
+        if self.simulations_left <= 0 and not self.done.is_set():
             self.done.set()
             self.logger.info('Finished running LAMMPS simulations. Will start finishing all remaining work')
 
@@ -402,9 +430,19 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
             except Empty:
                 continue
 
+            # Store relaxations of several MOFs one MOF at a time
+            level = result.task_info['level']
+            if result.method == 'run_optimization_ff_many':
+                for name, (relaxed, _) in zip(result.task_info['names'], result.value):
+                    record = mofadb.get_records(self.collection, [name])[0]
+                    self._store_relaxation(record, level, relaxed)
+                    mofadb.mark_completed(self.collection, record, 'stability')
+                self.cp2k_ready.set()
+                self.mofs_available.set()
+                continue
+
             # Pull the record
             name = result.task_info['name']
-            level = result.task_info['level']
             record = mofadb.get_records(self.collection, [name])[0]
 
             # Route based on whether it was relaxation or MD
@@ -412,15 +450,17 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
                 traj = result.value
                 self.logger.info(f'Received a trajectory of {len(traj)} frames for mof={name} at level={level}.'
                                  f' Backlog: {self.post_md_queue.qsize()}')
+                if traj.stop_reason is not None:
+                    self.logger.info(f'MD for mof={name} stopped early after {traj.timesteps[-1]} timesteps. Reason: {traj.stop_reason}')
 
                 # Compute the lattice strain
                 scorer = LatticeParameterChange(md_level=level)
-                traj = [(i, write_to_string(t, 'vasp')) for i, t in traj]
                 if level not in record.md_trajectory:
-                    record.md_trajectory[level] = []
-                record.md_trajectory[level].extend(traj)
+                    record.md_trajectory[level] = traj
+                else:
+                    record.md_trajectory[level].extend(traj)
 
-                latest_length, _ = record.md_trajectory[level][-1]
+                latest_length = int(record.md_trajectory[level].timesteps[-1])
                 strain = scorer.score_mof(record)
                 record.structure_stability[level] = strain
                 record.times['md-done'] = datetime.now()
@@ -431,22 +471,15 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
 
                 # Determine if we should retrain
                 self.num_lammps_completed += 1
+                if self.stability_model is not None and self.num_lammps_completed % self.sim_config.stability_retrain == 0:
+                    self.start_stability_train.set()
                 if self.num_lammps_completed >= self.trainer_config.curriculum.min_strain_counts \
                         and self.num_raspa_completed < self.trainer_config.curriculum.min_gas_counts:
                     self.start_train.set()  # Either starts or indicates that we have new data
 
             elif result.method == 'run_optimization_ff':
-                self.logger.info(f'Completed a relaxation for for mof={name} level={level}')
                 relaxed, _ = result.value
-
-                # Update the structure in the database and mark as relaxed
-                relaxed_vasp = write_to_string(relaxed, 'vasp')
-                self.collection.update_one({'name': name}, {
-                    '$set': {
-                        'structure': relaxed_vasp,
-                        'times.relaxed': datetime.now()
-                    }
-                })
+                self._store_relaxation(record, level, relaxed)
             else:
                 raise ValueError(f'Unrecognized method: {result.method}')
 
@@ -455,6 +488,54 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
             self.cp2k_ready.set()
             self.mofs_available.set()
 
+    def _store_relaxation(self, record: MOFRecord, level: str, relaxed: ase.Atoms):
+        """Store the relaxed structure of a MOF and describe its pores
+
+        Args:
+            record: Record of the MOF before relaxation
+            level: Level of the forcefield used for relaxation
+            relaxed: Relaxed structure
+        """
+        name = record.name
+        self.logger.info(f'Completed a relaxation for for mof={name} level={level}')
+
+        # Describe the pores, which determine whether gas can enter the MOF.
+        #  Use the description made by the worker, or a coarse grid if it was not made
+        pore_geometry = relaxed.info.pop('pore_geometry', None)
+        if pore_geometry is None:
+            try:
+                pore_geometry = PoreGeometry(grid_spacing=0.5).describe(relaxed)
+            except ValueError as exc:
+                self.logger.warning(f'Failed to compute pore geometry for mof={name}: {exc}')
+                pore_geometry = {}
+
+        # Update the structure in the database and mark as relaxed, keeping the assembled structure
+        relaxed_vasp = write_to_string(relaxed, 'vasp')
+        self.collection.update_one({'name': name}, {
+            '$set': {
+                'structure': relaxed_vasp,
+                'assembled_structure': record.assembled_structure or record.structure,
+                'pore_geometry': pore_geometry,
+                'times.relaxed': datetime.now()
+            }
+        })
+
+    @event_responder(event_name='start_stability_train')
+    def retrain_stability_model(self):
+        """Train the stability model on the latest MD results then use it to rank the stability queue"""
+        level = self.stability_model.md_level
+        query = {f'structure_stability.{level}': {'$exists': True}, 'assembled_structure': {'$ne': None}}
+        rows = self.collection.find(query, projection={'md_trajectory': 0}) \
+            .sort('times.md-done', -1).limit(self.stability_model.max_train)
+        records = [mofadb.row_to_record(row) for row in rows][::-1]
+        try:
+            self.stability_model.fit(records)
+        except ValueError as exc:
+            self.logger.info(f'Not yet able to train the stability model: {exc}')
+            return
+        self.stability_queue.set_scorer(self.stability_model.score_mof)
+        self.logger.info(f'Trained the stability model on {len(records)} MOFs and re-ranked {len(self.stability_queue)} queued MOFs')
+
     @event_responder(event_name='start_train')
     def retrain(self):
         """Retrain difflinker. Starts when we first exceed the training set size"""
@@ -526,6 +607,24 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
 
         # Query the database to find the best MOF we have not run CP2K on yet
         while True:  # Runs until something gets submitted
+            # Screen MOFs with GCMC before DFT, if enabled
+            if self.dft_selector.screen_key is not None:
+                try:
+                    record = self.dft_selector.select_screening()
+                except ValueError:
+                    pass
+                else:
+                    mofadb.mark_in_progress(self.collection, record, 'screening')
+                    self.queues.send_inputs(
+                        record.name, None,
+                        input_kwargs={'atoms': choose_starting_structure(record)},
+                        method='run_gcmc_screening',
+                        topic='cp2k',
+                        task_info={'mof': record.name}
+                    )
+                    self.logger.info(f'Submitted {record.name} to screen with GCMC')
+                    return
+
             try:
                 record = self.dft_selector.select_next()
             except ValueError:
@@ -556,7 +655,7 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
         """Store the results for the CP2K, submit any post-processing"""
 
         # Trigger new CP2K
-        if result.method == 'run_optimization':
+        if result.method in ['run_optimization', 'run_gcmc_screening']:
             self.rec.release('cp2k')
 
         # If it's a failure, report to the user
@@ -581,6 +680,18 @@ class MOFAThinker(BaseThinker, AbstractContextManager):
                 task_info=result.task_info
             )
             self.logger.info(f'Partial charges are complete for {mof_name}. Submitted RASPA')
+        elif result.method == 'run_gcmc_screening':
+            # Store the screening result apart from uptakes computed with DFT charges
+            uptake_mean, uptake_std, _, _ = result.value
+            record = mofadb.get_records(self.collection, [mof_name])[0]
+            mofadb.mark_completed(self.collection, record, 'screening')
+            record.gas_storage[self.dft_selector.screen_key] = uptake_mean
+            record.times['screening-done'] = datetime.now()
+            mofadb.update_records(self.collection, [record])
+
+            # Make the MOF available for DFT
+            self.cp2k_ready.set()
+            self.logger.info(f'Stored screening capacity for {mof_name}: {uptake_mean:.3e} +/- {uptake_std:.3e} mol/kg')
         elif result.method == 'run_gcmc':
             # Store result
             uptake_mean, uptake_std, _, _ = result.value
@@ -0,0 +1,337 @@
+"""Compact storage for molecular dynamics trajectories"""
+from dataclasses import dataclass, replace
+from typing import Iterator, Sequence
+from pathlib import Path
+from io import BytesIO
+import binascii
+import mmap
+
+import numpy as np
+from ase import Atoms
+from ase.geometry import cellpar_to_cell
+
+
+_encoding_version = 1
+"""Version of the format produced by :meth:`Trajectory.to_dict`"""
+
+
+@dataclass
+class CellSeries:
+    """Lattice parameters reported at each step of a molecular dynamics run
+
+    Holds the cell of every reported step, even when coordinates are only kept for a few frames.
+    """
+
+    timesteps: np.ndarray
+    """Timestep of each report, shape (reports,)"""
+    cellpars: np.ndarray
+    """Lattice parameters (a, b, c, alpha, beta, gamma) of each report, shape (reports, 6)"""
+
+    def __post_init__(self):
+        self.timesteps = np.asarray(self.timesteps, dtype=np.int64)
+        self.cellpars = np.asarray(self.cellpars, dtype=np.float32).reshape(-1, 6)
+
+    @classmethod
+    def from_thermo(cls, thermo: dict[str, np.ndarray]) -> 'CellSeries':
+        """Create the series from the thermodynamic output of LAMMPS
+
+        Args:
+            thermo: Columns of the thermo output, as read by :meth:`~mofa.simulation.thermo.read_thermo`
+        Returns:
+            Lattice parameters at each reported step
+        """
+        if len(thermo) == 0:
+            return cls(timesteps=np.zeros((0,)), cellpars=np.zeros((0, 6)))
+        return cls(
+            timesteps=thermo['step'],
+            cellpars=np.stack([thermo[c] for c in ['cella', 'cellb', 'cellc', 'cellalpha', 'cellbeta', 'cellgamma']], axis=1)
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CellSeries':
+        """Create the series from the form produced by :meth:`to_dict`
+
+        Args:
+            data: Dictionary form of the series, where the lattice parameters may be bytes or base64-encoded strings
+        Returns:
+            Lattice parameters at each reported step
+        """
+        cellpars = data['cellpars']
+        if isinstance(cellpars, str):
+            cellpars = binascii.a2b_base64(cellpars)
+        if isinstance(cellpars, bytes):
+            cellpars = np.frombuffer(cellpars, dtype='<f4')
+        return cls(timesteps=data['timesteps'], cellpars=cellpars)
+
+    def to_dict(self) -> dict:
+        """Encode the series as a dictionary which can be stored as a BSON document
+
+        Returns:
+            Timesteps as a list and lattice parameters as bytes holding little-endian float32 values
+        """
+        return {'timesteps': self.timesteps.tolist(), 'cellpars': self.cellpars.astype('<f4').tobytes()}
+
+    @property
+    def cells(self) -> np.ndarray:
+        """Lattice vectors of each report as rows, shape (reports, 3, 3)"""
+        return np.array([cellpar_to_cell(c) for c in self.cellpars.astype(float)]).reshape(-1, 3, 3)
+
+    def extend(self, other: 'CellSeries'):
+        """Append the reports of another series
+
+        Args:
+            other: Series to be appended
+        """
+        self.timesteps = np.concatenate([self.timesteps, other.timesteps])
+        self.cellpars = np.concatenate([self.cellpars, other.cellpars])
+
+    def shift_timesteps(self, offset: int) -> 'CellSeries':
+        """Create a copy of this series with the timesteps offset by a fixed amount
+
+        Args:
+            offset: Number of timesteps to add to each report
+        Returns:
+            Series with shifted timesteps
+        """
+        return replace(self, timesteps=self.timesteps + offset)
+
+    def __len__(self) -> int:
+        return len(self.timesteps)
+
+    def __getitem__(self, item) -> 'CellSeries':
+        return replace(self, timesteps=self.timesteps[item], cellpars=self.cellpars[item])
+
+
+@dataclass
+class Trajectory:
+    """Structures from a molecular dynamics run, stored as arrays
+
+    Iterating over the trajectory yields pairs of the timestep and an ASE Atoms object,
+    the same as the list of frames it replaces.
+    """
+
+    symbols: np.ndarray
+    """Chemical symbol of each atom, shape (atoms,)"""
+    timesteps: np.ndarray
+    """Timestep of each frame, shape (frames,)"""
+    cells: np.ndarray
+    """Lattice vectors of each frame as rows, shape (frames, 3, 3)"""
+    positions: np.ndarray
+    """Cartesian positions of each atom in each frame, shape (frames, atoms, 3)"""
+    stop_reason: str | None = None
+    """Why the latest MD run ended before its requested length (e.g., ``unstable`` or ``plateau``), if it did"""
+    cell_series: CellSeries | None = None
+    """Lattice parameters at every reported step, which may include steps without coordinates"""
+
+    def __post_init__(self):
+        self.symbols = np.asarray(self.symbols, dtype=str)
+        self.timesteps = np.asarray(self.timesteps, dtype=np.int64)
+        self.cells = np.asarray(self.cells, dtype=np.float32)
+        self.positions = np.asarray(self.positions, dtype=np.float32)
+        if isinstance(self.cell_series, dict):
+            self.cell_series = CellSeries.from_dict(self.cell_series)
+
+    @classmethod
+    def from_frames(cls, frames: Sequence[tuple[int, Atoms]]) -> 'Trajectory':
+        """Create a trajectory from a list of timesteps and structures
+
+        Args:
+            frames: Pairs of timestep and structure. All structures must contain the same atoms
+        Returns:
+            Trajectory holding the same structures
+        """
+        if len(frames) == 0:
+            raise ValueError('Trajectory must contain at least one frame')
+        return cls(
+            symbols=frames[0][1].get_chemical_symbols(),
+            timesteps=[s for s, _ in frames],
+            cells=np.stack([a.cell.array for _, a in frames]),
+            positions=np.stack([a.positions for _, a in frames]),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Trajectory':
+        """Create a trajectory from its dictionary form
+
+        Accepts either the encoded form produced by :meth:`to_dict`, where the arrays may be
+        stored as bytes or as base64-encoded strings, or a dictionary of arrays like that
+        produced by :func:`dataclasses.asdict`.
+
+        Args:
+            data: Dictionary form of the trajectory
+        Returns:
+            Trajectory
+        """
+        if 'version' not in data:
+            return cls(**data)
+        if data['version'] != _encoding_version:
+            raise ValueError(f'Unsupported trajectory encoding version: {data["version"]}')
+
+        def _to_array(value, shape):
+            if isinstance(value, str):
+                value = binascii.a2b_base64(value)
+            return np.frombuffer(value, dtype='<f4').reshape(shape)
+
+        n_frames, n_atoms = len(data['timesteps']), len(data['symbols'])
+        return cls(
+            symbols=data['symbols'],
+            timesteps=data['timesteps'],
+            cells=_to_array(data['cells'], (n_frames, 3, 3)),
+            positions=_to_array(data['positions'], (n_frames, n_atoms, 3)),
+            stop_reason=data.get('stop_reason'),
+            cell_series=data.get('cell_series'),
+        )
+
+    def to_dict(self) -> dict:
+        """Encode the trajectory as a dictionary which can be stored as a BSON document
+
+        The timesteps and symbols are stored as lists. The cells and positions are stored
+        as bytes holding little-endian float32 values.
+
+        Returns:
+            Dictionary form of the trajectory
+        """
+        return {
+            'version': _encoding_version,
+            'symbols': self.symbols.tolist(),
+            'timesteps': self.timesteps.tolist(),
+            'cells': self.cells.astype('<f4').tobytes(),
+            'positions': self.positions.astype('<f4').tobytes(),
+            'stop_reason': self.stop_reason,
+            'cell_series': None if self.cell_series is None else self.cell_series.to_dict(),
+        }
+
+    def extend(self, other: 'Trajectory'):
+        """Append the frames of another trajectory of the same atoms
+
+        The stop reason is replaced by that of the other trajectory,
+        and the lattice parameters of the other trajectory are appended to those of this one.
+
+        Args:
+            other: Trajectory to be appended
+        """
+        if not np.array_equal(self.symbols, other.symbols):
+            raise ValueError('Trajectories contain different atoms')
+        self.timesteps = np.concatenate([self.timesteps, other.timesteps])
+        self.cells = np.concatenate([self.cells, other.cells])
+        self.positions = np.concatenate([self.positions, other.positions])
+        self.stop_reason = other.stop_reason
+        if self.cell_series is None:
+            self.cell_series = other.cell_series
+        elif other.cell_series is not None:
+            self.cell_series = replace(self.cell_series)  # Copy, as slices of this trajectory share the series
+            self.cell_series.extend(other.cell_series)
+
+    def __len__(self) -> int:
+        return len(self.timesteps)
+
+    def __iter__(self) -> Iterator[tuple[int, Atoms]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return int(self.timesteps[item]), self.get_atoms(item)
+        return replace(self, timesteps=self.timesteps[item], cells=self.cells[item], positions=self.positions[item])
+
+    def get_atoms(self, index: int) -> Atoms:
+        """Get one frame as an ASE Atoms object
+
+        Args:
+            index: Index of the frame
+        Returns:
+            Structure of that frame
+        """
+        return Atoms(symbols=self.symbols.tolist(), positions=self.positions[index], cell=self.cells[index], pbc=True)
+
+    def shift_timesteps(self, offset: int) -> 'Trajectory':
+        """Create a copy of this trajectory with the timesteps offset by a fixed amount
+
+        Args:
+            offset: Number of timesteps to add to each frame
+        Returns:
+            Trajectory with shifted timesteps
+        """
+        cell_series = None if self.cell_series is None else self.cell_series.shift_timesteps(offset)
+        return replace(self, timesteps=self.timesteps + offset, cell_series=cell_series)
+
+
+def _box_to_cell(bounds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Convert the box bounds of a LAMMPS dump into lattice vectors
+
+    Args:
+        bounds: Box bounds from the dump, shape (3, 2) for orthogonal or (3, 3) for triclinic boxes
+    Returns:
+        - Lattice vectors as rows
+        - Origin of the box
+    """
+    if bounds.shape[1] == 3:
+        xy, xz, yz = bounds[:, 2]
+    else:
+        xy = xz = yz = 0.
+    xlo = bounds[0, 0] - min(0., xy, xz, xy + xz)
+    xhi = bounds[0, 1] - max(0., xy, xz, xy + xz)
+    ylo = bounds[1, 0] - min(0., yz)
+    yhi = bounds[1, 1] - max(0., yz)
+    zlo, zhi = bounds[2, :2]
+    cell = np.array([[xhi - xlo, 0, 0], [xy, yhi - ylo, 0], [xz, yz, zhi - zlo]])
+    return cell, np.array([xlo, ylo, zlo])
+
+
+def read_lammps_dump(path: str | Path, frames: int | slice | Sequence[int] | None = None) -> Trajectory:
+    """Read selected frames from a LAMMPS text dump file
+
+    The dump must include the ``id``, ``element``, ``x``, ``y``, and ``z`` columns.
+    Positions are reported relative to the origin of the simulation box.
+
+    Args:
+        path: Path to the dump file
+        frames: Indices of the frames to read, following the same rules as indexing a list. Default is to read all
+    Returns:
+        Trajectory containing the selected frames
+    """
+
+    with open(path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # Find the start of each frame
+        offsets = []
+        pos = data.find(b'ITEM: TIMESTEP')
+        while pos != -1:
+            offsets.append(pos)
+            pos = data.find(b'ITEM: TIMESTEP', pos + 1)
+        offsets.append(len(data))
+        if len(offsets) == 1:
+            raise ValueError(f'No frames found in {path}')
+
+        selected = np.arange(len(offsets) - 1)
+        if frames is not None:
+            selected = np.atleast_1d(selected[frames])
+
+        # Read the frames into preallocated arrays
+        symbols = None
+        timesteps = np.zeros((len(selected),), dtype=np.int64)
+        cells = np.zeros((len(selected), 3, 3), dtype=np.float32)
+        positions = None
+        for i, frame in enumerate(selected):
+            start, end = offsets[frame], offsets[frame + 1]
+            lines = data[start:end].split(b'\n', 9)
+            timesteps[i] = int(lines[1])
+            n_atoms = int(lines[3])
+            bounds = np.array([line.split() for line in lines[5:8]], dtype=float)
+            cell, origin = _box_to_cell(bounds)
+            cells[i] = cell
+
+            columns = lines[8].decode().split()[2:]
+            id_col, el_col = columns.index('id'), columns.index('element')
+            xyz_cols = [columns.index(c) for c in ['x', 'y', 'z']]
+            atoms_block = lines[9] if len(lines) > 9 else b''
+
+            # Sort atoms by their ID
+            values = np.loadtxt(BytesIO(atoms_block), usecols=[id_col] + xyz_cols, ndmin=2, max_rows=n_atoms)
+            order = np.argsort(values[:, 0], kind='stable')
+            if positions is None:
+                positions = np.zeros((len(selected), n_atoms, 3), dtype=np.float32)
+                elements = np.loadtxt(BytesIO(atoms_block), usecols=[el_col], dtype=str, ndmin=1, max_rows=n_atoms)
+                symbols = elements[order]
+            positions[i] = values[order, 1:] - origin
+
+    return Trajectory(symbols=symbols, timesteps=timesteps, cells=cells, positions=positions)
@@ -25,10 +25,12 @@ from mofa.assembly.validate import process_ligands
 from mofa.finetune.difflinker import DiffLinkerCurriculum
 from mofa.generator import run_generator, train_generator
 from mofa.model import NodeDescription, LigandTemplate
-from mofa.selection.dft import DFTSelector
+from mofa.scoring.geometry import PoreGeometry
+from mofa.selection.dft import DFTSelector, SurrogateDFTSelector
 from mofa.selection.md import MDSelector
 from mofa.simulation.dft import compute_partial_charges
 from mofa.simulation.mace import MACERunner
+from mofa.simulation.thermo import StrainMonitor
 from mofa.steering import GeneratorConfig, TrainingConfig, MOFAThinker, SimulationConfig
 from mofa.hpc.colmena import DiffLinkerInference
 from mofa.hpc.config import LocalConfig
@@ -73,9 +75,18 @@ if __name__ == "__main__":
     group.add_argument('--md-timesteps', default=3000, help='Number of timesteps per run of the MACE MD simulation', type=int)
     group.add_argument('--md-timesteps-max', default=20000, help='Maximum number of timesteps to run for any MD simulation', type=int)
     group.add_argument('--md-snapshots-freq', default=1000, help='How frequently to write timesteps', type=int)
+    group.add_argument('--relax-batch-size', default=1, help='Largest number of new MOFs to relax together in one task', type=int)
+    group.add_argument('--md-early-stop', action='store_true',
+                       help='End MD runs once the strain exceeds the maximum strain or stops changing')
+    group.add_argument('--md-cell-only', action='store_true',
+                       help='Write coordinates for only the first and last frames of MD, reading the cell at other steps from the log')
     group.add_argument('--retain-lammps', action='store_true', help='Keep LAMMPS output files after it finishes')
     group.add_argument('--dft-opt-steps', default=8, help='Maximum number of DFT optimization steps', type=int)
     group.add_argument('--raspa-timesteps', default=100000, help='Number of timesteps for GCMC computation', type=int)
+    group.add_argument('--raspa-charges', choices=['chargemol', 'qeq'], default=None,
+                       help='Method used to assign partial charges for GCMC. Default is to use the setting of the compute configuration')
+    group.add_argument('--gcmc-screening', action='store_true',
+                       help='Screen MOFs with GCMC using QEq charges before DFT, and run DFT on those with the largest uptakes first')
 
     group = parser.add_argument_group(title='Compute Settings', description='Compute environment configuration')
     group.add_argument('--lammps-on-ramdisk', action='store_true', help='Write LAMMPS outputs to a RAM Disk')
@@ -88,6 +99,17 @@ if __name__ == "__main__":
 
     group = parser.add_argument_group(title='Selector Settings', description='Control how simulation tasks are selected')
     group.add_argument('--md-new-fraction', default=0.5, help='How frequently to start MD on a new MOF')
+    group.add_argument('--md-stability-model', action='store_true',
+                       help='Start MD on new MOFs in order of their stability predicted by a model trained on previous MD results')
+    group.add_argument('--md-stability-retrain', default=32, type=int, help='Number of MD results between retraining the stability model')
+    group.add_argument('--dft-min-pld', default=None, type=float,
+                       help='Smallest pore-limiting diameter (Å) of MOFs sent to DFT. Default is to not screen by pore size')
+    group.add_argument('--dft-prefer', default=None, choices=['pld', 'lcd', 'void_fraction', 'asa'],
+                       help='Pore descriptor for which to run DFT on MOFs with the largest values first. Default is to pick randomly')
+    group.add_argument('--dft-surrogate', action='store_true',
+                       help='Run DFT on the MOFs with the best CO2 uptake predicted by a model trained on completed GCMC runs')
+    group.add_argument('--dft-exploration', default=1., type=float,
+                       help='Weight of the uncertainty of the predicted uptake when selecting MOFs with the surrogate model')
 
     args = parser.parse_args()
 
@@ -129,6 +151,8 @@ if __name__ == "__main__":
     hpc_config.run_dir = run_dir
     hpc_config.ai_fraction = args.ai_fraction
     hpc_config.dft_fraction = args.dft_fraction
+    if args.raspa_charges is not None:
+        hpc_config.raspa_charges = args.raspa_charges
 
     # Make the Parsl configuration
     config = hpc_config.make_parsl_config()
@@ -184,14 +208,24 @@ if __name__ == "__main__":
     # Make the LAMMPS function
     lmp_runner = MACERunner(lammps_cmd=hpc_config.lammps_cmd,
                             model_path=Path(args.mace_model_path).absolute(),
-                            run_dir=Path('/dev/shm/lmp_run' if args.lammps_on_ramdisk else run_dir / 'lmp_run'),
-                            delete_finished=args.lammps_on_ramdisk)
+                            run_dir=run_dir / 'lmp_run',
+                            scratch=hpc_config.make_scratch('lmp_run', Path('/dev/shm')) if args.lammps_on_ramdisk else None,
+                            delete_finished=args.lammps_on_ramdisk,
+                            strain_monitor=StrainMonitor(max_strain=args.maximum_strain) if args.md_early_stop else None,
+                            maximum_steps=args.md_timesteps_max,
+                            max_strain=args.maximum_strain,
+                            md_cell_only=args.md_cell_only,
+                            pore_geometry=PoreGeometry())
     md_fun = partial(lmp_runner.run_molecular_dynamics, report_frequency=args.md_snapshots_freq)
     update_wrapper(md_fun, lmp_runner.run_molecular_dynamics)
-    sim_config = SimulationConfig(md_length=args.md_timesteps, md_report=args.md_snapshots_freq)
+    sim_config = SimulationConfig(md_length=args.md_timesteps, md_report=args.md_snapshots_freq,
+                                  stability_model=args.md_stability_model, stability_retrain=args.md_stability_retrain,
+                                  relax_batch_size=args.relax_batch_size)
 
     md_opt_fun = partial(lmp_runner.run_optimization, steps=1024, fmax=0.5)
     md_opt_fun.__name__ = 'run_optimization_ff'
+    md_opt_many_fun = partial(lmp_runner.run_optimization_many, steps=1024, fmax=0.5)
+    md_opt_many_fun.__name__ = 'run_optimization_ff_many'
 
     md_selector = MDSelector(
         collection=mongo_coll,
@@ -205,10 +239,17 @@ if __name__ == "__main__":
     cp2k_fun = partial(dft_runner.run_optimization, steps=args.dft_opt_steps)  # Optimizes starting from assembled structure
     update_wrapper(cp2k_fun, dft_runner.run_optimization)
 
-    dft_selector = DFTSelector(
+    dft_options = dict(
         collection=mongo_coll,
-        max_strain=args.maximum_strain
+        max_strain=args.maximum_strain,
+        min_pore_diameter=args.dft_min_pld,
+        prefer=args.dft_prefer,
+        screen_key='CO2_qeq' if args.gcmc_screening else None
     )
+    if args.dft_surrogate:
+        dft_selector = SurrogateDFTSelector(exploration=args.dft_exploration, **dft_options)
+    else:
+        dft_selector = DFTSelector(**dft_options)
 
     # Make the RASPA function
     raspa_runner = hpc_config.make_raspa_runner()
@@ -218,6 +259,18 @@ if __name__ == "__main__":
                         pressure=1e4,
                         cycles=args.raspa_timesteps)
     update_wrapper(raspa_fun, raspa_runner.run_gcmc)
+    gcmc_methods = [(raspa_fun, {'executors': hpc_config.raspa_executors})]
+
+    # Make the screening function, which assigns charges without DFT
+    if args.gcmc_screening:
+        screen_runner = hpc_config.make_raspa_runner(charges='qeq')
+        screen_fun = partial(screen_runner.run_gcmc,
+                             adsorbate='CO2',
+                             temperature=298,
+                             pressure=1e4,
+                             cycles=args.raspa_timesteps)
+        screen_fun.__name__ = 'run_gcmc_screening'
+        gcmc_methods.append((screen_fun, {'executors': hpc_config.raspa_executors}))
 
     # Make the thinker
     thinker = MOFAThinker(queues,
@@ -252,11 +305,12 @@ if __name__ == "__main__":
             (train_func, {'executors': hpc_config.train_executors}),
             (md_fun, {'executors': hpc_config.lammps_executors}),
             (md_opt_fun, {'executors': hpc_config.lammps_executors}),
+            (md_opt_many_fun, {'executors': hpc_config.lammps_executors}),
             (cp2k_fun, {'executors': hpc_config.dft_executors}),
             (compute_partial_charges, {'executors': hpc_config.helper_executors}),
             (process_ligands, {'executors': hpc_config.helper_executors}),
-            (raspa_fun, {'executors': hpc_config.raspa_executors}),
-            (assemble_many, {'executors': hpc_config.helper_executors})
+            (assemble_many, {'executors': hpc_config.helper_executors}),
+            *gcmc_methods
         ],
         queues=queues,
         config=config
@@ -21,7 +21,8 @@ from mofa.scoring.geometry import LatticeParameterChange
 from mofa.simulation.interfaces import MDInterface
 from mofa.simulation.lammps import LAMMPSRunner
 from mofa.simulation.mace import MACERunner
-from mofa.utils.conversions import write_to_string
+from mofa.utils.conversions import read_from_string, write_to_string
+from mofa.utils.trajectory import Trajectory
 
 
 def test_function(
@@ -208,7 +209,7 @@ hostname
                     continue  # We're done
 
                 if args.continue_runs:
-                    mof.md_trajectory[runner.traj_name] = [(timesteps, strc)]
+                    mof.md_trajectory[runner.traj_name] = Trajectory.from_frames([(timesteps, read_from_string(strc, 'vasp'))])
                     num_ran -= timesteps
             elif args.continue_runs:
                 continue  # Skip if not already run
@@ -226,10 +227,8 @@ hostname
             runtime, traj = future.result()
 
             # Get the strain
-            # TODO (wardlt): Simplify how we compute strain
-            traj_vasp = [(s, write_to_string(t, 'vasp')) for (s, t) in traj]
             mof = future.mof
-            mof.md_trajectory[runner.traj_name] = traj_vasp
+            mof.md_trajectory[runner.traj_name] = traj
             strain = scorer.score_mof(mof)
 
             # Store the result
@@ -242,6 +241,6 @@ hostname
                     'runtime': runtime,
                     'steps_ran': future.num_ran,
                     'strain': strain,
-                    'structure': traj_vasp[-1][-1]
+                    'structure': write_to_string(traj.get_atoms(-1), 'vasp')
                 }), file=fp)
 
@@ -1,10 +1,9 @@
-from ase.io.vasp import write_vasp
 from pytest import raises
 from ase import Atoms
 import numpy as np
-from six import StringIO
 
-from mofa.scoring.geometry import MinimumDistance, LatticeParameterChange
+from mofa.scoring.geometry import MinimumDistance, LatticeParameterChange, PoreGeometry
+from mofa.utils.trajectory import CellSeries, Trajectory
 
 
 def test_distance(example_record):
@@ -24,16 +23,50 @@ def test_strain(example_record):
         scorer.score_mof(example_record)
 
     # Make a fake MD trajectory with no change
-    example_record.md_trajectory['uff'] = [(0, example_record.structure),
-                                           (1000, example_record.structure)]
+    init_atoms = example_record.atoms
+    example_record.md_trajectory['uff'] = Trajectory.from_frames([(0, init_atoms), (1000, init_atoms)])
     assert np.isclose(scorer.score_mof(example_record), 0)
 
     # Make sure it compute stresses correctly if the volume shears
-    final_atoms = example_record.atoms
+    final_atoms = init_atoms.copy()
     final_atoms.set_cell(final_atoms.cell.lengths().tolist() + [80, 90, 90])
-    sio = StringIO()
-    write_vasp(sio, final_atoms)
-    example_record.md_trajectory['uff'][1] = (1000, sio.getvalue())
+    example_record.md_trajectory['uff'] = Trajectory.from_frames([(0, init_atoms), (1000, final_atoms)])
 
     max_strain = scorer.score_mof(example_record)
     assert np.isclose(max_strain, 0.09647)  # Checked against https://www.cryst.ehu.es/cryst/strain.html
+
+    # Score using only the cells
+    cellpars = np.array([init_atoms.cell.cellpar(), final_atoms.cell.cellpar()])
+    assert np.isclose(scorer.score_series(cellpars), max_strain, atol=1e-5)
+    assert np.isclose(scorer.score_series(np.stack([init_atoms.cell.array, final_atoms.cell.array])), max_strain)
+    assert np.isclose(scorer.score_series(CellSeries(timesteps=[0, 1000], cellpars=cellpars)), max_strain, atol=1e-5)
+    with raises(ValueError):
+        scorer.score_series(np.zeros((0, 6)))
+
+
+def test_pore_geometry(example_record):
+    # A simple cubic lattice has a cavity at the center of the cube connected through its faces
+    atoms = Atoms('C', positions=[[0, 0, 0]], cell=[10., 10., 10.], pbc=True)
+    radius = 1.77
+    scorer = PoreGeometry(grid_spacing=0.25)
+    desc = scorer.describe(atoms)
+    assert np.isclose(desc['lcd'], 2 * (np.sqrt(3) * 5 - radius), atol=0.1)
+    assert np.isclose(desc['pld'], 2 * (np.sqrt(50) - radius), atol=0.1)
+    assert np.isclose(desc['void_fraction'], 1 - 4 / 3 * np.pi * radius ** 3 / 1000, atol=1e-3)
+    assert np.isclose(desc['asa'], 4 * np.pi * (radius + 1.65) ** 2 * 1e-20 / (atoms.get_masses().sum() * 1.66054e-24), rtol=1e-3)
+    assert scorer(atoms) == desc['pld']
+
+    # Walls of overlapping atoms enclose the cavity
+    walls = set()
+    for i in range(5):
+        for j in range(5):
+            walls.update([(2 * i, 2 * j, 0), (2 * i, 0, 2 * j), (0, 2 * i, 2 * j)])
+    atoms = Atoms('C' * len(walls), positions=sorted(walls), cell=[10., 10., 10.], pbc=True)
+    desc = scorer.describe(atoms)
+    assert desc['lcd'] > 6
+    assert desc['pld'] == 0
+
+    # Works on a MOF
+    desc = PoreGeometry(metric='lcd').describe(example_record.atoms)
+    assert 0 < desc['pld'] <= desc['lcd']
+    assert 0 < desc['void_fraction'] < 1
@@ -0,0 +1,83 @@
+from dataclasses import replace
+
+import numpy as np
+from pytest import raises
+
+from mofa.model import LigandDescription
+from mofa.scoring.surrogate import (StabilityClassifier, UptakeSurrogate, descriptor_names, ligand_fingerprint,
+                                    record_descriptors, structure_descriptors)
+from mofa.utils.conversions import write_to_string
+
+
+def make_records(example_record, count: int) -> list:
+    """Make copies of a record whose uptake increases with the void fraction"""
+    records = []
+    for i, void_fraction in enumerate(np.linspace(0.1, 0.9, count)):
+        pores = {'lcd': 10., 'pld': 5., 'void_fraction': void_fraction, 'asa': 1000.}
+        records.append(replace(example_record, name=f'mof-{i}', pore_geometry=pores, gas_storage={'CO2': 10 * void_fraction}))
+    return records
+
+
+def test_descriptors(example_record):
+    x = structure_descriptors(example_record.atoms)
+    assert x.shape == (len(descriptor_names),)
+    assert np.isfinite(x).all()
+    assert 0 < x[descriptor_names.index('frac_metal')] < 1
+
+    # Use the stored pore geometry when available
+    example_record.pore_geometry = {'lcd': 1., 'pld': 2., 'void_fraction': 3., 'asa': 4.}
+    assert record_descriptors(example_record)[-4:].tolist() == [1., 2., 3., 4.]
+
+
+def test_surrogate(example_record):
+    model = UptakeSurrogate()
+    with raises(ValueError, match='trained'):
+        model.score_mof(example_record)
+    with raises(ValueError, match='at least 2'):
+        model.fit([example_record])
+
+    records = make_records(example_record, 16)
+    records.append(replace(example_record, name='isotherm', gas_storage={'CO2': [(1e4, 1.)]}))  # Skipped
+    model.fit(records)
+    mean, std = model.predict([records[0], records[-2]])
+    assert mean[1] > mean[0]
+    assert (std >= 0).all()
+    assert np.isclose(model.score_mof(records[0]), mean[0])
+
+
+def test_fingerprint(example_record):
+    assert not ligand_fingerprint(example_record, length=64).any()  # No ligands
+
+    example_record.ligands = [LigandDescription(smiles='OC(=O)c1ccccc1'), LigandDescription(smiles=None)]
+    fp = ligand_fingerprint(example_record, length=64)
+    assert fp.shape == (64,) and fp.any()
+
+    example_record.ligands.append(LigandDescription(smiles='NCCN'))
+    assert (ligand_fingerprint(example_record, length=64) >= fp).all()
+
+
+def test_stability_classifier(example_record):
+    # Ligands with amines are stable, those with halogens are not
+    records = []
+    for i, smiles in enumerate(['NCCN', 'Nc1ccccc1N', 'NCC(N)C', 'NC(C)CN', 'ClCCCl', 'Clc1ccccc1Cl', 'BrCCBr', 'FCCF']):
+        strain = 0.1 if 'N' in smiles else 0.5
+        records.append(replace(example_record, name=f'mof-{i}', ligands=[LigandDescription(smiles=smiles)],
+                               structure_stability={'uff': strain}))
+
+    model = StabilityClassifier(md_level='uff')
+    with raises(ValueError, match='No MOFs'):
+        model.fit([example_record])
+    with raises(ValueError, match='Need examples of both'):
+        model.fit(records[:4])
+
+    model.fit(records)
+    prob = model.predict_proba([replace(example_record, ligands=[LigandDescription(smiles='NCCCN')]),
+                                replace(example_record, ligands=[LigandDescription(smiles='ClCCCCl')])])
+    assert prob[0] > prob[1]
+    assert 0 <= model.score_mof(records[0]) <= 1
+
+    # Describe relaxed MOFs by their assembled structure
+    relaxed = records[0].atoms.copy()
+    relaxed.set_cell(relaxed.cell * 0.9, scale_atoms=True)
+    relaxed_record = replace(records[0], structure=write_to_string(relaxed, 'vasp'), assembled_structure=records[0].structure)
+    assert np.allclose(model.features(relaxed_record), model.features(records[0]))
@@ -0,0 +1,42 @@
+"""Test reading the outputs of chargemol"""
+from pathlib import Path
+import shutil
+import os
+
+import numpy as np
+
+from mofa.simulation.chargemol import chargemol_fname, load_chargemol, read_chargemol
+from mofa.simulation.dft import load_atoms_with_charges
+from mofa.simulation.raspa.utils import get_cif_from_chargemol
+
+_file_path = Path(__file__).parent
+
+
+def test_read():
+    atoms = read_chargemol(_file_path / chargemol_fname)
+    assert len(atoms) == 92
+    assert atoms.symbols[0] == 'O'
+    assert np.isclose(atoms.arrays['q'][0], -0.556032)
+    assert np.allclose(atoms.cell[1], [1.809659, 15.847123, 0.001143])
+
+    # Both the DFT and RASPA interfaces use the same parser
+    assert np.allclose(load_atoms_with_charges(_file_path).arrays['q'], atoms.arrays['q'])
+    charged = get_cif_from_chargemol(_file_path)
+    assert charged.info['_atom_site_charge'] == atoms.arrays['q'].tolist()
+    assert 'q' not in charged.arrays
+
+
+def test_cache(tmpdir):
+    path = Path(tmpdir) / chargemol_fname
+    shutil.copyfile(_file_path / chargemol_fname, path)
+    first = load_chargemol(tmpdir)
+    first.arrays['q'][:] = 0  # Copies are returned, so the cached version is unchanged
+    assert not np.allclose(load_chargemol(tmpdir).arrays['q'], 0)
+
+    # Re-read once the file changes
+    lines = path.read_text().splitlines(keepends=True)
+    lines[2] = lines[2].replace('-0.556032', '-0.600000')
+    path.write_text(''.join(lines))
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert np.isclose(load_chargemol(tmpdir).arrays['q'][0], -0.6)
@@ -0,0 +1,60 @@
+"""Test the methods which assign partial charges"""
+from pathlib import Path
+
+import numpy as np
+from ase.build import bulk
+from ase.io import read
+from pytest import raises
+
+from mofa.simulation.raspa.charges import ChargemolCharges, QEqCharges
+from mofa.simulation.raspa.graspa import gRASPARunner
+
+_file_path = Path(__file__).parent
+_cache_dir = _file_path / 'graspa-runs' / 'cached'
+
+
+def test_qeq():
+    atoms = ChargemolCharges().assign(cp2k_dir=_file_path)
+    reference = np.array(atoms.info['_atom_site_charge'])
+    qeq = QEqCharges()
+    charges = qeq.compute(atoms)
+    assert np.isclose(charges.sum(), 0)
+    assert np.corrcoef(charges, reference)[0, 1] > 0.9  # Similar to the DDEC6 charges
+
+    # Charges do not depend on the choice of cell
+    supercell = atoms.repeat((2, 1, 1))
+    assert np.allclose(qeq.compute(supercell), np.tile(charges, 2), atol=1e-4)
+
+    # Net charges are distributed over the cell
+    assert np.isclose(QEqCharges(total_charge=1.).compute(atoms).sum(), 1.)
+
+    # Missing elements are reported
+    with raises(ValueError, match='Og'):
+        qeq.compute(bulk('Og', 'fcc', a=5.))
+
+
+def test_qeq_mof(cif_dir):
+    atoms = read(cif_dir / 'hMOF-0.cif')
+    charged = QEqCharges().assign(atoms)
+    charges = np.array(charged.info['_atom_site_charge'])
+    assert len(charges) == len(atoms)
+    assert np.isclose(charges.sum(), 0)
+    assert (charges[atoms.symbols == 'Zn'] > 0).all()
+    assert (charges[atoms.symbols == 'O'] < 0).all()
+    assert '_atom_site_charge' not in atoms.info
+
+
+def test_chargemol():
+    atoms = ChargemolCharges().assign(cp2k_dir=_file_path)
+    assert len(atoms.info['_atom_site_charge']) == len(atoms)
+    with raises(ValueError):
+        ChargemolCharges().assign(atoms)
+
+
+def test_gcmc_without_dft(tmpdir, cif_dir):
+    """Run GCMC with charges computed from the structure alone"""
+    runner = gRASPARunner(raspa_command=f"cp {_cache_dir.absolute()}/test_CO2_298_1.000000e+04.log raspa.err".split(),
+                          run_dir=Path(tmpdir), charges=QEqCharges())
+    uptake, *_ = runner.run_gcmc('test', None, 'CO2', 100, 298, 1e4, atoms=read(cif_dir / 'hMOF-0.cif'))
+    assert isinstance(uptake, float)
+    assert '_atom_site_charge' in (Path(tmpdir) / 'test_CO2_298_1.000000e+04' / 'input.cif').read_text()
@@ -1,12 +1,17 @@
+from datetime import datetime
+from pathlib import Path
 import os
 import shutil
 
+import numpy as np
 from pytest import mark
 
 from mofa.model import MOFRecord
-from mofa.simulation.dft.cp2k import CP2KRunner
+from mofa.simulation.dft.base import choose_starting_structure
+from mofa.simulation.dft.cp2k import CP2KRunner, get_shell_pool
 from mofa.simulation.dft import compute_partial_charges
-from mofa.utils.conversions import write_to_string
+from mofa.simulation.scratch import gzip_file
+from mofa.utils.trajectory import Trajectory
 
 IN_GITHUB_ACTIONS = os.getenv("GITHUB_ACTIONS") == "true"
 
@@ -21,7 +26,7 @@ def test_cp2k_single(cif_name, cif_dir, tmpdir):
 
     test_file = cif_dir / f'{cif_name}.cif'
     record = MOFRecord.from_file(test_file)
-    record.md_trajectory['uff'] = [write_to_string(record.atoms, 'vasp')]
+    record.md_trajectory['uff'] = Trajectory.from_frames([(0, record.atoms)])
     atoms, cp2k_path = runner.run_single_point(record, structure_source=('uff', -1))
 
     assert atoms.calc is not None
@@ -31,10 +36,11 @@ def test_cp2k_single(cif_name, cif_dir, tmpdir):
     assert charged_mof.arrays["q"].shape[0] == charged_mof.arrays["positions"].shape[0]
 
     # Run a second time to test re-using the executable
-    old_run_dir = runner._calc.run_dir
+    pool = get_shell_pool()
+    old_run_dir = pool.shells[0].handle.run_dir
     old_runtime = cp2k_path.joinpath('cp2k.out').stat().st_mtime
     _, cp2k_path = runner.run_single_point(record, structure_source=('uff', -1))
-    assert old_run_dir == runner._calc.run_dir  # No changed path
+    assert [s.handle.run_dir for s in pool.shells] == [old_run_dir]  # Reused the same shell
     assert old_runtime != cp2k_path.joinpath('cp2k.out').stat().st_mtime  # Changed mod times
 
 
@@ -51,7 +57,7 @@ def test_cp2k_optimize(cif_name, cif_dir, tmpdir):
 
     test_file = cif_dir / f'{cif_name}.cif'
     record = MOFRecord.from_file(test_file)
-    record.md_trajectory['uff'] = [write_to_string(record.atoms, 'vasp')]
+    record.md_trajectory['uff'] = Trajectory.from_frames([(0, record.atoms)])
     atoms, cp2k_path = runner.run_optimization(record, steps=2, fmax=0.1)
     assert atoms.get_potential_energy() is not None
     assert cp2k_path.exists()
@@ -63,3 +69,56 @@ def test_cp2k_optimize(cif_name, cif_dir, tmpdir):
 
     charged_mof = compute_partial_charges(cp2k_path, threads=2)
     assert charged_mof.arrays["q"].shape[0] == charged_mof.arrays["positions"].shape[0]
+
+
+def test_starting_structure(cif_dir):
+    record = MOFRecord.from_file(cif_dir / 'hMOF-0.cif')
+    assert np.allclose(choose_starting_structure(record).positions, record.atoms.positions)
+
+    # Use the last frame of the longest MD trajectory
+    moved = record.atoms.copy()
+    moved.rattle(0.1)
+    record.md_trajectory['uff'] = Trajectory.from_frames([(0, record.atoms)])
+    record.md_trajectory['mace'] = Trajectory.from_frames([(0, record.atoms), (1000, moved)])
+    assert np.allclose(choose_starting_structure(record).positions, moved.positions)
+
+    # Fold frames of a supercell back into the unit cell
+    supercell = record.atoms * [2, 2, 2]
+    supercell.set_cell(supercell.cell * 1.01, scale_atoms=True)
+    record.md_trajectory['mace'] = Trajectory.from_frames([(0, record.atoms * [2, 2, 2]), (2000, supercell)])
+    folded = choose_starting_structure(record)
+    assert len(folded) == len(record.atoms)
+    assert (folded.numbers == record.atoms.numbers).all()
+    assert np.allclose(folded.cell, record.atoms.cell * 1.01)
+    assert np.allclose(folded.get_scaled_positions(), record.atoms.get_scaled_positions(), atol=1e-6)
+
+    # Use the assembled structure if the frame does not match the unit cell
+    record.md_trajectory['mace'] = Trajectory.from_frames([(3000, record.atoms[:-1])])
+    assert np.allclose(choose_starting_structure(record).positions, record.atoms.positions)
+
+    # Prefer the relaxed structure
+    record.times['relaxed'] = datetime.now()
+    assert np.allclose(choose_starting_structure(record).positions, record.atoms.positions)
+
+
+def test_wavefunction_restart(tmpdir):
+    runner = CP2KRunner(run_dir=Path(tmpdir), close_cp2k=True)
+
+    # Wavefunction from an earlier computation of the same MOF at the same level
+    previous = Path(tmpdir) / 'mof-single-default'
+    previous.mkdir()
+    (previous / 'cp2k-RESTART.wfn').write_text('wfn')
+    (Path(tmpdir) / 'other-single-default').mkdir()
+    previous_dirs = runner._previous_dirs('mof', 'default')
+    assert previous_dirs == [previous.absolute()]
+
+    assert runner._find_wavefunction(previous_dirs) == previous.absolute() / 'cp2k-RESTART.wfn'
+    assert runner._find_wavefunction([]) is None
+    gzip_file(previous / 'cp2k-RESTART.wfn')
+    assert runner._find_wavefunction(previous_dirs) == previous.absolute() / 'cp2k-RESTART.wfn.gz'
+
+    # Read and write wavefunctions only if requested
+    inp = runner._make_input('default')
+    assert 'SCF_GUESS RESTART' in inp and '&RESTART ON' in inp
+    runner.reuse_wavefunction = False
+    assert 'SCF_GUESS' not in runner._make_input('default')
@@ -0,0 +1,43 @@
+"""Test the features shared by all DFT runners"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from ase.build import bulk
+from ase.calculators.emt import EMT
+from ase.io import read
+
+from mofa.model import MOFRecord
+from mofa.simulation.dft.base import BaseDFTRunner
+from mofa.utils.conversions import write_to_string
+
+
+class EMTRunner(BaseDFTRunner):
+    """Runner which uses a fast calculator available with ASE"""
+
+    @contextmanager
+    def _make_calc(self, level, out_dir, previous_dirs=()):
+        yield EMT()
+
+
+def test_concurrent_runs(tmpdir):
+    runner = EMTRunner(run_dir=Path(tmpdir))
+    records = []
+    for size in range(1, 5):
+        atoms = bulk('Cu', 'fcc', a=3.7, cubic=True).repeat((size, 1, 1))
+        atoms.rattle(0.05, seed=size)
+        records.append(MOFRecord(name=f'cu-{size}', structure=write_to_string(atoms, 'vasp')))
+
+    # Run every computation on a separate thread
+    start_dir = Path.cwd()
+    with ThreadPoolExecutor(max_workers=len(records)) as executor:
+        results = list(executor.map(lambda r: runner.run_optimization(r, steps=4, fmax=0.01), records))
+    assert Path.cwd() == start_dir
+
+    # Make sure each computation wrote only to its own directory
+    for record, (atoms, out_dir) in zip(records, results):
+        assert out_dir == Path(tmpdir).absolute() / f'{record.name}-optimize-default'
+        assert len(atoms) == len(record.atoms)
+        assert len(read(out_dir / 'atoms.json')) == len(record.atoms)
+        assert all(len(frame) == len(record.atoms) for frame in read(out_dir / 'relax.traj', ':'))
+    assert not any(start_dir.glob('relax.*'))
@@ -35,3 +35,74 @@ def test_graspa_runner(adsorbate, temperature, pressure):
     assert isinstance(error_mol_kg, float)
     assert isinstance(uptake_g_L, float)
     assert isinstance(error_g_L, float)
+
+
+def test_input_builder(tmpdir):
+    """Make sure the input files are written from templates without altering them"""
+    from mofa.simulation.raspa.graspa import _file_dir, _input_builder
+
+    original = (_file_dir / 'simulation.input').read_text()
+    settings = dict(cycles=100, adsorbate='CO2', temperature=298.0, pressure=1e4, unit_cells='2 2 2', cutoff=12.8, framework='input')
+    for _ in range(2):  # Staging twice replaces the previous files
+        _input_builder.stage(Path(tmpdir), **settings)
+
+    written = (Path(tmpdir) / 'simulation.input').read_text()
+    assert not (Path(tmpdir) / 'simulation.input').is_symlink()
+    for placeholder in ['NCYCLE', 'ADSORBATE', 'TEMPERATURE', 'PRESSURE', 'UC_X', 'CUTOFF', '$']:
+        assert placeholder not in written
+    assert 'UnitCells 0 2 2 2\n' in written
+    assert 'FrameworkName input\n' in written
+    assert 'UseChargesFromCIFFile' in written
+    assert (Path(tmpdir) / 'CO2.def').is_symlink()
+    assert (_file_dir / 'simulation.input').read_text() == original
+
+
+def test_graspa_many(tmpdir):
+    """Run several conditions from the same setup"""
+    conditions = [("CO2", 298, 1e4), ("H2", 160, 5e5)]
+    if graspa_path is None:
+        # Each condition runs in a directory named after the adsorbate, temperature and pressure
+        graspa_command = ['sh', '-c', f'cp {_cache_dir.absolute()}/test_$(basename $PWD).log raspa.err']
+    else:
+        graspa_command = graspa_path
+    gr = gRASPARunner(raspa_command=graspa_command, run_dir=Path(tmpdir))
+
+    table = gr.run_gcmc_many('test', _file_path, conditions, cycles=100)
+    assert len(table) == 2
+    assert table[['adsorbate', 'temperature', 'pressure']].values.tolist() == [list(c) for c in conditions]
+    assert table['uptake_mol_kg'].dtype.kind == 'f'
+    run_dir = Path(tmpdir) / 'test_gcmc'
+    assert (run_dir / 'CO2_298_1.000000e+04' / 'input.cif').resolve() == (run_dir / 'input.cif').resolve()
+
+    # Results match running each condition separately
+    if graspa_path is None:
+        single = gRASPARunner(raspa_command=f"cp {_cache_dir.absolute()}/test_H2_160_5.000000e+05.log raspa.err".split(),
+                              run_dir=Path(tmpdir))
+        assert single.run_gcmc('test', _file_path, 'H2', 100, 160, 5e5)[0] == table['uptake_mol_kg'].iloc[1]
+
+
+def test_write_cif(tmpdir):
+    """Write the charged structure and share it between runs"""
+    from mofa.simulation.raspa.utils import get_cif_from_chargemol, write_cif, write_cif_once
+
+    atoms = get_cif_from_chargemol(_file_path)
+    write_cif(atoms, Path(tmpdir), 'input.cif')
+    lines = (Path(tmpdir) / 'input.cif').read_text().splitlines()
+    assert lines[0] == 'MOFA-input.cif'
+    atom_lines = lines[-len(atoms):]
+    assert atom_lines[0].startswith('O1 1.0 ') and atom_lines[0].endswith(' Biso 1.0 O -0.556032')
+    labels = [line.split()[0] for line in atom_lines]
+    assert labels.count('Zn1') == 1 and 'Zn2' in labels and 'Zn3' not in labels
+
+    # The same structure is only written once
+    first = write_cif_once(atoms, Path(tmpdir) / 'frameworks')
+    assert first.read_text() == (Path(tmpdir) / 'input.cif').read_text()
+    assert write_cif_once(atoms.copy(), Path(tmpdir) / 'frameworks') == first
+    atoms.info['_atom_site_charge'] = [-q for q in atoms.info['_atom_site_charge']]
+    assert write_cif_once(atoms, Path(tmpdir) / 'frameworks') != first
+
+    # Runners link the shared file into each run directory
+    gr = gRASPARunner(raspa_command=f"cp {_cache_dir.absolute()}/test_CO2_298_1.000000e+04.log raspa.err".split(),
+                      run_dir=Path(tmpdir) / 'runs', framework_dir=Path(tmpdir) / 'frameworks')
+    gr.run_gcmc('test', _file_path, 'CO2', 100, 298, 1e4)
+    assert (Path(tmpdir) / 'runs' / 'test_CO2_298_1.000000e+04' / 'input.cif').resolve() == first.resolve()
@@ -1,9 +1,17 @@
 from pathlib import Path
+from shutil import which
+import gzip
+import sys
 
+import numpy as np
+from ase.io import read
 from pytest import mark
 
 from mofa.model import MOFRecord
+from mofa.simulation.engine import LAMMPSEngine
 from mofa.simulation.lammps import LAMMPSRunner
+from mofa.simulation.thermo import StrainMonitor
+from mofa.simulation.cif2lammps.main_conversion import single_conversion
 
 
 @mark.parametrize('cif_name', ['hMOF-0', 'hMOF-5000000'])
@@ -35,3 +43,187 @@ def test_lammps_runner(cif_name, cif_dir, tmpdir):
     traj = lmprunner.run_molecular_dynamics(record, timesteps=200, report_frequency=100)
     assert len(traj) == 3
     assert not Path(lmp_path).exists()
+
+
+@mark.parametrize('cif_name', ['hMOF-0', 'hMOF-5000000'])
+def test_prep_matches_cif(cif_name, cif_dir, tmpdir):
+    """Make sure preparing inputs from the structure in memory matches converting a CIF"""
+    lmprunner = LAMMPSRunner(lmp_sims_root_path=tmpdir / "lmp_sims")
+
+    record = MOFRecord.from_file(cif_dir / f'{cif_name}.cif')
+    lmp_path = Path(lmprunner.prep_molecular_dynamics_single(record.name, record.atoms, timesteps=1000, report_frequency=100))
+    assert 'dump_modify         trajectAll element' in (lmp_path / 'in.lmp').read_text()
+
+    # Convert the same structure via a CIF file
+    cif_path = Path(tmpdir) / f'{cif_name}.cif'
+    record.atoms.write(cif_path, 'cif')
+    single_conversion(str(cif_path), outdir=str(tmpdir), replication='2x2x2', read_cifs_pymatgen=True)
+
+    # Skip the first line, which contains the creation time
+    expected = Path(tmpdir).joinpath(f'data.{cif_name}_2x2x2').read_text().split('\n')[1:]
+    assert (lmp_path / 'data.lmp').read_text().split('\n')[1:] == expected
+
+
+@mark.parametrize('cif_name', ['hMOF-0', 'hMOF-5000000'])
+def test_force_field_unchanged(cif_name, cif_dir, file_path, tmpdir):
+    """Make sure the data file matches one written before the force field enumeration was vectorized"""
+    lmprunner = LAMMPSRunner(lmp_sims_root_path=tmpdir / "lmp_sims")
+
+    record = MOFRecord.from_file(cif_dir / f'{cif_name}.cif')
+    lmp_path = Path(lmprunner.prep_molecular_dynamics_single(record.name, record.atoms, timesteps=1000, report_frequency=100))
+
+    with gzip.open(file_path / 'lammps' / f'{cif_name}.data.lmp.gz', 'rt') as fp:
+        expected = fp.read().split('\n')[1:]
+    assert (lmp_path / 'data.lmp').read_text().split('\n')[1:] == expected
+
+
+def test_continuation(cif_dir, tmpdir):
+    """Make sure continuing a run reuses the typing and skips minimization"""
+    lmprunner = LAMMPSRunner(lmp_sims_root_path=tmpdir / "lmp_sims")
+    record = MOFRecord.from_file(cif_dir / 'hMOF-0.cif')
+
+    # Make sure the typing is stored after the first preparation
+    lmp_path = Path(lmprunner.prep_molecular_dynamics_single(record.name, record.atoms, timesteps=1000, report_frequency=100))
+    assert (lmprunner.cache.mof_dir(record.atoms, 'UFF4MOF-2x2x2') / 'typing.pkl').is_file()
+    assert 'minimize' in (lmp_path / 'in.lmp').read_text()
+
+    # Continue from a perturbed version of the supercell
+    last_frame = read(lmp_path / 'data.lmp', format='lammps-data', atom_style='full', units='real')
+    last_frame.positions += 0.01
+    cont_path = Path(lmprunner.prep_molecular_dynamics_continuation(
+        'continue', record.atoms, last_frame, start_timestep=1000, timesteps=1000, report_frequency=100
+    ))
+    assert 'minimize' not in (cont_path / 'in.lmp').read_text()
+    new_frame = read(cont_path / 'data.lmp', format='lammps-data', atom_style='full', units='real')
+    assert np.allclose(new_frame.positions, last_frame.positions, atol=1e-4)
+
+    # Use the restart file if one is available
+    lmprunner.cache.save_restart(record.atoms, 'UFF4MOF-2x2x2', 1000, cont_path / 'data.lmp')
+    cont_path = Path(lmprunner.prep_molecular_dynamics_continuation(
+        'restart', record.atoms, last_frame, start_timestep=1000, timesteps=1000, report_frequency=100
+    ))
+    assert (cont_path / 'in.lmp').read_text().startswith('read_restart')
+    assert (cont_path / 'restart.lmp').is_file()
+    assert not (cont_path / 'data.lmp').exists()
+
+    # Only the latest restart file is kept, and all are removed once the MOF is finished
+    lmprunner.cache.save_restart(record.atoms, 'UFF4MOF-2x2x2', 2000, cont_path / 'restart.lmp')
+    mof_dir = lmprunner.cache.mof_dir(record.atoms, 'UFF4MOF-2x2x2')
+    assert sorted(p.name for p in mof_dir.glob('*.restart')) == ['md.2000.restart']
+    lmprunner.cache.remove(record.atoms, 'UFF4MOF-2x2x2')
+    assert not mof_dir.exists()
+
+
+def test_cell_only(cif_dir, tmpdir):
+    """Make sure the cell-only mode writes only the first and last frames"""
+    lmprunner = LAMMPSRunner(lmp_sims_root_path=tmpdir / "lmp_sims", cell_only=True)
+    record = MOFRecord.from_file(cif_dir / 'hMOF-0.cif')
+
+    lmp_path = Path(lmprunner.prep_molecular_dynamics_single(record.name, record.atoms, timesteps=1000, report_frequency=100))
+    in_text = (lmp_path / 'in.lmp').read_text()
+    assert 'dump                trajectAll' not in in_text
+    assert in_text.count('write_dump') == 2
+    assert in_text.index('write_dump') < in_text.index('run ') < in_text.index('append yes')
+
+
+@mark.skipif(which('lmp_serial') is None, reason='LAMMPS not found')
+def test_persistent_engine(cif_dir, tmpdir):
+    """Make sure several simulations run in the same LAMMPS process"""
+    lmprunner = LAMMPSRunner(
+        lammps_command=["lmp_serial"],
+        lmp_sims_root_path=tmpdir / "lmp_sims",
+        lammps_environ={'OMP_NUM_THREADS': '1'},
+        persistent=True,
+    )
+
+    pids = set()
+    for cif_name in ['hMOF-0', 'hMOF-5000000']:
+        record = MOFRecord.from_file(cif_dir / f'{cif_name}.cif')
+        traj = lmprunner.run_molecular_dynamics(record, timesteps=200, report_frequency=100)
+        assert len(traj) == 3
+        pids.add(lmprunner.engine._proc.pid)
+    assert len(pids) == 1
+
+    # A failed run is reported, then a new process is started
+    bad_path = Path(tmpdir) / 'bad-run'
+    bad_path.mkdir()
+    (bad_path / 'in.lmp').write_text('not_a_command\n')
+    assert lmprunner.invoke_lammps(bad_path).returncode != 0
+    assert not lmprunner.engine.running
+
+    record.md_trajectory[lmprunner.traj_name] = traj
+    traj = lmprunner.run_molecular_dynamics(record, timesteps=400, report_frequency=100)
+    assert len(traj) == 2
+    lmprunner.engine.close()
+
+
+_fake_lammps = """
+import os, sys
+log = open(sys.argv[1], 'a') if sys.argv[1] != '-log' else None
+for line in sys.stdin:
+    if log is not None:
+        print(line.strip(), file=log, flush=True)
+    if line.startswith('shell cd'):
+        os.chdir(line.split('"')[1])
+    elif line.startswith('include'):
+        text = open(line.split()[1]).read()
+        print(f'message from {text}', file=sys.stderr, flush=True)
+        if 'fail' in text:
+            sys.exit(1)
+    elif line.startswith('print "done"'):
+        open(line.split('"')[3], 'w').close()
+"""
+
+
+def test_engine_errors(tmpdir):
+    """Make sure the error log of a failed run holds only its own output"""
+    engine = LAMMPSEngine([sys.executable, '-c', _fake_lammps])
+    for name in ['first', 'second', 'fail']:
+        run_dir = Path(tmpdir) / name
+        run_dir.mkdir()
+        (run_dir / 'in.lmp').write_text(name)
+        result = engine.run(run_dir)
+    assert result.returncode == 1
+    assert (run_dir / 'stderr.lmp').read_text() == 'message from fail\n'
+    assert not engine.running
+    engine.close()
+
+
+def test_engine_setup(tmpdir):
+    """Make sure the setup runs again only when it changes"""
+    log_path = Path(tmpdir) / 'commands.txt'
+    engine = LAMMPSEngine([sys.executable, '-c', _fake_lammps, str(log_path)])
+    for name, setup in [('first', 'model-a'), ('second', 'model-a'), ('third', 'model-b')]:
+        run_dir = Path(tmpdir) / name
+        run_dir.mkdir()
+        (run_dir / 'in.lmp').write_text(name)
+        (run_dir / 'setup.lmp').write_text(setup)
+        assert engine.run(run_dir, setup_file='setup.lmp').returncode == 0
+    commands = log_path.read_text().splitlines()
+    assert commands.count('clear') == 2
+    assert commands.count('include setup.lmp') == 2
+    assert commands.count('include in.lmp') == 3
+
+    # Runs without a setup clear the state, and the next setup runs again
+    assert engine.run(run_dir).returncode == 0
+    assert engine.run(run_dir, setup_file='setup.lmp').returncode == 0
+    commands = log_path.read_text().splitlines()
+    assert commands.count('clear') == 4
+    assert commands.count('include setup.lmp') == 3
+    engine.close()
+
+
+@mark.skipif(which('lmp_serial') is None, reason='LAMMPS not found')
+def test_early_stop(cif_dir, tmpdir):
+    """Make sure MD ends once the strain exceeds the limit"""
+    lmprunner = LAMMPSRunner(
+        lammps_command=["lmp_serial"],
+        lmp_sims_root_path=tmpdir / "lmp_sims",
+        lammps_environ={'OMP_NUM_THREADS': '1'},
+        strain_monitor=StrainMonitor(max_strain=-1),
+    )
+
+    record = MOFRecord.from_file(cif_dir / 'hMOF-0.cif')
+    traj = lmprunner.run_molecular_dynamics(record, timesteps=10000, report_frequency=100)
+    assert traj.stop_reason == 'unstable'
+    assert traj.timesteps[-1] < 10000
@@ -1,11 +1,17 @@
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from time import sleep
 
+from types import SimpleNamespace
+
+import torch
 from pytest import mark
 from mofa.model import MOFRecord
-from mofa.simulation.mace import MACERunner
-from mofa.utils.conversions import write_to_string
+from mofa.scoring.geometry import PoreGeometry
+from mofa.simulation.mace import MACERunner, ModelPool, _change_box_args
+from mofa.utils.trajectory import Trajectory
 
 IN_GITHUB_ACTIONS = os.getenv("GITHUB_ACTIONS") == "true"
 
@@ -17,12 +23,14 @@ _my_path = Path(__file__).parent
 @mark.parametrize("cif_name", ["hMOF-0"])
 def test_mace_single(cif_name, cif_dir, tmpdir):
     # Make a MACE simulator that reads and writes to a temporary directory
-    runner = MACERunner()
+    timings = []
+    runner = MACERunner(timing_hooks=[lambda *x: timings.append(x)])
 
     test_file = cif_dir / f"{cif_name}.cif"
     record = MOFRecord.from_file(test_file)
-    record.md_trajectory["uff"] = [(0, write_to_string(record.atoms, "vasp"))]
+    record.md_trajectory["uff"] = Trajectory.from_frames([(0, record.atoms)])
     atoms, mace_path = runner.run_single_point(record, structure_source=("uff", -1))
+    assert {'compute', 'io'}.issubset(stage for _, stage, _ in timings)
 
     # Check that the computation completed and produced expected outputs
     assert mace_path.exists()
@@ -37,15 +45,16 @@ def test_mace_optimize(cif_name, cif_dir, tmpdir):
     shutil.rmtree("mace-runs", ignore_errors=True)
 
     # Make a MACE simulator that reads and writes to a temporary directory
-    runner = MACERunner()
+    runner = MACERunner(pore_geometry=PoreGeometry(grid_spacing=0.5))
 
     test_file = cif_dir / f"{cif_name}.cif"
     record = MOFRecord.from_file(test_file)
-    record.md_trajectory["uff"] = [(0, write_to_string(record.atoms, "vasp"))]
+    record.md_trajectory["uff"] = Trajectory.from_frames([(0, record.atoms)])
     atoms, mace_path = runner.run_optimization(record, steps=2, fmax=0.1)
 
     # Check that optimization produced expected changes and outputs
     assert atoms != record.atoms
+    assert 'pld' in atoms.info['pore_geometry']
     assert mace_path.exists()
     assert mace_path.is_absolute()
     assert "optimize" in mace_path.name
@@ -54,6 +63,73 @@ def test_mace_optimize(cif_name, cif_dir, tmpdir):
     assert (mace_path / "relax.log").exists()
 
 
+def test_describe_pores(cif_dir):
+    runner = MACERunner(pore_geometry=PoreGeometry(grid_spacing=0.5))
+    record = MOFRecord.from_file(cif_dir / "hMOF-0.cif")
+    atoms = record.atoms.copy()
+    runner._describe_pores(record.name, atoms)
+    assert atoms.info['pore_geometry'] == PoreGeometry(grid_spacing=0.5).describe(record.atoms)
+
+    # Nothing is stored if no tool is provided
+    atoms = record.atoms.copy()
+    MACERunner()._describe_pores(record.name, atoms)
+    assert 'pore_geometry' not in atoms.info
+
+
+def test_model_pool():
+    def _loader(level):
+        return SimpleNamespace(models=[torch.nn.Linear(100, 100)], device=None)  # 40400 bytes
+
+    timings = []
+    pool = ModelPool('cpu', memory_budget=1e-4, loader=_loader)
+    calc = pool.get('a', timer=lambda *x: timings.append(x))
+    assert [stage for stage, _ in timings] == ['load', 'transfer']
+    assert pool.memory_used == 40400
+    assert pool.get('a') is calc
+
+    # Adding two more evicts the least-recently used
+    pool.get('b')
+    pool.get('a')
+    pool.get('c')
+    assert pool.levels == ['a', 'c']
+
+    # Without a budget, everything is kept
+    pool.memory_budget = None
+    pool.get('b')
+    assert pool.levels == ['a', 'c', 'b']
+
+
+def test_model_pool_threads():
+    loaded = []
+
+    def _loader(level):
+        loaded.append(level)
+        sleep(0.1)
+        return SimpleNamespace(models=[torch.nn.Linear(10, 10)], device=None)
+
+    # Load the model only once, even when requested by several threads at the same time
+    pool = ModelPool('cpu', loader=_loader)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        calcs = list(executor.map(lambda _: pool.get('a'), range(4)))
+    assert loaded == ['a']
+    assert all(c is calcs[0] for c in calcs)
+
+
+@mark.skipif(IN_GITHUB_ACTIONS, reason="Too expensive for CI")
+def test_mace_optimize_many(cif_dir):
+    runner = MACERunner(run_dir=Path("mace-runs"))
+
+    records = [MOFRecord.from_file(cif_dir / f"{name}.cif") for name in ["hMOF-0", "hMOF-5000000"]]
+    outputs = runner.run_optimization_many(records, steps=2, fmax=0.1)
+    assert len(outputs) == 2
+    for record, (atoms, mace_path) in zip(records, outputs):
+        assert len(atoms) == len(record.atoms)
+        assert atoms.calc is None
+        assert record.name in mace_path.name
+        assert (mace_path / "relax.traj").exists()
+        assert (mace_path / "atoms.extxyz").exists()
+
+
 @mark.parametrize("level", ["default"])
 def test_mace_options(level, cif_dir):
     """Test that different MACE options work"""
@@ -66,9 +142,44 @@ def test_mace_options(level, cif_dir):
     assert not mace_path.exists()
 
 
+def test_engine_inputs(cif_dir, tmpdir):
+    """Make sure MOFs with different elements share the setup of the persistent LAMMPS process"""
+    runner = MACERunner(run_dir=Path(tmpdir), model_path=Path('model.pt'), persistent_lammps=True)
+
+    setups = set()
+    for cif_name in ['hMOF-0', 'hMOF-5000000']:
+        atoms = MOFRecord.from_file(cif_dir / f'{cif_name}.cif').atoms
+        elements = sorted(set(atoms.get_chemical_symbols()))
+        out_dir = Path(tmpdir) / cif_name
+        out_dir.mkdir()
+        runner._write_engine_inputs(out_dir, atoms, elements, 100, 1000, 100, None)
+        setups.add((out_dir / 'setup.lammps').read_text())
+
+        # The input replaces the atoms and box, then assigns elements to each type
+        in_text = (out_dir / 'in.lammps').read_text()
+        assert 'minimize' in in_text
+        assert f'pair_coeff * * {" ".join(elements)}' in in_text
+        assert f'change_box          all {_change_box_args(out_dir / "data.lmp")} units box' in in_text
+
+        # Continuations read the data file written at the end of the previous segment
+        restart_dir = out_dir / 'restart'
+        restart_dir.mkdir()
+        runner._write_engine_inputs(restart_dir, atoms, elements, 100, 1000, 100, out_dir / 'data.lmp')
+        assert 'minimize' not in (restart_dir / 'in.lammps').read_text()
+        assert (restart_dir / 'data.lmp').read_text() == (out_dir / 'data.lmp').read_text()
+    assert len(setups) == 1
+
+    # Read the box from a data file written by LAMMPS
+    data_path = Path(tmpdir) / 'written.data'
+    data_path.write_text('LAMMPS data file via write_data\n\n8 atom types\n0 10 xlo xhi\n0 11 ylo yhi\n0 12 zlo zhi\n'
+                         '1 0 0 xy xz yz\n\nMasses\n\n1 12.011\n')
+    assert _change_box_args(data_path) == 'x final 0 10 y final 0 11 z final 0 12 xy final 1 xz final 0 yz final 0'
+
+
 @mark.skipif(IN_GITHUB_ACTIONS, reason="Too expensive for CI")
 @mark.skipif(not _has_lammps, reason="LAMMPS not found")
-def test_mace_md(cif_dir):
+@mark.parametrize('persistent', [False, True])
+def test_mace_md(cif_dir, persistent):
     test_file = cif_dir / "hMOF-0.cif"
     record = MOFRecord.from_file(test_file)
 
@@ -77,7 +188,8 @@ def test_mace_md(cif_dir):
     runner = MACERunner(
         lammps_cmd=f"{lmp_path} -k on g 1 -sf kk -pk kokkos newton on neigh half".split(),
         model_path=model_path,
-        delete_finished=False
+        delete_finished=False,
+        persistent_lammps=persistent
     )
     output = runner.run_molecular_dynamics(
         mof=record,
@@ -85,9 +197,7 @@ def test_mace_md(cif_dir):
         report_frequency=2
     )
     assert len(output) == 3
-    record.md_trajectory[runner.traj_name] = [
-        (f, write_to_string(a, 'vasp')) for f, a in output
-    ]
+    record.md_trajectory[runner.traj_name] = output
 
     # Continuation
     output = runner.run_molecular_dynamics(
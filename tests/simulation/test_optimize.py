@@ -0,0 +1,49 @@
+import numpy as np
+from ase.build import bulk
+from ase.calculators.emt import EMT
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.filters import UnitCellFilter
+from ase.optimize import FIRE
+
+from mofa.simulation.optimize import BatchFIRE
+
+
+def _make_structure(seed: int):
+    atoms = bulk('Cu', cubic=True) * ([2 + seed % 2] * 3)
+    atoms.rattle(0.1, seed=seed)
+    atoms.set_cell(atoms.cell * (1.02 + 0.01 * seed), scale_atoms=True)
+    return atoms
+
+
+def _evaluate(atoms_list):
+    for atoms in atoms_list:
+        calc = EMT()
+        calc.calculate(atoms, ['energy', 'forces', 'stress'])
+        atoms.calc = SinglePointCalculator(atoms, energy=calc.results['energy'], free_energy=calc.results['energy'],
+                                           forces=calc.results['forces'], stress=calc.results['stress'])
+
+
+def test_matches_ase():
+    # Run each structure separately with ASE
+    expected = []
+    for seed in range(3):
+        atoms = _make_structure(seed)
+        atoms.calc = EMT()
+        FIRE(UnitCellFilter(atoms), logfile=None).run(fmax=0.05, steps=40)
+        expected.append(atoms)
+
+    # Run them together
+    batch = [_make_structure(seed) for seed in range(3)]
+    opt = BatchFIRE([UnitCellFilter(atoms) for atoms in batch], _evaluate)
+    converged = opt.run(fmax=0.05, steps=40)
+    assert converged.shape == (3,)
+    for atoms, ref in zip(batch, expected):
+        assert np.allclose(atoms.positions, ref.positions)
+        assert np.allclose(atoms.cell, ref.cell)
+
+    # Structures stop once converged
+    batch = [_make_structure(0), _make_structure(0)]
+    batch[1].rattle(0.2, seed=1)
+    opt = BatchFIRE(batch, _evaluate)
+    assert opt.run(fmax=0.1, steps=200).all()
+    assert opt.nsteps[0] != opt.nsteps[1]
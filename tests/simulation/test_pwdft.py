@@ -5,7 +5,7 @@ from shutil import which
 from pytest import mark
 from mofa.model import MOFRecord
 from mofa.simulation.dft.pwdft import PWDFTRunner
-from mofa.utils.conversions import write_to_string
+from mofa.utils.trajectory import Trajectory
 
 IN_GITHUB_ACTIONS = os.getenv("GITHUB_ACTIONS") == "true"
 
@@ -24,7 +24,7 @@ def test_pwdft_single(cif_name, cif_dir, tmpdir):
 
     test_file = cif_dir / f"{cif_name}.cif"
     record = MOFRecord.from_file(test_file)
-    record.md_trajectory["uff"] = [write_to_string(record.atoms, "vasp")]
+    record.md_trajectory["uff"] = Trajectory.from_frames([(0, record.atoms)])
     atoms, pwdft_path = runner.run_single_point(record, structure_source=("uff", -1))
 
     # Check that the computation completed and produced expected outputs
@@ -46,7 +46,7 @@ def test_pwdft_optimize(cif_name, cif_dir, tmpdir):
 
     test_file = cif_dir / f"{cif_name}.cif"
     record = MOFRecord.from_file(test_file)
-    record.md_trajectory["uff"] = [write_to_string(record.atoms, "vasp")]
+    record.md_trajectory["uff"] = Trajectory.from_frames([(0, record.atoms)])
     atoms, pwdft_path = runner.run_optimization(record, steps=2, fmax=0.1)
 
     # Check that optimization produced expected changes and outputs
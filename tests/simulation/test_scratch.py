@@ -0,0 +1,108 @@
+"""Test the manager for run directories"""
+from pathlib import Path
+import pickle
+
+from mofa.simulation.scratch import ScratchManager, capture_files, directory_size, gunzip_file, gzip_file, gzip_in_background
+
+
+def test_make_dir(tmpdir):
+    tmpdir = Path(tmpdir)
+    scratch = ScratchManager(tmpdir / 'fast', fallback=tmpdir / 'slow', quota=1e-6)  # 1 kB
+
+    # Fill the fast directory past its quota
+    first = scratch.make_dir('first')
+    assert first.is_absolute() and first.parent.name == 'fast'
+    (first / 'data.bin').write_bytes(b'0' * 2048)
+    assert directory_size(tmpdir / 'fast') == 2048
+    assert not scratch.has_room()
+
+    # New directories go to the fallback, existing ones are reused
+    assert scratch.make_dir('second').parent.name == 'slow'
+    assert scratch.make_dir('first') == first
+    assert scratch.make_dir('second').parent.name == 'slow'
+
+    # The size is measured again only after the interval
+    (first / 'data.bin').unlink()
+    assert not scratch.has_room()
+    scratch.measure_interval = 0
+    assert scratch.has_room()
+
+    # Without a fallback, the fast directory is always used
+    scratch.fallback = None
+    assert scratch.make_dir('third').parent.name == 'fast'
+
+
+def test_link_files(tmpdir):
+    tmpdir = Path(tmpdir)
+    template = tmpdir / 'template'
+    template.mkdir()
+    (template / 'force_field.def').write_text('ff')
+    (template / 'simulation.input').write_text('NCYCLE')
+
+    run_dir = tmpdir / 'run'
+    run_dir.mkdir()
+    ScratchManager.link_files(template, run_dir, copy=['simulation.input'])
+    assert (run_dir / 'force_field.def').is_symlink()
+    assert (run_dir / 'force_field.def').read_text() == 'ff'
+    assert not (run_dir / 'simulation.input').is_symlink()
+    assert directory_size(run_dir) == len('NCYCLE')
+
+    # Linking again replaces the old files
+    ScratchManager.link_files(template, run_dir)
+    assert (run_dir / 'simulation.input').is_symlink()
+
+
+def test_capture_files(tmpdir):
+    tmpdir = Path(tmpdir)
+    run_dir = tmpdir / 'shared'
+    run_dir.mkdir()
+    for name in ['density.cube', 'cp2k.out', 'cp2k-RESTART.wfn', 'cp2k-1.restart']:
+        (run_dir / name).write_text(name)
+
+    out_dir = tmpdir / 'mof'
+    out_dir.mkdir()
+    captured = capture_files(run_dir, out_dir, move=['*.cube', '*.wfn'], copy=['cp2k.out'])
+    assert sorted(p.name for p in captured) == ['cp2k-RESTART.wfn', 'cp2k.out', 'density.cube']
+    assert sorted(p.name for p in run_dir.iterdir()) == ['cp2k-1.restart', 'cp2k.out']
+    assert (out_dir / 'density.cube').read_text() == 'density.cube'
+
+    # Nothing to do if the computation ran in the output directory
+    assert capture_files(out_dir, out_dir, move=['*']) == []
+
+
+def test_gzip(tmpdir):
+    path = Path(tmpdir) / 'density.cube'
+    path.write_text('0.0 ' * 1000)
+    gz_path = gzip_file(path)
+    assert not path.exists()
+    assert gz_path.name == 'density.cube.gz'
+    assert gz_path.stat().st_size < 4000
+
+    gunzip_file(gz_path, path)
+    assert path.read_text() == '0.0 ' * 1000
+
+    future, = gzip_in_background([path])
+    assert future.result() == gz_path
+    assert not path.exists()
+
+
+def test_release(tmpdir):
+    scratch = ScratchManager(Path(tmpdir) / 'fast')
+    run_dir = scratch.make_dir('run')
+    (run_dir / 'subdir').mkdir()
+    (run_dir / 'subdir' / 'file').write_text('data')
+
+    # The directory disappears immediately, and its contents are removed in the background
+    scratch.release(run_dir)
+    assert not run_dir.exists()
+    assert scratch.make_dir('run') == run_dir
+    scratch.wait()
+    assert [p.name for p in run_dir.parent.iterdir()] == ['run']
+    scratch.release(Path(tmpdir) / 'missing')
+
+    # Copies start their own cleanup thread
+    copied = pickle.loads(pickle.dumps(scratch))
+    assert copied._executor is None
+    copied.release(run_dir)
+    copied.wait()
+    assert not any(run_dir.parent.iterdir())
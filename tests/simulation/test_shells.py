@@ -0,0 +1,94 @@
+"""Test the pool of long-lived processes"""
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, PIPE
+from threading import Lock
+from time import sleep
+
+from pytest import raises
+
+from mofa.simulation.dft.shells import ShellPool
+
+
+def _launch():
+    return Popen(['cat'], stdin=PIPE, stdout=PIPE)
+
+
+def _close(proc: Popen):
+    proc.kill()
+    proc.wait()
+
+
+def _make_pool(**kwargs) -> ShellPool[Popen]:
+    return ShellPool(is_alive=lambda p: p.poll() is None, close=_close, **kwargs)
+
+
+def test_reuse():
+    pool = _make_pool(max_shells=1)
+    with pool.acquire('a', _launch) as first:
+        assert first.poll() is None
+    with pool.acquire('a', _launch) as second:
+        assert second is first
+
+    # Replace the idle shell when the settings differ
+    with pool.acquire('b', _launch) as third:
+        assert third is not first
+    assert first.poll() is not None
+    assert [s.key for s in pool.shells] == ['b']
+    pool.close_all()
+    assert pool.shells == [] and third.poll() is not None
+
+
+def test_recovery():
+    pool = _make_pool(max_shells=1)
+
+    # Close the shell if the computation fails
+    with raises(ValueError):
+        with pool.acquire('a', _launch) as first:
+            raise ValueError()
+    assert first.poll() is not None
+    assert pool.shells == []
+
+    # Replace shells which die while idle or during a computation
+    with pool.acquire('a', _launch) as second:
+        pass
+    second.kill()
+    second.wait()
+    with pool.acquire('a', _launch) as third:
+        assert third is not second
+        third.kill()
+        third.wait()
+    assert pool.shells == []
+
+    # Close shells which are idle for too long
+    pool.idle_timeout = 0.01
+    with pool.acquire('a', _launch) as fourth:
+        pass
+    sleep(0.05)
+    with pool.acquire('a', _launch) as fifth:
+        assert fifth is not fourth
+    assert fourth.poll() is not None
+
+
+def test_threads():
+    pool = _make_pool(max_shells=2)
+    lock = Lock()
+    in_use = set()
+    most_in_use = 0
+
+    def _task(i):
+        nonlocal most_in_use
+        with pool.acquire('a', _launch) as proc:
+            with lock:
+                assert proc.pid not in in_use  # Never shared between running tasks
+                in_use.add(proc.pid)
+                most_in_use = max(most_in_use, len(in_use))
+            sleep(0.02)
+            with lock:
+                in_use.remove(proc.pid)
+        return proc.pid
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        pids = set(executor.map(_task, range(16)))
+    assert most_in_use == 2
+    assert len(pids) == 2  # Shells are reused
+    pool.close_all()
@@ -0,0 +1,133 @@
+"""Test reading and monitoring the thermodynamic output of LAMMPS"""
+from pathlib import Path
+import sys
+
+import numpy as np
+from ase.geometry import cellpar_to_cell
+from pytest import fixture
+
+from mofa.simulation.engine import run_with_callback
+from mofa.simulation.thermo import (StrainMonitor, StrainWatch, dump_commands, md_finished, md_start_commands, md_start_marker,
+                                    read_thermo, thermo_strain)
+from mofa.utils.trajectory import CellSeries, Trajectory
+
+_header = 'Step CPU Dt Time Temp Press PotEng KinEng TotEng Density Xlo Ylo Zlo Cella Cellb Cellc CellAlpha CellBeta CellGamma'
+
+
+def write_log(path: Path, lengths: list[float], partial: bool = False):
+    """Write a LAMMPS log with a minimization followed by MD where the cell length changes"""
+    with path.open('w') as fp:
+        print(_header, file=fp)
+        print('0 0 0.5 0 0 0 -10 0 -10 1.0 0 0 0 9 9 9 90 90 90', file=fp)
+        print('Loop time of 1 on 1 procs for 10 steps with 8 atoms', file=fp)
+        print(f'print "{md_start_marker}"', file=fp)  # Echo of the command
+        print(md_start_marker, file=fp)
+        print(_header, file=fp)
+        for i, length in enumerate(lengths):
+            print(f'{i * 100} 0 0.5 0 300 0 -10 1 -9 1.0 0 0 0 {length} 10 10 90 90 90', file=fp)
+            if i == 0:
+                print('WARNING: Something harmless', file=fp)
+        if partial:
+            fp.write(f'{len(lengths) * 100} 0 0.5')
+        else:
+            print('Loop time of 1 on 1 procs for 100 steps with 8 atoms', file=fp)
+
+
+@fixture()
+def log_path(tmpdir) -> Path:
+    path = Path(tmpdir) / 'stdout.lmp'
+    write_log(path, [10., 10.5, 11., 11., 11.])
+    return path
+
+
+def test_commands():
+    assert md_start_marker in md_start_commands()
+    assert 'halt' not in md_start_commands()
+    assert 'fix                 halt' in md_start_commands(early_stop=True)
+
+    start, end = dump_commands('id x y z', 'C H')
+    assert start.startswith('dump ') and '${Nevery}' in start
+    assert end.startswith('undump')
+    start, end = dump_commands('id x y z', 'C H', cell_only=True)
+    assert start.startswith('write_dump') and start.rstrip().endswith('element C H')
+    assert end.rstrip().endswith('append yes')
+
+
+def test_read(log_path, tmpdir):
+    thermo = read_thermo(log_path)
+    assert thermo['step'].tolist() == [0, 100, 200, 300, 400]
+    assert thermo['step'].dtype == np.int64
+    assert np.allclose(thermo['cella'], [10., 10.5, 11., 11., 11.])
+    assert np.allclose(thermo['temp'], 300)
+
+    series = CellSeries.from_thermo(thermo)
+    assert series.timesteps.tolist() == [0, 100, 200, 300, 400]
+    assert np.allclose(series.cells[-1], np.diag([11., 10., 10.]))
+
+    # Skip incomplete lines and logs where MD has not started
+    write_log(log_path, [10., 10.5], partial=True)
+    assert read_thermo(log_path)['step'].tolist() == [0, 100]
+    log_path.write_text(f'{_header}\n0 0 0.5 0 0 0 -10 0 -10 1.0 0 0 0 9 9 9 90 90 90\n')
+    assert read_thermo(log_path) == {}
+
+
+def test_strain(log_path):
+    thermo = read_thermo(log_path)
+    strains = thermo_strain(thermo)
+    assert np.isclose(strains[0], 0)
+    assert np.allclose(strains[2:], 1 - 10 / 11)
+
+    # Use a reference cell in a different orientation
+    reference = cellpar_to_cell([10, 10, 10, 90, 90, 90], ab_normal=(1, 0, 0), a_direction=(0, 1, 0))
+    assert np.allclose(thermo_strain(thermo, reference), strains)
+
+
+def test_monitor():
+    monitor = StrainMonitor(max_strain=0.1, plateau_window=3, plateau_tolerance=0.01, min_timesteps=300)
+    steps = np.arange(5) * 100
+    assert monitor.check(steps[:0], np.zeros((0,))) is None
+    assert monitor.check(steps, np.array([0., 0.05, 0.08, 0.12, 0.15])) == 'unstable'
+    assert monitor.check(steps, np.array([0., 0.05, 0.05, 0.051, 0.052])) == 'plateau'
+    assert monitor.check(steps, np.array([0., 0.02, 0.04, 0.06, 0.08])) is None
+    assert monitor.check(steps[:3], np.array([0., 0., 0.])) is None  # Too few steps
+    assert monitor.check(steps[:3] + 100, np.array([0., 0., 0.])) == 'plateau'
+
+
+def test_finished():
+    traj = Trajectory(symbols=['H'], timesteps=[1000, 2000], positions=np.zeros((2, 1, 3)),
+                      cells=[np.eye(3) * 10, np.eye(3) * 11])
+    assert not md_finished(traj)
+    assert md_finished(traj, maximum_steps=2000)
+    assert not md_finished(traj, maximum_steps=3000, max_strain=0.2)
+    assert md_finished(traj, max_strain=0.05)
+    assert not md_finished(traj, reference_cell=np.eye(3) * 10.8, max_strain=0.05)  # Strain is measured from the start of the first run
+
+    traj.stop_reason = 'plateau'
+    assert md_finished(traj)
+
+
+def test_watch(log_path):
+    # Start with only part of the run
+    write_log(log_path, [10., 10.5])
+    watch = StrainWatch(StrainMonitor(max_strain=0.25, plateau_window=3), log_path.parent)
+    assert not watch()
+    assert not watch.stop_path.exists()
+
+    # Stop once the strain plateaus
+    write_log(log_path, [10., 10.5, 11., 11., 11.])
+    assert watch()
+    assert watch.reason == 'plateau'
+    assert watch.stop_path.is_file()
+
+    # Stop if unstable relative to the start of a previous segment
+    watch = StrainWatch(StrainMonitor(max_strain=0.05), log_path.parent, reference_cell=np.diag([8., 10., 10.]))
+    assert not watch.stop_path.exists()
+    assert watch()
+    assert watch.reason == 'unstable'
+
+
+def test_run_with_callback(tmpdir):
+    calls = []
+    proc = run_with_callback([sys.executable, '-c', 'import time; time.sleep(0.5)'], lambda: calls.append(1), poll_interval=0.05)
+    assert proc.returncode == 0
+    assert len(calls) > 1
@@ -1,10 +1,11 @@
 from pathlib import Path
 from io import StringIO
 
-from pytest import mark
+import numpy as np
+from pytest import mark, raises
 from ase.io import read
 
-from mofa.assembly.assemble import assemble_pillaredPaddleWheel_pcuMOF, assemble_mof, assemble_many
+from mofa.assembly.assemble import assemble_pillaredPaddleWheel_pcuMOF, assemble_mof, assemble_many, find_recipe, rotations_to_align
 from mofa.model import NodeDescription, LigandDescription
 
 _files_dir = Path(__file__).parent / 'files' / 'assemble'
@@ -28,7 +29,8 @@ def test_paddlewheel_pcu():
     ('zinc_paddle_pillar', 'pcu', {
         'COO': 2,
         'cyano': 1
-    })
+    }),
+    ('zinc_tetra', 'pcu', {'COO': 3}),
 ])
 def test_assemble(node_name, topology, ligand_counts, file_path):
     """Test the full integration
@@ -62,3 +64,38 @@ def test_assemble(node_name, topology, ligand_counts, file_path):
     # Test making many assemblies
     records = assemble_many(ligands, [node], 4, 1)
     assert len(records) == 4
+
+
+def test_rotations():
+    vec1 = np.array([[1., 0., 0.], [0., 1., 0.], [0., 0., 2.], [1., 1., 0.]])
+    vec2 = np.array([[0., 1., 0.], [0., 3., 0.], [0., 0., -1.], [-1., 1., 1.]])
+    rotations = rotations_to_align(vec1, vec2)
+
+    # Make sure they are rotations that align the vectors
+    assert np.allclose(np.linalg.det(rotations), 1)
+    rotated = np.einsum('nij,nj->ni', rotations, vec1)
+    assert np.allclose(rotated / np.linalg.norm(rotated, axis=1, keepdims=True),
+                       vec2 / np.linalg.norm(vec2, axis=1, keepdims=True))
+
+
+def test_many_nodes(file_path):
+    """Make sure we can assemble from several types of nodes in one call"""
+
+    nodes = [NodeDescription(smiles='NA', xyz=(_files_dir / f'nodes/{name}.xyz').read_text())
+             for name in ['zinc_paddle_pillar', 'zinc_tetra']]
+    assert find_recipe(nodes[0], 'pcu').requirements == {'cyano': 1, 'COO': 2}
+    assert find_recipe(nodes[1], 'pcu').requirements == {'COO': 3}
+    with raises(NotImplementedError):
+        find_recipe(nodes[0], 'dia')
+
+    ligands = dict(
+        (name, [LigandDescription.from_yaml(file_path / 'difflinker' / 'templates' / f'description_{name}.yml')])
+        for name in ['COO', 'cyano']
+    )
+    records = assemble_many(ligands, nodes, 8, 1)
+    assert len(records) == 8
+    assert all(r.topology == 'pcu' for r in records)
+
+    # Only the tetramer is possible without pillars
+    records = assemble_many({'COO': ligands['COO']}, nodes, 2, 1)
+    assert all(len(r.ligands) == 3 for r in records)
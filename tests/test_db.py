@@ -1,5 +1,10 @@
-from mofa.db import create_records, get_records, update_records, count_records, get_all_records
+import numpy as np
+
+from mofa.db import create_records, get_records, update_records, count_records, get_all_records, migrate_trajectories
 from mofa.model import MOFRecord
+from mofa.selection.md import MDSelector
+from mofa.utils.conversions import write_to_string
+from mofa.utils.trajectory import Trajectory
 
 
 def test_initialize(coll):
@@ -27,6 +32,36 @@ def test_update(coll, example_record):
     assert copies[0].gas_storage['co2'] == [1., 1.]
 
 
+def test_trajectory(coll, example_record):
+    example_record.md_trajectory['uff'] = Trajectory.from_frames([(0, example_record.atoms), (1000, example_record.atoms)])
+    create_records(coll, [example_record])
+
+    copy = get_records(coll, [example_record.name])[0]
+    traj = copy.md_trajectory['uff']
+    assert isinstance(traj, Trajectory)
+    assert traj.timesteps.tolist() == [0, 1000]
+    assert np.array_equal(traj.positions, example_record.md_trajectory['uff'].positions)
+
+
+def test_migrate_trajectories(coll, example_record):
+    # Store a trajectory as a list of timestep and POSCAR pairs, as done before trajectories were stored as arrays
+    poscar = write_to_string(example_record.atoms, 'vasp')
+    for name, last_step in [('finished', 20000), ('running', 1000)]:
+        document = example_record.to_dict()
+        document.update(name=name, md_trajectory={'uff': [[0, poscar], [last_step, poscar]]}, structure_stability={'uff': 0.01})
+        coll.insert_one(document)
+    assert migrate_trajectories(coll) == 2
+    assert migrate_trajectories(coll) == 0
+
+    # Only the MOF which has not reached the maximum steps is available for MD
+    selector = MDSelector(collection=coll, md_level='uff', maximum_steps=10000)
+    assert [row['name'] for row in coll.aggregate(selector.match_stages)] == ['running']
+
+    traj = get_records(coll, ['finished'])[0].md_trajectory['uff']
+    assert traj.timesteps.tolist() == [0, 20000]
+    assert np.allclose(traj.positions[0], example_record.atoms.positions, atol=1e-4)
+
+
 def test_get_all(coll):
     create_records(coll, [MOFRecord(name=str(x)) for x in range(5)])
     assert len(list(get_all_records(coll))) == 5
@@ -30,6 +30,16 @@ def test_name(example_cif):
     assert mof_3.name != mof_4.name
 
 
+def test_isotherms():
+    table = pd.DataFrame([('CO2', 298, 1e5, 2.), ('CO2', 298, 1e4, 1.), ('H2', 160, 1e4, 0.5)],
+                         columns=['adsorbate', 'temperature', 'pressure', 'uptake_mol_kg'])
+    mof = MOFRecord()
+    mof.add_isotherms(table)
+    assert mof.gas_storage['CO2_298K'] == [(1e4, 1.), (1e5, 2.)]
+    assert mof.gas_storage['H2_160K'] == [(1e4, 0.5)]
+    assert mof.to_dict()['gas_storage']['H2_160K'] == [(1e4, 0.5)]
+
+
 def test_ligand_model(file_path):
     template = LigandTemplate.from_yaml(file_path / 'difflinker' / 'templates' / 'template_COO.yml')
     assert template.anchor_type == 'COO'
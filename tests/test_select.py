@@ -1,10 +1,13 @@
 """Test method for selecting which computation to run"""
+from dataclasses import replace
 
+import numpy as np
 from pytest import raises, fixture
 
 from mofa.db import create_records, mark_in_progress
 from mofa.selection.dft import DFTSelector
-from mofa.selection.md import MDSelector
+from mofa.selection.md import MDSelector, StabilityQueue
+from mofa.utils.trajectory import Trajectory
 
 
 @fixture()
@@ -17,12 +20,12 @@ def example_coll(coll, example_record):
     example_record.name = '0'
     create_records(coll, [example_record])
 
-    example_record.md_trajectory['uff'] = [(10000000, 'a')]
+    example_record.md_trajectory['uff'] = Trajectory.from_frames([(10000000, example_record.atoms)])
     example_record.structure_stability['uff'] = 0.1
     example_record.name = 'a'
     create_records(coll, [example_record])
 
-    example_record.md_trajectory['uff'] = [(1000, 'b')]
+    example_record.md_trajectory['uff'] = Trajectory.from_frames([(1000, example_record.atoms)])
     example_record.structure_stability['uff'] = 1.
     example_record.name = 'b'
     create_records(coll, [example_record])
@@ -50,6 +53,14 @@ def test_md_select(example_coll, example_record):
     # Ensure that it counts both the "unran" and low strain not finished
     assert selector.count_available() == 2, [x['name'] for x in example_coll.aggregate(selector.match_stages)]
 
+    # Ensure that it skips MOFs whose strain has stopped changing
+    example_record.md_trajectory['uff'] = Trajectory.from_frames([(1000, example_record.atoms)])
+    example_record.md_trajectory['uff'].stop_reason = 'plateau'
+    example_record.structure_stability['uff'] = 0.01
+    example_record.name = 'd'
+    create_records(example_coll, [example_record])
+    assert selector.count_available() == 2
+
     # Remove the unran object
     result = example_coll.delete_one({'structure_stability.uff': {'$exists': False}})
     assert result.deleted_count == 1
@@ -71,6 +82,36 @@ def test_md_select(example_coll, example_record):
     assert selector.select_next([example_record]) is example_record
 
 
+def test_stability_queue(example_record):
+    records = [replace(example_record, name=str(i)) for i in range(4)]
+
+    # Without a scorer, behaves like a deque
+    queue = StabilityQueue(maxlen=3)
+    for record in records:
+        queue.append(record)
+    assert [r.name for r in queue] == ['3', '2', '1']
+    assert queue.pop().name == '3'
+    assert len(queue) == 2
+
+    # Pop the highest score then the newest, and evict the lowest score then the oldest
+    scores = {'0': 0.9, '1': 0.5, '2': 0.1, '3': 0.5}
+    queue = StabilityQueue(maxlen=3, scorer=lambda r: scores[r.name])
+    for record in records:
+        queue.append(record)
+    assert [r.name for r in queue] == ['0', '3', '1']
+
+    # Re-rank when the scorer changes
+    queue.set_scorer(lambda r: -scores[r.name])
+    assert [queue.pop().name for _ in range(3)] == ['3', '1', '0']
+    with raises(IndexError):
+        queue.pop()
+
+    # Works with the MD selector
+    queue.append(records[0])
+    selector = MDSelector(collection=None, new_fraction=1.)
+    assert selector.select_next(queue) is records[0]
+
+
 def test_dft_selector(example_coll):
     selector = DFTSelector(
         collection=example_coll,
@@ -96,3 +137,85 @@ def test_dft_selector(example_coll):
     assert 'dft' in example_coll.find_one({'name': next_rec.name})['in_progress']
     with raises(ValueError, match='criteria'):
         selector.select_next()
+
+
+def test_dft_pore_geometry(example_coll):
+    example_coll.update_many({}, {'$set': {'times.relaxed': 0., 'structure_stability.uff': 0.}})
+    example_coll.update_one({'name': 'a'}, {'$set': {'pore_geometry': {'pld': 2.0, 'void_fraction': 0.3}}})
+    example_coll.update_one({'name': 'b'}, {'$set': {'pore_geometry': {'pld': 6.0, 'void_fraction': 0.5}}})
+    example_coll.update_one({'name': 'c'}, {'$set': {'pore_geometry': {'pld': 8.0, 'void_fraction': 0.7}}})
+
+    # Exclude MOFs with small pores, but not those which lack descriptors
+    selector = DFTSelector(collection=example_coll, md_level='uff', min_pore_diameter=3.3)
+    assert selector.count_available() == 3
+
+    # Pick the most open MOF first
+    selector.prefer = 'void_fraction'
+    assert selector.select_next().name == 'c'
+    mark_in_progress(example_coll, selector.select_next(), 'dft')
+    assert selector.select_next().name == 'b'
+
+
+def test_dft_screening(example_coll):
+    example_coll.update_many({}, {'$set': {'times.relaxed': 0., 'structure_stability.uff': 0.}})
+    selector = DFTSelector(collection=example_coll, md_level='uff', screen_key='CO2_qeq')
+
+    # No MOF is ready for DFT until screened
+    assert selector.count_available() == 0
+    to_screen = selector.select_screening()
+    mark_in_progress(example_coll, to_screen, 'screening')
+    assert selector.select_screening().name != to_screen.name
+
+    # Screened MOFs go to DFT, largest uptake first
+    example_coll.update_one({'name': 'a'}, {'$set': {'gas_storage.CO2_qeq': 1.}})
+    example_coll.update_one({'name': 'b'}, {'$set': {'gas_storage.CO2_qeq': 2.}})
+    assert selector.count_available() == 2
+    assert selector.select_next().name == 'b'
+    assert selector.select_screening().name in ['0', 'c']
+
+
+def test_dft_surrogate(coll, example_record):
+    from dataclasses import replace
+    from mofa.selection.dft import SurrogateDFTSelector
+
+    # Make MOFs with uptakes which increase with void fraction, and some without uptakes
+    records = []
+    for i, void_fraction in enumerate(np.linspace(0.1, 0.9, 12)):
+        record = replace(example_record, name=f'mof-{i}', structure_stability={'uff': 0.},
+                         pore_geometry={'lcd': 10., 'pld': 5., 'void_fraction': void_fraction, 'asa': 1000.})
+        record.times = {'relaxed': i}
+        if i % 2 == 1:
+            record.gas_storage = {'CO2': 10 * void_fraction}
+        records.append(record)
+    create_records(coll, records[:4])
+
+    # Picks randomly until there are enough uptakes
+    selector = SurrogateDFTSelector(collection=coll, md_level='uff', min_train=4, exploration=0.)
+    assert not selector.update_surrogate()
+    assert selector.select_next().name.startswith('mof-')
+
+    # Picks the MOF predicted to be best once trained
+    create_records(coll, records[4:])
+    for record in records:
+        if 'CO2' in record.gas_storage:
+            mark_in_progress(coll, record, 'dft')
+    assert selector.select_next().name == 'mof-10'
+    assert selector._trained_on == 6
+
+    # MOFs without pore descriptors are neither used for training nor picked
+    create_records(coll, [replace(example_record, name='no-pores', structure_stability={'uff': 0.}, times={'relaxed': 0},
+                                  gas_storage={'CO2': 100.})])
+    assert selector.select_next().name == 'mof-10'
+    assert selector._trained_on == 6
+    assert 'no-pores' not in selector._descriptors
+
+    # Descriptors are kept only for MOFs used in training or which remain candidates
+    assert set(selector._descriptors) == set(r.name for r in records)
+    mark_in_progress(coll, records[10], 'dft')
+    assert selector.select_next().name != 'mof-10'
+    assert 'mof-10' not in selector._descriptors
+
+    # Only the most recently relaxed MOFs are ranked if there are too many candidates
+    coll.update_one({'name': 'mof-2'}, {'$set': {'times.relaxed': 100}})
+    selector.max_candidates = 1
+    assert selector.select_next().name == 'mof-2'
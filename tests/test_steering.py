@@ -1,4 +1,5 @@
 """Test for the Colmena steering algorithm"""
+from datetime import datetime
 from pathlib import Path
 from time import sleep
 import pickle as pkl
@@ -26,6 +27,7 @@ from mofa.model import LigandTemplate, NodeDescription, MOFRecord
 from mofa.steering import MOFAThinker, GeneratorConfig, TrainingConfig, SimulationConfig
 from mofa.hpc.config import LocalConfig
 from mofa.db import initialize_database, create_records
+from mofa.utils.trajectory import Trajectory
 
 
 def _pull_tasks(queues: ColmenaQueues) -> list[tuple[str, Result]]:
@@ -216,7 +218,7 @@ def make_lammps_output(task: Result, cache_dir: Path):
     if result_path.is_file():
         with gzip.open(result_path, 'rt') as fp:
             frames = aseio.read(fp, index=':', format='extxyz')
-        frames = [(length // 10 * i, frame) for i, frame in enumerate(frames)]
+        frames = Trajectory.from_frames([(length // 10 * i, frame) for i, frame in enumerate(frames)])
     else:
         lmp = LAMMPSRunner(
             lammps_command=["lmp_serial"],
@@ -365,6 +367,71 @@ def test_simulation_pipeline(thinker, queues, cache_dir, example_record):
     assert thinker.collection.count_documents({'gas_storage.CO2': {'$exists': True}}) == 1
 
 
+def test_batch_relaxation(thinker, queues, example_cif):
+    """Make sure new MOFs are relaxed together in one task"""
+    tasks = _pull_tasks(queues)
+    assert len(tasks) == 1
+
+    # Insert MOF records into the queue
+    thinker.sim_config.relax_batch_size = 2
+    for name in ['mof-1', 'mof-2']:
+        record = MOFRecord.from_file(example_cif)
+        record.name = name
+        thinker.stability_queue.append(record)
+    thinker.mofs_available.set()
+    sleep(0.5)
+    tasks = _pull_tasks(queues)
+    assert len(tasks) == 1
+    assert thinker.collection.count_documents({'in_progress': 'stability'}) == 2
+
+    # Relax both, and ensure both are stored
+    _, task = tasks[0]
+    assert task.method == 'run_optimization_ff_many'
+    assert sorted(task.task_info['names']) == ['mof-1', 'mof-2']
+    task.deserialize()
+    task.set_result([(mof.atoms, None) for mof in task.args[0]])
+    task.serialize()
+    queues.send_result(task)
+
+    sleep(3)
+    assert thinker.collection.count_documents({'times.relaxed': {'$exists': True}}) == 2
+    assert thinker.simulations_left == 8 - 2  # Each MOF counts against the budget
+
+
+def test_gcmc_screening(thinker, queues, example_record):
+    """Make sure MOFs are screened with GCMC before DFT"""
+    tasks = _pull_tasks(queues)
+    assert len(tasks) == 1
+
+    # Insert a relaxed, stable MOF
+    thinker.dft_selector.screen_key = 'CO2_qeq'
+    example_record.structure_stability['uff'] = 0.
+    example_record.times['relaxed'] = datetime.now()
+    create_records(thinker.collection, [example_record])
+    thinker.cp2k_ready.set()
+
+    # The first task screens it
+    tasks = _pull_tasks(queues)
+    assert len(tasks) == 1
+    _, task = tasks[0]
+    assert task.method == 'run_gcmc_screening'
+    assert thinker.collection.count_documents({'in_progress': 'screening'}) == 1
+
+    # Storing the result sends the MOF to DFT without recording a DFT-quality uptake
+    task.deserialize()
+    task.set_result((1., 0.1, 0., 0.))
+    task.serialize()
+    queues.send_result(task)
+
+    tasks = _pull_tasks(queues)
+    assert len(tasks) == 1
+    _, task = tasks[0]
+    assert task.method == 'run_optimization'
+    record = thinker.collection.find_one({'name': example_record.name})
+    assert record['gas_storage'] == {'CO2_qeq': 1.}
+    assert record['in_progress'] == ['dft']
+
+
 def test_retrain(thinker, queues, coll, example_record):
     """Make sure retraining can be triggered properly"""
     # Pull the generate task out of the queues (it is there on startup and irrelevant here)
@@ -120,3 +120,8 @@ def test_raspa_vs_graspa(tmpdir):
     # Check changing to gRASPA
     config.raspa_version = 'graspa'
     assert config.make_raspa_runner().raspa_command == ('/not/a/path',)
+
+    # Check overriding the charges for screening
+    runner = config.make_raspa_runner(charges='qeq')
+    assert not runner.charges.requires_dft
+    assert runner.run_dir.name == 'raspa-qeq-runs'
@@ -0,0 +1,135 @@
+"""Test the compact trajectory format"""
+from dataclasses import asdict
+from pathlib import Path
+import json
+
+import numpy as np
+from bson import BSON
+from ase.build import bulk
+from ase.io.lammpsrun import read_lammps_dump_text
+from pytest import fixture, raises
+
+from mofa.model import MOFRecord
+from mofa.utils.trajectory import CellSeries, Trajectory, read_lammps_dump
+
+
+@fixture()
+def dump_path(tmpdir) -> Path:
+    """Write a dump file with a triclinic box and atoms out of order"""
+    rng = np.random.default_rng(1)
+    path = Path(tmpdir) / 'dump.lammpstrj.all'
+    with path.open('w') as fp:
+        for step in range(0, 400, 100):
+            atoms = bulk('ZnO', 'wurtzite', a=3.25, c=5.2) * (2, 2, 1)
+            atoms.rattle(0.05, seed=step)
+            order = rng.permutation(len(atoms))
+            xy, xz, yz = atoms.cell[1, 0], atoms.cell[2, 0], atoms.cell[2, 1]
+            lo = np.array([0.1, -0.2, 0.3])
+            hi = lo + atoms.cell.array.diagonal()
+            print(f'ITEM: TIMESTEP\n{step}\nITEM: NUMBER OF ATOMS\n{len(atoms)}', file=fp)
+            print('ITEM: BOX BOUNDS xy xz yz pp pp pp', file=fp)
+            print(f'{lo[0] + min(0, xy, xz, xy + xz)} {hi[0] + max(0, xy, xz, xy + xz)} {xy}', file=fp)
+            print(f'{lo[1] + min(0, yz)} {hi[1] + max(0, yz)} {xz}', file=fp)
+            print(f'{lo[2]} {hi[2]} {yz}', file=fp)
+            print('ITEM: ATOMS id type element x y z q', file=fp)
+            for i in order:
+                x, y, z = atoms.positions[i] + lo
+                print(f'{i + 1} {atoms.numbers[i] // 30 + 1} {atoms.get_chemical_symbols()[i]} {x} {y} {z} 0.0', file=fp)
+    return path
+
+
+def test_read_dump(dump_path):
+    traj = read_lammps_dump(dump_path)
+    assert len(traj) == 4
+    assert traj.timesteps.tolist() == [0, 100, 200, 300]
+    assert traj.positions.dtype == np.float32
+
+    # Compare to ASE
+    with dump_path.open() as fp:
+        ase_frames = read_lammps_dump_text(fp, slice(None))
+    for (step, atoms), ase_atoms in zip(traj, ase_frames):
+        assert atoms.get_chemical_symbols() == ase_atoms.get_chemical_symbols()
+        assert np.allclose(atoms.cell, ase_atoms.cell, atol=1e-5)
+        assert np.allclose(atoms.positions, ase_atoms.positions - ase_atoms.get_celldisp().flatten(), atol=1e-5)
+
+    # Read only some frames
+    ends = read_lammps_dump(dump_path, frames=[0, -1])
+    assert ends.timesteps.tolist() == [0, 300]
+    assert np.array_equal(ends.positions[1], traj.positions[-1])
+    assert read_lammps_dump(dump_path, frames=-1).timesteps.tolist() == [300]
+    assert read_lammps_dump(dump_path, frames=slice(1, None)).timesteps.tolist() == [100, 200, 300]
+
+
+def test_trajectory(dump_path):
+    traj = read_lammps_dump(dump_path)
+
+    # Test conversion to and from a list of atoms
+    frames = list(traj)
+    copied = Trajectory.from_frames(frames)
+    assert np.array_equal(copied.positions, traj.positions)
+    assert np.array_equal(copied.symbols, traj.symbols)
+
+    # Test slicing and shifting
+    assert traj[1:].timesteps.tolist() == [100, 200, 300]
+    assert traj.shift_timesteps(1000).timesteps.tolist() == [1000, 1100, 1200, 1300]
+    step, atoms = traj[-1]
+    assert step == 300
+    assert len(atoms) == traj.positions.shape[1]
+
+    with raises(ValueError):
+        Trajectory.from_frames([])
+
+
+def test_encoding(dump_path, example_record):
+    traj = read_lammps_dump(dump_path)
+
+    # Round trip through BSON
+    encoded = traj.to_dict()
+    assert encoded['version'] == 1
+    copied = Trajectory.from_dict(BSON.decode(BSON.encode(encoded)))
+    assert np.array_equal(copied.positions, traj.positions)
+    assert np.array_equal(copied.cells, traj.cells)
+    assert np.array_equal(copied.timesteps, traj.timesteps)
+    assert copied.symbols.tolist() == traj.symbols.tolist()
+
+    traj.stop_reason = 'plateau'
+    assert Trajectory.from_dict(BSON.decode(BSON.encode(traj.to_dict()))).stop_reason == 'plateau'
+
+    with raises(ValueError, match='version'):
+        Trajectory.from_dict({**encoded, 'version': 2})
+
+    # Extending a trajectory
+    copied.extend(traj.shift_timesteps(400))
+    assert copied.timesteps.tolist() == [0, 100, 200, 300, 400, 500, 600, 700]
+    assert copied.stop_reason == 'plateau'
+    with raises(ValueError):
+        copied.extend(Trajectory.from_frames([(0, example_record.atoms)]))
+
+    # Stored in a MOF record, including the older list of POSCAR strings
+    example_record.md_trajectory['uff'] = traj
+    copied = MOFRecord(**json.loads(example_record.to_json(default=str)))
+    assert np.array_equal(copied.md_trajectory['uff'].positions, traj.positions)
+    copied = MOFRecord(md_trajectory={'uff': [(0, example_record.structure)], 'mace': []})
+    assert copied.md_trajectory['uff'].timesteps.tolist() == [0]
+    assert 'mace' not in copied.md_trajectory
+
+
+def test_cell_series(dump_path):
+    traj = read_lammps_dump(dump_path, frames=[0, -1])
+    cellpars = [[3.25, 3.25, 5.2, 90, 90, 120]] * 3
+    traj.cell_series = CellSeries(timesteps=[0, 100, 200], cellpars=cellpars)
+    assert np.allclose(traj.cell_series.cells[0], bulk('ZnO', 'wurtzite', a=3.25, c=5.2).cell, atol=1e-5)
+
+    # Round trip through BSON and the dataclass form
+    copied = Trajectory.from_dict(BSON.decode(BSON.encode(traj.to_dict())))
+    assert copied.cell_series.timesteps.tolist() == [0, 100, 200]
+    assert np.array_equal(copied.cell_series.cellpars, traj.cell_series.cellpars)
+    assert np.array_equal(Trajectory(**asdict(traj)).cell_series.cellpars, traj.cell_series.cellpars)
+
+    # Extending and shifting do not change the original
+    shifted = traj.shift_timesteps(200)
+    shifted.cell_series = shifted.cell_series[1:]
+    sliced = traj[1:]
+    sliced.extend(shifted)
+    assert sliced.cell_series.timesteps.tolist() == [0, 100, 200, 300, 400]
+    assert traj.cell_series.timesteps.tolist() == [0, 100, 200]